@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a benchmark suite for the data and storage hot paths of
+the STC time management application.
+
+Every benchmark runs against synthetic timesheet histories of several sizes
+(one month, one year, ten years and a company of 100 employees), which are
+generated into a temporary data folder so the real data is never touched.
+
+Results can be saved as a baseline and later be compared against it, e.g.
+before upgrading Python or one of the dependencies. A benchmark counts as
+regressed if its median runtime exceeds the baseline by more than the given
+threshold factor.
+
+The startup check runs the login window in a fresh interpreter under
+`python -X importtime`, on an empty temporary data folder. It fails if
+importing the application or showing the login frame exceeds its time budget,
+or if one of the deferred heavy modules is imported before the login frame
+appears. The preloading threads started by the login window are held until
+the frame is drawn, the modules they import afterwards are expected.
+
+Usage
+-----
+    python benchmark.py                 Run all benchmarks and print results.
+    python benchmark.py --save          Run and store results as baseline.
+    python benchmark.py --check         Run and compare with the baseline.
+    python benchmark.py --check --threshold 1.5
+    python benchmark.py --startup       Only run the startup check.
+"""
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os.path
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime_functions import DatetimeFunctions as dtf
+import gui_constants
+import timesheet_snapshot
+
+BASELINE_PATH = os.path.join(gui_constants.DATA_PATH,
+                             "benchmark_baseline.json")
+DEFAULT_THRESHOLD = 1.25
+
+# Startup budgets in seconds and modules which must not be imported at startup
+IMPORT_TIME_BUDGET = 0.15
+LOGIN_WINDOW_BUDGET = 0.5
+DEFERRED_MODULES = ("numpy", "dateutil", "sqlite3")
+
+# Written to stderr once the login frame is drawn, see parse_import_times()
+LOGIN_WINDOW_MARKER = "login window shown"
+
+# Runs with the temporary data folder as its argument
+LOGIN_WINDOW_PROBE = """
+import time
+start = time.perf_counter()
+import os
+import sys
+import threading
+import tkinter as tk
+import gui_constants
+data_path = sys.argv[1]
+gui_constants.DATA_PATH = data_path + os.sep
+gui_constants.DATABASE_PATH = os.path.join(data_path, "timesheet.db")
+gui_constants.LAST_USER_PATH = os.path.join(data_path, "last_user.txt")
+gui_constants.CALENDAR_PATH = os.path.join(data_path, "calendar") + os.sep
+gui_constants.INSTRUMENTATION_PATH = os.path.join(data_path, "instr.json")
+gui_constants.PROFILING_PATH = os.path.join(data_path, "profiling") + os.sep
+from gui_logic import Timesheet
+
+# The preloading threads only start loading once the login frame is drawn
+frame_shown = threading.Event()
+preload = Timesheet.preload
+Timesheet.preload = lambda self, function, *args: preload(
+    self, lambda *args: frame_shown.wait() and function(*args), *args)
+
+timesheet = Timesheet.__new__(Timesheet)
+timesheet.root = tk.Tk()
+timesheet.create_login_window()
+timesheet.root.update()
+login_time = time.perf_counter() - start
+sys.stderr.write("%s\\n" % MARKER)
+sys.stderr.flush()
+frame_shown.set()
+timesheet.wait_for_preload()
+print(login_time)
+timesheet.root.destroy()
+""".replace("MARKER", repr(LOGIN_WINDOW_MARKER))
+
+# Name: (amount of employees, days of history per employee, repetitions)
+HISTORY_SIZES = {
+    "1 month": (1, 31, 20),
+    "1 year": (1, 365, 10),
+    "10 years": (1, 3652, 3),
+    "100 employees": (100, 365, 3),
+}
+
+
+def generate_history(employee, number_of_days, seed=0):
+    """
+    Fill the working days of an employee with a synthetic history.
+
+    The history ends today and contains a plausible start, end and break
+    time for every weekday. Weekends are left empty.
+
+    Parameters
+    ----------
+    employee : WorkTimeEmployee
+        The employee to fill with data.
+    number_of_days : int
+        Amount of calendar days the history spans.
+    seed : int, optional
+        Seed of the random generator to get reproducible data.
+    """
+    rng = random.Random(seed)
+    first_day = dt.date.today() - dt.timedelta(days=number_of_days - 1)
+    for offset in range(number_of_days):
+        date_object = first_day + dt.timedelta(days=offset)
+        if date_object.weekday() > 4:
+            continue
+        day = employee.create_day(date_object)
+        day.start_time = dt.time(rng.randint(7, 9), rng.randrange(0, 60, 5))
+        day.end_time = dt.time(rng.randint(16, 18), rng.randrange(0, 60, 5))
+        day.break_time = float(rng.randrange(1800, 3600, 60))
+
+
+def create_employees(amount, number_of_days):
+    """
+    Create employees with synthetic histories and store them on disk.
+
+    Parameters
+    ----------
+    amount : int
+        Amount of employees to create.
+    number_of_days : int
+        Amount of calendar days of history per employee.
+
+    Returns
+    -------
+    list
+        The created WorkTimeEmployee instances.
+    """
+    from data_model import WorkTimeEmployee
+    from database_functions import DatabaseFunctions
+
+    employees = []
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    for i in range(amount):
+        employee = WorkTimeEmployee("bench{:03d}".format(i))
+        generate_history(employee, number_of_days, seed=i)
+        employee.save_to_database()
+        employee.save_to_csv()
+        db.save_employee(employee.employee_id, 30, 0)
+        employees.append(employee)
+    db.disconnect_from_database()
+    return employees
+
+
+def measure(function, repetitions):
+    """
+    Measure the runtime of a function.
+
+    Parameters
+    ----------
+    function : callable
+        The function to measure. Is called without arguments.
+    repetitions : int
+        How often the function is called.
+
+    Returns
+    -------
+    dict
+        Minimum and median runtime in seconds.
+    """
+    timings = []
+    for _ in range(repetitions):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings)}
+
+
+def get_benchmarks(employees):
+    """
+    Return all benchmarks for the given employees.
+
+    Parameters
+    ----------
+    employees : list
+        WorkTimeEmployee instances the benchmarks operate on.
+
+    Returns
+    -------
+    dict
+        Benchmark names mapped to functions without arguments.
+    """
+    from gui_logic import Timesheet
+    from working_time_model import WorkingTimeModel
+
+    days = [day for employee in employees
+            for day in employee.working_days.values()]
+    time_strings = [dtf.time_object_to_string(None, day.start_time)
+                    for day in days]
+    times = [(day.start_time, day.end_time) for day in days]
+    months = sorted({day.date.replace(day=1) for day in days})
+    timesheet = Timesheet.__new__(Timesheet)
+    part_time_models = [
+        WorkingTimeModel((6, 6, 6, 6, 0, 0, 0), months[0], months[len(months) // 2]),
+        WorkingTimeModel((7, 7, 7, 7, 7, 0, 0), months[len(months) // 2] + dt.timedelta(days=1)),
+    ]
+
+    def convert_string_to_time():
+        for time_string in time_strings:
+            dtf.convert_string_to_time(None, time_string)
+
+    def get_time_difference():
+        for start_time, end_time in times:
+            dtf.get_time_difference(None, start_time, end_time)
+
+    def get_work_time():
+        for day in days:
+            day.get_work_time()
+
+    def get_flex_time():
+        for employee in employees:
+            employee.get_flex_time()
+
+    def get_flex_time_part_time():
+        # A contract change discards the cached targets
+        for employee in employees:
+            employee.set_working_time_models(part_time_models)
+            employee.get_flex_time()
+            employee.set_working_time_models([])
+
+    def get_monthly_flex_time():
+        # Subtotals only touch the days of their month
+        for employee in employees:
+            for month in months:
+                employee.get_flex_time(month, dtf.add_months(None, month, 1) - dt.timedelta(days=1))
+
+    def read_from_database():
+        for employee in employees:
+            employee.clear_days()
+            employee.read_from_database()
+
+    def read_from_database_with_snapshot():
+        use_snapshots = gui_constants.USE_SNAPSHOTS
+        gui_constants.USE_SNAPSHOTS = True
+        try:
+            read_from_database()
+        finally:
+            gui_constants.USE_SNAPSHOTS = use_snapshots
+
+    def save_to_database():
+        # Only changed days are written, so every run changes all break times.
+        # Setting them costs next to nothing compared to writing the days.
+        for employee in employees:
+            for day in employee.working_days.values():
+                if day.break_time is not None:
+                    day.break_time += 60 if day.break_time % 120 else -60
+            employee.save_to_database()
+
+    def read_from_csv():
+        for employee in employees:
+            employee.clear_days()
+            employee.read_from_csv()
+
+    def save_to_csv():
+        for employee in employees:
+            employee.save_to_csv()
+
+    def get_month_days():
+        for month in months:
+            timesheet.get_month_days(month)
+
+    def load_team_page():
+        page_size = gui_constants.TEAM_OVERVIEW_PAGE_SIZE
+        for offset in range(0, len(employees), page_size):
+            timesheet.load_team_page(offset, page_size)
+
+    return {
+        "convert_string_to_time": convert_string_to_time,
+        "get_time_difference": get_time_difference,
+        "WorkingDay.get_work_time": get_work_time,
+        "WorkTimeEmployee.get_flex_time": get_flex_time,
+        "WorkTimeEmployee.get_flex_time (part time)": get_flex_time_part_time,
+        "WorkTimeEmployee.get_flex_time (per month)": get_monthly_flex_time,
+        "read_from_database": read_from_database,
+        "read_from_database (snapshot)": read_from_database_with_snapshot,
+        "save_to_database (all days changed)": save_to_database,
+        "read_from_csv": read_from_csv,
+        "save_to_csv": save_to_csv,
+        "Timesheet.get_month_days": get_month_days,
+        "Timesheet.load_team_page": load_team_page,
+    }
+
+
+def run_benchmarks(sizes=None):
+    """
+    Run all benchmarks for the given history sizes.
+
+    The data folder and database path are redirected to a temporary
+    folder while the benchmarks are running.
+
+    Parameters
+    ----------
+    sizes : list, optional
+        Names of the history sizes to run. Defaults to all sizes.
+
+    Returns
+    -------
+    dict
+        Results keyed by "<benchmark> [<size>]".
+    """
+    results = {}
+    data_path = gui_constants.DATA_PATH
+    database_path = gui_constants.DATABASE_PATH
+    calendar_path = gui_constants.CALENDAR_PATH
+
+    for size in sizes or HISTORY_SIZES:
+        amount, number_of_days, repetitions = HISTORY_SIZES[size]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gui_constants.DATA_PATH = temp_dir
+            gui_constants.DATABASE_PATH = os.path.join(temp_dir,
+                                                       "timesheet.db")
+            gui_constants.CALENDAR_PATH = os.path.join(temp_dir, "calendar")
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    employees = create_employees(amount, number_of_days)
+                    # Snapshots are off by default, they are built for their benchmark
+                    for employee in employees:
+                        timesheet_snapshot.SnapshotCache().rebuild(employee.employee_id)
+                for name, function in get_benchmarks(employees).items():
+                    key = "{name} [{size}]".format(name=name, size=size)
+                    results[key] = measure(function, repetitions)
+                    print("{key:<50} {median:10.6f} s".format(
+                        key=key, median=results[key]["median"]))
+            finally:
+                # The temporary folder is deleted next
+                timesheet_snapshot.wait_for_rebuilds()
+                gui_constants.DATA_PATH = data_path
+                gui_constants.DATABASE_PATH = database_path
+                gui_constants.CALENDAR_PATH = calendar_path
+    return results
+
+
+def save_baseline(results, file_path=BASELINE_PATH):
+    """Save benchmark results as baseline to a json file."""
+    with open(file_path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+    print("Saved baseline to '{path}'.".format(path=file_path))
+
+
+def check_against_baseline(results, threshold=DEFAULT_THRESHOLD,
+                           file_path=BASELINE_PATH):
+    """
+    Compare benchmark results with the saved baseline.
+
+    If there is no baseline yet, the results are saved as baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results as returned by run_benchmarks().
+    threshold : float, optional
+        Allowed factor between the current and the baseline median.
+    file_path : str, optional
+        Path to the baseline json file.
+
+    Returns
+    -------
+    list
+        Keys of all benchmarks which regressed.
+    """
+    if not os.path.isfile(file_path):
+        print("No baseline found at '{path}'.".format(path=file_path))
+        save_baseline(results, file_path)
+        return []
+    with open(file_path, 'r') as file:
+        baseline = json.load(file)
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            print("{key:<50} no baseline".format(key=key))
+            continue
+        ratio = result["median"] / max(baseline[key]["median"], 1e-9)
+        status = "ok"
+        if ratio > threshold:
+            status = "REGRESSION"
+            regressions.append(key)
+        print("{key:<50} {ratio:6.2f}x  {status}".format(
+            key=key, ratio=ratio, status=status))
+    return regressions
+
+
+def parse_import_times(output):
+    """
+    Read the `-X importtime` output of the login window probe.
+
+    Only the imports made before the login frame was drawn are collected,
+    everything after LOGIN_WINDOW_MARKER belongs to the preloading threads.
+
+    Parameters
+    ----------
+    output : str
+        The stderr output of the probe.
+
+    Returns
+    -------
+    tuple
+        Cumulative import time of gui_logic in seconds (None if it was not
+        imported) and the set of top level modules imported before the
+        login frame was drawn.
+    """
+    import_time = None
+    imported_modules = set()
+    for line in output.splitlines():
+        if line == LOGIN_WINDOW_MARKER:
+            break
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        cumulative, name = line.split("|")[1:3]
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        imported_modules.add(name.strip().split(".")[0])
+        if name.strip() == "gui_logic":
+            import_time = int(cumulative) / 1e6
+    return import_time, imported_modules
+
+
+def check_startup(import_budget=IMPORT_TIME_BUDGET,
+                  login_budget=LOGIN_WINDOW_BUDGET):
+    """
+    Check import time and login window latency in a fresh interpreter.
+
+    The login window part is skipped if no display is available.
+
+    Parameters
+    ----------
+    import_budget : float, optional
+        Allowed time in seconds to import gui_logic.
+    login_budget : float, optional
+        Allowed time in seconds from interpreter start until the login
+        frame is drawn.
+
+    Returns
+    -------
+    list
+        Descriptions of all violated budgets.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", LOGIN_WINDOW_PROBE,
+             temp_dir],
+            capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    import_time, imported_modules = parse_import_times(process.stderr)
+
+    violations = []
+    if import_time is None:
+        violations.append("gui_logic could not be imported")
+    else:
+        print("{key:<50} {value:10.6f} s".format(
+            key="import gui_logic", value=import_time))
+        if import_time > import_budget:
+            violations.append("import time exceeds {budget} s".format(
+                budget=import_budget))
+
+    for module in DEFERRED_MODULES:
+        if module in imported_modules:
+            violations.append("'{module}' is imported at startup".format(
+                module=module))
+
+    if process.returncode == 0:
+        login_time = float(process.stdout.strip().splitlines()[-1])
+        print("{key:<50} {value:10.6f} s".format(
+            key="login window shown", value=login_time))
+        if login_time > login_budget:
+            violations.append("login window exceeds {budget} s".format(
+                budget=login_budget))
+    else:
+        print("{key:<50} skipped (no display)".format(
+            key="login window shown"))
+
+    for violation in violations:
+        print("STARTUP REGRESSION:", violation)
+    return violations
+
+
+# Run benchmarks
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the data and storage hot paths.")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as new baseline")
+    parser.add_argument("--check", action="store_true",
+                        help="compare the results with the saved baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown factor (default: %(default)s)")
+    parser.add_argument("--size", action="append", choices=HISTORY_SIZES,
+                        help="history size to run, can be repeated")
+    parser.add_argument("--startup", action="store_true",
+                        help="only check import time and login window")
+    arguments = parser.parse_args()
+
+    if arguments.startup:
+        sys.exit(1 if check_startup() else 0)
+
+    benchmark_results = run_benchmarks(arguments.size)
+
+    exit_code = 0
+    if arguments.check:
+        if check_against_baseline(benchmark_results, arguments.threshold):
+            exit_code = 1
+        if check_startup():
+            exit_code = 1
+    if arguments.save:
+        save_baseline(benchmark_results)
+    sys.exit(exit_code)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+This module exports the changes of the STC time management application,
+e.g. for the nightly payroll sync.
+
+Triggers record the key of every inserted, updated or deleted day and
+employee in the change_feed table, in the same transaction as the change
+itself, also for changes made by other processes. Every change gets a
+sequence number, which only increases.
+
+The export writes one JSON line per changed day or employee since a cursor,
+the sequence number the previous export ended with. A line holds the current
+values of the row ("operation": "upsert") or tells that it was deleted
+("operation": "delete"); a row changed several times is exported once.
+Applying the lines in order brings the consumer up to date, the export ends
+with the new cursor. The work is proportional to the changes, not to the
+size of the tables.
+
+Functions
+---------
+export_changes(cursor=0, output=None, batch_size=None)
+    Writes the changes since a cursor as JSON lines.
+prune(cursor)
+    Deletes the changes up to a cursor.
+
+Usage
+-----
+    python change_feed.py export [--since CURSOR] [--output FILE]
+    python change_feed.py export --cursor-file FILE [--output FILE]
+    python change_feed.py prune CURSOR
+    python change_feed.py status
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+
+import gui_constants
+
+
+def timesheet_record(row):
+    """
+    Return a changed day as a JSON compatible dictionary.
+
+    Parameters
+    ----------
+    row : tuple
+        As returned by DatabaseFunctions.load_timesheet_changes().
+    """
+    from database_functions import STATES
+
+    sequence, employee_id, day, start, end, break_seconds, work_seconds, state, version = row
+    record = {"sequence": sequence, "table": "timesheet", "employee_id": employee_id,
+              "date": dt.date.fromordinal(day).isoformat()}
+    if version is None:
+        record["operation"] = "delete"
+    else:
+        record.update(operation="upsert", start_seconds=start, end_seconds=end,
+                      break_seconds=break_seconds, work_seconds=work_seconds,
+                      state=STATES[state], version=version)
+    return record
+
+
+def employee_record(row):
+    """
+    Return a changed employee as a JSON compatible dictionary.
+
+    Parameters
+    ----------
+    row : tuple
+        As returned by DatabaseFunctions.load_employee_changes().
+    """
+    sequence, employee_id, vacation_days, old_vacation_days, entitlement, rollover_year, region, version = row
+    record = {"sequence": sequence, "table": "employees", "employee_id": employee_id}
+    if version is None:
+        record["operation"] = "delete"
+    else:
+        record.update(operation="upsert", vacation_days=vacation_days,
+                      old_vacation_days=old_vacation_days, entitlement=entitlement,
+                      rollover_year=rollover_year, region=region, version=version)
+    return record
+
+
+def export_changes(cursor=0, output=None, batch_size=None):
+    """
+    Write the changes since a cursor as JSON lines.
+
+    Parameters
+    ----------
+    cursor : int, optional
+        Sequence number of the last change exported before (default is 0,
+        i.e. all recorded changes).
+    output : file, optional
+        Text file to write to (default is sys.stdout).
+    batch_size : int, optional
+        Sequence numbers read per query
+        (default is gui_constants.CHANGE_FEED_BATCH_SIZE).
+
+    Returns
+    -------
+    tuple
+        Amount of exported lines and the new cursor.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    output = output or sys.stdout
+    batch_size = batch_size or gui_constants.CHANGE_FEED_BATCH_SIZE
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        # Changes made during the export follow with the next one
+        last_sequence = db.load_last_change()
+        lines = 0
+        for first_sequence in range(cursor, last_sequence, batch_size):
+            def read_batch():
+                # Days and employees of a batch from the same read transaction
+                db.c.execute('BEGIN')
+                try:
+                    return (db.load_timesheet_changes(first_sequence, first_sequence + batch_size),
+                            db.load_employee_changes(first_sequence, first_sequence + batch_size))
+                finally:
+                    db.conn.commit()
+
+            days, employees = run_with_retry(read_batch)
+            records = ([timesheet_record(row) for row in days]
+                       + [employee_record(row) for row in employees])
+            for record in sorted(records, key=lambda record: record["sequence"]):
+                output.write(json.dumps(record) + "\n")
+            lines += len(records)
+        return lines, max(cursor, last_sequence)
+    finally:
+        db.disconnect_from_database()
+
+
+def read_cursor(file_path):
+    """Return the cursor stored in a file, 0 if the file does not exist."""
+    try:
+        with open(file_path) as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_cursor(file_path, cursor):
+    """Store a cursor in a file, replaced atomically."""
+    with open(file_path + ".tmp", 'w') as file:
+        file.write(f"{cursor}\n")
+    os.replace(file_path + ".tmp", file_path)
+
+
+def prune(cursor):
+    """
+    Delete the changes up to a cursor, once every consumer exported them.
+
+    Returns
+    -------
+    int
+        Amount of deleted changes.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        deleted = run_with_retry(db.prune_change_feed, cursor)
+        print(f"Deleted {deleted} changes up to {cursor}.")
+        return deleted
+    finally:
+        db.disconnect_from_database()
+
+
+def main():
+    """Export or prune the changes from the command line."""
+    parser = argparse.ArgumentParser(description="Export the changes of days and employees as JSON lines")
+    parser.add_argument('action', choices=('export', 'prune', 'status'))
+    parser.add_argument('cursor', type=int, nargs='?', help="prune: the last exported sequence number")
+    parser.add_argument('--since', type=int, default=0,
+                        help="export: the cursor of the previous export (default is 0)")
+    parser.add_argument('--cursor-file',
+                        help="export: read the cursor from this file and store the new one in it")
+    parser.add_argument('--output', help="export: the file to write (default is stdout)")
+    arguments = parser.parse_args()
+
+    if arguments.action == 'status':
+        from database_functions import DatabaseFunctions
+
+        db = DatabaseFunctions()
+        db.connect_to_database()
+        try:
+            print(f"Last change: {db.load_last_change()}")
+        finally:
+            db.disconnect_from_database()
+    elif arguments.action == 'prune':
+        if arguments.cursor is None:
+            parser.error("prune requires a cursor")
+        prune(arguments.cursor)
+    else:
+        cursor = read_cursor(arguments.cursor_file) if arguments.cursor_file else arguments.since
+        if arguments.output:
+            with open(arguments.output, 'w') as output:
+                lines, cursor = export_changes(cursor, output)
+        else:
+            lines, cursor = export_changes(cursor)
+        # Only advanced once everything is written
+        if arguments.cursor_file:
+            write_cursor(arguments.cursor_file, cursor)
+        print(f"Exported {lines} changes, cursor {cursor}.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
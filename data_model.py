@@ -5,14 +5,35 @@ Created on Tue Nov  5 16:17:50 2024
 @author: Luka, jnath
 """
 
+import bisect
 import datetime as dt
+import logging
 import os.path
 import csv
-import sqlite3
+import time
 
-from database_functions import DatabaseFunctions
 from datetime_functions import DatetimeFunctions as dtf
 import gui_constants
+import instrumentation
+import working_calendar
+from working_time_model import TargetSchedule, WorkingTimeModel
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentModificationError(Exception):
+    """
+    Raised if stored records were changed by another instance since they were read.
+
+    Attributes
+    ----------
+    conflicts : list
+        Keys of the conflicting records, e.g. date strings or employee IDs.
+    """
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__("Records were modified concurrently: " + ", ".join(conflicts))
 
 
 class WorkingDay():
@@ -25,12 +46,20 @@ class WorkingDay():
         Start time as a time object or None if not set.
     end_time : datetime.time or None
         End time as a time object or None if not set.
+    end_day_offset : int
+        Amount of days the end lies after the date, for shifts crossing
+        midnight. 0 means the next day if the end is before the start.
     break_time : int or None
         Break time in seconds or None if not set.
     state : str
         The state of the day, e.g., "default", "sick", or "vacation".
     date : datetime.date
         The date for this working day.
+    version : int or None
+        Version of the stored record this day was read from or written to.
+        None if this day is not stored in the database.
+    stored_entry : tuple or None
+        The entry as it was last read from or written to the database.
     """
 
     def __init__(self, date_object):
@@ -44,17 +73,22 @@ class WorkingDay():
         """
         self.start_time = None
         self.end_time = None
+        self.end_day_offset = 0
         self.break_time = None
 
         self.state = "default"
 
         self.date = date_object
 
+        self.version = None
+        self.stored_entry = None
+
     def get_work_time(self):
         """
         Returns the seconds worked on this day if calculatable by
         subtracting self.start_time from self.end_time. Subtracts
-        the self.break_time if set.
+        the self.break_time if set. Shifts may end on a later day,
+        see get_end_day_offset().
         In all other cases it will return None.
 
         Returns
@@ -63,21 +97,99 @@ class WorkingDay():
             This days working time in seconds or None if not set.
 
         """
-        work_time = None
-        # if self.start_time is not None and self.end_time is not None:
-        try:
-            work_time = dtf.get_time_difference(
-                self, self.start_time, self.end_time)
+        if self.start_time is None or self.end_time is None:
+            return None
 
-            if self.break_time is not None:
-                work_time -= self.break_time
-        except Exception as e:
-            if gui_constants.DEBUG:
-                print(
-                    "An error occured while calculating worktime for day {:%Y-%m-%d}: ".format(self.date), e)
-            pass
+        # Seconds since midnight of the date, without creating datetime objects
+        start = self.start_time
+        end = self.end_time
+        work_time = ((end.hour - start.hour) * 3600 + (end.minute - start.minute) * 60
+                     + end.second - start.second + self.get_end_day_offset() * 86400)
+
+        if self.break_time is not None:
+            work_time -= self.break_time
         return work_time
 
+    def get_end_day_offset(self):
+        """
+        Returns the amount of days the end lies after the date.
+
+        Returns
+        -------
+        int
+            end_day_offset if set, otherwise 1 if the end time is before
+            the start time (overnight shift) and 0 if not.
+        """
+        if self.end_day_offset:
+            return self.end_day_offset
+        if self.start_time is not None and self.end_time is not None and self.end_time < self.start_time:
+            return 1
+        return 0
+
+    def set_start_time(self, start_time):
+        """
+        Sets the start time entered by hand.
+
+        A changed start resets the end day offset, it is derived from the
+        start and end time again, see get_end_day_offset().
+
+        Parameters
+        ----------
+        start_time : datetime.time or None
+            The new start time, None deletes it.
+        """
+        if start_time != self.start_time:
+            self.start_time = start_time
+            self.end_day_offset = 0
+
+    def set_end_time(self, end_time):
+        """
+        Sets the end time entered by hand.
+
+        A changed end resets the end day offset, it is derived from the
+        start and end time again, see get_end_day_offset().
+
+        Parameters
+        ----------
+        end_time : datetime.time or None
+            The new end time, None deletes it.
+        """
+        if end_time != self.end_time:
+            self.end_time = end_time
+            self.end_day_offset = 0
+
+    def get_flex_time(self, target=None):
+        """
+        Returns the contribution of this day to the flex time in seconds.
+
+        The work time counts positive. The target is deducted
+        if the day is not "sick" or "vacation".
+
+        Parameters
+        ----------
+        target : int, optional
+            Target working time of this day in seconds, see
+            WorkTimeEmployee.get_target(). By default the daily working
+            hours on working days of gui_constants.DEFAULT_REGION.
+
+        Returns
+        -------
+        float
+            The flex time of this day, 0 if the day has no entry.
+        """
+        flex_time = 0.0
+        if self.has_entry():
+            flex_time += float(self.get_work_time() or 0)
+
+            if target is None:
+                target = (gui_constants.DAILY_WORKING_HOURS * 3600
+                          if working_calendar.is_working_day(self.date) else 0)
+
+            # Deduct the target if the day is not "sick" or "vacation"
+            if self.state not in ("sick", "vacation"):
+                flex_time -= float(target)
+        return flex_time
+
     def has_entry(self):
         """
         Checks wether this day has any data stored besides its date.
@@ -99,6 +211,81 @@ class WorkingDay():
             has_entry = True
         return has_entry
 
+    def get_entry(self):
+        """
+        Returns the stored attributes of this day.
+
+        Returns
+        -------
+        tuple
+            Start time, end time, end day offset, break time and state.
+        """
+        return (self.start_time, self.end_time, self.get_end_day_offset(), self.break_time, self.state)
+
+    def is_modified(self):
+        """
+        Checks wether this day was changed since it was read or written.
+
+        Returns
+        -------
+        bool
+            True if the day differs from its stored record.
+        """
+        if self.stored_entry is None:
+            return self.has_entry()
+        return self.get_entry() != self.stored_entry
+
+    def mark_stored(self, version):
+        """
+        Remembers the current attributes as stored in the database.
+
+        Parameters
+        ----------
+        version : int or None
+            Version of the stored record, None if the record was deleted.
+        """
+        self.version = version
+        self.stored_entry = self.get_entry()
+
+    def to_dict(self):
+        """
+        Returns this day as dictionary of json compatible values.
+
+        Returns
+        -------
+        dict
+            Date, start time, end time, end day offset, break time, state and version.
+        """
+        return {
+            'date': "{:%Y-%m-%d}".format(self.date),
+            'start_time': dtf.time_object_to_string(self, self.start_time),
+            'end_time': dtf.time_object_to_string(self, self.end_time),
+            'end_day_offset': self.get_end_day_offset(),
+            'break_time': self.break_time,
+            'state': self.state,
+            'version': self.version
+        }
+
+    def update_from_dict(self, data):
+        """
+        Sets the attributes of this day from a dictionary created by to_dict().
+
+        Parameters
+        ----------
+        data : dict
+            Start time, end time, end day offset, break time and state of the day.
+        """
+        self.start_time = dtf.convert_string_to_time(self, data['start_time'])
+        self.end_time = dtf.convert_string_to_time(self, data['end_time'])
+        self.end_day_offset = data.get('end_day_offset', 0)
+        self.break_time = data['break_time']
+        self.state = data['state']
+
+
+# Returned by WorkTimeEmployee.get_day() for dates without a working day.
+# Shared by all employees, it must not be changed; use create_day() instead.
+EMPTY_DAY = WorkingDay(None)
+
 
 class WorkTimeEmployee():
     """
@@ -112,14 +299,41 @@ class WorkTimeEmployee():
     file_path : str
         The path to the employee's timesheet file.
     working_days : dict
-        A dictionary mapping date strings to WorkingDay instances.
+        A dictionary mapping day numbers (date.toordinal()) to WorkingDay
+        instances.
+    day_numbers : list
+        The keys of working_days in ascending order, used to find the days
+        of a date range by bisection.
     amount_vacation_days : int
         Total vacation days available to the employee.
     amount_old_vacation_days : int
         Unused vacation days carried over from the previous year.
+    vacation_entitlement : int
+        Vacation days granted every year by the rollover.
+    rollover_year : int or None
+        The last year the vacation days were rolled over into.
+    region : str
+        Holiday region, see gui_constants.REGIONAL_HOLIDAYS.
+    schedule : TargetSchedule
+        Daily targets derived from the working-time models.
+    closed_months : dict
+        Month numbers (year * 12 + month - 1) of the closed months mapped
+        to their frozen totals, see get_month_totals(). The days of closed
+        months are not loaded with the timesheet and can't be changed.
+    loaded_months : set
+        Month numbers of the closed months whose days were loaded for
+        display, see load_month().
     on_break : datetime.time
         A timestamp which indicates when this employee started it's last break.
-        Is None if this employee is not on break currently.
+        Is None if this employee is not on break currently. Restored from the
+        running break interval in the punches table when today is loaded.
+    is_loaded : bool
+        Whether the working days were loaded from disk. Employees which
+        are not loaded must not be saved, as this would erase their data.
+    version : int or None
+        Version of the stored employee record, None if not stored yet.
+    stored_counters : tuple or None
+        The vacation day counters as they were last read or written.
 
     Methods
     -------
@@ -127,15 +341,23 @@ class WorkTimeEmployee():
         Creates a new WorkingDay for a given date.
     get_day(date_object=dt.date.today())
         Retrieves a WorkingDay for the specified date.
-    get_flex_time()
+    days_between(start_date=None, end_date=None)
+        Iterates over the WorkingDays of a date range in date order.
+    get_flex_time(start_date=None, end_date=None)
         Calculates the employee's accumulated flex time in seconds.
+    get_month_totals(year, month)
+        Sums up the work, target and flex time of a month.
+    load_month(year, month, db=None)
+        Loads the days of a closed month for display.
     load_working_days()
         Loads the working days data from a CSV file.
+    unload_working_days()
+        Drops the loaded working days.
     save_working_days()
         Saves the working days data to a CSV file.
     """
 
-    def __init__(self, employee_id="default"):
+    def __init__(self, employee_id="default", load=True):
         """
         Initializes a WorkTimeEmployee object with a given employee ID.
 
@@ -143,6 +365,10 @@ class WorkTimeEmployee():
         ----------
         employee_id : str, optional
             The unique ID of the employee (default is "default").
+        load : bool, optional
+            Whether to load the working days immediately (default is True).
+            Otherwise they are loaded by the first call of
+            load_working_days().
         """
         self.employee_id = employee_id
         self.name = 'default'
@@ -151,14 +377,27 @@ class WorkTimeEmployee():
             gui_constants.DATA_PATH, self.employee_id + ".csv")
 
         self.working_days = {}
+        self.day_numbers = []
         self.amount_vacation_days = 30
         self.amount_old_vacation_days = 0
+        self.vacation_entitlement = gui_constants.VACATION_DAYS_PER_YEAR
+        self.rollover_year = None
+        self.region = gui_constants.DEFAULT_REGION
+        self.schedule = TargetSchedule()
+        self.closed_months = {}
+        self.loaded_months = set()
         self.on_break = None
-
-        if os.path.isfile(self.file_path) or os.path.isfile(gui_constants.DATABASE_PATH):
-            self.load_working_days()
-        else:
-            self.save_working_days()
+        self.is_loaded = False
+        self.version = None
+        self.stored_counters = None
+
+        if load:
+            if (gui_constants.USE_SERVICE or os.path.isfile(self.file_path)
+                    or os.path.isfile(gui_constants.DATABASE_PATH)):
+                self.load_working_days()
+            else:
+                self.is_loaded = True
+                self.save_working_days()
 
     def create_day(self, date_object=dt.date.today()):
         """
@@ -176,15 +415,15 @@ class WorkTimeEmployee():
         WorkingDay
             The WorkingDay instance for the specified date.
         """
-        day = self.get_day(date_object)
-        if day.date is None:
-            day = WorkingDay(date_object)
-            try:
-                self.working_days["{:%Y-%m-%d}".format(date_object)] = day
-            except TypeError:
-                raise TypeError("Cannot create day with date None")
-                pass
-
+        if date_object is None:
+            raise TypeError("Cannot create day with date None")
+
+        day_number = date_object.toordinal()
+        day = self.working_days.get(day_number)
+        if day is None:
+            day = self.working_days[day_number] = WorkingDay(date_object)
+            # Days are mostly created in ascending order, which appends
+            bisect.insort(self.day_numbers, day_number)
         return day
 
     def get_day(self, date_object=dt.date.today()):
@@ -192,8 +431,8 @@ class WorkTimeEmployee():
         Retrieves the WorkingDay instance for the specified date.
 
         If there is no WorkingDay for the specified date yet,
-        a None-Day will be passed. All its attributes are NoneTypes
-        and will not be stored.
+        EMPTY_DAY will be passed. All its attributes are NoneTypes
+        and it must not be changed.
 
         Parameters
         ----------
@@ -205,17 +444,73 @@ class WorkTimeEmployee():
         WorkingDay
             The WorkingDay instance for the specified date.
         """
-        if "{:%Y-%m-%d}".format(date_object) in self.working_days:
-            day = self.working_days.get("{:%Y-%m-%d}".format(date_object))
-        else:
-            day = WorkingDay(None)
-        return day
+        return self.working_days.get(date_object.toordinal(), EMPTY_DAY)
+
+    def days_between(self, start_date=None, end_date=None):
+        """
+        Iterates over the working days of a date range in date order.
+
+        Only the days in the range are touched, they are found by
+        bisection of the sorted day numbers. Days may be created while
+        iterating, they are not included.
+
+        Parameters
+        ----------
+        start_date : datetime.date, optional
+            First day of the range (default is the first working day).
+        end_date : datetime.date, optional
+            Last day of the range (default is the last working day).
+
+        Yields
+        ------
+        WorkingDay
+            The existing working days from start_date to end_date.
+        """
+        first = 0 if start_date is None else bisect.bisect_left(
+            self.day_numbers, start_date.toordinal())
+        last = len(self.day_numbers) if end_date is None else bisect.bisect_right(
+            self.day_numbers, end_date.toordinal())
+        working_days = self.working_days
+        for day_number in self.day_numbers[first:last]:
+            yield working_days[day_number]
+
+    def remove_day(self, date_object):
+        """
+        Removes the working day of a date, if it exists.
+
+        Parameters
+        ----------
+        date_object : datetime.date
+            The date of the day to remove.
+        """
+        day_number = date_object.toordinal()
+        if self.working_days.pop(day_number, None) is not None:
+            del self.day_numbers[bisect.bisect_left(self.day_numbers, day_number)]
+
+    def clear_days(self):
+        """
+        Removes all working days, e.g. before loading them again.
+        """
+        self.working_days = {}
+        self.day_numbers = []
 
-    def get_flex_time(self):
+    @instrumentation.timed("flex.get_flex_time")
+    def get_flex_time(self, start_date=None, end_date=None):
         """
         Calculates the flex time for the employee by summing the daily
         work hours and deducting the expected daily working hours in seconds.
 
+        Closed months inside the range count with their frozen totals. The
+        days of a closed month which is only partly inside the range are
+        loaded and counted one by one.
+
+        Parameters
+        ----------
+        start_date : datetime.date, optional
+            Only sum up the days from this date on (default is all days).
+        end_date : datetime.date, optional
+            Only sum up the days until this date (default is all days).
+
         Returns
         -------
         int
@@ -223,69 +518,711 @@ class WorkTimeEmployee():
         """
         flex_time = 0
 
-        for day in self.working_days.values():
-            if day.has_entry():
-                flex_time += float(day.get_work_time() or 0)
+        # Closed months count with their frozen totals
+        closed_months = self.closed_months
+        partial_months = set()
+        for month_number, totals in list(closed_months.items()):
+            if ((start_date is None or start_date <= totals['first_date'])
+                    and (end_date is None or totals['last_date'] <= end_date)):
+                flex_time += totals['flex_seconds']
+            elif ((start_date is None or start_date <= totals['last_date'])
+                    and (end_date is None or totals['first_date'] <= end_date)):
+                partial_months.add(month_number)
+                self.load_month(totals['first_date'].year, totals['first_date'].month)
+
+        if start_date is None and end_date is None:
+            days = self.working_days.values()
+        else:
+            days = self.days_between(start_date, end_date)
 
-# Deduct expected daily working hours if the day is not "sick" or "vacation"
-                if day.state not in ("sick", "vacation") and day.date.weekday() < 5:
-                    flex_time -= (gui_constants.DAILY_WORKING_HOURS * 3600.0)
+        for day in days:
+            month_number = day.date.year * 12 + day.date.month - 1
+            if month_number in closed_months and month_number not in partial_months:
+                continue
+            flex_time += day.get_flex_time(self.get_target(day.date))
         return flex_time
 
+    def get_month_totals(self, year, month):
+        """
+        Sums up the loaded days of a month, e.g. to close it.
+
+        Parameters
+        ----------
+        year : int
+            Year of the month.
+        month : int
+            The month (1-12).
+
+        Returns
+        -------
+        dict
+            'first_date' and 'last_date' of the month, 'work_seconds',
+            'target_seconds' and 'flex_seconds' and the amount of
+            'vacation_days' and 'sick_days'.
+        """
+        first_date = dt.date(year, month, 1)
+        totals = {'first_date': first_date,
+                  'last_date': dtf.add_months(self, first_date, 1) - dt.timedelta(days=1),
+                  'work_seconds': 0, 'target_seconds': 0, 'flex_seconds': 0,
+                  'vacation_days': 0, 'sick_days': 0}
+        for day in self.days_between(first_date, totals['last_date']):
+            if not day.has_entry():
+                continue
+            target = self.get_target(day.date)
+            totals['work_seconds'] += day.get_work_time() or 0
+            if day.state in ("sick", "vacation"):
+                totals[day.state + '_days'] += 1
+            else:
+                totals['target_seconds'] += target
+            totals['flex_seconds'] += day.get_flex_time(target)
+        return totals
+
+    def set_closed_months(self, rows):
+        """
+        Replaces the closed months.
+
+        Parameters
+        ----------
+        rows : list
+            Tuples as returned by DatabaseFunctions.load_closed_months().
+        """
+        self.closed_months = {}
+        for first_day, last_day, work, target, flex, vacation_days, sick_days in rows:
+            first_date = dt.date.fromordinal(first_day)
+            self.closed_months[first_date.year * 12 + first_date.month - 1] = {
+                'first_date': first_date, 'last_date': dt.date.fromordinal(last_day),
+                'work_seconds': work, 'target_seconds': target, 'flex_seconds': flex,
+                'vacation_days': vacation_days, 'sick_days': sick_days}
+
+    def is_closed(self, date_object):
+        """
+        Checks whether the month of a date is closed.
+
+        Parameters
+        ----------
+        date_object : datetime.date
+            The date to check.
+
+        Returns
+        -------
+        bool
+            True if the days of the month can't be changed.
+        """
+        return date_object.year * 12 + date_object.month - 1 in self.closed_months
+
+    def load_month(self, year, month, db=None):
+        """
+        Loads the days of a closed month for display.
+
+        Closed months are skipped when the timesheet is loaded. Does
+        nothing if the month is open or was loaded already.
+
+        Parameters
+        ----------
+        year : int
+            Year of the month.
+        month : int
+            The month (1-12).
+        db : DatabaseFunctions, optional
+            An open connection to use.
+        """
+        month_number = year * 12 + month - 1
+        if month_number not in self.closed_months or month_number in self.loaded_months:
+            return
+        totals = self.closed_months[month_number]
+        if gui_constants.USE_SERVICE:
+            self.refresh_month_from_service(year, month)
+            self.loaded_months.add(month_number)
+            return
+        self.read_from_database(["{:%Y-%m-%d}".format(dt.date.fromordinal(day_number))
+                                 for day_number in range(totals['first_date'].toordinal(),
+                                                         totals['last_date'].toordinal() + 1)], db)
+        self.loaded_months.add(month_number)
+
+    def get_target(self, date_object):
+        """
+        Returns the target working time of a day in seconds.
+
+        Parameters
+        ----------
+        date_object : datetime.date
+            The day.
+
+        Returns
+        -------
+        int
+            Hours of the working-time model valid on that weekday,
+            0 on public holidays of the employee's region.
+        """
+        return self.schedule.get_target(date_object, self.region)
+
+    def set_working_time_models(self, models):
+        """
+        Replaces the working-time models, which discards the cached targets.
+
+        Parameters
+        ----------
+        models : list
+            WorkingTimeModel instances.
+        """
+        self.schedule = TargetSchedule(models)
+
+    def book_days(self, start_date, end_date, state):
+        """
+        Sets the state of all working days in a date range at once.
+
+        Days without target (weekends, public holidays and days off of the
+        working-time model) are skipped. Booking "default" cancels an
+        absence. The days are only changed in memory and written by the next
+        save_working_days(). The vacation day counters are not changed, the
+        bookings which were saved are passed to use_booked_vacation_days().
+
+        Parameters
+        ----------
+        start_date : datetime.date
+            First day of the range.
+        end_date : datetime.date
+            Last day of the range.
+        state : str
+            "vacation", "sick" or "default".
+
+        Returns
+        -------
+        list
+            Tuples of the changed WorkingDay, its state before and the
+            resulting change of the flex time in seconds.
+
+        Raises
+        ------
+        ValueError
+            If the state or the range is invalid or not enough
+            vacation days are left. Nothing is changed then.
+        """
+        if state not in ("vacation", "sick", "default"):
+            raise ValueError("Unknown state '{}'".format(state))
+        if end_date < start_date:
+            raise ValueError("The end date must not be before the start date.")
+
+        dates = [start_date + dt.timedelta(days=offset)
+                 for offset in range((end_date - start_date).days + 1)]
+        dates = [date_object for date_object in dates
+                 if self.get_target(date_object) > 0
+                 and self.get_day(date_object).state != state]
+        for date_object in dates:
+            if self.is_closed(date_object):
+                raise ValueError("The month of {:%Y-%m-%d} is closed.".format(date_object))
+
+        # Vacation days needed, negative if vacation is cancelled
+        vacation_days = sum((state == "vacation") - (self.get_day(date_object).state == "vacation")
+                            for date_object in dates)
+        if vacation_days > self.amount_vacation_days + self.amount_old_vacation_days:
+            raise ValueError("Not enough vacation days left: {needed} needed, {left} left.".format(
+                needed=vacation_days,
+                left=self.amount_vacation_days + self.amount_old_vacation_days))
+
+        bookings = []
+        for date_object in dates:
+            day = self.create_day(date_object)
+            previous_state = day.state
+            flex_time = -day.get_flex_time(self.get_target(date_object))
+            day.state = state
+            flex_time += day.get_flex_time(self.get_target(date_object))
+            bookings.append((day, previous_state, flex_time))
+        return bookings
+
+    def use_booked_vacation_days(self, bookings):
+        """
+        Takes the vacation days of saved bookings, or gives them back for
+        cancelled vacation, see use_vacation_days().
+
+        Parameters
+        ----------
+        bookings : list
+            The bookings returned by book_days() whose days were saved.
+        """
+        self.use_vacation_days(sum((day.state == "vacation") - (previous_state == "vacation")
+                                   for day, previous_state, _ in bookings))
+
+    def punch(self, kind, now=None, db=None):
+        """
+        Starts or ends the workday ("work") or a break ("break") of today.
+
+        Every punch opens or closes an interval in the punches table right
+        away, so a running shift or break survives a crash or logout. The
+        totals of the day are updated incrementally: ending the workday ends
+        a running break, working again after the end of the workday counts
+        the time in between as break time (split shifts). A workday started
+        before midnight is continued after midnight, see get_punch_day().
+
+        Parameters
+        ----------
+        kind : str
+            "work" or "break".
+        now : datetime.datetime, optional
+            Time of the punch (default is now).
+        db : DatabaseFunctions, optional
+            An open connection to store the interval with. By default
+            gui_constants.USE_SERVICE and USE_DATABASE decide.
+
+        Returns
+        -------
+        WorkingDay
+            Today.
+
+        Raises
+        ------
+        ValueError
+            If the punch is not possible, e.g. a break before the workday.
+        """
+        if gui_constants.USE_SERVICE and db is None:
+            return self.punch_service(kind)
+
+        now = (now or dt.datetime.now()).replace(microsecond=0)
+        today = self.get_punch_day(now)
+        if self.is_closed(today.date):
+            raise ValueError("The month of {:%Y-%m-%d} is closed.".format(today.date))
+        current_time = now.time()
+        day_offset = (now.date() - today.date).days
+        intervals = []
+
+        if kind == "work":
+            if today.start_time is None:
+                today.start_time = current_time
+                intervals.append(("start", "work"))
+            elif day_offset == 0 and today.start_time > current_time:
+                raise ValueError("Start time is in the future")
+            elif today.end_time is None:
+                if self.on_break is not None:
+                    self.end_break(today, current_time)
+                    intervals.append(("end", "break"))
+                today.end_time = current_time
+                today.end_day_offset = day_offset
+                intervals.append(("end", "work"))
+            else:
+                today.break_time = ((today.break_time or 0)
+                                    + dtf.get_time_difference(self, today.end_time, current_time,
+                                                              day_offset - today.get_end_day_offset()))
+                today.end_time = None
+                today.end_day_offset = 0
+                intervals.append(("start", "work"))
+        elif kind == "break":
+            if today.start_time is None:
+                raise ValueError("You can't take a break before you start to work.")
+            if today.end_time is not None:
+                raise ValueError("You can't take a break after you've finished work.")
+            if self.on_break is None:
+                self.on_break = current_time
+                intervals.append(("start", "break"))
+            else:
+                self.end_break(today, current_time)
+                intervals.append(("end", "break"))
+        else:
+            raise ValueError("Unknown punch kind '{}'".format(kind))
+
+        if db is not None or gui_constants.USE_DATABASE:
+            self.store_intervals(today, now, intervals, db)
+        return today
+
+    def get_punch_day(self, now):
+        """
+        Returns the day a punch at now belongs to.
+
+        Parameters
+        ----------
+        now : datetime.datetime
+            Time of the punch.
+
+        Returns
+        -------
+        WorkingDay
+            Yesterday if its workday is still running and started at most
+            gui_constants.MAX_SHIFT_HOURS ago (overnight shift), otherwise today.
+        """
+        today = self.get_day(now.date())
+        yesterday = self.get_day(now.date() - dt.timedelta(days=1))
+        if (today.start_time is None and yesterday.start_time is not None
+                and yesterday.end_time is None
+                and now - dt.datetime.combine(yesterday.date, yesterday.start_time)
+                <= dt.timedelta(hours=gui_constants.MAX_SHIFT_HOURS)):
+            return yesterday
+        return self.create_day(now.date())
+
+    def end_break(self, day, current_time):
+        """Adds the running break to the break time of a day."""
+        break_time = dtf.get_time_difference(self, self.on_break, current_time)
+        day.break_time = (day.break_time or 0) + break_time
+        self.on_break = None
+
+    def store_intervals(self, day, now, intervals, db=None):
+        """
+        Opens and closes punch intervals in the database in one transaction.
+
+        Parameters
+        ----------
+        day : WorkingDay
+            The day the intervals belong to.
+        now : datetime.datetime
+            Start or end of the intervals.
+        intervals : list
+            Tuples of "start" or "end" and the kind of the interval.
+        db : DatabaseFunctions, optional
+            An open connection to use. By default a new connection
+            is opened and closed again.
+        """
+        # Deferred, sqlite3 is not needed in csv-only mode
+        from database_functions import DatabaseFunctions, run_with_retry
+
+        def write_intervals():
+            with db.transaction():
+                for action, kind in intervals:
+                    if action == "start":
+                        db.start_interval(self.employee_id, date_string, kind, now)
+                    else:
+                        db.end_interval(self.employee_id, date_string, kind, now)
+
+        date_string = "{:%Y-%m-%d}".format(day.date)
+        is_own_connection = db is None
+        if is_own_connection:
+            db = DatabaseFunctions()
+            db.connect_to_database()
+        try:
+            run_with_retry(write_intervals)
+        finally:
+            if is_own_connection:
+                db.disconnect_from_database()
+
+    def punch_service(self, kind):
+        """
+        Punches through the local timesheet service, which stores the interval.
+
+        See punch().
+        """
+        from timesheet_client import get_client, ServiceError
+
+        try:
+            data = get_client().punch(self.employee_id, kind)
+        except ServiceError as e:
+            if e.status == 400:
+                raise ValueError(e.message)
+            if e.status in (None, 409):
+                # The service may have stored the punch before the connection failed,
+                # or today was changed by someone else
+                client = get_client()
+                client.invalidate(self.employee_id)
+                try:
+                    self.on_break = dtf.convert_string_to_time(
+                        self, client.get_punch_state(self.employee_id)['on_break'])
+                except ServiceError as error:
+                    logger.error("Failed to reload the punch state of '%s': %s",
+                                 self.employee_id, error)
+                raise ValueError("The punch was not confirmed by the service, "
+                                 "please check the timesheet. " + e.message)
+            raise
+        today = self.create_day(dtf.convert_string_to_date(self, data['day']['date']))
+        today.update_from_dict(data['day'])
+        today.mark_stored(data['day']['version'])
+        self.on_break = dtf.convert_string_to_time(self, data['on_break'])
+        return today
+
+    def restore_punches(self, intervals):
+        """
+        Restores the running break of the current workday from the punches table.
+
+        If the workday was punched but not saved, e.g. after a crash, its
+        start, end and break time are rebuilt from the intervals as well.
+
+        Parameters
+        ----------
+        intervals : list
+            Tuples of kind, start and end ('%Y-%m-%d %H:%M:%S', None while
+            running) of the intervals of get_punch_day() ordered by start.
+        """
+        self.on_break = None
+        for kind, starttime, endtime in intervals:
+            if kind == "break" and endtime is None:
+                self.on_break = dt.datetime.fromisoformat(starttime).time()
+
+        today = self.get_punch_day(dt.datetime.now())
+        work_intervals = [(dt.datetime.fromisoformat(starttime),
+                           dt.datetime.fromisoformat(endtime) if endtime else None)
+                          for kind, starttime, endtime in intervals if kind == "work"]
+        if today.start_time is not None or not work_intervals:
+            return
+        today.start_time = work_intervals[0][0].time()
+        today.end_time = work_intervals[-1][1].time() if work_intervals[-1][1] else None
+        today.end_day_offset = (work_intervals[-1][1].date() - today.date).days if today.end_time else 0
+        break_time = sum((dt.datetime.fromisoformat(endtime) - dt.datetime.fromisoformat(starttime))
+                         .total_seconds() for kind, starttime, endtime in intervals
+                         if kind == "break" and endtime is not None)
+        # Time between split shifts counts as break
+        break_time += sum((start - previous_end).total_seconds() for (_, previous_end), (start, _)
+                          in zip(work_intervals, work_intervals[1:]) if previous_end is not None)
+        today.break_time = break_time or None
+
+    def use_vacation_days(self, amount):
+        """
+        Takes vacation days, old vacation days first.
+
+        Parameters
+        ----------
+        amount : int
+            Amount of days to take. Negative amounts are given
+            back to the vacation days of the current year.
+        """
+        from_old_days = min(max(amount, 0), self.amount_old_vacation_days)
+        self.amount_old_vacation_days -= from_old_days
+        self.amount_vacation_days -= amount - from_old_days
+
+    def get_counters(self):
+        """
+        Returns the vacation day counters and the region stored in the employees table.
+
+        Returns
+        -------
+        tuple
+            Vacation days, old vacation days and holiday region.
+        """
+        return (self.amount_vacation_days, self.amount_old_vacation_days, self.region)
+
+    def counters_modified(self):
+        """Checks wether the vacation day counters changed since they were stored."""
+        return self.get_counters() != self.stored_counters
+
+    def mark_counters_stored(self, version):
+        """
+        Remembers the current vacation day counters as stored in the database.
+
+        Parameters
+        ----------
+        version : int
+            Version of the stored employee record.
+        """
+        self.version = version
+        self.stored_counters = self.get_counters()
+
     def load_working_days(self):
         """
         Saves the working_days dictionary to a CSV file with columns 'Date',
         'Start Time', 'End Time', 'Break Time', and 'State'.
         """
-        if gui_constants.USE_DATABASE:
+        if gui_constants.USE_SERVICE:
+            self.read_from_service()
+        elif gui_constants.USE_DATABASE:
             self.read_from_database()
         if gui_constants.IMPORT_FROM_CSV:
             self.read_from_csv()
+        self.is_loaded = True
 
-    def read_from_database(self):
+    def unload_working_days(self):
         """
-        Reads data from the database.
+        Drops the loaded working days, e.g. of an employee who was preloaded
+        but did not log in. They are loaded again by load_working_days().
         """
-        print("Loading '{employee}' from database...".format(employee=self.employee_id))
+        self.clear_days()
+        self.schedule = TargetSchedule()
+        self.closed_months = {}
+        self.loaded_months = set()
+        self.on_break = None
+        self.is_loaded = False
 
+    @instrumentation.timed("storage.read_from_database")
+    def read_from_database(self, date_strings=None, db=None):
+        """
+        Reads data from the database.
+
+        Parameters
+        ----------
+        date_strings : list, optional
+            Only read the days with these dates ('%Y-%m-%d').
+            Reads all days by default.
+        db : DatabaseFunctions, optional
+            An open connection to use. By default a new connection
+            is opened and closed again.
+        """
+        # Deferred, sqlite3 is not needed in csv-only mode
+        import sqlite3
+        from database_functions import DatabaseFunctions
+        import timesheet_snapshot
+
+        start = time.perf_counter()
+        source = "database"
+        is_own_connection = db is None
         try:
             # Create connection to the database
-            db = DatabaseFunctions()
-            db.connect_to_database()
-
-            # Query to get all working days from the timesheet table for the employee
-            db.c.execute('''SELECT date, starttime, endtime, breaktime, state FROM timesheet
-                            WHERE employee_id = ?''', (self.employee_id,))
-
-            # Fetch all results
-            rows = db.c.fetchall()
+            if is_own_connection:
+                db = DatabaseFunctions()
+                db.connect_to_database()
+
+            # The days of closed months are only loaded on demand, see load_month()
+            if date_strings is None:
+                self.set_closed_months(db.load_closed_months(self.employee_id))
+                self.loaded_months = set()
+
+            # Get the working days of the employee as numbers,
+            # from the snapshot if nothing changed since it was written
+            use_snapshot = gui_constants.USE_SNAPSHOTS and date_strings is None
+            rows = None
+            if use_snapshot:
+                with instrumentation.timer("snapshot.load"):
+                    rows = timesheet_snapshot.load(
+                        self.employee_id, db.load_timesheet_counter(self.employee_id))
+                instrumentation.count("snapshot.hits" if rows is not None else "snapshot.misses")
+                if rows is not None:
+                    source = "snapshot"
+            if rows is None:
+                with instrumentation.timer("db.query"):
+                    rows = db.load_days(self.employee_id, date_strings,
+                                        exclude_closed=date_strings is None)
+                if use_snapshot:
+                    timesheet_snapshot.rebuild_in_background(self.employee_id)
+
+            # Contracts only change with a full reload
+            if date_strings is None:
+                self.set_working_time_models([WorkingTimeModel.from_row(row) for row in
+                                              db.load_working_time_models(self.employee_id)])
+            instrumentation.count("db.rows_read", len(rows))
 
             # Populate the working_days dictionary
-            for row in rows:
-                date_object = dtf.convert_string_to_date(
-                    self, row[0])  # Convert date string to datetime
-                day = self.create_day(date_object)
-
-                # Handle start_time and end_time by extracting time from datetime string
-                day.start_time = dtf.convert_string_to_time_from_datetime(
-                    self, row[1]) if row[1] else None
-                day.end_time = dtf.convert_string_to_time_from_datetime(
-                    self, row[2]) if row[2] else None
-
-                # Handle break_time
-                day.break_time = float(row[3]) if row[3] else None
+            with instrumentation.timer("parse.rows"):
+                self.__populate_from_rows(rows)
 
-                # Handle state
-                day.state = row[4]
+            # Running breaks only change with a full reload
+            if date_strings is None:
+                punch_day = self.get_punch_day(dt.datetime.now())
+                self.restore_punches(db.load_intervals(
+                    self.employee_id, "{:%Y-%m-%d}".format(punch_day.date)))
+            logger.debug("Loaded %d days of '%s' from the %s in %.3f s.", len(rows),
+                         self.employee_id, source, time.perf_counter() - start)
 
         # Catch possible errors
         except sqlite3.Error as e:
-            print(f"Error loading working days from the database: {e}")
+            logger.error("Failed to load the working days of '%s' from the database: %s",
+                         self.employee_id, e)
 
         # Ensure database connection is closed even in case of error
         finally:
-            db.disconnect_from_database()
+            if is_own_connection:
+                db.disconnect_from_database()
+
+    def __populate_from_rows(self, rows):
+        """
+        Create working days from rows returned by DatabaseFunctions.load_days().
+
+        Parameters
+        ----------
+        rows : list
+            Tuples of day number, start, end, break and work time in seconds,
+            state code and version.
+        """
+        from database_functions import STATES
+
+        for day_number, start, end, break_time, _, state, version in rows:
+            day = self.create_day(dt.date.fromordinal(day_number))
+
+            # Start and end are seconds since midnight of the date
+            day.start_time = dtf.seconds_to_time(self, start) if start is not None else None
+            day.end_time = None
+            day.end_day_offset = 0
+            if end is not None:
+                # Shifts crossing midnight end more than a day after midnight
+                day.end_day_offset, end = divmod(end, 86400)
+                day.end_time = dtf.seconds_to_time(self, end)
+
+            day.break_time = break_time if break_time else None
+            day.state = STATES[state]
+
+            # Remember the version for optimistic locking
+            day.mark_stored(version)
 
+    def reload_days(self, date_strings):
+        """
+        Discards local changes of some days and reads them from the database again.
+
+        Parameters
+        ----------
+        date_strings : list
+            Dates ('%Y-%m-%d') of the days to reload.
+        """
+        for date_string in date_strings:
+            self.remove_day(dtf.convert_string_to_date(self, date_string))
+        if gui_constants.USE_SERVICE:
+            self.read_from_service()
+        else:
+            self.read_from_database(date_strings)
+
+    @instrumentation.timed("storage.read_from_service")
+    def read_from_service(self):
+        """
+        Reads data from the local timesheet service.
+        """
+        from timesheet_client import get_client
+
+        client = get_client()
+        self.set_closed_months(client.get_closed_months(self.employee_id))
+        self.loaded_months = set()
+        for data in client.get_days(self.employee_id):
+            day = self.create_day(dtf.convert_string_to_date(self, data['date']))
+            day.update_from_dict(data)
+            day.mark_stored(data['version'])
+        self.set_working_time_models([WorkingTimeModel.from_dict(data) for data in
+                                      client.get_working_time_models(self.employee_id)])
+        self.on_break = dtf.convert_string_to_time(
+            self, client.get_punch_state(self.employee_id)['on_break'])
+
+    @instrumentation.timed("storage.refresh_month_from_service")
+    def refresh_month_from_service(self, year, month):
+        """
+        Revalidates one month with the local timesheet service.
+
+        If the month did not change since it was fetched, this costs a single
+        "not modified" answer. Days with unsaved local changes are kept.
+
+        Parameters
+        ----------
+        year : int
+            Year of the month.
+        month : int
+            The month (1-12).
+
+        Returns
+        -------
+        list
+            Dates ('%Y-%m-%d') of the days which were changed.
+        """
+        from timesheet_client import get_client, ServiceError
+
+        try:
+            days, is_changed = get_client().load_month(self.employee_id, year, month)
+        except ServiceError as e:
+            logger.error("Failed to refresh the working days of '%s' from the service: %s",
+                         self.employee_id, e)
+            return []
+        if not is_changed:
+            return []
+
+        changed_dates = []
+        served_dates = set()
+        for data in days:
+            served_dates.add(data['date'])
+            day = self.create_day(dtf.convert_string_to_date(self, data['date']))
+            if not day.is_modified() and day.version != data['version']:
+                day.update_from_dict(data)
+                day.mark_stored(data['version'])
+                changed_dates.append(data['date'])
+
+        # Days deleted by another client
+        first_date = dt.date(year, month, 1)
+        for day in self.days_between(first_date, dtf.add_months(self, first_date, 1) - dt.timedelta(days=1)):
+            date_string = "{:%Y-%m-%d}".format(day.date)
+            if (date_string not in served_dates
+                    and day.version is not None and not day.is_modified()):
+                day.update_from_dict({'start_time': None, 'end_time': None,
+                                      'break_time': None, 'state': 'default'})
+                day.mark_stored(None)
+                changed_dates.append(date_string)
+        return changed_dates
+
+    @instrumentation.timed("storage.read_from_csv")
     def read_from_csv(self):
         """
         Reads data from a csv.
@@ -303,82 +1240,205 @@ class WorkTimeEmployee():
                         self, row['Start Time']) if row['Start Time'] else None
                     day.end_time = dtf.convert_string_to_time(
                         self, row['End Time']) if row['End Time'] else None
+                    # Missing in older files
+                    day.end_day_offset = int(row.get('End Day Offset') or 0)
                     day.break_time = float(
                         row['Break Time']) if row['Break Time'] else None
                     day.state = row['State']
 
         except Exception as e:
-            print("Error", f"Failed to load timesheet: {e}")
+            logger.error("Failed to load the timesheet of '%s': %s", self.employee_id, e)
 
     def save_working_days(self):
         """
         Saves the working_days dictionary to a CSV file with columns 'Date',
         'Start Time', 'End Time', 'Break Time', and 'State'.
         """
-        if gui_constants.USE_DATABASE:
+        if gui_constants.USE_SERVICE:
+            self.save_to_service()
+        elif gui_constants.USE_DATABASE:
             self.save_to_database()
         if gui_constants.WRITE_TO_CSVS:
             self.save_to_csv()
 
-    def save_to_database(self):
+    @instrumentation.timed("storage.save_to_database")
+    def save_to_database(self, db=None):
         """
         Save data to the database.
-        """
-        print("Saving '{employee}' to database...".format(employee=self.employee_id))
 
+        Only days changed since they were read are written. A day which was
+        changed by another instance in the meantime is not overwritten.
+
+        Parameters
+        ----------
+        db : DatabaseFunctions, optional
+            An open connection to use. By default a new connection
+            is opened and closed again.
+
+        Raises
+        ------
+        ConcurrentModificationError
+            If days were changed by another instance. All other days are
+            saved nevertheless.
+        sqlite3.Error
+            If the database rejected the days, e.g. of a closed month, and
+            db was passed. Nothing is saved then. With a connection of its
+            own the error is logged and the days stay modified.
+        """
+        # Deferred, sqlite3 is not needed in csv-only mode
+        import sqlite3
+        from database_functions import DatabaseFunctions, run_with_retry
+
+        start = time.perf_counter()
+        written = 0
+        conflicts = []
+        is_own_connection = db is None
         try:
             # Create connection to the
             # Important: use instance -> db=...
-            db = DatabaseFunctions()
-            db.connect_to_database()
+            if is_own_connection:
+                db = DatabaseFunctions()
+                db.connect_to_database()
+
+            # Save data to database, retried as a whole if the database is busy
+            written = run_with_retry(self.__write_modified_days, db, conflicts)
+            if written and gui_constants.USE_SNAPSHOTS:
+                import timesheet_snapshot
+                timesheet_snapshot.rebuild_in_background(self.employee_id)
+
+        # Catch possible errors
+        except sqlite3.Error as e:
+            logger.error("Failed to save the working days of '%s' to the database: %s",
+                         self.employee_id, e)
+            # The owner of the connection answers for the failed save
+            if not is_own_connection:
+                raise
+
+        # Ensure database connection is closed even in case of error
+        finally:
+            if is_own_connection:
+                db.disconnect_from_database()
+
+        # One line per save instead of one per day
+        if written or conflicts:
+            logger.info("Saved %d days of '%s' in %.3f s, %d conflicts.", written,
+                        self.employee_id, time.perf_counter() - start, len(conflicts))
+
+        if conflicts:
+            raise ConcurrentModificationError(conflicts)
+
+    def __write_modified_days(self, db, conflicts):
+        """
+        Write all modified days to the database in one transaction.
+
+        Parameters
+        ----------
+        db : DatabaseFunctions
+            The connected database.
+        conflicts : list
+            Is filled with the dates of days changed by another instance.
+
+        Returns
+        -------
+        int
+            Amount of written or deleted days.
+        """
+        conflicts.clear()
+        stored_days = []
+        with db.transaction():
+            for day in self.working_days.values():
+                # Ensure breaktime is valid, set to None if less than 60 seconds.
+                if day.break_time is not None and day.break_time < 60:
+                    day.break_time = None
+
+                if not day.is_modified():
+                    continue
+                date_string = "{:%Y-%m-%d}".format(day.date)
 
-            # Save data to database
-            for date_string, day in self.working_days.items():
                 # Ensure that the day has data before saving
                 if day.has_entry():
-                    # Ensure breaktime is valid, set to None if less than 60 seconds.
-                    if day.break_time is not None and day.break_time < 60:
-                        day.break_time = None
-
                     # Insert or update the database
-                    db.insert_into_database(
+                    version = db.save_day(
                         self.employee_id,
                         date_string,
                         day.start_time,
                         day.end_time,
                         day.break_time,
-                        day.state
+                        day.state,
+                        day.version,
+                        day.get_end_day_offset()
                     )
-                else:
-                    db.delete_from_database(self.employee_id, date_string)
+                    if version is None:
+                        conflicts.append(date_string)
+                    else:
+                        stored_days.append((day, version))
+                        instrumentation.count("db.rows_written")
+                elif day.version is not None:
+                    if db.delete_day(self.employee_id, date_string, day.version):
+                        stored_days.append((day, None))
+                    else:
+                        conflicts.append(date_string)
+
+        # Only remember the new versions once the transaction is committed
+        for day, version in stored_days:
+            day.mark_stored(version)
+        return len(stored_days)
+
+    @instrumentation.timed("storage.save_to_service")
+    def save_to_service(self):
+        """
+        Save data to the local timesheet service.
 
-        # Catch possible errors
-        except sqlite3.Error as e:
-            print(f"Error saving working days to the database: {e}")
+        All modified days are sent in one batch.
 
-        # Ensure database connection is closed even in case of error
-        finally:
-            db.disconnect_from_database()
+        Raises
+        ------
+        ConcurrentModificationError
+            If days were changed by another client in the meantime.
+        """
+        from timesheet_client import get_client
+
+        client = get_client()
+        modified_days = {}
+        for day in self.working_days.values():
+            if day.break_time is not None and day.break_time < 60:
+                day.break_time = None
+            if day.is_modified() and (day.has_entry() or day.version is not None):
+                modified_days["{:%Y-%m-%d}".format(day.date)] = day
+                client.upsert_day(self.employee_id, day.to_dict())
+
+        versions, conflicts = client.flush()
+        for date_string, version in versions.items():
+            if date_string in modified_days:
+                modified_days[date_string].mark_stored(version)
+
+        if conflicts:
+            raise ConcurrentModificationError(conflicts)
 
+    @instrumentation.timed("storage.save_to_csv")
     def save_to_csv(self):
         """
         Save data to the database.
         """
+        # The file holds all days, including those of closed months
+        for month_number in sorted(self.closed_months):
+            self.load_month(month_number // 12, month_number % 12 + 1)
         with open(self.file_path, 'w', newline='') as csvfile:
 
             fieldnames = ['Date', 'Start Time',
-                          'End Time', 'Break Time', 'State']
+                          'End Time', 'End Day Offset', 'Break Time', 'State']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
 
             writer.writeheader()
-            for date_string, day in self.working_days.items():
+            for day in self.days_between():
                 if day.has_entry():
                     if day.break_time is not None and day.break_time < 60:
                         day.break_time = None
                     writer.writerow({
-                        'Date': date_string,
+                        'Date': "{:%Y-%m-%d}".format(day.date),
                         'Start Time': dtf.time_object_to_string(self, day.start_time),
                         'End Time': dtf.time_object_to_string(self, day.end_time),
+                        'End Day Offset': day.get_end_day_offset(),
                         'Break Time': day.break_time,
                         'State': day.state
                     })
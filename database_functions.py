@@ -8,30 +8,141 @@ Created on Thu Nov  7 08:34:07 2024
 
 import sqlite3
 import datetime
+import contextlib
+import logging
+import os
+import random
+import time
 
 from datetime_functions import DatetimeFunctions
 import gui_constants
 
+# Layouts of the timesheet table, the layout of a database file is kept in PRAGMA user_version.
+# LEGACY_LAYOUT: "timesheet" stores dates, start and end times and states as text.
+# NUMERIC_LAYOUT: "timesheet_v2" stores integers only, see create_numeric_timesheet().
+LEGACY_LAYOUT = 0
+NUMERIC_LAYOUT = 2
+
+# PRAGMA user_version of a numeric database whose tables, indexes and triggers are complete,
+# always at least NUMERIC_LAYOUT. Increase it whenever connect_to_database() creates a new
+# table, column, index or trigger, so existing databases are set up again once.
+SCHEMA_VERSION = 3
+
+# States of a day, the index is the state code stored in the numeric layout
+STATES = ('default', 'sick', 'vacation')
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+# Fields synced between a replica and the central database, see timesheet_replica.py.
+# Every field of every row carries the time of its last change in field_clock.
+SYNC_FIELDS = {
+    'timesheet': ('start_seconds', 'end_seconds', 'break_seconds', 'state'),
+    'employees': ('vacation_days', 'old_vacation_days', 'entitlement', 'rollover_year', 'region'),
+}
+
+# The current time in seconds since the epoch, with milliseconds
+SQL_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+# Tables maintained in the central database only, copied to replicas as they are
+REFERENCE_TABLES = ('working_time_models', 'closed_months')
+
+# Day number, start, end, break and work seconds and state code of a legacy row {row},
+# the columns of the numeric layout between employee_id and version.
+# 1721424.5 is the julian day of date.fromordinal(0).
+LEGACY_TO_NUMERIC = '''
+    CAST(julianday({row}.date) - 1721424.5 AS INTEGER),
+    strftime('%s', {row}.starttime) - strftime('%s', {row}.date),
+    strftime('%s', {row}.endtime) - strftime('%s', {row}.date),
+    CAST(ROUND({row}.breaktime) AS INTEGER),
+    strftime('%s', {row}.endtime) - strftime('%s', {row}.starttime)
+        - CAST(ROUND(COALESCE({row}.breaktime, 0)) AS INTEGER),
+    CASE {row}.state WHEN 'sick' THEN 1 WHEN 'vacation' THEN 2 ELSE 0 END'''
+
+# Archives attached to one connection at most, SQLite allows 10 attached databases by default
+MAX_ATTACHED_ARCHIVES = 8
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+
+def run_with_retry(function, *args, **kwargs):
+    """
+    Call a function and retry it while the database is locked by another process.
+
+    Waits with exponential backoff and random jitter between the attempts.
+    After gui_constants.DATABASE_RETRIES failed attempts the error is raised.
+    """
+    for attempt in range(gui_constants.DATABASE_RETRIES + 1):
+        try:
+            return function(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            is_busy = 'locked' in str(e) or 'busy' in str(e)
+            if not is_busy or attempt == gui_constants.DATABASE_RETRIES:
+                raise
+            # Backoff: 1x, 2x, 4x, ... the base delay, randomized to avoid lockstep retries
+            delay = gui_constants.DATABASE_BACKOFF * 2 ** attempt
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
 # ------------------------------------------------------------------------------
 
 
 class DatabaseFunctions:
 
     # Create Connection to database
-    def connect_to_database(self):
+    def connect_to_database(self, database_path=None):
         # Create or connect to a SQLite database
         # (the database file will be created if it doesn't exist yet)
-        self.conn = sqlite3.connect(gui_constants.DATABASE_PATH)
+        # - database_path: The database file (default: gui_constants.DATABASE_PATH).
+        # Wait up to DATABASE_TIMEOUT seconds if another process holds a lock.
+        # Autocommit mode: a statement failing with 'database is locked' must not
+        # leave an implicit transaction open, which would block the other processes.
+        self.database_path = database_path or gui_constants.DATABASE_PATH
+        self.conn = sqlite3.connect(self.database_path,
+                                    timeout=gui_constants.DATABASE_TIMEOUT,
+                                    isolation_level=None)
         # 'timesheet.db' is the file name
         # Create a cursor object to interact with the database
         self.c = self.conn.cursor()
 
+        # Outside of transaction() every change is committed immediately
+        self.in_transaction = False
+
         # conn and c should be instance attributes of the class, so it can be used across different methods
         # -> self.conn / self.c
 
-        # Create a table (if it doesn't already exist)
-        with self.conn:
-            # with: Automatically commits/rollbacks transactions
+        # The tables, indexes and triggers are only created once per database file
+        # and whenever SCHEMA_VERSION was increased, see get_schema_version()
+        if self.get_schema_version() < SCHEMA_VERSION:
+            with self.conn:
+                # with: Automatically commits/rollbacks transactions
+                self.__create_schema()
+
+        # Years whose public holidays are in the temporary public_holidays table
+        self.holiday_years = set()
+
+        # Years mapped to the schema name of their attached archive
+        self.attached_archives = {}
+
+    # ------------------------------------------------------------------------------
+
+    def __create_schema(self):
+        # Creates all tables, indexes and triggers which don't exist yet and adds missing columns.
+        # A database of the numeric layout records SCHEMA_VERSION afterwards, so further
+        # connections skip this. Legacy databases are set up on every connection until they
+        # are migrated, their PRAGMA user_version must stay LEGACY_LAYOUT for older instances.
+
+        # New database files get the numeric layout, existing ones keep the legacy
+        # layout until they are migrated with timesheet_migration.py
+        self.c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'timesheet'")
+        if self.c.fetchone() is None and self.get_layout() == LEGACY_LAYOUT:
+            # Free pages can be released in small steps, see database_maintenance.py.
+            # Only possible before anything is written to the file.
+            self.c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.c.execute(f'PRAGMA user_version = {NUMERIC_LAYOUT}')
+
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            self.create_numeric_timesheet()
+        else:
             self.c.execute('''
                 CREATE TABLE IF NOT EXISTS timesheet (
                     employee_id TEXT,
@@ -40,97 +151,1204 @@ class DatabaseFunctions:
                     endtime DATETIME,
                     workhours REAL,
                     breaktime REAL,
-                    state TEXT
+                    state TEXT,
+                    version INTEGER NOT NULL DEFAULT 1
                 )
             ''')
+            # Tables created by older versions lack the version column for optimistic locking
+            self.__add_column_if_missing('timesheet', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+            # Lookups and aggregates always filter by employee and date
+            self.c.execute('''
+                CREATE INDEX IF NOT EXISTS timesheet_employee_date ON timesheet (employee_id, date)
+            ''')
+            self.__create_counter_triggers('timesheet')
+
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS employees (
+                employee_id TEXT PRIMARY KEY,
+                vacation_days INTEGER,
+                old_vacation_days INTEGER,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+        ''')
+
+        # Tables created by older versions lack the version column for optimistic locking
+        self.__add_column_if_missing('employees', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+        # Yearly vacation entitlement and the last year the vacation days were rolled over into
+        self.__add_column_if_missing('employees', 'entitlement',
+                                     f'INTEGER NOT NULL DEFAULT {int(gui_constants.VACATION_DAYS_PER_YEAR)}')
+        self.__add_column_if_missing('employees', 'rollover_year', 'INTEGER')
+
+        # Holiday region of gui_constants.REGIONAL_HOLIDAYS, NULL for the default region
+        self.__add_column_if_missing('employees', 'region', 'TEXT')
+
+        # Department for bulk changes by an admin, see employee_admin.py
+        self.__add_column_if_missing('employees', 'department', 'TEXT')
+        self.c.execute('''
+            CREATE INDEX IF NOT EXISTS employees_department ON employees (department)
+        ''')
+
+        # Target hours per weekday of an employee, valid from valid_from until valid_to (NULL: open end)
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS working_time_models (
+                employee_id TEXT,
+                valid_from DATE,
+                valid_to DATE,
+                monday REAL,
+                tuesday REAL,
+                wednesday REAL,
+                thursday REAL,
+                friday REAL,
+                saturday REAL,
+                sunday REAL,
+                PRIMARY KEY (employee_id, valid_from)
+            )
+        ''')
+
+        self.create_punches_table()
+
+        # Frozen totals of the closed months of every employee, see month_close.py.
+        # first_day and last_day are the day numbers (date.toordinal()) of the month.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS closed_months (
+                employee_id TEXT NOT NULL,
+                first_day INTEGER NOT NULL,
+                last_day INTEGER NOT NULL,
+                work_seconds INTEGER NOT NULL,
+                target_seconds INTEGER NOT NULL,
+                flex_seconds INTEGER NOT NULL,
+                vacation_days INTEGER NOT NULL,
+                sick_days INTEGER NOT NULL,
+                closed_at DATETIME NOT NULL,
+                PRIMARY KEY (employee_id, first_day)
+            ) WITHOUT ROWID
+        ''')
+
+        # Every change of the days and employees gets a sequence number, see change_feed.py.
+        # day is the day number of a changed day, NULL for a changed employee.
+        # Only the keys are recorded, the changed rows are read when the changes are exported.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS change_feed (
+                sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                employee_id TEXT NOT NULL,
+                day INTEGER
+            )
+        ''')
+
+        # Time of the last change of every field of SYNC_FIELDS, see timesheet_replica.py.
+        # day is the day number of a day, 0 for an employee. Deleted rows keep their
+        # timestamps, so a deletion is a change like any other.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS field_clock (
+                table_name TEXT NOT NULL,
+                employee_id TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                field TEXT NOT NULL,
+                modified_at REAL NOT NULL,
+                PRIMARY KEY (table_name, employee_id, day, field)
+            ) WITHOUT ROWID
+        ''')
+
+        # Cursors of the sync of a replica, see timesheet_replica.py
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+        self.__create_change_feed_triggers('employees', 'NULL')
+        self.__create_field_clock_triggers('employees')
+        self.create_layout_triggers()
+
+        # Years moved into database files of their own, see timesheet_archive.py.
+        # The file is stored next to the database, first_day and last_day are day numbers.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS archives (
+                year INTEGER PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                first_day INTEGER NOT NULL,
+                last_day INTEGER NOT NULL,
+                days INTEGER NOT NULL,
+                punches INTEGER NOT NULL,
+                archived_at DATETIME NOT NULL
+            )
+        ''')
+
+        # Last run of every maintenance task, see database_maintenance.py.
+        # last_run is in seconds since the epoch, sizes are in bytes.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance_log (
+                task TEXT PRIMARY KEY,
+                last_run INTEGER NOT NULL,
+                seconds REAL,
+                size_before INTEGER,
+                size_after INTEGER,
+                result TEXT
+            )
+        ''')
+
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            self.c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    # ------------------------------------------------------------------------------
+
+    def get_layout(self):
+        # Returns the layout of the timesheet table, LEGACY_LAYOUT or NUMERIC_LAYOUT.
+        # Read before every access (a single header field), the layout changes when
+        # timesheet_migration.py migrates the database while instances are running.
+        return min(self.get_schema_version(), NUMERIC_LAYOUT)
+
+    # ------------------------------------------------------------------------------
+
+    def get_schema_version(self):
+        # Returns PRAGMA user_version: LEGACY_LAYOUT, NUMERIC_LAYOUT for a database set up
+        # by an older version, or the SCHEMA_VERSION it was set up with.
+        self.c.execute('PRAGMA user_version')
+        return self.c.fetchone()[0]
+
+    # ------------------------------------------------------------------------------
+
+    def create_numeric_timesheet(self, schema='main'):
+        # Creates the timesheet table of the numeric layout, one row per employee and day:
+        # - day: date.toordinal() of the date.
+        # - start_seconds, end_seconds: Seconds since midnight of the date, the end of a
+        #   shift crossing midnight lies 86400 seconds later per day.
+        # - break_seconds, work_seconds: Break and net working time in seconds.
+        # - state: Index in STATES.
+        # The rows are stored in the primary key, there is no separate index.
+        # - schema: An attached archive gets the table without triggers.
+        self.c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.timesheet_v2 (
+                employee_id TEXT NOT NULL,
+                day INTEGER NOT NULL,
+                start_seconds INTEGER,
+                end_seconds INTEGER,
+                break_seconds INTEGER,
+                work_seconds INTEGER,
+                state INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (employee_id, day)
+            ) WITHOUT ROWID
+        ''')
+        if schema == 'main':
+            self.__create_counter_triggers('timesheet_v2')
+
+    # ------------------------------------------------------------------------------
+
+    def create_punches_table(self, schema='main'):
+        # Creates the table of the punch intervals of work and breaks,
+        # endtime is NULL while the interval is running.
+        # - schema: The schema of the table, e.g. an attached archive.
+        self.c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.punches (
+                employee_id TEXT,
+                date DATE,
+                kind TEXT,
+                starttime DATETIME,
+                endtime DATETIME
+            )
+        ''')
+        self.c.execute(f'''
+            CREATE INDEX IF NOT EXISTS {schema}.punches_employee_date ON punches (employee_id, date)
+        ''')
+
+    # ------------------------------------------------------------------------------
+
+    def __create_counter_triggers(self, table):
+        # Counts the changes of the days of every employee in timesheet_counters.
+        # Maintained by triggers, so changes of other processes and of the migration are
+        # counted as well. Snapshots of a timesheet are valid as long as its counter is unchanged.
+        self.c.execute('''
+            CREATE TABLE IF NOT EXISTS timesheet_counters (
+                employee_id TEXT PRIMARY KEY,
+                counter INTEGER NOT NULL
+            )
+        ''')
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            self.c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_count_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO timesheet_counters (employee_id, counter) VALUES ({row}.employee_id, 1)
+                    ON CONFLICT (employee_id) DO UPDATE SET counter = counter + 1;
+                END
+            ''')
+
+    # ------------------------------------------------------------------------------
+
+    def create_layout_triggers(self):
+        # Creates the triggers of the timesheet table of the current layout,
+        # also called by timesheet_migration.py when it switches the layout
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            table, day = 'timesheet_v2', '{row}.day'
+        else:
+            table, day = 'timesheet', 'CAST(julianday({row}.date) - 1721424.5 AS INTEGER)'
+        self.__create_closed_month_triggers(table, day)
+        self.__create_change_feed_triggers(table, day)
+        # A replica is always synced with a migrated database
+        if table == 'timesheet_v2':
+            self.__create_field_clock_triggers(table)
+
+    # ------------------------------------------------------------------------------
+
+    def __create_change_feed_triggers(self, table, day):
+        # Records the key of every changed row in change_feed, in the transaction of the change.
+        # - day: SQL expression of the day number of the row {row}, 'NULL' for employees.
+        # An update moving a row to another key records the old key as well.
+        table_name = 'employees' if table == 'employees' else 'timesheet'
+        insert = f'''
+            INSERT INTO change_feed (table_name, employee_id, day)
+            VALUES ('{table_name}', {{row}}.employee_id, {day})
+        '''
+        for event, statements in (
+                ('INSERT', insert.format(row='NEW')),
+                ('UPDATE', insert.format(row='NEW') + f''';
+                    INSERT INTO change_feed (table_name, employee_id, day)
+                    SELECT '{table_name}', OLD.employee_id, {day.format(row='OLD')}
+                    WHERE OLD.employee_id IS NOT NEW.employee_id
+                        OR {day.format(row='OLD')} IS NOT {day.format(row='NEW')}
+                '''),
+                ('DELETE', insert.format(row='OLD'))):
+            self.c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_feed_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    {statements};
+                END
+            ''')
+
+    # ------------------------------------------------------------------------------
+
+    def __create_field_clock_triggers(self, table):
+        # Stamps every inserted, changed or deleted field of SYNC_FIELDS in field_clock with
+        # the current time, in the transaction of the change. The timestamps resolve
+        # conflicting changes of a replica and the central database, see apply_sync_records().
+        table_name, day = ('employees', '0') if table == 'employees' else ('timesheet', '{row}.day')
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            statements = ''.join(f'''
+                INSERT INTO field_clock (table_name, employee_id, day, field, modified_at)
+                SELECT '{table_name}', {row}.employee_id, {day.format(row=row)}, '{field}', {SQL_NOW}
+                WHERE {f'OLD.{field} IS NOT NEW.{field}' if event == 'UPDATE' else 1}
+                ON CONFLICT (table_name, employee_id, day, field) DO UPDATE
+                SET modified_at = excluded.modified_at;
+            ''' for field in SYNC_FIELDS[table_name])
+            self.c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_clock_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    {statements}
+                END
+            ''')
+
+    # ------------------------------------------------------------------------------
+
+    def __create_closed_month_triggers(self, table, day):
+        # Rejects every change of a day in a closed month, also by other processes.
+        # An update is rejected if the row lies in a closed month before or after it.
+        # - day: SQL expression of the day number of the row {row}.
+        self.c.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                       (f'{table}_closed_update',))
+        trigger = self.c.fetchone()
+        if trigger is not None and 'NEW.' not in trigger[0]:
+            # Created by an earlier version which only checked the old row
+            self.c.execute(f'DROP TRIGGER {table}_closed_update')
+        for event, rows in (('INSERT', ('NEW',)), ('UPDATE', ('OLD', 'NEW')), ('DELETE', ('OLD',))):
+            closed = ' OR '.join(f'''EXISTS (SELECT 1 FROM closed_months c
+                             WHERE c.employee_id = {row}.employee_id
+                                 AND {day.format(row=row)} BETWEEN c.first_day AND c.last_day)'''
+                                 for row in rows)
+            self.c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_closed_{event.lower()} BEFORE {event} ON {table}
+                WHEN {closed}
+                BEGIN
+                    SELECT RAISE(ABORT, 'The month is closed');
+                END
+            ''')
+
+    # ------------------------------------------------------------------------------
+
+    def __drop_layout_triggers(self, table):
+        # Allows moving the days of closed months without recording them as changes,
+        # only within a transaction which creates the triggers again
+        for event in ('insert', 'update', 'delete'):
+            self.c.execute(f'DROP TRIGGER IF EXISTS {table}_closed_{event}')
+            self.c.execute(f'DROP TRIGGER IF EXISTS {table}_feed_{event}')
+            self.c.execute(f'DROP TRIGGER IF EXISTS {table}_clock_{event}')
+
+    # ------------------------------------------------------------------------------
+
+    def __add_column_if_missing(self, table, column, definition):
+        """Add a column to an existing table if it does not exist yet."""
+        columns = [row[1] for row in self.c.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            self.c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
 
     # ------------------------------------------------------------------------------
 
-    # Insert data into the table
-    # work with default parameters because python does not support overloading
-    def insert_into_database(self, employee_id, date, starttime, endtime=None, breaktime=None, state='default'):
-        # Inserts a new record into the timesheet table.
-        # - date: The date of the work entry (required).
-        # - starttime: The start time of the work (required).
-        # - endtime: The end time of the work (optional, can be None).
-        # - breaktime: The break time (optional, can be None).
-        # - state: sick day or normal working day (default: 'default')
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Group several changes into one transaction.
 
-        # Try to insert data into databse
+        The write lock is acquired at the beginning (BEGIN IMMEDIATE), so a busy
+        database is detected before any change is made and the whole transaction
+        can safely be retried with run_with_retry().
+        Commits at the end or rolls back if an exception occurs.
+        """
+        self.c.execute('BEGIN IMMEDIATE')
+        self.in_transaction = True
         try:
-            # Convert strings to datetime objects if needed
-            if isinstance(date, str):
-                date = DatetimeFunctions.convert_string_to_date(self, date)
-            if isinstance(starttime, str):
-                starttime = DatetimeFunctions.convert_string_to_time(
-                    self, starttime)
-            if isinstance(endtime, str) and endtime:  # only converts if endtime exists
-                endtime = DatetimeFunctions.convert_string_to_time(
-                    self, endtime)
-
-            # As datetime.time() objects are not supported in database table:
-            # Conevert to full datetime object by merging with the passed date before inserting into table
-            if isinstance(starttime, datetime.time):
-                starttime = DatetimeFunctions.merge_date_and_time_to_datetime(
-                    self, date, starttime)
-            if isinstance(endtime, datetime.time):
-                endtime = DatetimeFunctions.merge_date_and_time_to_datetime(
-                    self, date, endtime)
-
-            # Calculate Workhours if starttime and endtime exist
-            # If no start or end time are logged, then the workhours are None
-            if starttime is None or endtime is None:
-                workhours = None
-            # If both start and end time are logged, then calculate the time difference
-            else:
-                workhours = DatetimeFunctions.get_time_difference(
-                    self, starttime, endtime)
-                # convert workhours to full datetime object, so they can be stored in the table
-                if isinstance(workhours, datetime.time):
-                    workhours = DatetimeFunctions.merge_date_and_time_to_datetime(
-                        self, date, workhours)
+            yield
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self.in_transaction = False
 
-            # Check if an entry for the passed date already exists,
-            # If so, update the entry instead of creating a new one
+    # ------------------------------------------------------------------------------
 
-            # Check if employee and date already exists in timesheet table
+    def __commit(self):
+        """Commit changes unless they are part of a transaction()."""
+        if not self.in_transaction:
+            self.conn.commit()
+
+    # ------------------------------------------------------------------------------
+
+    def __prepare_entry(self, date, starttime, endtime, end_day_offset=0):
+        """
+        Convert an entry to the types stored in the timesheet table and calculate its workhours.
+
+        The end is stored with the date it falls on, end_day_offset days after date.
+        """
+        # Convert strings to datetime objects if needed
+        if isinstance(date, str):
+            date = DatetimeFunctions.convert_string_to_date(self, date)
+        if isinstance(starttime, str):
+            starttime = DatetimeFunctions.convert_string_to_time(
+                self, starttime)
+        if isinstance(endtime, str) and endtime:  # only converts if endtime exists
+            endtime = DatetimeFunctions.convert_string_to_time(
+                self, endtime)
+
+        # As datetime.time() objects are not supported in database table:
+        # Conevert to full datetime object by merging with the passed date before inserting into table
+        if isinstance(starttime, datetime.time):
+            starttime = DatetimeFunctions.merge_date_and_time_to_datetime(
+                self, date, starttime)
+        if isinstance(endtime, datetime.time):
+            endtime = DatetimeFunctions.merge_date_and_time_to_datetime(
+                self, date + datetime.timedelta(days=end_day_offset), endtime)
+
+        # Calculate Workhours (in seconds) if starttime and endtime exist
+        # If no start or end time are logged, then the workhours are None
+        if starttime is None or endtime is None:
+            workhours = None
+        # If both start and end time are logged, then calculate the time difference
+        else:
+            workhours = DatetimeFunctions.get_time_difference(
+                self, starttime, endtime)
+
+        return date, starttime, endtime, workhours
+
+    # ------------------------------------------------------------------------------
+
+    def __prepare_numeric_entry(self, date, starttime, endtime, breaktime, state, end_day_offset=0):
+        """
+        Convert an entry to the integers stored in the numeric layout.
+
+        Returns the day number, the start, end, break and work time in seconds
+        and the state code. An end before the start without end_day_offset lies
+        on the next day, like in get_time_difference().
+        """
+        day = self.__to_day_number(date)
+        start = self.__to_seconds(starttime, day)
+        end = self.__to_seconds(endtime, day)
+        if end is not None:
+            if end_day_offset:
+                end += end_day_offset * 86400
+            elif start is not None and end < start:
+                end += 86400
+        break_seconds = None if breaktime is None else round(breaktime)
+
+        work = None
+        if start is not None and end is not None:
+            work = end - start - (break_seconds or 0)
+        return day, start, end, break_seconds, work, STATE_CODES[state]
+
+    # ------------------------------------------------------------------------------
+
+    def __to_day_number(self, date):
+        """Convert a date or date string to its day number (date.toordinal())."""
+        if isinstance(date, str):
+            date = DatetimeFunctions.convert_string_to_date(self, date)
+        return date.toordinal()
+
+    # ------------------------------------------------------------------------------
+
+    def __to_seconds(self, value, day):
+        """Convert a time, datetime or time string to seconds since midnight of day."""
+        if not value:
+            return None
+        if isinstance(value, str):
+            value = DatetimeFunctions.convert_string_to_time(self, value)
+        seconds = 0
+        if isinstance(value, datetime.datetime):
+            seconds = (value.toordinal() - day) * 86400
+            value = value.time()
+        return seconds + DatetimeFunctions.time_in_seconds(self, value)
+
+    # ------------------------------------------------------------------------------
+
+    def save_day(self, employee_id, date, starttime, endtime=None, breaktime=None, state='default', version=None,
+                 end_day_offset=0):
+        # Saves a day using optimistic locking (compare and swap on the version column).
+        # - version: The version this day had when it was read, None if it was never stored.
+        # - end_day_offset: Amount of days the end lies after date, for shifts crossing midnight.
+        # Returns the new version of the record, or None if the record was changed
+        # by someone else in the meantime. In that case nothing is written.
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            return self.__save_numeric_day(employee_id, self.__prepare_numeric_entry(
+                date, starttime, endtime, breaktime, state, end_day_offset), version)
+
+        date, starttime, endtime, workhours = self.__prepare_entry(date, starttime, endtime, end_day_offset)
+        new_entry = (employee_id, date, starttime, endtime, workhours, breaktime, state)
+
+        if version is not None:
+            # Only update the record if nobody changed it since it was read
             self.c.execute('''
-                SELECT * FROM timesheet WHERE employee_id = ? AND date = ?
-            ''', (employee_id, date))
+                UPDATE timesheet
+                SET starttime = ?, endtime = ?, workhours = ?, breaktime = ?, state = ?,
+                    version = version + 1
+                WHERE employee_id = ? AND date = ? AND version = ?
+            ''', (starttime, endtime, workhours, breaktime, state, employee_id, date, version))
+            if self.c.rowcount == 1:
+                self.__commit()
+                return version + 1
 
-            # Fetch row, if it exists
-            existing_entry = self.c.fetchone()
+        # Check the current state of the record
+        self.c.execute('''
+            SELECT employee_id, date, starttime, endtime, workhours, breaktime, state, version
+            FROM timesheet WHERE employee_id = ? AND date = ?
+        ''', (employee_id, date))
+        existing_entry = self.c.fetchone()
 
-            # If record already exists then update it
-            if existing_entry:
-                # Check if entry has changed:
-                # Make new entry to compare to the old one
-                new_entry = (employee_id, date, starttime,
-                             endtime, workhours, breaktime, state)
+        # Someone else already stored exactly the same data, nothing to do
+        if existing_entry is not None and self.__is_equal(existing_entry[:7], new_entry):
+            return existing_entry[7]
 
-                # If the data of the new entry are not already in the table, then update them
-                if not self.__is_equal(existing_entry, new_entry):
+        # The record was inserted, changed or deleted by someone else
+        if existing_entry is not None or version is not None:
+            return None
 
-                    self.edit_in_database(
-                        employee_id, date, starttime, endtime, breaktime, state)
-                    print(f"Record for date {date} updated successfully.")
+        self.c.execute("INSERT INTO timesheet (employee_id, date, starttime, endtime, workhours, breaktime, state, version) VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+                       new_entry)
+        self.__commit()
+        return 1
+
+    # ------------------------------------------------------------------------------
 
-            # If the record does not already exist, then insert it into the table
+    def __save_numeric_day(self, employee_id, entry, version):
+        """save_day() in the numeric layout, entry as returned by __prepare_numeric_entry()."""
+        day = entry[0]
+        if version is not None:
+            self.c.execute('''
+                UPDATE timesheet_v2
+                SET start_seconds = ?, end_seconds = ?, break_seconds = ?, work_seconds = ?, state = ?,
+                    version = version + 1
+                WHERE employee_id = ? AND day = ? AND version = ?
+            ''', entry[1:] + (employee_id, day, version))
+            if self.c.rowcount == 1:
+                self.__commit()
+                return version + 1
+
+        self.c.execute('''
+            SELECT start_seconds, end_seconds, break_seconds, work_seconds, state, version
+            FROM timesheet_v2 WHERE employee_id = ? AND day = ?
+        ''', (employee_id, day))
+        existing_entry = self.c.fetchone()
+
+        if existing_entry is not None and existing_entry[:5] == entry[1:]:
+            return existing_entry[5]
+        if existing_entry is not None or version is not None:
+            return None
+
+        self.c.execute('''
+            INSERT INTO timesheet_v2 (employee_id, day, start_seconds, end_seconds, break_seconds,
+                                      work_seconds, state, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+        ''', (employee_id,) + entry)
+        self.__commit()
+        return 1
+
+    # ------------------------------------------------------------------------------
+
+    def delete_day(self, employee_id, date, version):
+        # Deletes a day using optimistic locking.
+        # Returns False if the record was changed by someone else in the meantime.
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            table, column, date = 'timesheet_v2', 'day', self.__to_day_number(date)
+        else:
+            table, column = 'timesheet', 'date'
+        self.c.execute(f'''
+            DELETE FROM {table}
+            WHERE employee_id = ? AND {column} = ? AND version = ?
+        ''', (employee_id, date, version))
+        if self.c.rowcount == 0:
+            self.c.execute(f'''
+                SELECT 1 FROM {table} WHERE employee_id = ? AND {column} = ?
+            ''', (employee_id, date))
+            # Already deleted by someone else is fine, changed is a conflict
+            return self.c.fetchone() is None
+        self.__commit()
+        return True
+
+    # ------------------------------------------------------------------------------
+
+    def load_days(self, employee_id, dates=None, exclude_closed=False):
+        # Returns the days of an employee as tuples of day number (date.toordinal()), start, end,
+        # break and work time in seconds, state code (index in STATES) and version.
+        # Start and end are seconds since midnight of the date, like in the numeric layout.
+        # - dates: Only load the days with these dates ('%Y-%m-%d'), None for all days.
+        # - exclude_closed: Skip the days of closed months, their totals are frozen.
+        # The legacy layout is converted by the query, so no strings have to be parsed.
+        # Archived years are read from their archive if dates reach into them.
+        parameters = [employee_id]
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            if dates is not None:
+                dates = [self.__to_day_number(date) for date in dates]
+            # Archived months are closed, they are never needed without their dates
+            if exclude_closed or dates == []:
+                table = 'timesheet_v2'
+            elif dates is None:
+                table = self.__archived_table('timesheet_v2')
             else:
+                table = self.__archived_table('timesheet_v2', min(dates), max(dates))
+            query = f'''
+                SELECT day, start_seconds, end_seconds, break_seconds, work_seconds, state, version
+                FROM {table} t WHERE employee_id = ?
+            '''
+            column = 'day'
+            day = 't.day'
+        else:
+            query = f'''
+                SELECT {LEGACY_TO_NUMERIC.format(row='t')}, t.version
+                FROM timesheet t WHERE employee_id = ?
+            '''
+            column = 't.date'
+            day = 'julianday(t.date) - 1721424.5'
+        if exclude_closed:
+            query += f'''
+                AND NOT EXISTS (SELECT 1 FROM closed_months c
+                                WHERE c.employee_id = t.employee_id
+                                    AND {day} BETWEEN c.first_day AND c.last_day)
+            '''
+        if dates is not None:
+            query += ' AND {column} IN ({marks})'.format(column=column, marks=', '.join('?' * len(dates)))
+            parameters += dates
+        self.c.execute(query, parameters)
+        return self.c.fetchall()
 
-                # Insert data into databse
-                self.c.execute("INSERT INTO timesheet (employee_id, date, starttime, endtime, workhours, breaktime, state) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                               (employee_id, date, starttime, endtime, workhours, breaktime, state))
+    # ------------------------------------------------------------------------------
 
-                # Commit the changes to the database
-                self.conn.commit()
+    def load_timesheet_counter(self, employee_id):
+        # Returns the change counter of the days of an employee, 0 if they were never changed
+        self.c.execute('SELECT counter FROM timesheet_counters WHERE employee_id = ?', (employee_id,))
+        row = self.c.fetchone()
+        return row[0] if row else 0
 
-        # If data could not be inserted into database, raise error
-        except sqlite3.Error as e:
-            # Rollback in case something goes wrong
-            self.conn.rollback()
-            # Raise Error
-            raise sqlite3.Error(f"Error inserting into database: {e}")
+    # ------------------------------------------------------------------------------
+
+    def load_closed_months(self, employee_id):
+        # Returns the closed months of an employee as tuples of the first and last day number,
+        # work, target and flex time in seconds and the amount of vacation and sick days
+        self.c.execute('''
+            SELECT first_day, last_day, work_seconds, target_seconds, flex_seconds, vacation_days, sick_days
+            FROM closed_months WHERE employee_id = ? ORDER BY first_day
+        ''', (employee_id,))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def close_month(self, employee_id, first_date, last_date, work_seconds, target_seconds, flex_seconds,
+                    vacation_days, sick_days):
+        # Freezes the month from first_date to last_date of an employee with its totals.
+        # Afterwards the days of the month can't be changed until reopen_month().
+        # Returns False if the month is already closed.
+        self.c.execute('''
+            INSERT OR IGNORE INTO closed_months (employee_id, first_day, last_day, work_seconds, target_seconds,
+                                                 flex_seconds, vacation_days, sick_days, closed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+        ''', (employee_id, first_date.toordinal(), last_date.toordinal(), round(work_seconds),
+              round(target_seconds), round(flex_seconds), vacation_days, sick_days))
+        if self.c.rowcount == 0:
+            return False
+        self.__count_timesheet_change(employee_id)
+        self.__commit()
+        return True
+
+    # ------------------------------------------------------------------------------
+
+    def reopen_month(self, employee_id, first_date):
+        # Deletes the frozen totals of a closed month, so its days can be changed again.
+        # Returns False if the month was not closed or its year is archived.
+        self.c.execute('''
+            DELETE FROM closed_months WHERE employee_id = ? AND first_day = ?
+                AND NOT EXISTS (SELECT 1 FROM archives WHERE closed_months.first_day BETWEEN archives.first_day AND archives.last_day)
+        ''', (employee_id, first_date.toordinal()))
+        if self.c.rowcount == 0:
+            return False
+        self.__count_timesheet_change(employee_id)
+        self.__commit()
+        return True
+
+    # ------------------------------------------------------------------------------
+
+    def load_archives(self):
+        # Returns the archived years as tuples of year, file name, first and last day number
+        # and the amount of archived days and punch intervals, ordered by year
+        self.c.execute('''
+            SELECT year, file_name, first_day, last_day, days, punches FROM archives ORDER BY year
+        ''')
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def count_open_days(self, first_day, last_day):
+        # Returns the amount of days between the day numbers first_day and last_day
+        # of all employees which are not in a closed month
+        self.c.execute('''
+            SELECT COUNT(*) FROM timesheet_v2 t
+            WHERE t.day BETWEEN ? AND ?
+                AND NOT EXISTS (SELECT 1 FROM closed_months c
+                                WHERE c.employee_id = t.employee_id
+                                    AND t.day BETWEEN c.first_day AND c.last_day)
+        ''', (first_day, last_day))
+        return self.c.fetchone()[0]
+
+    # ------------------------------------------------------------------------------
+
+    def attach_archive(self, year, file_name):
+        # Attaches the archive of a year and returns its schema name, e.g. 'archive_2024'.
+        # - file_name: The archive file next to the database.
+        # SQLite can't attach a database within a transaction.
+        schema = self.attached_archives.get(year)
+        if schema is None:
+            schema = f'archive_{int(year)}'
+            path = os.path.join(os.path.dirname(self.database_path), file_name)
+            self.c.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+            self.attached_archives[year] = schema
+        return schema
+
+    # ------------------------------------------------------------------------------
+
+    def detach_archives(self):
+        # Detaches all attached archives
+        for schema in self.attached_archives.values():
+            self.c.execute(f'DETACH DATABASE {schema}')
+        self.attached_archives = {}
+
+    # ------------------------------------------------------------------------------
+
+    def __archived_table(self, table, first_day=None, last_day=None):
+        # Returns the FROM expression of a table including the archived years overlapping the
+        # day numbers first_day to last_day (None: all archived years). The archives are only
+        # attached when a range reaches into them, without archives it is the table itself.
+        self.c.execute('''
+            SELECT year, file_name FROM archives
+            WHERE last_day >= COALESCE(?, last_day) AND first_day <= COALESCE(?, first_day)
+            ORDER BY year
+        ''', (first_day, last_day))
+        archives = self.c.fetchall()
+        if not archives:
+            return table
+        if len(self.attached_archives.keys() | {row[0] for row in archives}) > MAX_ATTACHED_ARCHIVES:
+            self.detach_archives()
+        tables = [table] + [f'{self.attach_archive(year, file_name)}.{table}' for year, file_name in archives]
+        return '({})'.format(' UNION ALL '.join(f'SELECT * FROM {name}' for name in tables))
+
+    # ------------------------------------------------------------------------------
+
+    def archive_year(self, year, schema, file_name):
+        # Moves the days and punch intervals of a year into the attached archive schema and
+        # records the archive. All days of the year must be in closed months, their totals
+        # stay in closed_months. Must be called within transaction().
+        # Returns the amount of moved days and punch intervals.
+        first_day = datetime.date(year, 1, 1).toordinal()
+        last_day = datetime.date(year, 12, 31).toordinal()
+        first_date, last_date = f'{year:04d}-01-01', f'{year:04d}-12-31'
+        self.create_numeric_timesheet(schema)
+        self.create_punches_table(schema)
+
+        self.c.execute(f'''
+            INSERT OR REPLACE INTO {schema}.timesheet_v2
+            SELECT * FROM timesheet_v2 WHERE day BETWEEN ? AND ?
+        ''', (first_day, last_day))
+        days = self.c.rowcount
+        # An archive left behind by an earlier attempt must not get the intervals twice
+        self.c.execute(f'DELETE FROM {schema}.punches WHERE date BETWEEN ? AND ?', (first_date, last_date))
+        self.c.execute(f'''
+            INSERT INTO {schema}.punches SELECT * FROM punches WHERE date BETWEEN ? AND ?
+        ''', (first_date, last_date))
+        punches = self.c.rowcount
+
+        self.__drop_layout_triggers('timesheet_v2')
+        self.c.execute('DELETE FROM timesheet_v2 WHERE day BETWEEN ? AND ?', (first_day, last_day))
+        self.c.execute('DELETE FROM punches WHERE date BETWEEN ? AND ?', (first_date, last_date))
+        self.create_layout_triggers()
+
+        self.c.execute('''
+            INSERT INTO archives (year, file_name, first_day, last_day, days, punches, archived_at)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now', 'localtime'))
+        ''', (year, file_name, first_day, last_day, days, punches))
+        return days, punches
+
+    # ------------------------------------------------------------------------------
+
+    def restore_year(self, year, schema):
+        # Moves the days and punch intervals of an archived year from the attached archive
+        # schema back into the database. Must be called within transaction().
+        # Returns the amount of restored days and punch intervals.
+        self.__drop_layout_triggers('timesheet_v2')
+        self.c.execute(f'INSERT OR REPLACE INTO timesheet_v2 SELECT * FROM {schema}.timesheet_v2')
+        days = self.c.rowcount
+        self.c.execute(f'INSERT INTO punches SELECT * FROM {schema}.punches')
+        punches = self.c.rowcount
+        self.create_layout_triggers()
+        self.c.execute('DELETE FROM archives WHERE year = ?', (year,))
+        return days, punches
+
+    # ------------------------------------------------------------------------------
+
+    def __count_timesheet_change(self, employee_id):
+        # Closing and reopening changes which days are loaded, snapshots must be rebuilt
+        self.c.execute('''
+            INSERT INTO timesheet_counters (employee_id, counter) VALUES (?, 1)
+            ON CONFLICT (employee_id) DO UPDATE SET counter = counter + 1
+        ''', (employee_id,))
+
+    # ------------------------------------------------------------------------------
+
+    def load_employees(self):
+        # Returns all employees as tuples of employee_id, vacation_days, old_vacation_days, version and region
+        self.c.execute('''
+            SELECT employee_id, vacation_days, old_vacation_days, version, region FROM employees
+        ''')
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_working_time_models(self, employee_id):
+        # Returns the working-time models of an employee ordered by start, as tuples of
+        # valid_from, valid_to and the target hours from monday to sunday
+        self.c.execute('''
+            SELECT valid_from, valid_to, monday, tuesday, wednesday, thursday, friday, saturday, sunday
+            FROM working_time_models WHERE employee_id = ? ORDER BY valid_from
+        ''', (employee_id,))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def save_working_time_model(self, employee_id, valid_from, valid_to, weekday_hours):
+        # Saves a working-time model, replacing the model of the employee starting at valid_from.
+        # - weekday_hours: Seven target hours from monday to sunday.
+        self.c.execute('''
+            INSERT OR REPLACE INTO working_time_models
+                (employee_id, valid_from, valid_to, monday, tuesday, wednesday, thursday, friday, saturday, sunday)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (employee_id, valid_from, valid_to, *weekday_hours))
+
+    # ------------------------------------------------------------------------------
+
+    def delete_working_time_model(self, employee_id, valid_from):
+        # Deletes the working-time model of an employee starting at valid_from
+        self.c.execute('DELETE FROM working_time_models WHERE employee_id = ? AND valid_from = ?',
+                       (employee_id, valid_from))
+
+    # ------------------------------------------------------------------------------
+
+    def start_interval(self, employee_id, date, kind, starttime):
+        # Opens a punch interval of kind 'work' or 'break'.
+        # - date: The day the interval belongs to ('%Y-%m-%d').
+        # - starttime: Start as datetime.datetime.
+        self.c.execute('''
+            INSERT INTO punches (employee_id, date, kind, starttime, endtime) VALUES (?, ?, ?, ?, NULL)
+        ''', (employee_id, date, kind, starttime.isoformat(' ')))
+        self.__commit()
+
+    # ------------------------------------------------------------------------------
+
+    def end_interval(self, employee_id, date, kind, endtime):
+        # Closes the running punch interval of a kind on a day.
+        # Returns whether a running interval was found.
+        self.c.execute('''
+            UPDATE punches SET endtime = ?
+            WHERE employee_id = ? AND date = ? AND kind = ? AND endtime IS NULL
+        ''', (endtime.isoformat(' '), employee_id, date, kind))
+        self.__commit()
+        return self.c.rowcount > 0
+
+    # ------------------------------------------------------------------------------
+
+    def load_open_intervals(self, employee_id, date):
+        # Returns the running punch intervals of an employee on a day as tuples of kind and starttime
+        self.c.execute('''
+            SELECT kind, starttime FROM punches
+            WHERE employee_id = ? AND date = ? AND endtime IS NULL
+        ''', (employee_id, date))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_intervals(self, employee_id, date):
+        # Returns all punch intervals of an employee on a day as tuples of kind, starttime and endtime
+        day = self.__to_day_number(date)
+        self.c.execute(f'''
+            SELECT kind, starttime, endtime FROM {self.__archived_table('punches', day, day)}
+            WHERE employee_id = ? AND date = ? ORDER BY starttime
+        ''', (employee_id, date))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_interval_totals(self, employee_id, first_date, last_date):
+        # Aggregates the punch intervals of every day between first_date and last_date in one query.
+        # Returns tuples of date, first start of work, last end of work, work seconds without
+        # breaks, punched break seconds and the amount of work intervals (split shifts).
+        # Running intervals are not counted. Archived years are read from their archive.
+        punches = self.__archived_table('punches', self.__to_day_number(first_date),
+                                        self.__to_day_number(last_date))
+        self.c.execute(f'''
+            SELECT date,
+                MIN(CASE WHEN kind = 'work' THEN starttime END),
+                MAX(CASE WHEN kind = 'work' THEN endtime END),
+                ROUND(COALESCE(SUM(CASE WHEN kind = 'work' THEN julianday(endtime) - julianday(starttime) END), 0) * 86400
+                      - COALESCE(SUM(CASE WHEN kind = 'break' THEN julianday(endtime) - julianday(starttime) END), 0) * 86400, 3),
+                ROUND(COALESCE(SUM(CASE WHEN kind = 'break' THEN julianday(endtime) - julianday(starttime) END), 0) * 86400, 3),
+                COUNT(CASE WHEN kind = 'work' THEN 1 END)
+            FROM {punches}
+            WHERE employee_id = ? AND date BETWEEN ? AND ?
+            GROUP BY date
+            ORDER BY date
+        ''', (employee_id, first_date, last_date))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_employee_region(self, employee_id):
+        # Returns the holiday region of an employee, None if the employee uses the default region
+        self.c.execute('SELECT region FROM employees WHERE employee_id = ?', (employee_id,))
+        row = self.c.fetchone()
+        return row[0] if row else None
+
+    # ------------------------------------------------------------------------------
+
+    def count_employees(self):
+        # Returns the amount of employees in the employees table
+        self.c.execute('SELECT COUNT(*) FROM employees')
+        return self.c.fetchone()[0]
+
+    # ------------------------------------------------------------------------------
+
+    def __load_public_holidays(self, last_year, is_numeric):
+        # Fills the temporary public_holidays table with the holidays of all regions
+        # from the first year in the timesheet table up to last_year.
+        # Every holiday is stored as date string and as day number for both layouts.
+        import working_calendar
+
+        self.c.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS public_holidays (
+                region TEXT,
+                date DATE,
+                day INTEGER,
+                PRIMARY KEY (region, day)
+            )
+        ''')
+        self.c.execute('''
+            CREATE INDEX IF NOT EXISTS temp.public_holidays_date ON public_holidays (region, date)
+        ''')
+        if is_numeric:
+            self.c.execute('SELECT MIN(day) FROM timesheet_v2')
+            first_day = self.c.fetchone()[0]
+            first_year = datetime.date.fromordinal(first_day).year if first_day else last_year
+        else:
+            self.c.execute('SELECT MIN(date) FROM timesheet')
+            first_date = self.c.fetchone()[0]
+            first_year = int(first_date[:4]) if first_date else last_year
+        for year in range(first_year, last_year + 1):
+            if year in self.holiday_years:
+                continue
+            self.c.executemany('INSERT OR IGNORE INTO public_holidays (region, date, day) VALUES (?, ?, ?)',
+                               [(region, holiday.isoformat(), holiday.toordinal())
+                                for region in gui_constants.REGIONAL_HOLIDAYS
+                                for holiday in working_calendar.get_holidays(year, region)])
+            self.holiday_years.add(year)
+
+    # ------------------------------------------------------------------------------
+
+    def load_team_overview(self, date, daily_seconds, limit, offset=0):
+        # Aggregates one page of employees in a single query, without loading their days.
+        # - date: Today's date, used for the punch status and to find open days before it.
+        # - daily_seconds: Expected working time of a weekday not covered by a working-time model.
+        # Returns tuples of employee_id, vacation_days, old_vacation_days, today's start and end
+        # in seconds since midnight, flex time in seconds and the amount of days without end before date.
+        # Closed months count with their frozen flex time, their days are skipped.
+        # The target of a day comes from the latest working-time model covering it; sick and
+        # vacation days and the public holidays of the employee's region are not deducted.
+        is_numeric = self.get_layout() >= NUMERIC_LAYOUT
+        self.__load_public_holidays(date.year, is_numeric)
+        parameters = {'date': date, 'day': date.toordinal(), 'daily_seconds': daily_seconds,
+                      'limit': limit, 'offset': offset, 'default_region': gui_constants.DEFAULT_REGION}
+        if is_numeric:
+            self.c.execute('''
+                WITH page AS (
+                    SELECT employee_id, vacation_days, old_vacation_days,
+                        COALESCE(region, :default_region) AS region
+                    FROM employees
+                    ORDER BY employee_id LIMIT :limit OFFSET :offset
+                )
+                SELECT p.employee_id, p.vacation_days, p.old_vacation_days,
+                    MAX(CASE WHEN t.day = :day THEN t.start_seconds END),
+                    MAX(CASE WHEN t.day = :day THEN t.end_seconds END),
+                    COALESCE(SUM(
+                        COALESCE(t.work_seconds, 0)
+                        - CASE WHEN t.state = 0
+                                    AND NOT EXISTS (SELECT 1 FROM public_holidays h
+                                                    WHERE h.region = p.region AND h.day = t.day)
+                            THEN COALESCE(
+                                (SELECT ROUND(3600 * CASE (t.day - 1) % 7
+                                            WHEN 0 THEN m.monday WHEN 1 THEN m.tuesday
+                                            WHEN 2 THEN m.wednesday WHEN 3 THEN m.thursday
+                                            WHEN 4 THEN m.friday WHEN 5 THEN m.saturday
+                                            ELSE m.sunday END)
+                                 FROM working_time_models m
+                                 WHERE m.employee_id = p.employee_id
+                                     AND julianday(m.valid_from) - 1721424.5 <= t.day
+                                     AND (m.valid_to IS NULL OR t.day <= julianday(m.valid_to) - 1721424.5)
+                                 ORDER BY m.valid_from DESC LIMIT 1),
+                                CASE WHEN (t.day - 1) % 7 < 5 THEN :daily_seconds ELSE 0 END)
+                            ELSE 0 END
+                    ), 0)
+                    + (SELECT COALESCE(SUM(c.flex_seconds), 0) FROM closed_months c
+                       WHERE c.employee_id = p.employee_id),
+                    COUNT(CASE WHEN t.start_seconds IS NOT NULL AND t.end_seconds IS NULL
+                               AND t.day < :day THEN 1 END)
+                FROM page p
+                LEFT JOIN timesheet_v2 t ON t.employee_id = p.employee_id
+                    AND NOT EXISTS (SELECT 1 FROM closed_months c
+                                    WHERE c.employee_id = t.employee_id
+                                        AND t.day BETWEEN c.first_day AND c.last_day)
+                GROUP BY p.employee_id
+                ORDER BY p.employee_id
+            ''', parameters)
+            return self.c.fetchall()
+
+        # Times are compared in minutes like in earlier versions of the data model
+        self.c.execute('''
+            WITH page AS (
+                SELECT employee_id, vacation_days, old_vacation_days,
+                    COALESCE(region, :default_region) AS region
+                FROM employees
+                ORDER BY employee_id LIMIT :limit OFFSET :offset
+            )
+            SELECT p.employee_id, p.vacation_days, p.old_vacation_days,
+                MAX(CASE WHEN t.date = :date THEN strftime('%s', t.starttime) - strftime('%s', t.date) END),
+                MAX(CASE WHEN t.date = :date THEN strftime('%s', t.endtime) - strftime('%s', t.date) END),
+                COALESCE(SUM(
+                    CASE WHEN t.starttime IS NOT NULL AND t.endtime >= t.starttime
+                        THEN strftime('%s', substr(t.endtime, 1, 16))
+                             - strftime('%s', substr(t.starttime, 1, 16))
+                             - COALESCE(t.breaktime, 0)
+                        ELSE 0 END
+                    - CASE WHEN t.state NOT IN ('sick', 'vacation')
+                                AND NOT EXISTS (SELECT 1 FROM public_holidays h
+                                                WHERE h.region = p.region AND h.date = t.date)
+                        THEN COALESCE(
+                            (SELECT ROUND(3600 * CASE strftime('%w', t.date)
+                                        WHEN '1' THEN m.monday WHEN '2' THEN m.tuesday
+                                        WHEN '3' THEN m.wednesday WHEN '4' THEN m.thursday
+                                        WHEN '5' THEN m.friday WHEN '6' THEN m.saturday
+                                        ELSE m.sunday END)
+                             FROM working_time_models m
+                             WHERE m.employee_id = p.employee_id AND m.valid_from <= t.date
+                                 AND (m.valid_to IS NULL OR t.date <= m.valid_to)
+                             ORDER BY m.valid_from DESC LIMIT 1),
+                            CASE WHEN strftime('%w', t.date) BETWEEN '1' AND '5'
+                                THEN :daily_seconds ELSE 0 END)
+                        ELSE 0 END
+                ), 0)
+                + (SELECT COALESCE(SUM(c.flex_seconds), 0) FROM closed_months c
+                   WHERE c.employee_id = p.employee_id),
+                COUNT(CASE WHEN t.starttime IS NOT NULL AND t.endtime IS NULL
+                           AND t.date < :date THEN 1 END)
+            FROM page p
+            LEFT JOIN timesheet t ON t.employee_id = p.employee_id
+                AND NOT EXISTS (SELECT 1 FROM closed_months c
+                                WHERE c.employee_id = t.employee_id
+                                    AND julianday(t.date) - 1721424.5 BETWEEN c.first_day AND c.last_day)
+            GROUP BY p.employee_id
+            ORDER BY p.employee_id
+        ''', parameters)
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def preview_vacation_rollover(self, year, carry_over_limit=None):
+        # Returns the result of rolling the vacation days over into year without changing anything.
+        # - carry_over_limit: Maximum of remaining vacation days carried over, None for no limit.
+        # Returns tuples of employee_id, vacation_days, old_vacation_days, new vacation_days,
+        # new old_vacation_days and rollover_year for all employees. Employees already rolled
+        # over into year keep their values.
+        self.c.execute('''
+            SELECT employee_id, vacation_days, old_vacation_days,
+                CASE WHEN COALESCE(rollover_year, 0) < :year
+                    THEN entitlement ELSE vacation_days END,
+                CASE WHEN COALESCE(rollover_year, 0) < :year
+                    THEN MAX(MIN(COALESCE(vacation_days, 0),
+                                 COALESCE(:limit, COALESCE(vacation_days, 0))), 0)
+                    ELSE old_vacation_days END,
+                rollover_year
+            FROM employees ORDER BY employee_id
+        ''', {'year': year, 'limit': carry_over_limit})
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def rollover_vacation_days(self, year, carry_over_limit=None):
+        # Rolls the vacation days of all employees over into year in one statement:
+        # Remaining vacation days become old vacation days (at most carry_over_limit),
+        # remaining old vacation days expire and the yearly entitlement is granted.
+        # Idempotent, employees already rolled over into year are not changed again.
+        # Returns the amount of changed employees.
+        self.c.execute('''
+            UPDATE employees
+            SET old_vacation_days = MAX(MIN(COALESCE(vacation_days, 0),
+                                            COALESCE(:limit, COALESCE(vacation_days, 0))), 0),
+                vacation_days = entitlement,
+                rollover_year = :year,
+                version = version + 1
+            WHERE COALESCE(rollover_year, 0) < :year
+        ''', {'year': year, 'limit': carry_over_limit})
+        changed = self.c.rowcount
+        self.__commit()
+        return changed
+
+    # ------------------------------------------------------------------------------
+
+    def save_employee(self, employee_id, vacation_days, old_vacation_days, version=None, region=None):
+        # Saves the vacation days and holiday region of an employee using optimistic locking.
+        # - region: None keeps the stored region.
+        # Returns the new version of the record, or None if the record was changed
+        # by someone else since it was read.
+        if version is None:
+            self.c.execute('''
+                INSERT OR IGNORE INTO employees (employee_id, vacation_days, old_vacation_days, version, region)
+                VALUES (?, ?, ?, 1, ?)
+            ''', (employee_id, vacation_days, old_vacation_days, region))
+            new_version = 1
+        else:
+            self.c.execute('''
+                UPDATE employees
+                SET vacation_days = ?, old_vacation_days = ?, region = COALESCE(?, region),
+                    version = version + 1
+                WHERE employee_id = ? AND version = ?
+            ''', (vacation_days, old_vacation_days, region, employee_id, version))
+            new_version = version + 1
+
+        if self.c.rowcount == 0:
+            return None
+        self.__commit()
+        return new_version
+
+    # ------------------------------------------------------------------------------
+
+    def save_employees(self, rows):
+        # Saves the vacation days and holiday regions of several employees using optimistic
+        # locking, with one query for the stored versions and one upsert for all employees.
+        # Must be called inside transaction(), so nobody writes between the two.
+        # - rows: Tuples of employee_id, vacation_days, old_vacation_days, the version read
+        #   (None for a new employee) and region (None keeps the stored region).
+        # Returns a dictionary of the employee_ids mapped to their new version, None for the
+        # employees which were changed by someone else since they were read.
+        if not rows:
+            return {}
+        self.c.execute('SELECT employee_id, version FROM employees WHERE employee_id IN ({marks})'
+                       .format(marks=', '.join('?' * len(rows))), [row[0] for row in rows])
+        stored_versions = dict(self.c.fetchall())
+
+        versions = {}
+        for employee_id, _, _, version, _ in rows:
+            versions[employee_id] = (1 if version is None else version + 1) \
+                if stored_versions.get(employee_id) == version else None
+        self.c.executemany('''
+            INSERT INTO employees (employee_id, vacation_days, old_vacation_days, version, region)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (employee_id) DO UPDATE
+            SET vacation_days = excluded.vacation_days,
+                old_vacation_days = excluded.old_vacation_days,
+                region = COALESCE(excluded.region, region),
+                version = version + 1
+        ''', [(employee_id, vacation_days, old_vacation_days, region)
+              for employee_id, vacation_days, old_vacation_days, _, region in rows
+              if versions[employee_id] is not None])
+        self.__commit()
+        return versions
+
+    # ------------------------------------------------------------------------------
+
+    def set_department(self, employee_ids, department):
+        # Assigns employees to a department, None removes them from their department.
+        # Returns the amount of changed employees.
+        employee_ids = list(employee_ids)
+        self.c.execute('''
+            UPDATE employees SET department = ?, version = version + 1
+            WHERE department IS NOT ? AND employee_id IN ({marks})
+        '''.format(marks=', '.join('?' * len(employee_ids))), [department, department] + employee_ids)
+        changed = self.c.rowcount
+        self.__commit()
+        return changed
+
+    # ------------------------------------------------------------------------------
+
+    def set_entitlement(self, entitlement, department=None):
+        # Sets the yearly vacation entitlement of all employees of a department in one
+        # statement, of all employees if department is None. Takes effect with the next
+        # vacation rollover. Returns the amount of changed employees.
+        self.c.execute('''
+            UPDATE employees SET entitlement = :entitlement, version = version + 1
+            WHERE (:department IS NULL OR department = :department)
+                AND entitlement IS NOT :entitlement
+        ''', {'entitlement': entitlement, 'department': department})
+        changed = self.c.rowcount
+        self.__commit()
+        return changed
+
+    # ------------------------------------------------------------------------------
+
+    def grant_vacation_days(self, days, department=None):
+        # Adds vacation days to all employees of a department in one statement, to all
+        # employees if department is None. Negative days are taken away.
+        # Returns the amount of changed employees.
+        self.c.execute('''
+            UPDATE employees SET vacation_days = COALESCE(vacation_days, 0) + :days,
+                version = version + 1
+            WHERE :department IS NULL OR department = :department
+        ''', {'days': days, 'department': department})
+        changed = self.c.rowcount
+        self.__commit()
+        return changed
+
+    # ------------------------------------------------------------------------------
+
+    def load_departments(self):
+        # Returns tuples of department (None for employees without one), the amount of
+        # employees and the smallest and largest entitlement, ordered by department.
+        self.c.execute('''
+            SELECT department, COUNT(*), MIN(entitlement), MAX(entitlement)
+            FROM employees GROUP BY department ORDER BY department
+        ''')
+        return self.c.fetchall()
 
     # ------------------------------------------------------------------------------
 
@@ -159,72 +1377,335 @@ class DatabaseFunctions:
 
     # ------------------------------------------------------------------------------
 
-    # Edit data in the table of the database
-    def edit_in_database(self, employee_id, date, starttime, endtime=None, breaktime=None, state='default'):
-        # Try to update data in databse
-        try:
-            # Convert strings to datetime objects if needed
-            if isinstance(date, str):
-                date = DatetimeFunctions.convert_string_to_date(self, date)
-            if isinstance(starttime, str):
-                starttime = DatetimeFunctions.convert_string_to_time(
-                    self, starttime)
-            if isinstance(endtime, str) and endtime:  # only converts if endtime exists
-                endtime = DatetimeFunctions.convert_string_to_time(
-                    self, endtime)
-
-            # Calculate Workhours if starttime and endtime exists
-            if starttime is None or endtime is None:
-                workhours = None
+    def get_database_size(self):
+        # Returns the size of the database file and the size of its free pages in bytes
+        page_size = self.c.execute('PRAGMA page_size').fetchone()[0]
+        page_count = self.c.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = self.c.execute('PRAGMA freelist_count').fetchone()[0]
+        return page_count * page_size, free_pages * page_size
+
+    # ------------------------------------------------------------------------------
+
+    def claim_maintenance_task(self, task, interval):
+        # Marks a maintenance task as running now if it did not run for interval seconds.
+        # Returns True if this connection shall run it, every instance may try at the same time.
+        now = int(time.time())
+        self.c.execute('''
+            INSERT INTO maintenance_log (task, last_run) VALUES (?, ?)
+            ON CONFLICT (task) DO UPDATE SET last_run = excluded.last_run
+            WHERE maintenance_log.last_run <= excluded.last_run - ?
+        ''', (task, now, interval))
+        is_claimed = self.c.rowcount > 0
+        self.__commit()
+        return is_claimed
+
+    # ------------------------------------------------------------------------------
+
+    def record_maintenance(self, task, seconds, size_before, size_after, result):
+        # Stores the duration, the database size before and after and the result of a maintenance task
+        self.c.execute('''
+            INSERT INTO maintenance_log (task, last_run, seconds, size_before, size_after, result)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (task) DO UPDATE SET seconds = excluded.seconds, size_before = excluded.size_before,
+                size_after = excluded.size_after, result = excluded.result
+        ''', (task, int(time.time()), seconds, size_before, size_after, result))
+        self.__commit()
+
+    # ------------------------------------------------------------------------------
+
+    def load_maintenance_log(self):
+        # Returns the maintenance tasks as tuples of task, last run (seconds since the epoch),
+        # duration in seconds, size before and after in bytes and result
+        self.c.execute('''
+            SELECT task, last_run, seconds, size_before, size_after, result FROM maintenance_log ORDER BY task
+        ''')
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_last_change(self):
+        # Returns the sequence number of the last change recorded in change_feed, also if it
+        # was pruned already, 0 if there is none
+        self.c.execute('''
+            SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'change_feed'), 0)
+        ''')
+        return self.c.fetchone()[0]
+
+    # ------------------------------------------------------------------------------
+
+    def load_timesheet_changes(self, after_sequence, last_sequence):
+        # Returns the days changed after the sequence number after_sequence up to last_sequence,
+        # every day once with its last sequence number and in that order. Tuples of sequence,
+        # employee_id, day number and the current start, end, break and work time in seconds,
+        # state code and version of the day like load_days(), all None if it was deleted.
+        changes = '''
+            SELECT MAX(sequence) AS sequence, employee_id, day FROM change_feed
+            WHERE sequence > ? AND sequence <= ? AND table_name = 'timesheet'
+            GROUP BY employee_id, day
+        '''
+        if self.get_layout() >= NUMERIC_LAYOUT:
+            self.c.execute(f'''
+                SELECT f.sequence, f.employee_id, f.day, t.start_seconds, t.end_seconds,
+                    t.break_seconds, t.work_seconds, t.state, t.version
+                FROM ({changes}) f
+                LEFT JOIN timesheet_v2 t ON t.employee_id = f.employee_id AND t.day = f.day
+                ORDER BY f.sequence
+            ''', (after_sequence, last_sequence))
+            return self.c.fetchall()
+
+        self.c.execute(f'''
+            SELECT f.sequence, f.employee_id, f.day, {LEGACY_TO_NUMERIC.format(row='t')}, t.version
+            FROM ({changes}) f
+            LEFT JOIN timesheet t ON t.employee_id = f.employee_id AND t.date = date(f.day + 1721424.5)
+            ORDER BY f.sequence
+        ''', (after_sequence, last_sequence))
+        # Without the day number of the legacy row
+        return [row[:3] + (row[4:] if row[-1] is not None else (None,) * 6)
+                for row in self.c.fetchall()]
+
+    # ------------------------------------------------------------------------------
+
+    def load_employee_changes(self, after_sequence, last_sequence):
+        # Returns the employees changed after the sequence number after_sequence up to
+        # last_sequence, every employee once with its last sequence number and in that order.
+        # Tuples of sequence, employee_id and the current vacation_days, old_vacation_days,
+        # entitlement, rollover_year, region and version, all None if it was deleted.
+        self.c.execute('''
+            SELECT f.sequence, f.employee_id, e.vacation_days, e.old_vacation_days, e.entitlement,
+                e.rollover_year, e.region, e.version
+            FROM (SELECT MAX(sequence) AS sequence, employee_id FROM change_feed
+                  WHERE sequence > ? AND sequence <= ? AND table_name = 'employees'
+                  GROUP BY employee_id) f
+            LEFT JOIN employees e ON e.employee_id = f.employee_id
+            ORDER BY f.sequence
+        ''', (after_sequence, last_sequence))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def prune_change_feed(self, sequence):
+        # Deletes the changes up to the sequence number sequence, once every consumer exported them.
+        # The sequence numbers are never used again. Returns the amount of deleted changes.
+        self.c.execute('DELETE FROM change_feed WHERE sequence <= ?', (sequence,))
+        deleted = self.c.rowcount
+        self.__commit()
+        return deleted
+
+    # ------------------------------------------------------------------------------
+
+    def load_first_change(self):
+        # Returns the sequence number of the oldest change in change_feed, None if there is none.
+        # The changes before it were pruned.
+        self.c.execute('SELECT MIN(sequence) FROM change_feed')
+        return self.c.fetchone()[0]
+
+    # ------------------------------------------------------------------------------
+
+    def load_changed_keys(self, after_sequence, last_sequence):
+        # Returns the keys of the rows changed after the sequence number after_sequence up to
+        # last_sequence, every row once and in the order of its last change. Tuples of
+        # table_name ('timesheet' or 'employees'), employee_id and day number (None for employees).
+        self.c.execute('''
+            SELECT table_name, employee_id, day FROM change_feed
+            WHERE sequence > ? AND sequence <= ?
+            GROUP BY table_name, employee_id, day
+            ORDER BY MAX(sequence)
+        ''', (after_sequence, last_sequence))
+        return self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_sync_keys(self, after=None, limit=-1):
+        # Returns the keys of all employees and days like load_changed_keys(), for the first
+        # sync of a replica. Paged by the days in the numeric layout:
+        # - after: The key of the last day of the previous page, None for the first page,
+        #   which starts with all employees.
+        # - limit: Days per page (default: all).
+        keys = []
+        if after is None:
+            self.c.execute("SELECT 'employees', employee_id, NULL FROM employees ORDER BY employee_id")
+            keys = self.c.fetchall()
+            after = ('timesheet', '', 0)
+        self.c.execute('''
+            SELECT 'timesheet', employee_id, day FROM timesheet_v2
+            WHERE (employee_id, day) > (?, ?)
+            ORDER BY employee_id, day
+            LIMIT ?
+        ''', (after[1], after[2], limit))
+        return keys + self.c.fetchall()
+
+    # ------------------------------------------------------------------------------
+
+    def load_sync_records(self, keys):
+        # Returns the rows with keys as returned by load_changed_keys() in the numeric layout.
+        # Tuples of table_name, employee_id, day, the values of SYNC_FIELDS[table_name]
+        # (None if the row does not exist) and the times of their last changes in seconds
+        # since the epoch (0 if unknown, e.g. for fields unchanged since the update).
+        return [(table_name, employee_id, day) + self.__load_sync_values(table_name, employee_id, day)
+                for table_name, employee_id, day in keys]
+
+    # ------------------------------------------------------------------------------
+
+    def __load_sync_values(self, table_name, employee_id, day):
+        # Returns the values of a row and their timestamps, see load_sync_records()
+        fields = SYNC_FIELDS[table_name]
+        if table_name == 'employees':
+            self.c.execute(f'SELECT {", ".join(fields)} FROM employees WHERE employee_id = ?',
+                           (employee_id,))
+        else:
+            self.c.execute(f'SELECT {", ".join(fields)} FROM timesheet_v2 WHERE employee_id = ? AND day = ?',
+                           (employee_id, day))
+        values = self.c.fetchone()
+        self.c.execute('''
+            SELECT field, modified_at FROM field_clock WHERE table_name = ? AND employee_id = ? AND day = ?
+        ''', (table_name, employee_id, day or 0))
+        modified_at = dict(self.c.fetchall())
+        return values, tuple(modified_at.get(field, 0) for field in fields)
+
+    # ------------------------------------------------------------------------------
+
+    def apply_sync_records(self, records):
+        # Merges rows of another database as returned by load_sync_records(), field by field:
+        # the value changed last wins, on equal timestamps the greater one, so both databases
+        # end up with the same values. Merging the same records again changes nothing.
+        # A deleted day is a day without times in the default state, days of closed months
+        # are not changed. Must be called within transaction().
+        # Returns the keys of the changed rows and the keys of the rejected days.
+        changed = []
+        rejected = []
+        for table_name, employee_id, day, values, modified_at in records:
+            fields = SYNC_FIELDS[table_name]
+            empty = (None, None, None, 0) if table_name == 'timesheet' else (None,) * len(fields)
+            if values is None:
+                # Employees are never deleted
+                if table_name == 'employees':
+                    continue
+                values = empty
+            local_values, local_modified_at = self.__load_sync_values(table_name, employee_id, day)
+            current = tuple(local_values or empty)
+
+            merged = [(at, value) if (at, value is not None, repr(value))
+                      > (local_at, local_value is not None, repr(local_value))
+                      else (local_at, local_value)
+                      for value, at, local_value, local_at
+                      in zip(values, modified_at, current, local_modified_at)]
+            merged_values = tuple(value for _, value in merged)
+            if merged_values != current:
+                if table_name == 'timesheet' and self.__is_closed_day(employee_id, day):
+                    rejected.append((table_name, employee_id, day))
+                    continue
+                self.__write_sync_values(table_name, employee_id, day, merged_values,
+                                         local_values is not None)
+                changed.append((table_name, employee_id, day))
+            # Also after the row was written, which stamped its changed fields with now
+            self.c.executemany('''
+                INSERT INTO field_clock (table_name, employee_id, day, field, modified_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (table_name, employee_id, day, field) DO UPDATE SET modified_at = excluded.modified_at
+            ''', [(table_name, employee_id, day or 0, field, at)
+                  for field, (at, _), local_at in zip(fields, merged, local_modified_at)
+                  if at and at != local_at or merged_values != current])
+        return changed, rejected
+
+    # ------------------------------------------------------------------------------
+
+    def __is_closed_day(self, employee_id, day):
+        # Returns True if the day number day of an employee is in a closed month
+        self.c.execute('''
+            SELECT 1 FROM closed_months WHERE employee_id = ? AND ? BETWEEN first_day AND last_day
+        ''', (employee_id, day))
+        return self.c.fetchone() is not None
+
+    # ------------------------------------------------------------------------------
+
+    def __write_sync_values(self, table_name, employee_id, day, values, exists):
+        # Writes the merged values of a row for apply_sync_records(), the version is
+        # increased so instances holding the row detect the change
+        if table_name == 'employees':
+            columns = ", ".join(SYNC_FIELDS['employees'])
+            if exists:
+                self.c.execute(f'''
+                    UPDATE employees SET ({columns}) = ({", ".join("?" * len(values))}),
+                        version = version + 1
+                    WHERE employee_id = ?
+                ''', values + (employee_id,))
             else:
-                workhours = DatetimeFunctions.get_time_difference(
-                    self, starttime, endtime)
+                self.c.execute(f'''
+                    INSERT INTO employees (employee_id, {columns}, version)
+                    VALUES (?, {", ".join("?" * len(values))}, 1)
+                ''', (employee_id,) + values)
+            return
 
-            # Update the timesheet record for the given date
+        start, end, break_seconds, state = values
+        if (start, end, break_seconds, state) == (None, None, None, 0):
+            self.c.execute('DELETE FROM timesheet_v2 WHERE employee_id = ? AND day = ?', (employee_id, day))
+            return
+        work = None
+        if start is not None and end is not None:
+            work = end - start - (break_seconds or 0)
+        if exists:
             self.c.execute('''
-                UPDATE timesheet
-                SET starttime = ?, endtime = ?, workhours = ?, breaktime = ?, state = ?
-                WHERE employee_id = ? AND date = ?
-            ''',
-                           (starttime, endtime, workhours, breaktime, state, employee_id, date))
+                UPDATE timesheet_v2
+                SET start_seconds = ?, end_seconds = ?, break_seconds = ?, work_seconds = ?, state = ?,
+                    version = version + 1
+                WHERE employee_id = ? AND day = ?
+            ''', (start, end, break_seconds, work, state, employee_id, day))
+        else:
+            self.c.execute('''
+                INSERT INTO timesheet_v2 (employee_id, day, start_seconds, end_seconds, break_seconds,
+                                          work_seconds, state, version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+            ''', (employee_id, day, start, end, break_seconds, work, state))
 
-            # Commit the changes to the database
-            self.conn.commit()
+    # ------------------------------------------------------------------------------
 
-        # If data could not be updated, raise error
-        except sqlite3.Error as e:
-            # Rollback in case something goes wrong
-            self.conn.rollback()
-            # Raise Error
-            raise sqlite3.Error(f"Error updating database: {e}")
+    def load_reference_rows(self):
+        # Returns the rows of the REFERENCE_TABLES as a dictionary of table name and rows
+        return {table: self.c.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall()
+                for table in REFERENCE_TABLES}
 
     # ------------------------------------------------------------------------------
 
-    # Delete data from database
-    def delete_from_database(self, employee_id, date):
-        try:
-            # Delete a record from the timesheet table where the date matches
-            self.c.execute('''
-                DELETE FROM timesheet
-                WHERE employee_id = ? AND date = ?
-            ''', (employee_id, date))
+    def replace_reference_rows(self, tables):
+        # Replaces the rows of the REFERENCE_TABLES by rows as returned by load_reference_rows()
+        # of the central database, tables whose rows are equal are kept.
+        # Must be called within transaction(). Returns the names of the replaced tables.
+        replaced = []
+        for table, rows in tables.items():
+            if table not in REFERENCE_TABLES:
+                continue
+            rows = {tuple(row) for row in rows}
+            current = set(self.c.execute(f'SELECT * FROM {table}').fetchall())
+            if rows == current:
+                continue
+            self.c.execute(f'DELETE FROM {table}')
+            if rows:
+                self.c.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(next(iter(rows))))})',
+                                   sorted(rows))
+            if table == 'closed_months':
+                # Closed months are not part of the snapshots
+                for employee_id in sorted({row[0] for row in rows ^ current}):
+                    self.__count_timesheet_change(employee_id)
+            replaced.append(table)
+        return replaced
 
-            # Commit the changes to the database
-            self.conn.commit()
+    # ------------------------------------------------------------------------------
 
-            # Check if any rows were affected
-            if self.c.rowcount == 0:
-                if gui_constants.DEBUG:
-                    print(f"No records found for date {date} to delete.")
-            else:
-                print(f"Record for date {date} deleted successfully.")
+    def load_sync_cursor(self, name):
+        # Returns a cursor of the sync of a replica, None if it was never stored
+        self.c.execute('SELECT value FROM sync_state WHERE name = ?', (name,))
+        row = self.c.fetchone()
+        return None if row is None else row[0]
 
-        # If data could not be deleted
-        except sqlite3.Error as e:
-            # Rollback in case something goes wrong
-            self.conn.rollback()
-            # Raise Error
-            raise sqlite3.Error(f"Error deleting from database: {e}")
+    # ------------------------------------------------------------------------------
+
+    def save_sync_cursor(self, name, value):
+        # Stores a cursor of the sync of a replica
+        self.c.execute('''
+            INSERT INTO sync_state (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        ''', (name, value))
+        self.__commit()
 
     # ------------------------------------------------------------------------------
 
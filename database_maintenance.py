@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+This module backs up and maintains the database of the STC time management
+application.
+
+Tasks
+-----
+backup
+    Copies the database with the SQLite online backup API into
+    gui_constants.BACKUP_DIRECTORY while other connections keep working.
+    The copy is made in steps of gui_constants.BACKUP_PAGES_PER_STEP pages,
+    the database is only locked during a step. Archives of past years (see
+    timesheet_archive.py) never change and are copied once. The newest
+    gui_constants.BACKUPS_KEPT backups are kept.
+analyze
+    Updates the statistics the query planner chooses indexes with.
+vacuum
+    Gives up to gui_constants.VACUUM_PAGES free pages back to the file
+    system (incremental vacuum). New databases support this, existing ones
+    are converted once with "vacuum --full".
+integrity
+    Checks the database file for corruption.
+
+Every task reports its duration and the database size before and after, and
+records them in the maintenance_log table. The maintenance is a scheduled
+job: `python database_maintenance.py due` runs the tasks which are due
+(gui_constants.MAINTENANCE_INTERVALS), e.g. started hourly by cron or the
+Windows task scheduler. With gui_constants.RUN_MAINTENANCE the application
+and the timesheet service also check every
+gui_constants.MAINTENANCE_CHECK_INTERVAL milliseconds, the first time one
+interval after their start, and run the due tasks on a background thread;
+only one instance runs a due task.
+
+Functions
+---------
+run_task(task, db=None, **options)
+    Runs one task and reports it.
+run_due_tasks(database_path=None)
+    Runs all tasks which are due.
+run_due_tasks_in_background()
+    Runs the due tasks on the background thread.
+
+Usage
+-----
+    python database_maintenance.py backup [--target PATH]
+    python database_maintenance.py analyze
+    python database_maintenance.py vacuum [--full]
+    python database_maintenance.py integrity [--full]
+    python database_maintenance.py due
+    python database_maintenance.py status
+"""
+
+import argparse
+import concurrent.futures
+import datetime as dt
+import glob
+import logging
+import os
+import time
+
+import gui_constants
+import instrumentation
+import logging_config
+
+logger = logging.getLogger(__name__)
+
+
+def get_backup_directory(database_path=None):
+    """Return the folder the backups of a database are stored in."""
+    return gui_constants.BACKUP_DIRECTORY or os.path.join(
+        os.path.dirname(database_path or gui_constants.DATABASE_PATH), "backups")
+
+
+def copy_database(connection, target_path):
+    """
+    Copy a database with the online backup API in small steps.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection to the database to copy.
+    target_path : str
+        The backup file, replaced atomically once the copy is complete.
+    """
+    # Deferred, sqlite3 is not loaded while the application starts
+    import sqlite3
+
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    target = sqlite3.connect(target_path + ".tmp")
+    try:
+        # Restarts if another connection writes between two steps
+        connection.backup(target, pages=gui_constants.BACKUP_PAGES_PER_STEP,
+                          sleep=gui_constants.BACKUP_STEP_SLEEP)
+    finally:
+        target.close()
+    os.replace(target_path + ".tmp", target_path)
+
+
+def backup(db, target_path=None):
+    """
+    Back up the database and its archives.
+
+    Parameters
+    ----------
+    db : DatabaseFunctions
+        Connection to the database.
+    target_path : str, optional
+        The backup file (default is a file named after the database and the
+        current time in the backup folder, of which the newest
+        gui_constants.BACKUPS_KEPT are kept).
+
+    Returns
+    -------
+    str
+        The result to report.
+    """
+    import sqlite3
+
+    directory = get_backup_directory(db.database_path)
+    stem, extension = os.path.splitext(os.path.basename(db.database_path))
+    is_rotated = target_path is None
+    if is_rotated:
+        target_path = os.path.join(directory, "{stem}_{now:%Y%m%d_%H%M%S}{extension}".format(
+            stem=stem, now=dt.datetime.now(), extension=extension))
+    copy_database(db.conn, target_path)
+
+    # Archives never change, they are copied once
+    for _, file_name, *_ in db.load_archives():
+        if not os.path.exists(os.path.join(directory, file_name)):
+            archive = sqlite3.connect(os.path.join(os.path.dirname(db.database_path), file_name))
+            try:
+                copy_database(archive, os.path.join(directory, file_name))
+            finally:
+                archive.close()
+
+    if is_rotated:
+        backups = sorted(glob.glob(os.path.join(directory, f"{stem}_????????_??????{extension}")))
+        for old_backup in backups[:-gui_constants.BACKUPS_KEPT]:
+            os.remove(old_backup)
+    return "{size:.1f} MB written to {path}".format(
+        size=os.path.getsize(target_path) / 1e6, path=target_path)
+
+
+def analyze(db):
+    """Update the statistics of the query planner, returns the result to report."""
+    db.c.execute('ANALYZE')
+    return "ok"
+
+
+def vacuum(db, full=False):
+    """
+    Give free pages of the database file back to the file system.
+
+    Parameters
+    ----------
+    db : DatabaseFunctions
+        Connection to the database.
+    full : bool, optional
+        Rebuild the whole file and switch it to incremental vacuum
+        (default is False). Locks the database until it is done.
+
+    Returns
+    -------
+    str
+        The result to report.
+    """
+    if full:
+        db.c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        db.c.execute('VACUUM')
+        return "rebuilt, incremental from now on"
+    if db.c.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return "skipped, run 'python database_maintenance.py vacuum --full' once"
+    free_pages = db.c.execute('PRAGMA freelist_count').fetchone()[0]
+    pages = min(free_pages, gui_constants.VACUUM_PAGES or free_pages)
+    if pages == 0:
+        return "no free pages"
+    # execute() only runs the first step of the pragma, which releases a single page
+    db.conn.executescript(f'PRAGMA incremental_vacuum({pages});')
+    return f"{pages} pages released"
+
+
+def check_integrity(db, full=False):
+    """
+    Check the database file for corruption.
+
+    Parameters
+    ----------
+    db : DatabaseFunctions
+        Connection to the database.
+    full : bool, optional
+        Also check that indexes match their tables (default is False).
+
+    Returns
+    -------
+    str
+        "ok" or the first problems found.
+    """
+    db.c.execute('PRAGMA integrity_check(10)' if full else 'PRAGMA quick_check(10)')
+    problems = [row[0] for row in db.c.fetchall()]
+    return "ok" if problems == ["ok"] else "; ".join(problems)
+
+
+TASKS = {
+    'backup': backup,
+    'analyze': analyze,
+    'vacuum': vacuum,
+    'integrity': check_integrity,
+}
+
+
+def run_task(task, db=None, **options):
+    """
+    Run a maintenance task, report and record its duration and the
+    database size before and after.
+
+    Parameters
+    ----------
+    task : str
+        One of TASKS.
+    db : DatabaseFunctions, optional
+        An open connection to use.
+    **options
+        Passed on to the task, e.g. full=True.
+
+    Returns
+    -------
+    str
+        The result of the task.
+    """
+    import sqlite3
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    is_own_connection = db is None
+    if is_own_connection:
+        db = DatabaseFunctions()
+        run_with_retry(db.connect_to_database)
+    try:
+        size_before, _ = db.get_database_size()
+        start = time.perf_counter()
+        try:
+            with instrumentation.timer("maintenance." + task):
+                result = run_with_retry(TASKS[task], db, **options)
+        except (sqlite3.Error, OSError) as error:
+            result = f"failed: {error}"
+        seconds = time.perf_counter() - start
+        size_after, free_after = db.get_database_size()
+        run_with_retry(db.record_maintenance, task, seconds, size_before, size_after, result)
+        logger.info("Maintenance %s: %s (%.2f s, database %.1f MB -> %.1f MB, %.1f MB free)",
+                    task, result, seconds, size_before / 1e6, size_after / 1e6, free_after / 1e6)
+        return result
+    finally:
+        if is_own_connection:
+            db.disconnect_from_database()
+
+
+def run_due_tasks(database_path=None):
+    """
+    Run all tasks whose interval in gui_constants.MAINTENANCE_INTERVALS is
+    over. A task claimed by another instance is skipped.
+
+    Parameters
+    ----------
+    database_path : str, optional
+        The database (default is gui_constants.DATABASE_PATH).
+
+    Returns
+    -------
+    list
+        The tasks which were run.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database, database_path)
+    try:
+        tasks = []
+        for task, hours in gui_constants.MAINTENANCE_INTERVALS.items():
+            if run_with_retry(db.claim_maintenance_task, task, hours * 3600):
+                run_task(task, db)
+                tasks.append(task)
+        return tasks
+    finally:
+        db.disconnect_from_database()
+
+
+# One thread runs all tasks, so the UI and the service never wait for them
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="maintenance")
+running = None
+
+
+def run_due_tasks_in_background():
+    """
+    Run the due tasks on the background thread, unless the previous
+    check is still running.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        Completed once the due tasks are done.
+    """
+    global running
+
+    def run():
+        try:
+            return run_due_tasks(database_path)
+        except Exception as error:
+            logger.error("Failed to run the database maintenance: %s", error)
+            return []
+
+    if running is None or running.done():
+        # Bound now, the database path may change until the thread runs
+        database_path = gui_constants.DATABASE_PATH
+        running = executor.submit(run)
+    return running
+
+
+def print_status():
+    """Print the size of the database and the last run of every task."""
+    from database_functions import DatabaseFunctions
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        size, free = db.get_database_size()
+        print("Database {size:.1f} MB, {free:.1f} MB free.".format(size=size / 1e6, free=free / 1e6))
+        for task, last_run, seconds, size_before, size_after, result in db.load_maintenance_log():
+            print("{task}: {time:%Y-%m-%d %H:%M}, {result}".format(
+                task=task, time=dt.datetime.fromtimestamp(last_run), result=result or "running"))
+    finally:
+        db.disconnect_from_database()
+
+
+def main():
+    """Run maintenance tasks from the command line."""
+    parser = argparse.ArgumentParser(description="Back up and maintain the database")
+    parser.add_argument('action', choices=tuple(TASKS) + ('due', 'status'),
+                        help="'due' runs all tasks whose interval is over")
+    parser.add_argument('--full', action='store_true',
+                        help="vacuum: rebuild the file once, integrity: also check the indexes")
+    parser.add_argument('--target', help="backup: the backup file")
+    arguments = parser.parse_args()
+
+    logging_config.configure()
+    if arguments.action == 'status':
+        print_status()
+    elif arguments.action == 'due':
+        if not run_due_tasks():
+            print("No maintenance task is due.")
+    elif arguments.action == 'backup':
+        run_task('backup', target_path=arguments.target)
+    elif arguments.action in ('vacuum', 'integrity'):
+        run_task(arguments.action, full=arguments.full)
+    else:
+        run_task(arguments.action)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,8 @@ Created on Tue Nov  5 15:04:48 2024
 """
 # Datetime Function Module
 
+import calendar
 import datetime
-import numpy as np
 
 import gui_constants
 
@@ -177,25 +177,38 @@ class DatetimeFunctions():
 
     # ------------------------------------------------------------------------------
 
-    def get_time_difference(self, start_time, end_time):
-        """ Calculates time difference between two datetimes in seconds"""
+    def get_time_difference(self, start_time, end_time, day_offset=None):
+        """
+        Calculates time difference between two times in seconds.
+
+        Two full datetimes are subtracted as they are. For times of day,
+        day_offset is the amount of days the end lies after the start. By
+        default an end before the start is on the next day (overnight shift).
+        """
 
         # Convert strings to datetime objects if needed
         if isinstance(start_time, str):
-            start_time = self.convert_string_to_time(start_time)
+            start_time = DatetimeFunctions.convert_string_to_time(self, start_time)
         if isinstance(end_time, str):
-            end_time = self.convert_string_to_time(end_time)
-
-        # Convert datetime objects to datetime.time objects if needed
-        if isinstance(start_time, datetime.datetime):
-            start_time = start_time.time()
-        if isinstance(end_time, datetime.datetime):
-            end_time = end_time.time()
+            end_time = DatetimeFunctions.convert_string_to_time(self, end_time)
 
-        # Calculate the time difference in seconds
-        today = datetime.date.today()
-        start_datetime = datetime.datetime.combine(today, start_time)
-        end_datetime = datetime.datetime.combine(today, end_time)
+        if isinstance(start_time, datetime.datetime) and isinstance(end_time, datetime.datetime):
+            start_datetime = start_time
+            end_datetime = end_time
+        else:
+            # Convert datetime objects to datetime.time objects if needed
+            if isinstance(start_time, datetime.datetime):
+                start_time = start_time.time()
+            if isinstance(end_time, datetime.datetime):
+                end_time = end_time.time()
+
+            # Calculate the time difference in seconds
+            today = datetime.date.today()
+            start_datetime = datetime.datetime.combine(today, start_time)
+            end_datetime = datetime.datetime.combine(today, end_time)
+            if day_offset is None:
+                day_offset = 1 if end_datetime < start_datetime else 0
+            end_datetime += datetime.timedelta(days=day_offset)
 
         # Ensure end_time is greater than start_time
         if end_datetime < start_datetime:
@@ -209,6 +222,90 @@ class DatetimeFunctions():
 
     # ------------------------------------------------------------------------------
 
+    def add_months(self, date_object, months):
+        """
+        Add an amount of months to a date.
+
+        If the day does not exist in the resulting month, the last day of
+        that month is used instead, e.g. January 31st plus one month
+        results in February 28th or 29th.
+
+        Parameters
+        ----------
+        date_object : datetime.date
+            The date to start from.
+        months : int
+            Amount of months to add, may be negative.
+
+        Returns
+        -------
+        datetime.date
+            The shifted date.
+        """
+        month_index = date_object.year * 12 + date_object.month - 1 + months
+        year, month = divmod(month_index, 12)
+        day = min(date_object.day, calendar.monthrange(year, month + 1)[1])
+        return date_object.replace(year=year, month=month + 1, day=day)
+
+    # ------------------------------------------------------------------------------
+
+    def get_easter_sunday(self, year):
+        """
+        Calculate the date of Easter Sunday (Gregorian calendar).
+
+        Parameters
+        ----------
+        year : int
+            The year.
+
+        Returns
+        -------
+        datetime.date
+            Easter Sunday of that year.
+        """
+        # Anonymous Gregorian algorithm (Meeus/Jones/Butcher)
+        a = year % 19
+        b, c = divmod(year, 100)
+        d, e = divmod(b, 4)
+        f = (b + 8) // 25
+        g = (b - f + 1) // 3
+        h = (19 * a + b - d - g + 15) % 30
+        i, k = divmod(c, 4)
+        l = (32 + 2 * e + 2 * i - h - k) % 7
+        m = (a + 11 * h + 22 * l) // 451
+        month, day = divmod(h + l - 7 * m + 114, 31)
+        return datetime.date(year, month, day + 1)
+
+    # ------------------------------------------------------------------------------
+
+    def get_public_holidays(self, year, region=None):
+        """
+        Return the public holidays of a year.
+
+        Parameters
+        ----------
+        year : int
+            The year.
+        region : str, optional
+            Key of gui_constants.REGIONAL_HOLIDAYS whose holidays are added
+            to the nationwide ones (default is gui_constants.DEFAULT_REGION).
+
+        Returns
+        -------
+        set
+            The holidays as datetime.date objects.
+        """
+        fixed_days, easter_offsets = gui_constants.REGIONAL_HOLIDAYS[
+            region or gui_constants.DEFAULT_REGION]
+        easter = DatetimeFunctions.get_easter_sunday(self, year)
+        holidays = {datetime.date(year, month, day)
+                    for month, day in gui_constants.FIXED_PUBLIC_HOLIDAYS + fixed_days}
+        holidays.update(easter + datetime.timedelta(days=offset)
+                        for offset in gui_constants.EASTER_PUBLIC_HOLIDAYS + easter_offsets)
+        return holidays
+
+    # ------------------------------------------------------------------------------
+
     def time_to_string(self, time=None, unsigned=True):
         """
         Convert time in seconds to a string formatted as "HH:MM".
@@ -229,8 +326,8 @@ class DatetimeFunctions():
         time_string = gui_constants.NO_TIME_DATA
 
         if time is not None:
-            sign = np.sign(time)
-            time = np.abs(time)
+            sign = -1 if time < 0 else 1
+            time = abs(time)
 
             time = time // 60
             minutes = time % 60
@@ -284,3 +381,23 @@ class DatetimeFunctions():
 
         """
         return (time_object.hour * 60 + time_object.minute) * 60 + time_object.second
+
+    # ------------------------------------------------------------------------------
+
+    def seconds_to_time(self, seconds):
+        """
+        Return the time of day the given seconds after midnight, the
+        inverse of time_in_seconds().
+
+        Parameters
+        ----------
+        seconds : int
+            Seconds since midnight, less than 86400.
+
+        Returns
+        -------
+        datetime.time
+            The time of day.
+
+        """
+        return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
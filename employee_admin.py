@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides bulk changes of the employees of the STC time
+management application.
+
+Employees can be assigned to a department. The vacation entitlement of a
+whole department (or of all employees) is set, and vacation days are granted
+to it, by one set-based UPDATE in a single transaction instead of loading,
+changing and saving every employee. Every changed employee gets a new
+version, so open instances reload its counters instead of overwriting them.
+
+Functions
+---------
+set_department(department, employee_ids)
+    Assigns employees to a department.
+set_entitlement(entitlement, department=None)
+    Sets the yearly vacation entitlement of a department.
+grant_vacation_days(days, department=None)
+    Adds vacation days to all employees of a department.
+list_departments()
+    Prints the departments.
+
+Usage
+-----
+    python employee_admin.py department DEPARTMENT EMPLOYEE_ID [EMPLOYEE_ID ...]
+    python employee_admin.py entitlement DAYS [--department DEPARTMENT]
+    python employee_admin.py grant DAYS [--department DEPARTMENT]
+    python employee_admin.py list
+"""
+
+import argparse
+
+
+def run_update(update, *arguments):
+    """
+    Run a bulk update of DatabaseFunctions in one transaction.
+
+    Parameters
+    ----------
+    update : str
+        Name of the DatabaseFunctions method.
+    *arguments
+        Passed on to the method.
+
+    Returns
+    -------
+    int
+        Amount of changed employees.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    def run():
+        with db.transaction():
+            return getattr(db, update)(*arguments)
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        return run_with_retry(run)
+    finally:
+        db.disconnect_from_database()
+
+
+def set_department(department, employee_ids):
+    """
+    Assign employees to a department.
+
+    Parameters
+    ----------
+    department : str or None
+        The department, None removes the employees from their department.
+    employee_ids : list
+        The employees to assign.
+
+    Returns
+    -------
+    int
+        Amount of changed employees.
+    """
+    return run_update('set_department', employee_ids, department)
+
+
+def set_entitlement(entitlement, department=None):
+    """
+    Set the yearly vacation entitlement of all employees of a department.
+    It is granted with the next vacation rollover, see vacation_rollover.py.
+
+    Parameters
+    ----------
+    entitlement : int
+        Vacation days per year.
+    department : str, optional
+        The department (default is all employees).
+
+    Returns
+    -------
+    int
+        Amount of changed employees.
+    """
+    return run_update('set_entitlement', entitlement, department)
+
+
+def grant_vacation_days(days, department=None):
+    """
+    Add vacation days to all employees of a department.
+
+    Parameters
+    ----------
+    days : int
+        Vacation days to add, negative days are taken away.
+    department : str, optional
+        The department (default is all employees).
+
+    Returns
+    -------
+    int
+        Amount of changed employees.
+    """
+    return run_update('grant_vacation_days', days, department)
+
+
+def list_departments():
+    """Print the departments with their amount of employees and entitlements."""
+    from database_functions import DatabaseFunctions
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        for department, employees, min_entitlement, max_entitlement in db.load_departments():
+            entitlement = (f"{min_entitlement}" if min_entitlement == max_entitlement
+                           else f"{min_entitlement}-{max_entitlement}")
+            print(f"{department or '(none)'}: {employees} employees, entitlement {entitlement} days")
+    finally:
+        db.disconnect_from_database()
+
+
+def main():
+    """Change employees in bulk from the command line."""
+    parser = argparse.ArgumentParser(description="Change the employees of a department in bulk")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+    department_parser = subparsers.add_parser('department', help="Assign employees to a department")
+    department_parser.add_argument('department', help="The department, '' removes the employees from theirs")
+    department_parser.add_argument('employee_ids', nargs='+')
+    for action, help_text in (('entitlement', "Set the yearly vacation entitlement"),
+                              ('grant', "Add vacation days, negative days are taken away")):
+        action_parser = subparsers.add_parser(action, help=help_text)
+        action_parser.add_argument('days', type=int)
+        action_parser.add_argument('--department', help="Only this department (default is all employees)")
+    subparsers.add_parser('list', help="Show the departments")
+    arguments = parser.parse_args()
+
+    if arguments.action == 'list':
+        list_departments()
+        return
+    if arguments.action == 'department':
+        changed = set_department(arguments.department or None, arguments.employee_ids)
+    elif arguments.action == 'entitlement':
+        changed = set_entitlement(arguments.days, arguments.department)
+    else:
+        changed = grant_vacation_days(arguments.days, arguments.department)
+    print(f"Changed {changed} employees.")
+
+
+if __name__ == "__main__":
+    main()
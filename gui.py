@@ -6,12 +6,15 @@ Created on Sun Nov 10 11:45:51 2024
 """
 
 import tkinter as tk
+import logging
 import re
-from dateutil.relativedelta import relativedelta
 import calendar
 
 from datetime_functions import DatetimeFunctions as dtf
 import gui_constants
+import instrumentation
+
+logger = logging.getLogger(__name__)
 
 
 class Day_Widget(tk.Frame):
@@ -75,6 +78,7 @@ class Day_Widget(tk.Frame):
         self.entry_break.config(font=("Arial", font_size))
         self.label_total.config(font=("Arial", font_size))
 
+    @instrumentation.timed("tk.validate_input")
     def on_validate_input(self, field_input):
         """
         Validates the input for the start time,
@@ -97,8 +101,7 @@ class Day_Widget(tk.Frame):
             if field_input[-2] != ":":
                 self.store_input()
         except Exception as e:
-            if gui_constants.DEBUG:
-                print("Exception catched in on_validate_input:", e)
+            logger.debug("Exception caught in on_validate_input: %s", e)
             if field_input == '':
                 self.delete_input()
 
@@ -112,15 +115,17 @@ class Day_Widget(tk.Frame):
         if len(field_input) > 5:
             is_valid = False
 
-        if gui_constants.DEBUG:
-            print("Is time input valid? ", is_valid)
+        logger.debug("Is time input valid? %s", is_valid)
 
         return is_valid
 
+    @instrumentation.timed("tk.validate_start")
     def on_validate_start(self, field_input):
         """
-        Validates that the start time input is in the correct format
-        and occurs before the end time.
+        Validates that the start time input is in the correct format.
+
+        A start after the end time is allowed, the
+        shift then ends on the next day.
 
         Parameters
         ----------
@@ -130,40 +135,21 @@ class Day_Widget(tk.Frame):
         Returns
         -------
         bool
-            True if the start time is valid and
-            leads end time; False otherwise.
+            True if the start time is valid; False otherwise.
         """
         is_valid = self.on_validate_input(field_input)
 
-        for i in range(0, len(field_input)):
-            try:
-                if self.var_end_time.get() == '':
-                    raise ValueError('End time is empty.')
-                end = dtf.convert_string_to_time(
-                    self, self.var_end_time.get())
-            except Exception:
-                end = dtf.convert_string_to_time(self, '23:59')
-
-            try:
-                start = field_input[:i+1] + '-0:00'[i+1:]
-                start = dtf.convert_string_to_time(self, start)
-            except Exception:
-                start = dtf.convert_string_to_time(self, '00:00')
-
-            try:
-                dtf.get_time_difference(self, start, end)
-            except Exception:
-                is_valid = False
-
-        if gui_constants.DEBUG:
-            print("Is start time input valid? ", is_valid)
+        logger.debug("Is start time input valid? %s", is_valid)
 
         return is_valid
 
+    @instrumentation.timed("tk.validate_end")
     def on_validate_end(self, field_input):
         """
-        Validates that the end time input is in the correct format
-        and occurs after the start time.
+        Validates that the end time input is in the correct format.
+
+        An end before the start time is allowed, the
+        shift then ends on the next day (overnight shift).
 
         Parameters
         ----------
@@ -173,37 +159,11 @@ class Day_Widget(tk.Frame):
         Returns
         -------
         bool
-            True if the end time is valid and
-            follows start time; False otherwise.
+            True if the end time is valid; False otherwise.
         """
         is_valid = self.on_validate_input(field_input)
 
-        for i in range(0, len(field_input)):
-            try:
-                if self.var_start_time.get() == '':
-                    raise ValueError('Start time is empty.')
-                start = dtf.convert_string_to_time(
-                    self, self.var_start_time.get())
-            except Exception:
-                start = dtf.convert_string_to_time(self, '00:00')
-
-            if len(field_input) > 1 and field_input[1] == ':':
-                field_input = '0' + field_input
-                i += 1
-
-            try:
-                end = field_input[:i+1] + '-9:59'[i+1:]
-                end = dtf.convert_string_to_time(self, end)
-            except Exception:
-                end = dtf.convert_string_to_time(self, '23:59')
-
-            try:
-                dtf.get_time_difference(self, start, end)
-            except Exception:
-                is_valid = False
-
-        if gui_constants.DEBUG:
-            print("Is end time input valid? ", is_valid)
+        logger.debug("Is end time input valid? %s", is_valid)
 
         return is_valid
 
@@ -317,6 +277,20 @@ class Day_Widget(tk.Frame):
         """
         self.var_total_time.set(dtf.time_to_string(self, time_in_seconds))
 
+    def set_read_only(self, read_only):
+        """
+        Locks or unlocks the input fields of this widget.
+
+        Parameters
+        ----------
+        read_only : bool
+            True if the day belongs to a closed month.
+        """
+        state = "readonly" if read_only else "normal"
+        self.entry_start.config(state=state)
+        self.entry_end.config(state=state)
+        self.entry_break.config(state=state)
+
 
 class Info_Panel(tk.Frame):
     def __init__(self, parent):
@@ -328,6 +302,7 @@ class Info_Panel(tk.Frame):
         self.var_flex_time = tk.StringVar(value="+ 00:00")
         self.var_vacation_days = tk.StringVar(value=30)
         self.var_old_vacation_days = tk.StringVar(value=0)
+        self.var_region = tk.StringVar(value=gui_constants.DEFAULT_REGION)
 
         # Original labels
         self.label_flex_time = tk.Label(
@@ -336,6 +311,8 @@ class Info_Panel(tk.Frame):
             self, text="Vacation Days:", font=("Arial", 12, "underline"), bg=gui_constants.BACKGROUND_COLOR)
         self.label_vacation_days_previous = tk.Label(
             self, text="From Previous Year:", font=("Arial", 12, "underline"), bg=gui_constants.BACKGROUND_COLOR)
+        self.label_region = tk.Label(
+            self, text="Holiday Region:", font=("Arial", 12, "underline"), bg=gui_constants.BACKGROUND_COLOR)
 
         # New labels displaying "--"
         self.label_flex_time_text = tk.Label(
@@ -344,6 +321,10 @@ class Info_Panel(tk.Frame):
             self, textvariable=self.var_vacation_days, font=("Arial", 12), bg=gui_constants.BACKGROUND_COLOR)
         self.label_vacation_days_previous_text = tk.Label(
             self, textvariable=self.var_old_vacation_days, font=("Arial", 12), bg=gui_constants.BACKGROUND_COLOR)
+        self.menu_region = tk.OptionMenu(
+            self, self.var_region, *sorted(gui_constants.REGIONAL_HOLIDAYS),
+            command=lambda region: self.master.master.main.change_region(region))
+        self.menu_region.config(font=("Arial", 12), bg=gui_constants.BACKGROUND_COLOR)
 
         # Arrange labels in the Info_Panel
         self.label_flex_time.pack(padx=5, pady=(2, 0), anchor="w")
@@ -356,6 +337,149 @@ class Info_Panel(tk.Frame):
         self.label_vacation_days_previous_text.pack(
             padx=10, pady=(0, 5), anchor="w")
 
+        self.label_region.pack(padx=5, pady=(2, 0), anchor="w")
+        self.menu_region.pack(padx=10, pady=(0, 5), anchor="w")
+
+
+class Debug_Panel(tk.Frame):
+    def __init__(self, parent):
+        """Composite widget listing the rolling instrumentation percentiles."""
+        super().__init__(master=parent, bg=gui_constants.BACKGROUND_COLOR,
+                         relief="solid", borderwidth=1)
+
+        self.var_summary = tk.StringVar(value="No measurements yet.")
+
+        self.label_title = tk.Label(
+            self, text="Timings (p50/p90/p99 ms):", font=("Arial", 10, "underline"), bg=gui_constants.BACKGROUND_COLOR)
+        self.label_summary = tk.Label(
+            self, textvariable=self.var_summary, font=("Courier", 8), justify="left", bg=gui_constants.BACKGROUND_COLOR)
+
+        self.label_title.pack(padx=5, pady=(2, 0), anchor="w")
+        self.label_summary.pack(padx=5, pady=(0, 5), anchor="w")
+
+    def show_summary(self, summary):
+        """
+        Displays an instrumentation summary.
+
+        Parameters
+        ----------
+        summary : dict
+            Summary as returned by Instrumentation.summary().
+        """
+        lines = []
+        for name, timer in summary["timers"].items():
+            lines.append("{name:<24}{p50:7.1f}{p90:7.1f}{p99:7.1f}".format(
+                name=name[:23], **timer))
+        for name, value in summary["counters"].items():
+            lines.append("{name:<24}{value:>21}".format(
+                name=name[:23], value=value))
+        if lines:
+            self.var_summary.set("\n".join(lines))
+
+
+class Booking_Dialog(tk.Toplevel):
+    STATES = (("Vacation", "vacation"), ("Sick Leave", "sick"), ("Cancel Absence", "default"))
+
+    def __init__(self, parent, main, date_object):
+        """Window for booking vacation or sick leave over a date range."""
+        super().__init__(master=parent, bg=gui_constants.BACKGROUND_COLOR)
+        self.main = main
+
+        self.var_start_date = tk.StringVar(value="{:%Y-%m-%d}".format(date_object))
+        self.var_end_date = tk.StringVar(value="{:%Y-%m-%d}".format(date_object))
+        self.var_state = tk.StringVar(value="vacation")
+        self.var_result = tk.StringVar(value="Weekends and public holidays are skipped.")
+
+        self.title("Request Vacation")
+        self.resizable(False, False)
+
+        tk.Label(self, text="From (YYYY-MM-DD):", font=("Arial", 12),
+                 bg=gui_constants.BACKGROUND_COLOR).grid(row=0, column=0, sticky="w", padx=10, pady=(10, 2))
+        tk.Entry(self, textvariable=self.var_start_date, font=("Arial", 12),
+                 justify="center").grid(row=0, column=1, padx=10, pady=(10, 2))
+        tk.Label(self, text="To (YYYY-MM-DD):", font=("Arial", 12),
+                 bg=gui_constants.BACKGROUND_COLOR).grid(row=1, column=0, sticky="w", padx=10, pady=2)
+        tk.Entry(self, textvariable=self.var_end_date, font=("Arial", 12),
+                 justify="center").grid(row=1, column=1, padx=10, pady=2)
+
+        for row, (text, state) in enumerate(self.STATES, start=2):
+            tk.Radiobutton(self, text=text, value=state, variable=self.var_state, font=("Arial", 12),
+                           bg=gui_constants.BACKGROUND_COLOR).grid(row=row, column=0, columnspan=2, sticky="w", padx=10)
+
+        tk.Label(self, textvariable=self.var_result, font=("Arial", 10), wraplength=320, justify="left",
+                 bg=gui_constants.BACKGROUND_COLOR).grid(row=5, column=0, columnspan=2, sticky="w", padx=10, pady=5)
+        tk.Button(self, text="Book", font=("Arial", 12), command=lambda: self.book()).grid(
+            row=6, column=0, columnspan=2, sticky="ew", padx=10, pady=(0, 10))
+
+    def book(self):
+        """
+        Callback method for the book button.
+        """
+        self.var_result.set(self.main.book_absence(
+            self.var_start_date.get(), self.var_end_date.get(), self.var_state.get()))
+
+
+class Team_Overview(tk.Toplevel):
+    COLUMNS = ("Employee", "Today", "Flex-Time", "Vacation Days", "Open Days")
+
+    def __init__(self, parent, main):
+        """Window listing one page of employees with their aggregated data."""
+        super().__init__(master=parent, bg=gui_constants.BACKGROUND_COLOR)
+        self.main = main
+        self.offset = 0
+        self.total = 0
+        self.var_page = tk.StringVar(value="")
+
+        self.title("Team Overview")
+        self.minsize(640, 400)
+
+        self.table = tk.Frame(self, bg=gui_constants.BACKGROUND_COLOR)
+        self.table.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        for column in range(len(self.COLUMNS)):
+            self.table.columnconfigure(column, weight=1, uniform="column")
+
+        navigation = tk.Frame(self, bg=gui_constants.BACKGROUND_COLOR)
+        navigation.pack(fill="x", padx=10, pady=(0, 10))
+        self.button_previous_page = tk.Button(navigation, text="Previous Page", font=(
+            "Arial", 10), command=lambda: self.show_page(self.offset - gui_constants.TEAM_OVERVIEW_PAGE_SIZE))
+        self.button_previous_page.pack(side="left")
+        self.button_next_page = tk.Button(navigation, text="Next Page", font=(
+            "Arial", 10), command=lambda: self.show_page(self.offset + gui_constants.TEAM_OVERVIEW_PAGE_SIZE))
+        self.button_next_page.pack(side="right")
+        tk.Label(navigation, textvariable=self.var_page, font=("Arial", 10),
+                 bg=gui_constants.BACKGROUND_COLOR).pack(expand=True)
+
+        self.show_page(0)
+
+    def show_page(self, offset):
+        """
+        Loads and displays the page of employees starting at offset.
+
+        Parameters
+        ----------
+        offset : int
+            Index of the first employee of the page.
+        """
+        rows, self.total = self.main.load_team_page(
+            offset, gui_constants.TEAM_OVERVIEW_PAGE_SIZE)
+        self.offset = offset
+
+        for widget in self.table.winfo_children():
+            widget.destroy()
+        for column, title in enumerate(self.COLUMNS):
+            tk.Label(self.table, text=title, font=("Arial", 12, "underline"),
+                     bg=gui_constants.BACKGROUND_COLOR).grid(row=0, column=column, sticky="w")
+        for row, values in enumerate(rows, start=1):
+            for column, value in enumerate(values):
+                tk.Label(self.table, text=value, font=("Arial", 12),
+                         bg=gui_constants.BACKGROUND_COLOR).grid(row=row, column=column, sticky="w")
+
+        last = min(offset + gui_constants.TEAM_OVERVIEW_PAGE_SIZE, self.total)
+        self.var_page.set("{first}-{last} of {total}".format(
+            first=offset + 1 if self.total else 0, last=last, total=self.total))
+        self.button_previous_page.config(state="normal" if offset > 0 else "disabled")
+        self.button_next_page.config(state="normal" if last < self.total else "disabled")
+
 
 class Sidebar(tk.Frame):
     def __init__(self, parent, width):
@@ -372,6 +496,11 @@ class Sidebar(tk.Frame):
             "Arial", 12), command=lambda: self.request_vacation())
         self.button_request_vacation.pack(padx=10, fill="x")
 
+        # Show hot path timings below the buttons if instrumentation is enabled
+        if gui_constants.INSTRUMENTATION:
+            self.debug_panel = Debug_Panel(self)
+            self.debug_panel.pack(padx=10, pady=10, fill="x")
+
         # Create two buttons at the bottom, stacked on top of each other
         self.button_log_break = tk.Button(self, text="Start Break", font=(
             "Arial", 12), command=lambda: self.log_break())
@@ -382,6 +511,15 @@ class Sidebar(tk.Frame):
         self.button_log_break.pack(side="bottom", padx=10, pady=10, fill="x")
         self.button_log_work.pack(side="bottom", padx=10, fill="x")
 
+    def show_team_button(self):
+        """
+        Adds the team overview button below the request vacation button.
+        """
+        self.button_team_overview = tk.Button(self, text="Team Overview", font=(
+            "Arial", 12), command=lambda: self.master.main.open_team_overview())
+        self.button_team_overview.pack(padx=10, pady=(10, 0), fill="x",
+                                       after=self.button_request_vacation)
+
     def request_vacation(self):
         """
         Callback method for request vacation button.
@@ -510,15 +648,15 @@ class MainApp(tk.Frame):
         """
         self.main.store_all_inputs()
         self.main.select_month(
-            self.main.selected_date + relativedelta(months=1))
+            dtf.add_months(self, self.main.selected_date, 1))
 
     def previous_month(self):
         """
         Moves the calendar display back by one month,
         updating the main calendar widget.
         """
-        self.main.select_month(self.main.selected_date +
-                               relativedelta(months=-1))
+        self.main.select_month(
+            dtf.add_months(self, self.main.selected_date, -1))
 
 
 # Testing Login
@@ -1,9 +1,15 @@
 # Data
 DAILY_WORKING_HOURS = 8
+# A workday still running after midnight is ended by a punch up to this many hours after its start
+MAX_SHIFT_HOURS = 16
 NO_TIME_DATA = "--:--"
 TIME_FORMAT = '%H:%M'
 DATA_PATH = "data/"
 DATABASE_PATH = "data/timesheet.db"
+INSTRUMENTATION_PATH = "data/instrumentation.json"
+PROFILING_PATH = "data/profiling/"
+LAST_USER_PATH = "data/last_user.txt"
+CALENDAR_PATH = "data/calendar/"
 
 # Fonts
 BOLD = ('TkDefaultFont', 9, 'bold')
@@ -25,6 +31,92 @@ AUTO_LOGIN = False
 SHOW_ONLY_MINIMUM_DAYS = False
 USE_TEXT_HINTS = False
 USE_DATABASE = True
+USE_SERVICE = False
+USE_SNAPSHOTS = False  # Load unchanged timesheets from binary snapshots next to the database
+RUN_MAINTENANCE = False  # Maintain in the background, else schedule "database_maintenance.py due"
+USE_REPLICA = False  # Work on a local copy of DATABASE_PATH, synced in the background
+SYNC_WITH_SERVICE = False  # Sync the replica with the timesheet service instead of the database file
 REDUCED_DATABASE_TRAFFIC = True
 IMPORT_FROM_CSV = False
 WRITE_TO_CSVS = False
+INSTRUMENTATION = False
+PROFILING = False
+PROFILE_MEMORY = False
+
+# Logging, see logging_config.py
+LOG_LEVEL = 'INFO'  # Level of all modules, DEBUG while DEBUG is set
+LOG_LEVELS = {  # Levels of single modules, e.g. 'database_functions': 'DEBUG'
+    'gui': 'WARNING',  # Input validation logs every keystroke
+}
+LOG_PATH = None  # Also write the log into this file, e.g. "data/timesheet.log"
+LOG_RATE_LIMIT = 10  # Equal messages written per period at most, further ones are dropped
+LOG_RATE_PERIOD = 10.0  # Seconds
+
+# Instrumentation
+INSTRUMENTATION_WINDOW = 500  # Durations kept per timer
+INSTRUMENTATION_REFRESH = 1000  # Debug panel refresh interval in ms
+
+# Database
+DATABASE_TIMEOUT = 5.0  # Seconds to wait for a lock held by another process
+DATABASE_RETRIES = 5  # Retries after the timeout if the database is still busy
+DATABASE_BACKOFF = 0.05  # Base delay in seconds, doubled after every retry
+MIGRATION_BATCH_SIZE = 5000  # Rows copied per transaction by timesheet_migration.py
+
+# Timesheet service
+SERVICE_HOST = '127.0.0.1'  # Only reachable from this machine
+SERVICE_PORT = 8765
+SERVICE_TIMEOUT = 5.0  # Seconds to wait for a response
+SERVICE_EVENT_REFRESH = 200  # Milliseconds between checks for pushed changes
+
+# Vacation
+VACATION_DAYS_PER_YEAR = 30  # Default entitlement of new employees
+VACATION_CARRY_OVER_LIMIT = None  # Days carried over at most, None for no limit
+ROLLOVER_CHUNK_SIZE = 1000  # Employees per worker for the csv rollover
+
+# Maintenance, see database_maintenance.py
+BACKUP_DIRECTORY = None  # None for "backups" next to the database
+BACKUPS_KEPT = 7  # Older backups are deleted
+BACKUP_PAGES_PER_STEP = 256  # Pages copied per step of the online backup
+BACKUP_STEP_SLEEP = 0.01  # Seconds between two steps, other connections can write meanwhile
+VACUUM_PAGES = 1000  # Free pages released per incremental vacuum, None for all
+MAINTENANCE_INTERVALS = {  # Hours between two runs of a task
+    'backup': 24,
+    'analyze': 24 * 7,
+    'vacuum': 24 * 7,
+    'integrity': 24 * 7,
+}
+MAINTENANCE_CHECK_INTERVAL = 600000  # Milliseconds between two checks for due tasks
+
+# Change feed
+CHANGE_FEED_BATCH_SIZE = 1000  # Sequence numbers read per query by change_feed.py
+
+# Replica, see timesheet_replica.py
+REPLICA_PATH = "~/.stc_timesheet/replica.db"  # On the local disk
+SYNC_INTERVAL = 30000  # Milliseconds between two syncs with the central database
+SYNC_BATCH_SIZE = 500  # Changes merged per transaction
+
+# Month close
+MONTH_CLOSE_DAY = 10  # From this day on, month_close.py auto closes the previous month (after payroll)
+
+# Public holidays, no target hours and skipped when vacation or sick leave is booked
+# New Year, Labour Day, German Unity Day, Christmas
+FIXED_PUBLIC_HOLIDAYS = ((1, 1), (5, 1), (10, 3), (12, 25), (12, 26))
+# Days after Easter Sunday: Good Friday, Easter Monday, Ascension, Whit Monday
+EASTER_PUBLIC_HOLIDAYS = (-2, 1, 39, 50)
+# Additional holidays per region as (fixed (month, day), days after Easter Sunday)
+REGIONAL_HOLIDAYS = {
+    'DE': ((), ()),
+    'DE-BW': (((1, 6), (11, 1)), (60,)),  # Epiphany, All Saints, Corpus Christi
+    'DE-BY': (((1, 6), (8, 15), (11, 1)), (60,)),  # Also Assumption Day
+    'DE-BE': (((3, 8),), ()),  # International Women's Day
+    'DE-HH': (((10, 31),), ()),  # Reformation Day
+    'DE-NW': (((11, 1),), (60,)),
+}
+DEFAULT_REGION = 'DE'  # Region of employees without own region
+
+# Team overview
+TEAM_OVERVIEW_ROLES = ('Admin', 'Supervisor', 'CEO', 'Human Resources')
+TEAM_OVERVIEW_PAGE_SIZE = 25  # Employees per page
+
+# Profiling
+PROFILING_HOTKEY = '<F12>'  # Starts/stops a capture, None to disable
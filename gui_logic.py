@@ -16,18 +16,25 @@ Timesheet
 @author: Luka, jnath, lpasd, Tim, Danny
 """
 import tkinter as tk
+import tkinter.messagebox
 import calendar
-from datetime import date
+from datetime import date, datetime
 import os.path
 import csv
-import dateutil.relativedelta as rdelta
-import sqlite3
+import logging
+import queue
+import threading
 
-from data_model import WorkTimeEmployee
+from data_model import WorkTimeEmployee, ConcurrentModificationError
 from datetime_functions import DatetimeFunctions as dtf
 from login import LoginFrame
 import gui
 import gui_constants
+import instrumentation
+from profiling import Profiler
+import working_calendar
+
+logger = logging.getLogger(__name__)
 
 
 class Timesheet:
@@ -97,25 +104,126 @@ class Timesheet:
         selected date, adds a default employee,
         and starts the main loop.
 
-        Falls back to csv files if no database shall be used.
+        Falls back to csv files if neither database nor service shall be used.
+        Runs the whole session under the profiler if profiling is enabled.
         """
-        if not gui_constants.USE_DATABASE:
+        if not (gui_constants.USE_DATABASE or gui_constants.USE_SERVICE):
             gui_constants.IMPORT_FROM_CSV = True
 
-        self.run()
+        self.profiler = Profiler()
+        if gui_constants.PROFILING:
+            self.profiler.start()
+
+        try:
+            self.run()
+        finally:
+            self.profiler.stop()
 
     def run(self):
         """Create the main window provided by the os' window manager."""
         self.selected_date = date.today()
         self.root = tk.Tk()
+        # Captures exactly the slow interaction, with or without PROFILING
+        if gui_constants.PROFILING_HOTKEY:
+            self.root.bind_all(gui_constants.PROFILING_HOTKEY,
+                               self.profiler.toggle)
+
+        # The replica replaces the database before anything is read
+        self.sync = None
+        if (gui_constants.USE_REPLICA and gui_constants.USE_DATABASE
+                and not gui_constants.USE_SERVICE):
+            # Deferred, the replica and its transports are only loaded if it is used
+            import timesheet_replica
+
+            timesheet_replica.open_replica()
+            self.schedule_sync()
 
         self.create_login_window()
 
         if gui_constants.AUTO_LOGIN:
             self.login('default')
 
+        # With the service, the service maintains the database
+        if (gui_constants.RUN_MAINTENANCE and gui_constants.USE_DATABASE
+                and not gui_constants.USE_SERVICE):
+            # Not at startup, the first check is one interval later
+            self.root.after(gui_constants.MAINTENANCE_CHECK_INTERVAL,
+                            self.schedule_maintenance)
+
         self.root.mainloop()
 
+    def schedule_maintenance(self):
+        """
+        Run the due database maintenance tasks in the background.
+
+        Reschedules itself every gui_constants.MAINTENANCE_CHECK_INTERVAL
+        milliseconds as long as the application runs.
+        """
+        # Deferred, the maintenance is not needed to show the login window
+        import database_maintenance
+
+        database_maintenance.run_due_tasks_in_background()
+        self.root.after(gui_constants.MAINTENANCE_CHECK_INTERVAL,
+                        self.schedule_maintenance)
+
+    def schedule_sync(self):
+        """
+        Sync the replica with the central database in the background and
+        show the pulled changes of the previous sync.
+
+        Reschedules itself every gui_constants.SYNC_INTERVAL milliseconds
+        as long as the application runs.
+        """
+        import timesheet_replica
+
+        if self.sync is not None and self.sync.done() and self.sync.result():
+            self.show_pulled_changes(self.sync.result())
+        self.sync = timesheet_replica.sync_in_background()
+        self.root.after(gui_constants.SYNC_INTERVAL, self.schedule_sync)
+
+    def show_pulled_changes(self, changes):
+        """
+        Reload the days and vacation days pulled into the replica.
+
+        Days and counters with unsaved local changes are kept, they are
+        pushed with the next sync.
+
+        Parameters
+        ----------
+        changes : dict
+            As returned by timesheet_replica.Replica.sync().
+        """
+        employee_ids = [employee_id for employee_id in changes["employees"]
+                        if employee_id not in self.employees
+                        or not self.employees[employee_id].counters_modified()]
+        if employee_ids:
+            self.load_employees_from_database(employee_ids)
+
+        changed_dates = []
+        for employee_id, date_strings in changes["days"].items():
+            employee = self.employees.get(employee_id)
+            if employee is None or not employee.is_loaded:
+                continue
+            date_strings = [date_string for date_string in date_strings
+                            if not employee.get_day(dtf.convert_string_to_date(
+                                self, date_string)).is_modified()]
+            if not date_strings:
+                continue
+            employee.reload_days(date_strings)
+            if employee is self.current_employee:
+                changed_dates += date_strings
+
+        if self.current_employee is None:
+            return
+        try:
+            for day in self.gui.days:
+                if day.date is not None and "{:%Y-%m-%d}".format(day.date) in changed_dates:
+                    self.update_day_widget(day)
+            self.update_info_panel()
+            self.update_buttons()
+        except tk.TclError:
+            pass  # Timesheet window was closed in the meantime
+
     def create_login_window(self):
         """
         Create login window.
@@ -127,27 +235,25 @@ class Timesheet:
             widget.destroy()
 
         window_pos_x = (self.root.winfo_screenwidth()-300)/2
-        window_pos_y = (self.root.winfo_screenheight()-200)/2
+        window_pos_y = (self.root.winfo_screenheight()-220)/2
 
         self.root.title("Login Screen")
-        self.root.minsize(300, 200)
-        self.root.geometry('300x200+%d+%d' % (window_pos_x, window_pos_y))
+        self.root.minsize(300, 220)
+        self.root.geometry('300x220+%d+%d' % (window_pos_x, window_pos_y))
         self.root.protocol("WM_DELETE_WINDOW", lambda: self.on_closing())
 
         try:
             os.mkdir(gui_constants.DATA_PATH)
         except FileExistsError:
-            print("Tried to create '~/data' folder but it exists already.")
+            pass  # Created by an earlier start
         except OSError as error:
-            print(error)
+            logger.error("Failed to create the data folder: %s", error)
 
         self.employees = {}
         self.file_path_employees = os.path.join(
             gui_constants.DATA_PATH, "employees.csv")
-        if os.path.isfile(self.file_path_employees) or os.path.isfile(gui_constants.DATABASE_PATH):
-            self.load_employees()
-        else:
-            self.save_employees()
+        # Rows of the employees csv file as last written, it is only rewritten if they changed
+        self.stored_csv_rows = None
         self.current_employee = None
 
         self.login_frame = LoginFrame(self.root, self)
@@ -155,6 +261,102 @@ class Timesheet:
 
         self.root.bind('<Return>', self.login_frame.login)
 
+        # Load data while the credentials are typed
+        self.preload_thread = None
+        self.preload_messages = queue.Queue()
+        # The employee whose working days were loaded before the login
+        self.preloaded_employee = None
+        self.preload(self.preload_employees)
+        self.preload(self.preload_working_days, self.get_last_user())
+        self.show_preload_messages()
+
+    def preload(self, function, *args):
+        """
+        Run a loading function on a background thread.
+
+        Preload threads are chained, every thread waits for its predecessor
+        before running, so loading steps never overlap.
+
+        Parameters
+        ----------
+        function : callable
+            The loading function.
+        *args
+            Arguments passed to the loading function.
+        """
+        previous_thread = self.preload_thread
+
+        def run_after_previous():
+            if previous_thread is not None:
+                previous_thread.join()
+            try:
+                function(*args)
+            except Exception as e:
+                self.preload_messages.put((f"Failed to load data: {e}", True))
+
+        self.preload_thread = threading.Thread(target=run_after_previous,
+                                               daemon=True)
+        self.preload_thread.start()
+
+    def wait_for_preload(self):
+        """Block until all preloading threads are finished."""
+        if self.preload_thread is not None:
+            self.preload_thread.join()
+
+    def preload_employees(self):
+        """Load the list of employees without their working days."""
+        self.preload_messages.put(("Loading employees...", False))
+        if (gui_constants.USE_SERVICE or os.path.isfile(self.file_path_employees)
+                or os.path.isfile(gui_constants.DATABASE_PATH)):
+            self.load_employees()
+        else:
+            self.save_employees()
+        self.preload_messages.put(("", False))
+
+    def preload_working_days(self, employee_id):
+        """
+        Load the working days of an employee if it is not loaded yet.
+
+        Parameters
+        ----------
+        employee_id : str or None
+            Username/employee_id. Nothing is loaded for unknown employees.
+        """
+        employee = self.employees.get(employee_id)
+        if employee is not None and not employee.is_loaded:
+            self.preload_messages.put(("Loading timesheet...", False))
+            employee.load_working_days()
+            self.preloaded_employee = employee
+            self.preload_messages.put(("", False))
+
+    def show_preload_messages(self):
+        """
+        Show progress and errors of preloading threads in the login frame.
+
+        Reschedules itself as long as the login frame exists.
+        """
+        try:
+            while not self.preload_messages.empty():
+                self.login_frame.set_status(*self.preload_messages.get())
+            self.root.after(100, self.show_preload_messages)
+        except tk.TclError:
+            pass  # Login frame was destroyed in the meantime
+
+    def get_last_user(self):
+        """
+        Return the employee ID of the last successful login.
+
+        Returns
+        -------
+        str or None
+            The employee ID or None if nobody logged in yet.
+        """
+        try:
+            with open(gui_constants.LAST_USER_PATH, 'r') as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
     def create_timesheet_window(self):
         """Create the timesheet widgets and initializes them."""
         self.login_frame.pack_forget()
@@ -185,6 +387,13 @@ class Timesheet:
 
         self.root.bind('<Return>', self.update)
 
+        if gui_constants.INSTRUMENTATION:
+            self.update_debug_panel()
+        if gui_constants.USE_SERVICE:
+            self.listen_to_service()
+        if self.current_employee.role in gui_constants.TEAM_OVERVIEW_ROLES:
+            self.gui.sidebar.show_team_button()
+
     def login(self, user, role='Employee', name='default'):
         """
         Log in a user.
@@ -196,12 +405,27 @@ class Timesheet:
         user : str
             Username/employee_id.
         """
+        self.wait_for_preload()
+        # Another user logged in, the preloaded timesheet must not be saved
+        # over changes made elsewhere in the meantime
+        if (self.preloaded_employee is not None
+                and self.preloaded_employee.employee_id != user):
+            self.preloaded_employee.unload_working_days()
+        self.preloaded_employee = None
+
         self.add_employee(user)
         self.current_employee = self.employees.get(user)
         self.current_employee.role = role
         self.current_employee.name = name
 
-        self.current_employee.load_working_days()
+        if not self.current_employee.is_loaded:
+            self.current_employee.load_working_days()
+
+        try:
+            with open(gui_constants.LAST_USER_PATH, 'w') as file:
+                file.write(user)
+        except OSError as error:
+            logger.warning("Failed to store the last user: %s", error)
 
         self.create_timesheet_window()
 
@@ -209,7 +433,7 @@ class Timesheet:
         """Save all data and log out the current employee."""
         self.store_all_inputs()
         try:
-            self.current_employee.save_working_days()
+            self.save_working_days(self.current_employee)
 
             self.current_employee = None
             self.save_employees()
@@ -230,36 +454,130 @@ Failed to save data to disk.""")
         self.update_info_panel()
 
     def request_vacation(self):
-        """Request a vacation day."""
-        if self.current_employee.amount_old_vacation_days > 0:
-            self.current_employee.amount_old_vacation_days -= 1
-        elif self.current_employee.amount_vacation_days > 0:
-            self.current_employee.amount_vacation_days -= 1
-        else:
-            print("""You can't request a day off as
-                  you don't have any vacation days left.""")
-        self.update_info_panel()
+        """
+        Open the dialog for booking vacation or sick leave.
+
+        Callback method for the request vacation button.
+        """
+        gui.Booking_Dialog(self.root, self, self.selected_date)
+
+    def book_absence(self, start_date, end_date, state):
+        """
+        Book vacation or sick leave for the current employee.
+
+        All affected days are written in one save, the vacation
+        day counters in a second one. Days changed by another instance in
+        the meantime are not booked and their vacation days are not taken.
+
+        Parameters
+        ----------
+        start_date : str
+            First day of the range ('YYYY-MM-DD').
+        end_date : str
+            Last day of the range ('YYYY-MM-DD').
+        state : str
+            "vacation", "sick" or "default" to cancel an absence.
+
+        Returns
+        -------
+        str
+            Message describing the result.
+        """
+        self.store_all_inputs()
+        try:
+            bookings = self.current_employee.book_days(
+                dtf.convert_string_to_date(self, start_date),
+                dtf.convert_string_to_date(self, end_date),
+                state)
+        except ValueError as e:
+            return str(e)
+
+        # Only the saved days change the vacation day counters
+        conflicts = self.save_working_days(self.current_employee)
+        bookings = [booking for booking in bookings
+                    if "{:%Y-%m-%d}".format(booking[0].date) not in conflicts]
+        self.current_employee.use_booked_vacation_days(bookings)
         self.save_employees()
+        self.update_from_db()
+        return "{amount} days changed, flex time {flex_time}.".format(
+            amount=len(bookings),
+            flex_time=dtf.time_to_string(self, sum(booking[2] for booking in bookings),
+                                         unsigned=False))
+
+    def save_working_days(self, employee):
+        """
+        Save the working days of an employee.
+
+        Days changed by another instance in the meantime are not
+        overwritten. Instead they are reloaded and the user is informed.
+
+        Parameters
+        ----------
+        employee : WorkTimeEmployee
+            The employee to save.
+
+        Returns
+        -------
+        list
+            Dates ('%Y-%m-%d') of the days which were reloaded instead.
+        """
+        try:
+            employee.save_working_days()
+        except ConcurrentModificationError as e:
+            employee.reload_days(e.conflicts)
+            self.show_conflicts("entries on", e.conflicts)
+            if employee is self.current_employee:
+                self.update_from_db()
+            return e.conflicts
+        return []
+
+    def show_conflicts(self, description, conflicts):
+        """
+        Inform the user about data changed by another instance.
+
+        Parameters
+        ----------
+        description : str
+            What was changed, e.g. "entries on".
+        conflicts : list
+            Keys of the changed records, e.g. dates or employee IDs.
+        """
+        tk.messagebox.showwarning("Conflict", """The {what} {keys} were changed
+by someone else in the meantime.
+Your changes were discarded and the stored data was reloaded.""".format(
+            what=description, keys=", ".join(conflicts)))
 
     def store_all_inputs(self):
         """Save all data of the selected month persistently on disk."""
         for day in self.gui.days:
             self.store_input_data(day)
         if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-            self.current_employee.save_working_days()
+            self.save_working_days(self.current_employee)
 
     def on_closing(self):
         """Save all employee working day data and closes the application."""
+        self.wait_for_preload()
         if self.current_employee is not None:
             self.store_all_inputs()
             self.current_employee = None
         try:
             for employee in self.employees.values():
-                employee.save_working_days()
+                if employee.is_loaded:
+                    self.save_working_days(employee)
             self.save_employees()
         except Exception:
             tk.messagebox.showerror("Error", """Some times are invalid.
                                     Failed to save data to disk.""")
+        if gui_constants.INSTRUMENTATION:
+            instrumentation.instruments.dump(
+                gui_constants.INSTRUMENTATION_PATH)
+        if gui_constants.USE_SERVICE:
+            from timesheet_client import get_client
+            get_client().stop_listening()
+        # Only set while a replica is used
+        if self.sync is not None:
+            import timesheet_replica
+            timesheet_replica.sync_before_exit()
         self.root.destroy()
 
     def print_day(self, day, always_enabled=False):
@@ -271,12 +589,8 @@ Failed to save data to disk.""")
         day : WorkingDay
             The working day object containing the day’s information.
         """
-        if gui_constants.DEBUG or always_enabled:
-            print(day.date, ":")
-            print(day.start_time)
-            print(day.end_time)
-            print(day.break_time)
-            print(day.state)
+        logger.log(logging.INFO if always_enabled else logging.DEBUG, "%s: %s - %s, break %s, %s",
+                   day.date, day.start_time, day.end_time, day.break_time, day.state)
 
     def update_info_panel(self):
         """Update the flex-time and vacation day information in the sidebar."""
@@ -287,6 +601,114 @@ Failed to save data to disk.""")
         panel.var_vacation_days.set(self.current_employee.amount_vacation_days)
         panel.var_old_vacation_days.set(
             self.current_employee.amount_old_vacation_days)
+        panel.var_region.set(self.current_employee.region)
+
+    def change_region(self, region):
+        """
+        Change the holiday region of the current employee.
+
+        Callback method for the region menu of the info panel. The target
+        hours and the calendar colors follow the new region.
+
+        Parameters
+        ----------
+        region : str
+            A region of gui_constants.REGIONAL_HOLIDAYS.
+        """
+        if region == self.current_employee.region:
+            return
+        self.current_employee.region = region
+        self.save_employees()
+        self.select_month(self.selected_date)
+        self.update_info_panel()
+
+    def open_team_overview(self):
+        """
+        Open the team overview window.
+
+        Callback method for the team overview button. The overview is
+        aggregated by the database, so it is not available with csv files.
+        """
+        if not (gui_constants.USE_DATABASE or gui_constants.USE_SERVICE):
+            tk.messagebox.showinfo("Team Overview",
+                                   "The team overview requires the database.")
+            return
+        # The overview is read from storage, include the latest own changes
+        self.store_all_inputs()
+        self.save_working_days(self.current_employee)
+        self.save_employees()
+        gui.Team_Overview(self.root, self)
+
+    @instrumentation.timed("storage.load_team_page")
+    def load_team_page(self, offset, limit):
+        """
+        Load one page of the team overview.
+
+        Parameters
+        ----------
+        offset : int
+            Index of the first employee of the page.
+        limit : int
+            Maximum amount of employees of the page.
+
+        Returns
+        -------
+        tuple
+            List of rows of display strings (employee, today's punch status,
+            flex time, vacation days, open days) and the total amount of
+            employees.
+        """
+        if gui_constants.USE_SERVICE:
+            from timesheet_client import get_client
+            page = get_client().get_team_page(offset, limit)
+            rows, total = page['rows'], page['total']
+        else:
+            # Deferred, sqlite3 is not needed in csv-only mode
+            from database_functions import DatabaseFunctions
+
+            db = DatabaseFunctions()
+            db.connect_to_database()
+            try:
+                rows = db.load_team_overview(date.today(),
+                                             gui_constants.DAILY_WORKING_HOURS * 3600,
+                                             limit, offset)
+                total = db.count_employees()
+            finally:
+                db.disconnect_from_database()
+
+        display_rows = []
+        for employee_id, vacation_days, old_vacation_days, start, end, flex_time, open_days in rows:
+            if start is None:
+                today = "Not started"
+            elif end is None:
+                today = "Working since " + dtf.time_to_string(self, start)
+            else:
+                # The end of a shift crossing midnight lies more than a day after midnight
+                today = "{start} - {end}".format(start=dtf.time_to_string(self, start),
+                                                 end=dtf.time_to_string(self, end % 86400))
+            display_rows.append((
+                employee_id,
+                today,
+                dtf.time_to_string(self, flex_time, unsigned=False),
+                "{days} (+{old})".format(days=vacation_days or 0, old=old_vacation_days or 0),
+                open_days
+            ))
+        return display_rows, total
+
+    def update_debug_panel(self):
+        """
+        Show the current instrumentation percentiles in the sidebar.
+
+        Reschedules itself every gui_constants.INSTRUMENTATION_REFRESH
+        milliseconds as long as the timesheet window exists.
+        """
+        try:
+            self.gui.sidebar.debug_panel.show_summary(
+                instrumentation.instruments.summary())
+            self.root.after(gui_constants.INSTRUMENTATION_REFRESH,
+                            self.update_debug_panel)
+        except tk.TclError:
+            pass  # Timesheet window was closed in the meantime
 
     def purge_inputs(self):
         """Remove all data from all input fields."""
@@ -296,6 +718,7 @@ Failed to save data to disk.""")
             day.set_break_time(None)
             day.set_total_time(None)
 
+    @instrumentation.timed("tk.update_from_db")
     def update_from_db(self):
         """
         Load and update the calendar from the current employee’s data model.
@@ -304,25 +727,90 @@ Failed to save data to disk.""")
         are filled with gui_constants.NO_TIME_DATA.
         """
         if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-            self.current_employee.save_working_days()
-            self.current_employee.load_working_days()
+            self.save_working_days(self.current_employee)
+            if not gui_constants.USE_SERVICE:
+                self.current_employee.load_working_days()
+        if gui_constants.USE_SERVICE:
+            # Costs one "not modified" answer if the month is unchanged
+            self.current_employee.refresh_month_from_service(
+                self.selected_date.year, self.selected_date.month)
+        # Closed months are not loaded with the timesheet
+        for year, month in sorted({(day.date.year, day.date.month)
+                                   for day in self.gui.days if day.date is not None}):
+            self.current_employee.load_month(year, month)
         for day in self.gui.days:
-            current_date = day.date
-            if current_date is not None:
-                try:
-                    work_day = self.current_employee.get_day(current_date)
-                    day.set_start_time(work_day.start_time)
-                    day.set_end_time(work_day.end_time)
-                    day.set_break_time(work_day.break_time)
-                    day.set_total_time(work_day.get_work_time())
-                    self.print_day(work_day)  # Debug
-                except Exception:
-                    if gui_constants.DEBUG:
-                        print("Error at day:" + day.var_day.get())
+            self.update_day_widget(day)
 
         self.update_info_panel()
         self.update_buttons()
 
+    def update_day_widget(self, day):
+        """
+        Show the data of the current employee in a single DayWidget.
+
+        Parameters
+        ----------
+        day : DayWidget
+            The DayWidget display.
+        """
+        current_date = day.date
+        if current_date is not None:
+            day.set_read_only(self.current_employee.is_closed(current_date))
+            try:
+                work_day = self.current_employee.get_day(current_date)
+                day.set_start_time(work_day.start_time)
+                day.set_end_time(work_day.end_time)
+                day.set_break_time(work_day.break_time)
+                day.set_total_time(work_day.get_work_time())
+                self.print_day(work_day)  # Debug
+            except Exception:
+                logger.debug("Error at day %s", day.var_day.get())
+
+    def listen_to_service(self):
+        """
+        Receive changes made by other clients of the timesheet service.
+
+        Events arrive on the listener thread of the client and are
+        handed to the Tk main loop through a queue.
+        """
+        from timesheet_client import get_client
+
+        self.service_events = queue.Queue()
+        get_client().listen(self.service_events.put)
+        self.show_service_events()
+
+    def show_service_events(self):
+        """
+        Refresh the data and cells affected by changes of other clients.
+
+        Only the DayWidgets of changed days are redrawn. Reschedules itself
+        every gui_constants.SERVICE_EVENT_REFRESH milliseconds as long as
+        the timesheet window exists.
+        """
+        try:
+            while not self.service_events.empty():
+                event = self.service_events.get()
+                employee = self.employees.get(event['employee_id'])
+                if event['kind'] == 'counters':
+                    self.load_employees_from_service([event['employee_id']])
+                elif employee is not None and employee.is_loaded:
+                    changed_dates = []
+                    for month in sorted({date_string[:7] for date_string in event['dates']}):
+                        changed_dates += employee.refresh_month_from_service(
+                            int(month[:4]), int(month[5:]))
+                    if employee is self.current_employee:
+                        for day in self.gui.days:
+                            if (day.date is not None
+                                    and "{:%Y-%m-%d}".format(day.date) in changed_dates):
+                                self.update_day_widget(day)
+                if employee is not None and employee is self.current_employee:
+                    self.update_info_panel()
+                    self.update_buttons()
+            self.root.after(gui_constants.SERVICE_EVENT_REFRESH,
+                            self.show_service_events)
+        except tk.TclError:
+            pass  # Timesheet window was closed in the meantime
+
     def get_old_date_of_day(self, day):
         """
         Return the date currently displayed by the specified DayWidget.
@@ -364,9 +852,9 @@ Failed to save data to disk.""")
             months from the selected date.
 
         """
-        return self.selected_date + rdelta.relativedelta(months=month_delta)
+        return dtf.add_months(self, self.selected_date, month_delta)
 
-    def add_employee(self, employee_id):
+    def add_employee(self, employee_id, load=True):
         """
         Add an employee with the specified ID to the application.
 
@@ -374,12 +862,13 @@ Failed to save data to disk.""")
         ----------
         employee_id : str
             Unique ID for the new employee.
+        load : bool, optional
+            Whether to load the employee's working days immediately.
         """
         if employee_id not in self.employees:
-            self.employees[employee_id] = WorkTimeEmployee(employee_id)
+            self.employees[employee_id] = WorkTimeEmployee(employee_id, load)
         else:
-            print("Employee with id '{e_id}' already in database.".format(
-                e_id=employee_id))
+            logger.debug("Employee with id '%s' already loaded.", employee_id)
 
     def get_month_days(self, date_object):
         """
@@ -422,33 +911,69 @@ Failed to save data to disk.""")
                 # child has children, go through its children
                 self.change_color(color, child)
 
+    @instrumentation.timed("storage.load_employees")
     def load_employees(self):
         """Load the list of employees from disk."""
-        if gui_constants.USE_DATABASE:
+        if gui_constants.USE_SERVICE:
+            self.load_employees_from_service()
+        elif gui_constants.USE_DATABASE:
             self.load_employees_from_database()
         if gui_constants.IMPORT_FROM_CSV:
             self.load_employees_from_csv()
 
-    def load_employees_from_database(self):
-        """Load employees and their vacation days from the database."""
-        con = sqlite3.connect(gui_constants.DATABASE_PATH)
-        cur = con.cursor()
-        cur.execute("""CREATE TABLE IF NOT EXISTS employees(
-                        employee_id TEXT PRIMARY KEY,
-                        vacation_days INTEGER,
-                        old_vacation_days INTEGER)"""
-                    )
-
-        for row in cur.execute("""SELECT employee_id,
-                                   vacation_days,
-                                   old_vacation_days FROM employees"""):
-            self.add_employee(row[0])
-            employee = self.employees.get(row[0])
+    def load_employees_from_database(self, employee_ids=None):
+        """
+        Load employees and their vacation days from the database.
+
+        Parameters
+        ----------
+        employee_ids : list, optional
+            Only reload these employees. Loads all employees by default.
+        """
+        # Deferred, sqlite3 is not needed in csv-only mode
+        from database_functions import DatabaseFunctions
+
+        db = DatabaseFunctions()
+        db.connect_to_database()
+        try:
+            for row in db.load_employees():
+                if employee_ids is not None and row[0] not in employee_ids:
+                    continue
+                if row[0] not in self.employees:
+                    self.add_employee(row[0], load=False)
+                employee = self.employees.get(row[0])
+                employee.amount_vacation_days = int(
+                    row[1]) if row[1] else 30
+                employee.amount_old_vacation_days = int(
+                    row[2]) if row[2] else 0
+                employee.region = row[4] or gui_constants.DEFAULT_REGION
+                employee.mark_counters_stored(row[3])
+        finally:
+            db.disconnect_from_database()
+
+    def load_employees_from_service(self, employee_ids=None):
+        """
+        Load employees and their vacation days from the timesheet service.
+
+        Parameters
+        ----------
+        employee_ids : list, optional
+            Only reload these employees. Loads all employees by default.
+        """
+        from timesheet_client import get_client
+
+        for row in get_client().get_employees():
+            if employee_ids is not None and row['employee_id'] not in employee_ids:
+                continue
+            if row['employee_id'] not in self.employees:
+                self.add_employee(row['employee_id'], load=False)
+            employee = self.employees.get(row['employee_id'])
             employee.amount_vacation_days = int(
-                row[1]) if row[1] else 30
+                row['vacation_days']) if row['vacation_days'] else 30
             employee.amount_old_vacation_days = int(
-                row[2]) if row[2] else 0
-        con.close()
+                row['old_vacation_days']) if row['old_vacation_days'] else 0
+            employee.region = row['region'] or gui_constants.DEFAULT_REGION
+            employee.mark_counters_stored(row['version'])
 
     def load_employees_from_csv(self):
         """Load employees and their vacation days from a csv file."""
@@ -456,62 +981,152 @@ Failed to save data to disk.""")
             with open(self.file_path_employees, 'r') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
-                    self.add_employee(row['Employee ID'])
+                    self.add_employee(row['Employee ID'], load=False)
 
                     employee = self.employees.get(row['Employee ID'])
                     employee.amount_vacation_days = int(
                         row['Vacation Days']) if row['Vacation Days'] else 30
                     employee.amount_old_vacation_days = int(
                         row['Old Vacation Days']) if row['Old Vacation Days'] else 0
+                    # Written by the vacation rollover, missing in older files
+                    if row.get('Vacation Entitlement'):
+                        employee.vacation_entitlement = int(row['Vacation Entitlement'])
+                    if row.get('Rollover Year'):
+                        employee.rollover_year = int(row['Rollover Year'])
+                    if row.get('Region'):
+                        employee.region = row['Region']
 
         except Exception as e:
-            print("Error", f"Failed to load employees: {e}")
+            logger.error("Failed to load employees: %s", e)
 
+    @instrumentation.timed("storage.save_employees")
     def save_employees(self):
-        """Save the list of employees to disk."""
-        if gui_constants.USE_DATABASE:
-            self.save_employees_to_database()
+        """
+        Save the list of employees to disk.
+
+        Vacation days changed by another instance are
+        reloaded and reported instead of being overwritten.
+        """
+        if gui_constants.USE_DATABASE or gui_constants.USE_SERVICE:
+            try:
+                if gui_constants.USE_SERVICE:
+                    self.save_employees_to_service()
+                else:
+                    self.save_employees_to_database()
+            except ConcurrentModificationError as e:
+                self.show_conflicts("vacation days of", e.conflicts)
+                if self.current_employee is not None:
+                    self.update_info_panel()
         if gui_constants.WRITE_TO_CSVS:
             self.save_employees_to_csv()
 
     def save_employees_to_database(self):
-        """Save the list of employees and their vacation days to a csv file."""
-        con = sqlite3.connect(gui_constants.DATABASE_PATH)
-        cur = con.cursor()
-        cur.execute(
-            """CREATE TABLE IF NOT EXISTS
-            employees(employee_id TEXT PRIMARY KEY,
-            vacation_days INTEGER,
-            old_vacation_days INTEGER)"""
-        )
-
-        for employee in self.employees.values():
-            cur.execute("""INSERT OR REPLACE INTO employees(employee_id,
-                        vacation_days,
-                        old_vacation_days) VALUES (?, ?, ?)""",
-                        (employee.employee_id,
-                         employee.amount_vacation_days,
-                         employee.amount_old_vacation_days)
-                        )
-
-        con.commit()
-        con.close()
+        """
+        Save the vacation days of all changed employees to the database.
+
+        Raises
+        ------
+        ConcurrentModificationError
+            If employees were changed by another instance since they were
+            read. Their counters are reloaded instead of being overwritten.
+        """
+        # Deferred, sqlite3 is not needed in csv-only mode
+        from database_functions import DatabaseFunctions, run_with_retry
+
+        modified_employees = [employee for employee in self.employees.values()
+                              if employee.counters_modified()]
+        if not modified_employees:
+            return
+
+        def write_modified_employees():
+            with db.transaction():
+                return db.save_employees([
+                    (employee.employee_id, employee.amount_vacation_days,
+                     employee.amount_old_vacation_days, employee.version, employee.region)
+                    for employee in modified_employees])
+
+        db = DatabaseFunctions()
+        db.connect_to_database()
+        try:
+            versions = run_with_retry(write_modified_employees)
+        finally:
+            db.disconnect_from_database()
+
+        conflicts = []
+        for employee in modified_employees:
+            if versions[employee.employee_id] is None:
+                conflicts.append(employee.employee_id)
+            else:
+                employee.mark_counters_stored(versions[employee.employee_id])
+        if conflicts:
+            self.load_employees_from_database(conflicts)
+            raise ConcurrentModificationError(conflicts)
+
+    def save_employees_to_service(self):
+        """
+        Save the vacation days of all changed employees to the timesheet service.
+
+        Raises
+        ------
+        ConcurrentModificationError
+            If employees were changed by another client since they were
+            read. Their counters are reloaded instead of being overwritten.
+        """
+        from timesheet_client import get_client
+
+        modified_employees = [employee for employee in self.employees.values()
+                              if employee.counters_modified()]
+        if not modified_employees:
+            return
+
+        versions = get_client().update_employees([
+            (employee.employee_id, employee.amount_vacation_days,
+             employee.amount_old_vacation_days, employee.version, employee.region)
+            for employee in modified_employees])
+        conflicts = []
+        for employee in modified_employees:
+            if versions[employee.employee_id] is None:
+                conflicts.append(employee.employee_id)
+            else:
+                employee.mark_counters_stored(versions[employee.employee_id])
+
+        if conflicts:
+            self.load_employees_from_service(conflicts)
+            raise ConcurrentModificationError(conflicts)
 
     def save_employees_to_csv(self):
-        """Save the list of employees and their vacation days to a csv file."""
+        """
+        Save the list of employees and their vacation days to a csv file.
+
+        The file is only rewritten if an employee changed since it was
+        written last.
+        """
+        rows = [(employee.employee_id, employee.amount_vacation_days,
+                 employee.amount_old_vacation_days, employee.vacation_entitlement,
+                 employee.rollover_year, employee.region)
+                for employee in self.employees.values()]
+        if rows == self.stored_csv_rows:
+            return
         with open(self.file_path_employees, 'w', newline='') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=[
                                     'Employee ID',
                                     'Vacation Days',
-                                    'Old Vacation Days'
+                                    'Old Vacation Days',
+                                    'Vacation Entitlement',
+                                    'Rollover Year',
+                                    'Region'
                                     ])
             writer.writeheader()
-            for employee in self.employees.values():
+            for employee_id, vacation_days, old_vacation_days, entitlement, rollover_year, region in rows:
                 writer.writerow({
-                    'Employee ID': employee.employee_id,
-                    'Vacation Days': employee.amount_vacation_days,
-                    'Old Vacation Days': employee.amount_old_vacation_days
+                    'Employee ID': employee_id,
+                    'Vacation Days': vacation_days,
+                    'Old Vacation Days': old_vacation_days,
+                    'Vacation Entitlement': entitlement,
+                    'Rollover Year': rollover_year,
+                    'Region': region
                 })
+        self.stored_csv_rows = rows
 
     def hide_empty_row(self):
         """
@@ -530,6 +1145,7 @@ Failed to save data to disk.""")
                 for i in range(35, 42):
                     self.gui.days[i].grid()
 
+    @instrumentation.timed("tk.select_month")
     def select_month(self, date_object=date.today()):
         """
         Update the calendar to show the selected month.
@@ -589,7 +1205,8 @@ Failed to save data to disk.""")
 
             else:
                 self.change_color(gui_constants.DEFAULT_COLOR, day)
-                if current_date.weekday() > 4:
+                # Weekends and public holidays of the employee's region
+                if not working_calendar.is_working_day(current_date, self.current_employee.region):
                     self.change_color(gui_constants.WEEKEND_COLOR, day)
                 day.label_day.config(bg=gui_constants.HIGHLIGHT_COLOR)
 
@@ -614,23 +1231,13 @@ Failed to save data to disk.""")
         return [value for value in array if value != 0]
 
     def log_work_time(self):
-        """Log the start or end time of a workday and update the display."""
-        self.store_all_inputs()
-        today = self.current_employee.create_day()
-        self.print_day(today)
-        if today.start_time is None:
-            today.start_time = dtf.get_current_time(self)
-        else:
-            if today.start_time <= dtf.get_current_time(self):
-                if self.current_employee.on_break is not None:
-                    self.log_break_time()
-                today.end_time = dtf.get_current_time(self)
-            else:
-                tk.messagebox.showerror("Error", "Start time is in the future")
+        """
+        Log the start or end time of a workday and update the display.
 
-        if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-            self.current_employee.save_working_days()
-        self.update_from_db()
+        Starting again after the end of the workday
+        counts the time in between as break.
+        """
+        self.punch("work")
 
     def log_break_time(self):
         """
@@ -639,26 +1246,32 @@ Failed to save data to disk.""")
         As long as the workday is not ended, an
         arbitrary amount of breaks can be entered.
         """
-        self.store_all_inputs()
-        if self.current_employee.get_day().start_time is None:
-            print("You can't take a break before you start to work.")
-        elif self.current_employee.get_day().end_time is not None:
-            print("You can't take a break after you've finished work.")
-        elif self.current_employee.on_break is None:
-            self.current_employee.on_break = dtf.get_current_time(self)
-        else:
-            break_start = self.current_employee.on_break
-            break_end = dtf.get_current_time(self)
-            break_time = dtf.get_time_difference(self, break_start, break_end)
-            try:
-                self.current_employee.get_day().break_time += break_time
-            except TypeError:
-                self.current_employee.get_day().break_time = break_time
+        self.punch("break")
 
-            self.current_employee.on_break = None
+    def punch(self, kind):
+        """
+        Punch the current employee and update the display.
+
+        The punch interval is stored immediately, the day itself
+        is saved unless REDUCED_DATABASE_TRAFFIC is set.
+
+        Parameters
+        ----------
+        kind : str
+            "work" or "break".
+        """
+        self.store_all_inputs()
+        try:
+            today = self.current_employee.punch(kind)
+        except ValueError as e:
+            tk.messagebox.showerror("Error", str(e))
+            # Show what was stored, e.g. after an unconfirmed punch
+            self.update_from_db()
+            return
+        self.print_day(today)
 
         if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-            self.current_employee.save_working_days()
+            self.save_working_days(self.current_employee)
         self.update_from_db()
 
     def update_buttons(self):
@@ -669,12 +1282,14 @@ Failed to save data to disk.""")
             button_label_break = "Start Break"
         self.gui.sidebar.button_log_break.config(text=button_label_break)
 
-        if self.current_employee.create_day().start_time is None:
+        # A shift running over midnight is still ended on the next day
+        day = self.current_employee.get_punch_day(datetime.now())
+        if day.start_time is None:
             button_label_time = "Start Workday"
-        elif self.current_employee.create_day().end_time is None:
+        elif day.end_time is None:
             button_label_time = "End Workday"
         else:
-            button_label_time = "Update Endtime"
+            button_label_time = "Resume Work"
         self.gui.sidebar.button_log_work.config(text=button_label_time)
 
     def store_input_data(self, day):
@@ -689,46 +1304,64 @@ Failed to save data to disk.""")
             The day widget which data to store.
         """
         current_date = day.date
-        if current_date is not None:
+        if current_date is not None and not self.current_employee.is_closed(current_date):
             try:
                 work_day = self.current_employee.create_day(current_date)
+                # The fields show minutes only, punched times keep their seconds.
+                # Unchanged fields must not truncate them or reset the end day offset.
                 try:
-                    work_day.start_time = dtf.convert_string_to_time(
+                    start_time = dtf.convert_string_to_time(
                         self, day.var_start_time.get())
-                    if gui_constants.DEBUG:
-                        print(work_day.start_time)
+                    if start_time != self.truncate_to_minutes(work_day.start_time):
+                        work_day.set_start_time(start_time)
+                    logger.debug("Start time: %s", work_day.start_time)
                 except Exception:
-                    if gui_constants.DEBUG:
-                        print("No data in start_time")
+                    logger.debug("No data in start_time")
                 try:
-                    work_day.end_time = dtf.convert_string_to_time(
+                    end_time = dtf.convert_string_to_time(
                         self, day.var_end_time.get())
-                    if gui_constants.DEBUG:
-                        print(work_day.end_time)
+                    if end_time != self.truncate_to_minutes(work_day.end_time):
+                        work_day.set_end_time(end_time)
+                    logger.debug("End time: %s", work_day.end_time)
                 except Exception:
-                    if gui_constants.DEBUG:
-                        print("No data in end_time")
+                    logger.debug("No data in end_time")
 
                 try:
                     break_time = dtf.convert_string_to_time(
                         self, day.var_break_time.get())
                     break_time = dtf.time_in_seconds(self, break_time)
-                    if break_time > 59:
+                    if break_time > 59 and break_time != (work_day.break_time or 0) // 60 * 60:
                         work_day.break_time = break_time
-                    if gui_constants.DEBUG:
-                        print(work_day.break_time)
+                    logger.debug("Break time: %s", work_day.break_time)
                 except Exception as e:
-                    if gui_constants.DEBUG:
-                        print("No data in break_time", e)
+                    logger.debug("No data in break_time: %s", e)
 
                 day.set_total_time(work_day.get_work_time())
             except AttributeError as e:
-                print(e)  # pass
+                logger.debug("Failed to store input: %s", e)
 
             if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-                self.current_employee.save_working_days()
+                self.save_working_days(self.current_employee)
             self.update_buttons()
 
+    def truncate_to_minutes(self, time_object):
+        """
+        Return a time without its seconds, as shown in the input fields.
+
+        Parameters
+        ----------
+        time_object : datetime.time or None
+            The time to truncate.
+
+        Returns
+        -------
+        datetime.time or None
+            The truncated time, None if time_object is None.
+        """
+        if time_object is None:
+            return None
+        return time_object.replace(second=0, microsecond=0)
+
     def delete_input_data(self, day):
         """
         Delete data from internal memory.
@@ -741,26 +1374,23 @@ Failed to save data to disk.""")
             The day widget which data to delete.
         """
         current_date = day.date
-        if current_date is not None:
+        if current_date is not None and not self.current_employee.is_closed(current_date):
             work_day = self.current_employee.create_day(current_date)
             if day.var_start_time.get() in (gui_constants.NO_TIME_DATA, ''):
-                if gui_constants.DEBUG:
-                    print(day.var_day.get(), 'start', day.var_start_time.get())
-                work_day.start_time = None
+                logger.debug("Deleted start time of day %s", day.var_day.get())
+                work_day.set_start_time(None)
 
             if day.var_end_time.get() in (gui_constants.NO_TIME_DATA, ''):
-                if gui_constants.DEBUG:
-                    print(day.var_day.get(), 'end', day.var_end_time.get())
-                work_day.end_time = None
+                logger.debug("Deleted end time of day %s", day.var_day.get())
+                work_day.set_end_time(None)
 
             if day.var_break_time.get() in (gui_constants.NO_TIME_DATA, ''):
-                if gui_constants.DEBUG:
-                    print(day.var_day.get(), 'break', day.var_break_time.get())
+                logger.debug("Deleted break time of day %s", day.var_day.get())
                 work_day.break_time = None
 
             day.set_total_time(work_day.get_work_time())
             if not gui_constants.REDUCED_DATABASE_TRAFFIC:
-                self.current_employee.save_working_days()
+                self.save_working_days(self.current_employee)
             self.update_buttons()
 
 
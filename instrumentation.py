@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a lightweight instrumentation layer for the STC time
+management application.
+
+Timers and counters can be placed around hot paths, e.g. storage calls, flex
+time computation, calendar redraws and input validation. Recorded durations
+are kept in a rolling window per timer, so percentiles always reflect the
+recent behaviour of the running application.
+
+Instrumentation is controlled by gui_constants.INSTRUMENTATION. While it is
+disabled, every instrumented call costs a single flag lookup.
+
+Classes
+-------
+Instrumentation
+    Collects durations and counters and computes rolling percentiles.
+
+Functions
+---------
+timed(name)
+    Decorator which records the runtime of a function.
+timer(name)
+    Context manager which records the runtime of a code block.
+count(name, amount=1)
+    Increases a counter.
+
+Usage
+-----
+    @instrumentation.timed("db.read")
+    def read_from_database(self):
+        ...
+
+    with instrumentation.timer("parse.rows"):
+        ...
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import threading
+import time
+
+import gui_constants
+
+
+class Instrumentation():
+    """
+    A collection of rolling timers and counters.
+
+    Attributes
+    ----------
+    window_size : int
+        Amount of recent durations kept per timer.
+    timers : dict
+        Timer names mapped to deques of durations in seconds.
+    totals : collections.Counter
+        Timer names mapped to the total amount of recorded calls.
+    counters : collections.Counter
+        Counter names mapped to their current value.
+    """
+
+    def __init__(self, window_size=500):
+        """
+        Initializes an empty Instrumentation.
+
+        Parameters
+        ----------
+        window_size : int, optional
+            Amount of recent durations kept per timer (default is 500).
+        """
+        self.window_size = window_size
+        self.timers = {}
+        self.totals = collections.Counter()
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """
+        Record a duration for the given timer.
+
+        Parameters
+        ----------
+        name : str
+            Name of the timer, e.g. "db.read".
+        seconds : float
+            The measured duration in seconds.
+        """
+        with self.lock:
+            if name not in self.timers:
+                self.timers[name] = collections.deque(maxlen=self.window_size)
+            self.timers[name].append(seconds)
+            self.totals[name] += 1
+
+    def count(self, name, amount=1):
+        """
+        Increase the given counter.
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter, e.g. "db.rows_read".
+        amount : int, optional
+            Value to add to the counter (default is 1).
+        """
+        with self.lock:
+            self.counters[name] += amount
+
+    def percentiles(self, name, quantiles=(50, 90, 99)):
+        """
+        Return rolling percentiles of a timer in milliseconds.
+
+        Parameters
+        ----------
+        name : str
+            Name of the timer.
+        quantiles : tuple, optional
+            The percentiles to compute (default is 50, 90 and 99).
+
+        Returns
+        -------
+        dict
+            Maps "p<quantile>" to the duration in milliseconds. Is empty
+            if nothing was recorded for this timer yet.
+        """
+        with self.lock:
+            durations = sorted(self.timers.get(name, ()))
+        return self.get_percentiles(durations, quantiles)
+
+    @staticmethod
+    def get_percentiles(durations, quantiles=(50, 90, 99)):
+        """
+        Return percentiles of sorted durations in milliseconds, see percentiles().
+        """
+        result = {}
+        if durations:
+            for quantile in quantiles:
+                index = min(len(durations) - 1,
+                            int(len(durations) * quantile / 100))
+                result["p{}".format(quantile)] = durations[index] * 1000.0
+        return result
+
+    def summary(self):
+        """
+        Return a snapshot of all timers and counters.
+
+        Returns
+        -------
+        dict
+            "timers" maps every timer to its call count and percentiles,
+            "counters" maps every counter to its value.
+        """
+        # Copy everything at once, other threads keep recording meanwhile
+        with self.lock:
+            durations = {name: sorted(timer) for name, timer in self.timers.items()}
+            totals = dict(self.totals)
+            counters = dict(sorted(self.counters.items()))
+        timers = {}
+        for name in sorted(durations):
+            timers[name] = {"calls": totals[name]}
+            timers[name].update(self.get_percentiles(durations[name]))
+        return {"timers": timers, "counters": counters}
+
+    def dump(self, file_path):
+        """
+        Write the summary of all timers and counters to a json file.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the json file.
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def reset(self):
+        """Remove all recorded durations and counters."""
+        with self.lock:
+            self.timers = {}
+            self.totals.clear()
+            self.counters.clear()
+
+
+instruments = Instrumentation(gui_constants.INSTRUMENTATION_WINDOW)
+
+
+def timed(name):
+    """
+    Return a decorator which records the runtime of a function.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer.
+
+    Returns
+    -------
+    callable
+        The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not gui_constants.INSTRUMENTATION:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                instruments.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class _Timer():
+    """Context manager which records the runtime of its code block."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        instruments.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# Returned by timer() while instrumentation is disabled, nothing is created
+_NO_TIMER = contextlib.nullcontext()
+
+
+def timer(name):
+    """
+    Record the runtime of the enclosed code block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer.
+
+    Returns
+    -------
+    context manager
+        A new timer, or a shared one doing nothing while instrumentation
+        is disabled.
+    """
+    if not gui_constants.INSTRUMENTATION:
+        return _NO_TIMER
+    return _Timer(name)
+
+
+def count(name, amount=1):
+    """
+    Increase a counter if instrumentation is enabled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter.
+    amount : int, optional
+        Value to add to the counter (default is 1).
+    """
+    if gui_constants.INSTRUMENTATION:
+        instruments.count(name, amount)
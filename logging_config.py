@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+This module configures the logging of the STC time management application.
+
+Modules log with `logger = logging.getLogger(__name__)` instead of print().
+A QueueHandler only puts the records into a queue, a QueueListener writes
+them on a thread of its own, so a slow console (e.g. on Windows) never
+delays the UI, a save loop or the timesheet service.
+
+- gui_constants.LOG_LEVEL is the level of all modules (DEBUG while
+  gui_constants.DEBUG is set), gui_constants.LOG_LEVELS overrides it per
+  module, e.g. {'database_functions': 'DEBUG'}.
+- A message repeated more than gui_constants.LOG_RATE_LIMIT times within
+  gui_constants.LOG_RATE_PERIOD seconds is dropped, the next message
+  written tells how many were dropped. Messages are equal if they are
+  logged by the same logger with the same format string, so the
+  arguments must be passed separately: logger.debug("Saved %s", date).
+- gui_constants.LOG_PATH also writes the log into a file.
+
+Classes
+-------
+RateLimitFilter
+    Drops messages repeated too often.
+
+Functions
+---------
+configure()
+    Installs the queue handler and starts the listener thread.
+stop()
+    Writes the queued records and stops the listener thread.
+
+Usage
+-----
+    import logging
+    logger = logging.getLogger(__name__)
+
+    if __name__ == "__main__":
+        logging_config.configure()
+"""
+
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+
+import gui_constants
+
+FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops messages repeated too often within a period.
+
+    Attributes
+    ----------
+    limit : int
+        Equal messages passed per period.
+    period : float
+        Length of a period in seconds, starting with the first message.
+    periods : dict
+        (logger name, format string) mapped to the start of its period,
+        the amount of passed and the amount of dropped messages.
+    """
+
+    def __init__(self, limit=None, period=None):
+        """
+        Initializes a RateLimitFilter.
+
+        Parameters
+        ----------
+        limit : int, optional
+            Equal messages passed per period
+            (default is gui_constants.LOG_RATE_LIMIT).
+        period : float, optional
+            Seconds per period (default is gui_constants.LOG_RATE_PERIOD).
+        """
+        super().__init__()
+        self.limit = gui_constants.LOG_RATE_LIMIT if limit is None else limit
+        self.period = gui_constants.LOG_RATE_PERIOD if period is None else period
+        self.periods = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        """Return False if the message is dropped."""
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            start, passed, dropped = self.periods.get(key, (now, 0, 0))
+            if now - start >= self.period:
+                start, passed = now, 0
+            if passed >= self.limit:
+                self.periods[key] = (start, passed, dropped + 1)
+                return False
+            self.periods[key] = (start, passed + 1, 0)
+        if dropped:
+            record.msg = "{message} ({dropped} similar messages dropped)".format(
+                message=record.getMessage(), dropped=dropped)
+            record.args = None
+        return True
+
+
+# Writes the queued records, None while logging is not configured
+listener = None
+queue_handler = None
+
+
+def configure():
+    """
+    Send all log records through a queue to a listener thread writing
+    them to stderr and gui_constants.LOG_PATH. Calling it again changes
+    nothing.
+    """
+    global listener, queue_handler
+    # Deferred, logging.handlers loads socket and pickle
+    import logging.handlers
+
+    if listener is not None:
+        return
+    formatter = logging.Formatter(FORMAT, "%H:%M:%S")
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if gui_constants.LOG_PATH:
+        handlers.append(logging.FileHandler(gui_constants.LOG_PATH, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    # Before the queue, dropped messages cost no formatting
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if gui_constants.DEBUG else gui_constants.LOG_LEVEL)
+    for name, level in gui_constants.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, *handlers)
+    listener.start()
+    atexit.register(stop)
+
+
+def stop():
+    """Write the records still queued and stop the listener thread."""
+    global listener, queue_handler
+
+    if listener is not None:
+        logging.getLogger().removeHandler(queue_handler)
+        listener.stop()
+        listener = None
+        queue_handler = None
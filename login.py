@@ -62,6 +62,9 @@ class LoginFrame(tk.Frame):
     login()
         Verifies entered credentials and displays a message indicating
         success or failure.
+
+    set_status(message, is_error=False)
+        Shows a progress or error message below the login button.
     """
 
     def __init__(self, parent, main=None):
@@ -98,6 +101,35 @@ class LoginFrame(tk.Frame):
         button_login = tk.Button(self, text="Login", command=self.login)
         button_login.pack(pady=10)
 
+        self.var_status = tk.StringVar(value="")
+        self.label_status = tk.Label(self, textvariable=self.var_status)
+        self.label_status.pack()
+
+        # Start loading the timesheet as soon as the username is entered
+        self.__entry_username.bind("<FocusOut>", self.preload_user)
+
+    def set_status(self, message, is_error=False):
+        """
+        Shows a progress or error message below the login button.
+
+        Parameters
+        ----------
+        message : str
+            The message to show, an empty string hides the message.
+        is_error : bool, optional
+            Whether the message is shown as an error (default is False).
+        """
+        self.var_status.set(message)
+        self.label_status.config(fg='red' if is_error else 'black')
+
+    def preload_user(self, event=None):
+        """
+        Loads the data of the entered username in the background.
+        """
+        if self.main is not None:
+            self.main.preload(self.main.preload_working_days,
+                              self.__entry_username.get())
+
     def login(self, event=None):
         """
         Validates the entered username and password.
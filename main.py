@@ -7,6 +7,7 @@ Created on Mon Nov  4 18:46:08 2024
 
 from gui_logic import Timesheet
 import gui_constants
+import logging_config
 
 
 # Start STC time management program
@@ -17,8 +18,13 @@ if __name__ == "__main__":
     # gui_constants.SHOW_ONLY_MINIMUM_DAYS = True
     # gui_constants.USE_TEXT_HINTS = True
     # gui_constants.USE_DATABASE = False
+    # gui_constants.USE_SERVICE = True
     # gui_constants.REDUCED_DATABASE_TRAFFIC = False
     # gui_constants.IMPORT_FROM_CSV = True
     # gui_constants.WRITE_TO_CSVS = True
+    # gui_constants.INSTRUMENTATION = True
+    # gui_constants.PROFILING = True
+    # gui_constants.PROFILE_MEMORY = True
 
+    logging_config.configure()
     app = Timesheet()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+This module closes the months of the STC time management application.
+
+Closing a month of an employee sums up its days once and stores the totals
+in the closed_months table: work, target and flex time and the amount of
+vacation and sick days. Afterwards:
+- The flex time is the sum of the frozen totals plus the open months, see
+  WorkTimeEmployee.get_flex_time().
+- Only the days of open months are loaded at login, the days of a closed
+  month are loaded when it is displayed.
+- Triggers in the database reject every change of the month's days, until
+  an admin reopens it.
+
+A month can only be closed once it is over. "auto" closes the previous
+month from day gui_constants.MONTH_CLOSE_DAY of the month on, i.e. after
+payroll, and can be run daily. Running it twice changes nothing.
+
+Functions
+---------
+parse_month(text)
+    Returns the first day of a month given as YYYY-MM.
+close_month(first_date, employee_ids=None)
+    Closes a month of all or some employees.
+reopen_month(first_date, employee_ids=None)
+    Reopens a closed month of all or some employees.
+auto_close(today=None)
+    Closes the previous month after payroll.
+
+Usage
+-----
+    python month_close.py close YYYY-MM [--employee ID ...]
+    python month_close.py reopen YYYY-MM [--employee ID ...]
+    python month_close.py auto
+"""
+
+import argparse
+import calendar
+import datetime as dt
+
+import gui_constants
+
+
+def parse_month(text):
+    """
+    Return the first day of a month.
+
+    Parameters
+    ----------
+    text : str
+        The month as 'YYYY-MM'.
+
+    Returns
+    -------
+    datetime.date
+    """
+    return dt.datetime.strptime(text, "%Y-%m").date()
+
+
+def get_employee_ids(db, employee_ids=None):
+    """Return the given employee ids or the ids of all employees."""
+    if employee_ids:
+        return list(employee_ids)
+    return [row[0] for row in db.load_employees()]
+
+
+def close_month(first_date, employee_ids=None):
+    """
+    Close a month of all or some employees.
+
+    Every employee is closed in a transaction of its own, the totals are
+    computed from the days read in the same transaction.
+
+    Parameters
+    ----------
+    first_date : datetime.date
+        First day of the month.
+    employee_ids : list, optional
+        The employees to close the month for (default is all).
+
+    Returns
+    -------
+    int
+        Amount of employees whose month was closed now.
+    """
+    from data_model import WorkTimeEmployee
+    from database_functions import DatabaseFunctions, run_with_retry
+    from working_time_model import WorkingTimeModel
+
+    if first_date >= dt.date.today().replace(day=1):
+        print("{:%Y-%m} is not over yet and can't be closed.".format(first_date))
+        return 0
+    date_strings = ["{:%Y-%m-%d}".format(first_date.replace(day=day)) for day in
+                    range(1, calendar.monthrange(first_date.year, first_date.month)[1] + 1)]
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        closed = 0
+        for employee_id in get_employee_ids(db, employee_ids):
+            # Closed months may be archived already, their days are not read again
+            if first_date.toordinal() in {row[0] for row in db.load_closed_months(employee_id)}:
+                print("{month:%Y-%m} of '{employee}' is already closed.".format(
+                    month=first_date, employee=employee_id))
+                continue
+            employee = WorkTimeEmployee(employee_id, load=False)
+            employee.region = db.load_employee_region(employee_id) or gui_constants.DEFAULT_REGION
+            employee.set_working_time_models([WorkingTimeModel.from_row(row) for row in
+                                              db.load_working_time_models(employee_id)])
+
+            def close():
+                # Nobody can change the days between summing and freezing them
+                with db.transaction():
+                    employee.clear_days()
+                    employee.read_from_database(date_strings, db)
+                    totals = employee.get_month_totals(first_date.year, first_date.month)
+                    return db.close_month(employee_id, totals['first_date'], totals['last_date'],
+                                          totals['work_seconds'], totals['target_seconds'],
+                                          totals['flex_seconds'], totals['vacation_days'],
+                                          totals['sick_days'])
+
+            if run_with_retry(close):
+                closed += 1
+            else:
+                print("{month:%Y-%m} of '{employee}' is already closed.".format(
+                    month=first_date, employee=employee_id))
+        print("Closed {month:%Y-%m} for {closed} employees.".format(month=first_date, closed=closed))
+        return closed
+    finally:
+        db.disconnect_from_database()
+
+
+def reopen_month(first_date, employee_ids=None):
+    """
+    Reopen a closed month of all or some employees, so its days can be
+    changed again.
+
+    Parameters
+    ----------
+    first_date : datetime.date
+        First day of the month.
+    employee_ids : list, optional
+        The employees to reopen the month for (default is all).
+
+    Returns
+    -------
+    int
+        Amount of employees whose month was reopened.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        reopened = 0
+        for employee_id in get_employee_ids(db, employee_ids):
+            if run_with_retry(db.reopen_month, employee_id, first_date):
+                reopened += 1
+        print("Reopened {month:%Y-%m} for {reopened} employees.".format(
+            month=first_date, reopened=reopened))
+        return reopened
+    finally:
+        db.disconnect_from_database()
+
+
+def auto_close(today=None):
+    """
+    Close the previous month once payroll is done.
+
+    Parameters
+    ----------
+    today : datetime.date, optional
+        The current day (default is today).
+
+    Returns
+    -------
+    int
+        Amount of employees whose month was closed now.
+    """
+    today = today or dt.date.today()
+    if today.day < gui_constants.MONTH_CLOSE_DAY:
+        print("The previous month is closed from day {day} on.".format(
+            day=gui_constants.MONTH_CLOSE_DAY))
+        return 0
+    return close_month((today.replace(day=1) - dt.timedelta(days=1)).replace(day=1))
+
+
+def main():
+    """Close or reopen months from the command line."""
+    parser = argparse.ArgumentParser(description="Close or reopen the months of the timesheets")
+    parser.add_argument('action', choices=('close', 'reopen', 'auto'),
+                        help="'auto' closes the previous month from MONTH_CLOSE_DAY on")
+    parser.add_argument('month', nargs='?', type=parse_month,
+                        help="The month as YYYY-MM")
+    parser.add_argument('--employee', nargs='+', dest='employee_ids',
+                        help="Only these employees (default is all)")
+    arguments = parser.parse_args()
+
+    if arguments.action == 'auto':
+        auto_close()
+    elif arguments.month is None:
+        parser.error(f"{arguments.action} requires a month")
+    elif arguments.action == 'close':
+        close_month(arguments.month, arguments.employee_ids)
+    else:
+        reopen_month(arguments.month, arguments.employee_ids)
+
+
+if __name__ == "__main__":
+    main()
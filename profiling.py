@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a profiling mode for the STC time management application.
+
+A capture runs the application under cProfile and, optionally, tracemalloc.
+Every capture writes a `.pstats` file and, if memory profiling is enabled, a
+text file with the top allocations to gui_constants.PROFILING_PATH.
+
+With gui_constants.PROFILING enabled a capture spans the whole session.
+gui_constants.PROFILING_HOTKEY starts and stops a capture while the
+application is running, also without PROFILING, so exactly the slow
+interaction can be profiled on demand.
+
+Classes
+-------
+Profiler
+    Starts and stops cProfile/tracemalloc captures and writes their results.
+
+Usage
+-----
+The written statistics can be inspected with the pstats module, e.g.
+
+    python -m pstats data/profiling/<session>.pstats
+"""
+
+import cProfile
+import datetime
+import logging
+import os
+import tracemalloc
+
+import gui_constants
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler():
+    """
+    A start/stop wrapper around cProfile and tracemalloc.
+
+    Attributes
+    ----------
+    directory : str
+        Folder the captures are written to.
+    trace_memory : bool
+        Whether allocations are traced with tracemalloc.
+    top_allocations : int
+        Amount of allocation sites written per capture.
+    profile : cProfile.Profile or None
+        The running profile. Is None if no capture is running.
+    session : str
+        Name of the current session, used as file name prefix.
+    captures : int
+        Amount of captures written during this session.
+    """
+
+    def __init__(self, directory=None, trace_memory=None, top_allocations=25):
+        """
+        Initializes a Profiler without starting a capture.
+
+        Parameters
+        ----------
+        directory : str, optional
+            Folder the captures are written to
+            (default is gui_constants.PROFILING_PATH).
+        trace_memory : bool, optional
+            Whether allocations are traced with tracemalloc
+            (default is gui_constants.PROFILE_MEMORY).
+        top_allocations : int, optional
+            Amount of allocation sites written per capture (default is 25).
+        """
+        if directory is None:
+            directory = gui_constants.PROFILING_PATH
+        if trace_memory is None:
+            trace_memory = gui_constants.PROFILE_MEMORY
+
+        self.directory = directory
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self.profile = None
+        self.session = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.captures = 0
+
+    def is_running(self):
+        """Return True if a capture is currently running."""
+        return self.profile is not None
+
+    def start(self):
+        """Start a new capture if none is running."""
+        if self.is_running():
+            return
+        if self.trace_memory:
+            tracemalloc.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        logger.info("Profiling started.")
+
+    def stop(self):
+        """
+        Stop the running capture and write its results to disk.
+
+        Returns
+        -------
+        list
+            Paths of the written files. Is empty if no capture was running.
+        """
+        if not self.is_running():
+            return []
+        self.profile.disable()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.captures += 1
+        file_name = "{session}_{capture:02d}".format(session=self.session,
+                                                      capture=self.captures)
+        file_paths = [os.path.join(self.directory, file_name + ".pstats")]
+        self.profile.dump_stats(file_paths[0])
+        self.profile = None
+
+        if tracemalloc.is_tracing():
+            file_paths.append(os.path.join(self.directory,
+                                           file_name + "_allocations.txt"))
+            self.write_allocations(file_paths[-1])
+            tracemalloc.stop()
+
+        logger.info("Profiling stopped, written to: %s", ", ".join(file_paths))
+        return file_paths
+
+    def toggle(self, event=None):
+        """
+        Start a capture or stop the running one.
+
+        Callback method for the profiling hotkey.
+        """
+        if self.is_running():
+            self.stop()
+        else:
+            self.start()
+
+    def write_allocations(self, file_path):
+        """
+        Write the top allocation sites of the running trace to a text file.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the text file.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        statistics = snapshot.statistics('lineno')
+        current, peak = tracemalloc.get_traced_memory()
+
+        with open(file_path, 'w') as file:
+            file.write("Current: {current:.1f} KiB, Peak: {peak:.1f} KiB\n\n"
+                       .format(current=current / 1024, peak=peak / 1024))
+            for statistic in statistics[:self.top_allocations]:
+                file.write(str(statistic) + "\n")
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests.
+
+Every test runs in a data folder of its own, so the data folder of the
+checkout is never read or written.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gui_constants  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def data_path(tmp_path, monkeypatch):
+    """Redirect all files of the application into a temporary folder."""
+    monkeypatch.setattr(gui_constants, 'DATA_PATH', str(tmp_path) + os.sep)
+    monkeypatch.setattr(gui_constants, 'DATABASE_PATH', str(tmp_path / "timesheet.db"))
+    monkeypatch.setattr(gui_constants, 'CALENDAR_PATH', str(tmp_path / "calendar"))
+    monkeypatch.setattr(gui_constants, 'INSTRUMENTATION_PATH', str(tmp_path / "instrumentation.json"))
+    monkeypatch.setattr(gui_constants, 'PROFILING_PATH', str(tmp_path / "profiling"))
+    monkeypatch.setattr(gui_constants, 'LAST_USER_PATH', str(tmp_path / "last_user.txt"))
+    yield tmp_path
+    if 'timesheet_snapshot' in sys.modules:
+        # Snapshots are written on a background thread
+        sys.modules['timesheet_snapshot'].wait_for_rebuilds()
+
+
+@pytest.fixture
+def db():
+    """An open connection to a new database with the numeric layout."""
+    from database_functions import DatabaseFunctions
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    yield db
+    db.disconnect_from_database()
+
+
+@pytest.fixture
+def legacy_db():
+    """An open connection to a database with the legacy text layout."""
+    import sqlite3
+
+    from database_functions import DatabaseFunctions
+
+    # An existing timesheet table keeps the layout of earlier versions
+    connection = sqlite3.connect(gui_constants.DATABASE_PATH)
+    connection.execute('''
+        CREATE TABLE timesheet (employee_id TEXT, date DATE, starttime DATETIME, endtime DATETIME,
+                                workhours REAL, breaktime REAL, state TEXT)
+    ''')
+    connection.close()
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    yield db
+    db.disconnect_from_database()
+
+
+class Variable():
+    """Stands in for a tkinter variable of a DayWidget."""
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+def make_day_widget(date_object, start='', end='', break_time=''):
+    """Return a stand-in for gui.DayWidget with the given inputs."""
+    widget = types.SimpleNamespace(date=date_object, total_time=None)
+    widget.var_day = Variable(str(date_object.day))
+    widget.var_start_time = Variable(start)
+    widget.var_end_time = Variable(end)
+    widget.var_break_time = Variable(break_time)
+    widget.set_total_time = lambda seconds: setattr(widget, 'total_time', seconds)
+    return widget
+
+
+class TimesheetStandIn(types.SimpleNamespace):
+    """
+    Stands in for gui_logic.Timesheet without any window. Methods which are
+    not set on the instance are the ones of Timesheet.
+    """
+
+    def __getattr__(self, name):
+        from gui_logic import Timesheet
+
+        return getattr(Timesheet, name).__get__(self)
+
+
+def make_timesheet(*employees):
+    """Return a TimesheetStandIn working on the given employees."""
+    timesheet = TimesheetStandIn(employees={employee.employee_id: employee
+                                            for employee in employees})
+    timesheet.current_employee = employees[0] if employees else None
+    timesheet.stored_csv_rows = None
+    timesheet.file_path_employees = os.path.join(gui_constants.DATA_PATH, "employees.csv")
+    timesheet.shown_conflicts = []
+    timesheet.show_conflicts = lambda description, conflicts: timesheet.shown_conflicts.append(
+        (description, list(conflicts)))
+    for name in ('update_buttons', 'update_info_panel', 'update_from_db', 'store_all_inputs'):
+        setattr(timesheet, name, lambda: None)
+    return timesheet
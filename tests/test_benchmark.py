@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Tests of the baseline and startup checks of the benchmark."""
+
+import os
+import subprocess
+
+import pytest
+
+import benchmark
+
+
+def test_missing_baseline_is_saved_instead_of_compared(tmp_path):
+    file_path = str(tmp_path / "baseline.json")
+    results = {"read_from_database [1 year]": {"min": 0.001, "median": 0.002}}
+    assert benchmark.check_against_baseline(results, file_path=file_path) == []
+    slower = {"read_from_database [1 year]": {"min": 0.004, "median": 0.004}}
+    assert benchmark.check_against_baseline(slower, file_path=file_path) == [
+        "read_from_database [1 year]"]
+
+
+def import_line(cumulative, name):
+    return "import time: {self:>9} | {cumulative:>10} | {name}".format(
+        self=100, cumulative=cumulative, name=name)
+
+
+def test_only_imports_before_the_login_frame_count():
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        import_line(500, "  tkinter"),
+        import_line(70000, "gui_logic"),
+        benchmark.LOGIN_WINDOW_MARKER,
+        import_line(3000, "sqlite3"),
+        import_line(2000, "  sqlite3.dbapi2"),
+    ])
+    import_time, imported_modules = benchmark.parse_import_times(output)
+    assert import_time == 0.07
+    assert imported_modules == {"tkinter", "gui_logic"}
+
+
+def test_deferred_module_imported_before_the_login_frame_is_reported(
+        monkeypatch):
+    output = "\n".join([
+        import_line(3000, "sqlite3"),
+        import_line(70000, "gui_logic"),
+        benchmark.LOGIN_WINDOW_MARKER,
+    ])
+    monkeypatch.setattr(benchmark.subprocess, 'run', lambda *args, **kwargs:
+                        subprocess.CompletedProcess(args, 1, "", output))
+    assert benchmark.check_startup() == ["'sqlite3' is imported at startup"]
+
+
+def test_probe_runs_on_a_temporary_data_folder(monkeypatch):
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        assert os.path.isdir(command[-1])
+        return subprocess.CompletedProcess(command, 1, "", "")
+
+    monkeypatch.setattr(benchmark.subprocess, 'run', run)
+    benchmark.check_startup()
+    data_path = calls[0][-1]
+    assert not os.path.exists(data_path)  # Removed after the check
+    assert calls[0][calls[0].index("-c") + 1] == benchmark.LOGIN_WINDOW_PROBE
+
+
+@pytest.mark.skipif(not os.environ.get("DISPLAY"), reason="No display")
+def test_startup_check_leaves_the_checkout_data_untouched():
+    database_path = os.path.join(
+        os.path.dirname(os.path.abspath(benchmark.__file__)),
+        "data", "timesheet.db")
+    modified = (os.path.getmtime(database_path)
+                if os.path.isfile(database_path) else None)
+    violations = benchmark.check_startup(import_budget=60, login_budget=60)
+    assert not any("imported at startup" in v for v in violations)
+    assert modified == (os.path.getmtime(database_path)
+                        if os.path.isfile(database_path) else None)
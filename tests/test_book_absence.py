@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of booking vacation and sick leave over date ranges."""
+
+import datetime as dt
+
+import pytest
+
+from conftest import make_timesheet
+from data_model import WorkTimeEmployee
+
+MONDAY = dt.date(2026, 3, 9)
+FRIDAY = dt.date(2026, 3, 13)
+
+
+def load_counters(employee_id):
+    """Return the vacation days and old vacation days stored in the database."""
+    from database_functions import DatabaseFunctions
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        return next(row[1:3] for row in db.load_employees() if row[0] == employee_id)
+    finally:
+        db.disconnect_from_database()
+
+
+@pytest.fixture
+def timesheet():
+    employee = WorkTimeEmployee("booker", load=False)
+    employee.amount_vacation_days = 30
+    employee.amount_old_vacation_days = 2
+    return make_timesheet(employee)
+
+
+def test_booking_skips_weekend_and_takes_old_days_first(timesheet):
+    message = timesheet.book_absence("2026-03-09", "2026-03-15", "vacation")
+
+    assert message.startswith("5 days changed")
+    employee = WorkTimeEmployee("booker")
+    assert [employee.get_day(MONDAY + dt.timedelta(days=offset)).state for offset in range(7)] == \
+        ["vacation"] * 5 + ["default"] * 2
+    assert load_counters("booker") == (27, 0)
+
+
+def test_cancelled_vacation_is_given_back(timesheet):
+    timesheet.book_absence("2026-03-09", "2026-03-13", "vacation")
+    timesheet.book_absence("2026-03-12", "2026-03-13", "default")
+
+    assert load_counters("booker") == (29, 0)
+
+
+def test_not_enough_vacation_days_changes_nothing(timesheet):
+    timesheet.current_employee.amount_vacation_days = 1
+    message = timesheet.book_absence("2026-03-09", "2026-03-13", "vacation")
+
+    assert message.startswith("Not enough vacation days left")
+    assert timesheet.current_employee.get_day(MONDAY).state == "default"
+
+
+def test_conflicting_day_does_not_take_vacation_days(timesheet):
+    # Another instance enters times on Wednesday in the meantime
+    other = WorkTimeEmployee("booker", load=False)
+    wednesday = other.create_day(dt.date(2026, 3, 11))
+    wednesday.start_time = dt.time(8)
+    wednesday.end_time = dt.time(16)
+    other.save_to_database()
+
+    message = timesheet.book_absence("2026-03-09", "2026-03-13", "vacation")
+
+    assert message.startswith("4 days changed")
+    assert timesheet.shown_conflicts == [("entries on", ["2026-03-11"])]
+    assert timesheet.current_employee.get_day(dt.date(2026, 3, 11)).state == "default"
+    assert (timesheet.current_employee.amount_vacation_days,
+            timesheet.current_employee.amount_old_vacation_days) == (28, 0)
+    assert load_counters("booker") == (28, 0)
+    assert WorkTimeEmployee("booker").get_day(FRIDAY).state == "vacation"
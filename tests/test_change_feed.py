@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Tests of the change feed export."""
+
+import io
+import json
+
+import change_feed
+
+
+def export(cursor=0, batch_size=None):
+    output = io.StringIO()
+    lines, cursor = change_feed.export_changes(cursor, output, batch_size)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(records) == lines
+    return records, cursor
+
+
+def apply(records):
+    """Bring a consumer up to date like the payroll sync does."""
+    rows = {}
+    for record in records:
+        key = (record["table"], record["employee_id"], record.get("date"))
+        if record["operation"] == "delete":
+            rows.pop(key, None)
+        else:
+            rows[key] = record
+    return rows
+
+
+def test_changes_are_exported_once_since_the_cursor(db):
+    db.save_employee('E1', 30, 0)
+    version = db.save_day('E1', '2026-03-09', '08:00', '16:00')
+    db.save_day('E1', '2026-03-09', '08:00', '17:00', version=version)
+    version = db.save_day('E1', '2026-03-10', '08:00')
+    db.delete_day('E1', '2026-03-10', version)
+    db.disconnect_from_database()
+
+    records, cursor = export()
+    assert [(record["table"], record["operation"], record.get("date")) for record in records] == [
+        ("employees", "upsert", None), ("timesheet", "upsert", "2026-03-09"),
+        ("timesheet", "delete", "2026-03-10")]
+    assert records[1]["end_seconds"] - records[1]["start_seconds"] == 9 * 3600
+    # Small batches may repeat a row, applying them in order gives the same result
+    assert apply(export(batch_size=1)[0]) == apply(records)
+
+    assert export(cursor) == ([], cursor)
+    db.connect_to_database()
+    db.save_employee('E2', 25, 0)
+    db.disconnect_from_database()
+    records, new_cursor = export(cursor)
+    assert [record["employee_id"] for record in records] == ["E2"] and new_cursor > cursor
+
+    assert change_feed.prune(cursor) > 0
+    assert [record["employee_id"] for record in export()[0]] == ["E2"]
+    db.connect_to_database()
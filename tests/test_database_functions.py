@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Tests of optimistic locking and retrying on a shared database."""
+
+import multiprocessing
+import sqlite3
+
+import pytest
+
+import gui_constants
+from database_functions import DatabaseFunctions, NUMERIC_LAYOUT, SCHEMA_VERSION, run_with_retry
+
+
+def load_counter(db):
+    db.c.execute("SELECT vacation_days, version FROM employees WHERE employee_id = 'stress'")
+    return db.c.fetchone()
+
+
+def increment(db):
+    """Add a vacation day with compare and swap, return None on a conflict."""
+    vacation_days, version = load_counter(db)
+    return db.save_employee('stress', vacation_days + 1, 0, version)
+
+
+def stress_test_worker(database_path, worker_id, increments):
+    # Increments a shared counter using compare and swap and inserts own days in one transaction.
+    # Returns the amount of conflicts this worker had to resolve by retrying.
+    gui_constants.DATABASE_PATH = database_path
+    # Short busy timeout, so contention is resolved by run_with_retry()
+    gui_constants.DATABASE_TIMEOUT = 0.01
+    gui_constants.DATABASE_RETRIES = 20
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    conflicts = 0
+
+    def insert_days():
+        with db.transaction():
+            for day in range(1, 29):
+                db.save_day(f'worker{worker_id}', f'2024-02-{day:02d}', '08:00', '16:30', 1800.0)
+
+    done = 0
+    while done < increments:
+        if run_with_retry(increment, db) is None:
+            conflicts += 1
+        else:
+            done += 1
+    run_with_retry(insert_days)
+
+    db.disconnect_from_database()
+    return conflicts
+
+
+def test_conflicting_update_is_rejected_and_retried(db):
+    db.save_employee('stress', 0, 0)
+    other = DatabaseFunctions()
+    other.connect_to_database()
+    try:
+        # Both read version 1, the second write must not overwrite the first one
+        vacation_days, version = load_counter(other)
+        assert increment(db) == 2
+        assert other.save_employee('stress', vacation_days + 1, 0, version) is None
+        assert load_counter(db) == (1, 2)
+        # Retrying reads the new version
+        assert increment(other) == 3
+    finally:
+        other.disconnect_from_database()
+    assert load_counter(db) == (2, 3)
+
+
+def test_schema_is_set_up_once_per_database(db):
+    def has_index():
+        db.c.execute("SELECT 1 FROM sqlite_master WHERE name = 'employees_department'")
+        return db.c.fetchone() is not None
+
+    assert db.get_schema_version() == SCHEMA_VERSION
+    assert db.get_layout() == NUMERIC_LAYOUT
+    db.c.execute('DROP INDEX employees_department')
+    db.disconnect_from_database()
+    db.connect_to_database()
+    assert not has_index()
+
+    # A database set up by an earlier version is set up again once
+    db.c.execute(f'PRAGMA user_version = {NUMERIC_LAYOUT}')
+    db.disconnect_from_database()
+    db.connect_to_database()
+    assert has_index() and db.get_schema_version() == SCHEMA_VERSION
+
+
+def test_run_with_retry_waits_while_locked(monkeypatch):
+    monkeypatch.setattr(gui_constants, 'DATABASE_BACKOFF', 0)
+    calls = []
+
+    def locked_twice():
+        calls.append(None)
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'done'
+
+    assert run_with_retry(locked_twice) == 'done'
+    assert len(calls) == 3
+
+
+def test_run_with_retry_raises_other_errors(monkeypatch):
+    monkeypatch.setattr(gui_constants, 'DATABASE_BACKOFF', 0)
+    calls = []
+
+    def broken():
+        calls.append(None)
+        raise sqlite3.OperationalError('no such table: missing')
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_with_retry(broken)
+    assert len(calls) == 1
+
+
+def test_no_update_is_lost_by_concurrent_processes(db):
+    processes, increments = 4, 25
+    db.save_employee('stress', 0, 0)
+    with multiprocessing.Pool(processes) as pool:
+        pool.starmap(stress_test_worker, [(gui_constants.DATABASE_PATH, i, increments) for i in range(processes)])
+    assert load_counter(db) == (processes * increments, processes * increments + 1)
+    for i in range(processes):
+        assert len(db.load_days(f'worker{i}')) == 28
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Tests of the online backups and the scheduled maintenance."""
+
+import asyncio
+import os
+import sqlite3
+
+import database_maintenance
+import gui_constants
+from timesheet_server import TimesheetServer
+
+
+def test_backup_copies_the_database_and_keeps_the_newest(db, monkeypatch):
+    monkeypatch.setattr(gui_constants, 'BACKUPS_KEPT', 2)
+    db.save_day('E1', '2026-03-09', '08:00', '16:00')
+    directory = database_maintenance.get_backup_directory()
+    os.makedirs(directory)
+    for old_backup in ('timesheet_20260101_000000.db', 'timesheet_20260102_000000.db'):
+        open(os.path.join(directory, old_backup), 'w').close()
+
+    assert 'MB written' in database_maintenance.run_task('backup', db)
+    backups = sorted(os.listdir(directory))
+    assert len(backups) == 2 and backups[0] == 'timesheet_20260102_000000.db'
+    copy = sqlite3.connect(os.path.join(directory, backups[1]))
+    try:
+        assert copy.execute('SELECT COUNT(*) FROM timesheet_v2').fetchone()[0] == 1
+    finally:
+        copy.close()
+
+
+def test_vacuum_releases_free_pages(db):
+    db.c.execute('CREATE TABLE filler (data BLOB)')
+    db.c.executemany('INSERT INTO filler VALUES (zeroblob(4096))', [()] * 50)
+    db.c.execute('DROP TABLE filler')
+    assert database_maintenance.run_task('vacuum', db).endswith('pages released')
+    assert db.c.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_due_tasks_run_once_per_interval(db):
+    db.disconnect_from_database()
+    assert database_maintenance.run_due_tasks() == list(gui_constants.MAINTENANCE_INTERVALS)
+    assert database_maintenance.run_due_tasks() == []
+    db.connect_to_database()
+    results = {row[0]: row[5] for row in db.load_maintenance_log()}
+    assert results['integrity'] == 'ok' and results['analyze'] == 'ok'
+
+
+def test_service_maintains_one_interval_after_its_start(monkeypatch):
+    runs = []
+    monkeypatch.setattr(database_maintenance, 'run_due_tasks_in_background',
+                        lambda: runs.append(True))
+    monkeypatch.setattr(gui_constants, 'MAINTENANCE_CHECK_INTERVAL', 50)
+    server = TimesheetServer('127.0.0.1', 0)
+
+    async def maintain():
+        task = asyncio.ensure_future(server.maintain())
+        await asyncio.sleep(0.01)
+        runs_at_start = len(runs)
+        await asyncio.sleep(0.08)
+        task.cancel()
+        return runs_at_start
+
+    assert asyncio.run(maintain()) == 0
+    assert runs == [True]
+    server.executor.shutdown()
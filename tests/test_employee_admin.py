@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Tests of the bulk changes of employees."""
+
+from conftest import make_timesheet
+from data_model import WorkTimeEmployee
+import employee_admin
+import gui_constants
+
+
+def load_employees(db):
+    db.c.execute('SELECT employee_id, department, version, vacation_days FROM employees ORDER BY employee_id')
+    return db.c.fetchall()
+
+
+def test_set_department_changes_only_other_departments(db):
+    for employee_id in ('E1', 'E2', 'E3'):
+        db.save_employee(employee_id, 30, 0)
+    assert db.set_department(['E1'], 'Sales') == 1
+    # E1 is already in Sales, the duplicate id is changed once
+    assert db.set_department(['E1', 'E2', 'E2'], 'Sales') == 1
+    assert load_employees(db) == [('E1', 'Sales', 2, 30), ('E2', 'Sales', 2, 30), ('E3', None, 1, 30)]
+    assert db.set_department(['E1', 'E3'], None) == 1
+    assert load_employees(db)[0] == ('E1', None, 3, 30)
+
+
+def test_bulk_changes_of_a_department(db):
+    for employee_id in ('E1', 'E2', 'E3'):
+        db.save_employee(employee_id, 30, 0)
+    db.disconnect_from_database()
+    assert employee_admin.set_department('Sales', ['E1', 'E2']) == 2
+    assert employee_admin.grant_vacation_days(2, 'Sales') == 2
+    assert employee_admin.set_entitlement(28) == 3
+    db.connect_to_database()
+    assert load_employees(db) == [('E1', 'Sales', 4, 32), ('E2', 'Sales', 4, 32), ('E3', None, 2, 30)]
+
+
+def test_save_employees_detects_stale_versions(db):
+    db.save_employee('E2', 30, 0)
+    with db.transaction():
+        versions = db.save_employees([('E1', 28, 2, None, 'DE-BY'), ('E2', 20, 0, 5, None)])
+    assert versions == {'E1': 1, 'E2': None}
+    assert load_employees(db) == [('E1', None, 1, 28), ('E2', None, 1, 30)]
+
+
+def test_timesheet_saves_only_changed_employees(db, monkeypatch):
+    monkeypatch.setattr(gui_constants, 'USE_DATABASE', True)
+    monkeypatch.setattr(gui_constants, 'USE_SERVICE', False)
+    monkeypatch.setattr(gui_constants, 'WRITE_TO_CSVS', False)
+    for employee_id in ('E1', 'E2', 'E3'):
+        db.save_employee(employee_id, 30, 0)
+    employees = []
+    for employee_id in ('E1', 'E2', 'E3'):
+        employee = WorkTimeEmployee(employee_id, load=False)
+        employee.amount_vacation_days, employee.amount_old_vacation_days = 30, 0
+        employee.mark_counters_stored(1)
+        employees.append(employee)
+    timesheet = make_timesheet(*employees)
+    employees[0].amount_vacation_days = 25
+    employees[1].amount_vacation_days = 26
+    # Another instance changed E2 in the meantime
+    db.save_employee('E2', 31, 0, version=1)
+
+    timesheet.save_employees()
+    assert load_employees(db) == [('E1', None, 2, 25), ('E2', None, 2, 31), ('E3', None, 1, 30)]
+    assert timesheet.shown_conflicts == [("vacation days of", ['E2'])]
+    # The counters of the conflict are reloaded instead of overwritten
+    assert (employees[1].amount_vacation_days, employees[1].version) == (31, 2)
+    assert not any(employee.counters_modified() for employee in employees)
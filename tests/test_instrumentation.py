@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Tests of the timers and counters."""
+
+import threading
+
+import pytest
+
+import gui_constants
+import instrumentation
+from instrumentation import Instrumentation
+
+
+def test_summary_of_timers_and_counters():
+    instruments = Instrumentation(window_size=3)
+    for seconds in (0.004, 0.001, 0.002, 0.003):
+        instruments.record("db.read", seconds)
+    instruments.count("db.rows_read", 5)
+    summary = instruments.summary()
+    # Only the last three durations are kept, the calls count all of them
+    assert summary["timers"] == {"db.read": {"calls": 4, "p50": 2.0, "p90": 3.0, "p99": 3.0}}
+    assert summary["counters"] == {"db.rows_read": 5}
+
+
+def test_summary_waits_for_the_lock():
+    instruments = Instrumentation()
+    instruments.record("db.read", 0.001)
+    summaries = []
+    reader = threading.Thread(target=lambda: summaries.append(instruments.summary()))
+    with instruments.lock:
+        reader.start()
+        reader.join(0.1)
+        assert reader.is_alive()
+        # A timer added meanwhile must not change the dict being iterated
+        instruments.timers["db.write"] = [0.002]
+        instruments.totals["db.write"] += 1
+    reader.join(1.0)
+    assert sorted(summaries[0]["timers"]) == ["db.read", "db.write"]
+
+
+def test_timer_records_only_while_enabled(monkeypatch):
+    monkeypatch.setattr(instrumentation, 'instruments', Instrumentation(window_size=3))
+    monkeypatch.setattr(gui_constants, 'INSTRUMENTATION', False)
+    # Disabled timers are one shared object doing nothing
+    assert instrumentation.timer("db.read") is instrumentation.timer("db.write")
+    with instrumentation.timer("db.read"):
+        pass
+    assert instrumentation.instruments.timers == {}
+
+    monkeypatch.setattr(gui_constants, 'INSTRUMENTATION', True)
+    with pytest.raises(ValueError):
+        with instrumentation.timer("db.read"):
+            raise ValueError()
+    assert instrumentation.instruments.summary()["timers"]["db.read"]["calls"] == 1
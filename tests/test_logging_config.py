@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Tests of the buffered, rate-limited logging."""
+
+import logging
+
+import gui_constants
+import logging_config
+from logging_config import RateLimitFilter
+
+
+def make_record(message, *args):
+    return logging.LogRecord("database_functions", logging.INFO, __file__, 1, message, args, None)
+
+
+def test_repeated_messages_are_dropped_within_a_period(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_config.time, 'monotonic', lambda: now[0])
+    rate_limit = RateLimitFilter(limit=2, period=10.0)
+
+    assert [rate_limit.filter(make_record("Saved %s", day)) for day in range(3)] == [True, True, False]
+    assert rate_limit.filter(make_record("Loaded %s", 1))
+
+    now[0] += 10.0
+    record = make_record("Saved %s", 3)
+    assert rate_limit.filter(record)
+    assert record.getMessage() == "Saved 3 (1 similar messages dropped)"
+
+
+def test_records_are_written_by_the_listener(tmp_path, monkeypatch):
+    log_path = tmp_path / "timesheet.log"
+    monkeypatch.setattr(gui_constants, 'LOG_PATH', str(log_path))
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'level', root.level)
+
+    logging_config.configure()
+    logging_config.configure()
+    try:
+        logging.getLogger("database_functions").info("Saved %s days", 3)
+    finally:
+        logging_config.stop()
+    assert logging_config.listener is None
+    lines = log_path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 1 and lines[0].endswith("INFO    database_functions: Saved 3 days")
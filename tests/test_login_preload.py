@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of loading the timesheet of the last user while the login is typed."""
+
+import datetime as dt
+import queue
+import threading
+
+import gui_constants
+from conftest import make_timesheet
+from data_model import WorkTimeEmployee
+
+MONDAY = dt.date(2026, 3, 9)
+
+
+def make_login_timesheet(last_user):
+    """Return a timesheet stand-in which preloaded the last user's timesheet."""
+    with open(gui_constants.LAST_USER_PATH, 'w') as file:
+        file.write(last_user)
+    timesheet = make_timesheet()
+    timesheet.create_timesheet_window = lambda: None
+    timesheet.preload_thread = None
+    timesheet.preload_messages = queue.Queue()
+    timesheet.preloaded_employee = None
+    timesheet.preload(timesheet.preload_employees)
+    timesheet.preload(timesheet.preload_working_days, timesheet.get_last_user())
+    return timesheet
+
+
+def test_preloaded_timesheet_of_another_user_is_dropped(db):
+    db.save_employee('E1', 30, 0)
+    db.save_employee('E2', 30, 0)
+    db.save_day('E1', '2026-03-09', '08:00', '16:30', 1800.0)
+    db.save_day('E2', '2026-03-09', '09:00', '17:00', 1800.0)
+
+    timesheet = make_login_timesheet('E1')
+    timesheet.login('E2')
+
+    preloaded = timesheet.employees['E1']
+    assert not preloaded.is_loaded and preloaded.working_days == {}
+    assert timesheet.preloaded_employee is None
+    assert timesheet.current_employee.get_day(MONDAY).start_time == dt.time(9)
+    with open(gui_constants.LAST_USER_PATH) as file:
+        assert file.read() == 'E2'
+
+
+def test_login_waits_for_the_preloaded_timesheet(db, monkeypatch):
+    db.save_employee('E1', 30, 0)
+    db.save_day('E1', '2026-03-09', '08:00', '16:30', 1800.0)
+
+    # The preloading thread is held inside read_from_database
+    reading = threading.Event()
+    release = threading.Event()
+    reads = []
+    read_from_database = WorkTimeEmployee.read_from_database
+
+    def held_read(self, *args, **kwargs):
+        reads.append(threading.current_thread())
+        reading.set()
+        release.wait(5)
+        return read_from_database(self, *args, **kwargs)
+
+    monkeypatch.setattr(WorkTimeEmployee, 'read_from_database', held_read)
+    timesheet = make_login_timesheet('E1')
+    assert reading.wait(5)
+
+    login = threading.Thread(target=timesheet.login, args=('E1',))
+    login.start()
+    login.join(0.2)
+    assert login.is_alive()  # Blocked until the preload is done
+    release.set()
+    login.join(5)
+
+    # The preloaded timesheet is used and not read a second time
+    assert reads == [timesheet.preload_thread]
+    assert timesheet.current_employee is timesheet.employees['E1']
+    assert timesheet.current_employee.get_day(MONDAY).start_time == dt.time(8)
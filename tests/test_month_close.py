@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Tests of closed months."""
+
+import datetime as dt
+import sqlite3
+
+import pytest
+
+from data_model import WorkTimeEmployee
+from database_functions import NUMERIC_LAYOUT
+import gui_constants
+import month_close
+
+MARCH = dt.date(2026, 3, 1), dt.date(2026, 3, 31)
+APRIL_DAY = dt.date(2026, 4, 1).toordinal()
+MARCH_DAY = dt.date(2026, 3, 31).toordinal()
+
+
+@pytest.fixture
+def closed_db(db):
+    db.save_day('E1', '2026-04-01', '08:00', '16:00')
+    db.close_month('E1', *MARCH, 8 * 3600, 8 * 3600, 0, 0, 0)
+    return db
+
+
+def move_day_into_closed_month(db):
+    db.c.execute('UPDATE timesheet_v2 SET day = ? WHERE employee_id = ? AND day = ?',
+                 (MARCH_DAY, 'E1', APRIL_DAY))
+
+
+def test_day_can_not_be_moved_into_a_closed_month(closed_db):
+    with pytest.raises(sqlite3.IntegrityError, match='The month is closed'):
+        move_day_into_closed_month(closed_db)
+    closed_db.c.execute('SELECT day FROM timesheet_v2 WHERE employee_id = ?', ('E1',))
+    assert closed_db.c.fetchall() == [(APRIL_DAY,)]
+
+
+def test_trigger_of_earlier_versions_is_replaced(closed_db):
+    closed_db.c.execute('DROP TRIGGER timesheet_v2_closed_update')
+    closed_db.c.execute('''
+        CREATE TRIGGER timesheet_v2_closed_update BEFORE UPDATE ON timesheet_v2
+        WHEN EXISTS (SELECT 1 FROM closed_months c
+                     WHERE c.employee_id = OLD.employee_id AND OLD.day BETWEEN c.first_day AND c.last_day)
+        BEGIN
+            SELECT RAISE(ABORT, 'The month is closed');
+        END
+    ''')
+    # Set up by an earlier version
+    closed_db.c.execute(f'PRAGMA user_version = {NUMERIC_LAYOUT}')
+    closed_db.disconnect_from_database()
+    closed_db.connect_to_database()
+    with pytest.raises(sqlite3.IntegrityError, match='The month is closed'):
+        move_day_into_closed_month(closed_db)
+
+
+def save_march(db):
+    db.save_employee('E2', 30, 0)
+    db.save_day('E2', '2026-03-02', '08:00', '17:00', 3600.0)
+    db.save_day('E2', '2026-03-03', None, state='vacation')
+    db.save_day('E2', '2026-03-04', None, state='sick')
+    db.save_day('E2', '2026-03-05', '08:00', '18:00', 3600.0)
+
+
+def test_closed_month_keeps_its_totals(db):
+    save_march(db)
+    target = round(gui_constants.DAILY_WORKING_HOURS * 3600)
+    assert month_close.close_month(MARCH[0], ['E2']) == 1
+    assert month_close.close_month(MARCH[0], ['E2']) == 0
+    assert db.load_closed_months('E2') == [(MARCH[0].toordinal(), MARCH_DAY, 17 * 3600, 2 * target,
+                                            17 * 3600 - 2 * target, 1, 1)]
+    employee = WorkTimeEmployee('E2')
+    assert employee.get_flex_time() == 17 * 3600 - 2 * target
+    assert employee.get_day(dt.date(2026, 3, 2)).start_time is None  # Not loaded at login
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save_day('E2', '2026-03-06', '08:00', '16:00')
+
+    assert month_close.reopen_month(MARCH[0], ['E2']) == 1
+    db.save_day('E2', '2026-03-06', '08:00', '16:00')
+    assert db.load_closed_months('E2') == []
+
+
+def test_month_is_closed_after_payroll_only(db):
+    save_march(db)
+    assert month_close.auto_close(dt.date(2026, 4, gui_constants.MONTH_CLOSE_DAY - 1)) == 0
+    assert month_close.auto_close(dt.date(2026, 4, gui_constants.MONTH_CLOSE_DAY)) == 1
+    assert month_close.close_month(dt.date.today().replace(day=1)) == 0
+
+
+def test_range_cutting_through_a_closed_month_counts_its_days(db):
+    save_march(db)
+    db.save_day('E2', '2026-03-16', '08:00', '18:00', 3600.0)
+    db.save_day('E2', '2026-04-01', '08:00', '17:00', 3600.0)
+    month_close.close_month(MARCH[0], ['E2'])
+    target = round(gui_constants.DAILY_WORKING_HOURS * 3600)
+
+    employee = WorkTimeEmployee('E2')
+    # Only the closed days from the 15th on count, one by one
+    assert employee.get_flex_time(dt.date(2026, 3, 15), dt.date(2026, 4, 15)) == (
+        (9 * 3600 - target) + (8 * 3600 - target))
+    assert employee.get_flex_time(dt.date(2026, 3, 1), dt.date(2026, 3, 4)) == 8 * 3600 - target
+    # The whole month still counts with its frozen totals
+    assert employee.get_flex_time(MARCH[0], dt.date(2026, 4, 15)) == (
+        26 * 3600 - 3 * target + (8 * 3600 - target))
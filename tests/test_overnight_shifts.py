@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Tests of shifts crossing midnight."""
+
+import datetime as dt
+import types
+
+from conftest import make_day_widget, make_timesheet
+from data_model import WorkTimeEmployee
+import gui_logic
+
+DATE = dt.date(2026, 3, 10)
+
+
+def save_night_shift():
+    """Save a 22:00 - 06:00 shift and return the employee read again."""
+    employee = WorkTimeEmployee("night", load=False)
+    day = employee.create_day(DATE)
+    day.start_time = dt.time(22, 0)
+    day.end_time = dt.time(6, 0)
+    employee.save_to_database()
+    return WorkTimeEmployee("night")
+
+
+def test_night_shift_is_stored_with_end_on_next_day():
+    employee = save_night_shift()
+    day = employee.get_day(DATE)
+    assert day.end_day_offset == 1
+    assert day.get_work_time() == 8 * 3600
+
+
+def test_edited_end_recomputes_end_day_offset():
+    employee = save_night_shift()
+    timesheet = make_timesheet(employee)
+
+    timesheet.store_input_data(make_day_widget(DATE, "22:00", "23:00"))
+
+    day = employee.get_day(DATE)
+    assert day.get_end_day_offset() == 0
+    assert day.get_work_time() == 3600
+    # The saved end is on the same day as well
+    employee.save_to_database()
+    assert WorkTimeEmployee("night").get_day(DATE).get_work_time() == 3600
+
+
+def test_unchanged_input_keeps_end_day_offset():
+    employee = save_night_shift()
+    day = employee.get_day(DATE)
+    day.end_day_offset = 2  # A punched shift ending two days later
+    timesheet = make_timesheet(employee)
+
+    timesheet.store_input_data(make_day_widget(DATE, "22:00", "06:00"))
+
+    assert day.get_end_day_offset() == 2
+
+
+def test_unchanged_input_keeps_punched_seconds():
+    employee = WorkTimeEmployee("night", load=False)
+    day = employee.create_day(DATE)
+    day.start_time = dt.time(22, 0, 41)
+    day.end_time = dt.time(6, 3, 12)
+    day.end_day_offset = 1
+    day.break_time = 1830.0
+    day.mark_stored(1)
+    timesheet = make_timesheet(employee)
+
+    timesheet.store_input_data(make_day_widget(DATE, "22:00", "06:03", "00:30"))
+
+    assert (day.start_time, day.end_time, day.end_day_offset, day.break_time) == (
+        dt.time(22, 0, 41), dt.time(6, 3, 12), 1, 1830.0)
+    assert not day.is_modified()
+
+    timesheet.store_input_data(make_day_widget(DATE, "22:00", "06:30", "00:30"))
+    assert (day.start_time, day.end_time) == (dt.time(22, 0, 41), dt.time(6, 30))
+
+
+def test_deleted_end_resets_end_day_offset():
+    employee = save_night_shift()
+    timesheet = make_timesheet(employee)
+
+    timesheet.delete_input_data(make_day_widget(DATE, "22:00", ""))
+    day = employee.get_day(DATE)
+    assert day.end_time is None
+    assert day.end_day_offset == 0
+
+    timesheet.store_input_data(make_day_widget(DATE, "22:00", "23:30"))
+    assert day.get_work_time() == 5400
+
+
+def test_open_shift_after_midnight_shows_end_workday(monkeypatch):
+    employee = WorkTimeEmployee("night", load=False)
+    employee.create_day(DATE).start_time = dt.time(22, 0)
+    timesheet = make_timesheet(employee)
+    labels = {}
+    timesheet.gui = types.SimpleNamespace(sidebar=types.SimpleNamespace(
+        button_log_break=types.SimpleNamespace(config=lambda text: labels.update(brk=text)),
+        button_log_work=types.SimpleNamespace(config=lambda text: labels.update(work=text))))
+
+    class Now(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2026, 3, 11, 2, 0)
+
+    monkeypatch.setattr(gui_logic, 'datetime', Now)
+    gui_logic.Timesheet.update_buttons(timesheet)
+
+    assert labels == {'brk': "Start Break", 'work': "End Workday"}
+    # Only looking at the buttons creates no day after midnight
+    assert dt.date(2026, 3, 11).toordinal() not in employee.working_days
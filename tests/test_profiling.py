@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Tests of the profiling hotkey."""
+
+import pytest
+
+import gui_constants
+import gui_logic
+from conftest import TimesheetStandIn
+from profiling import Profiler
+
+
+class StopRun(Exception):
+    """Ends Timesheet.run() once the main window is created."""
+
+
+class FakeTk():
+    """Stands in for tkinter.Tk and records the bound hotkeys."""
+
+    def __init__(self):
+        self.bindings = {}
+
+    def bind_all(self, sequence, function):
+        self.bindings[sequence] = function
+
+
+def run_until_login(monkeypatch, profiling, hotkey='<F12>'):
+    monkeypatch.setattr(gui_constants, 'PROFILING', profiling)
+    monkeypatch.setattr(gui_constants, 'PROFILING_HOTKEY', hotkey)
+    monkeypatch.setattr(gui_constants, 'USE_REPLICA', False)
+    monkeypatch.setattr(gui_logic.tk, 'Tk', FakeTk)
+
+    def create_login_window():
+        raise StopRun
+
+    timesheet = TimesheetStandIn(profiler=Profiler(), create_login_window=create_login_window)
+    with pytest.raises(StopRun):
+        timesheet.run()
+    return timesheet.profiler, timesheet.root.bindings
+
+
+def test_hotkey_is_bound_when_profiling(monkeypatch):
+    bindings = run_until_login(monkeypatch, True)[1]
+    assert '<F12>' in bindings
+
+
+def test_hotkey_captures_on_demand_without_profiling(monkeypatch):
+    profiler, bindings = run_until_login(monkeypatch, False)
+    assert not profiler.is_running()
+    bindings['<F12>']()
+    assert profiler.is_running()
+    bindings['<F12>']()
+    assert not profiler.is_running() and profiler.captures == 1
+
+
+def test_hotkey_is_not_bound_if_disabled(monkeypatch):
+    assert run_until_login(monkeypatch, False, hotkey=None)[1] == {}
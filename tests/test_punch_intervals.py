@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests of punching several intervals per day."""
+
+import datetime as dt
+
+import pytest
+
+from data_model import WorkTimeEmployee
+
+DATE = dt.date(2026, 3, 10)
+
+
+def punch(employee, kind, hour, minute, db):
+    return employee.punch(kind, dt.datetime.combine(DATE, dt.time(hour, minute)), db=db)
+
+
+def test_split_shift_with_break(db):
+    employee = WorkTimeEmployee("E1", load=False)
+    for kind, hour, minute in (("work", 8, 0), ("break", 12, 0), ("break", 12, 30),
+                               ("work", 14, 0), ("work", 15, 0)):
+        punch(employee, kind, hour, minute, db)
+    today = punch(employee, "work", 17, 0, db)
+
+    # The gap between the two shifts counts as break
+    assert (today.start_time, today.end_time, today.break_time) == (dt.time(8), dt.time(17), 5400)
+    assert db.load_interval_totals("E1", "2026-03-10", "2026-03-10") == [
+        ("2026-03-10", "2026-03-10 08:00:00", "2026-03-10 17:00:00", 7.5 * 3600, 1800, 2)]
+
+
+def test_break_needs_a_running_workday(db):
+    employee = WorkTimeEmployee("E1", load=False)
+    with pytest.raises(ValueError):
+        punch(employee, "break", 8, 0, db)
+    punch(employee, "work", 8, 0, db)
+    punch(employee, "work", 16, 0, db)
+    with pytest.raises(ValueError):
+        punch(employee, "break", 16, 30, db)
+    assert db.load_open_intervals("E1", "2026-03-10") == []
+
+
+def test_running_break_is_restored_after_a_crash(db):
+    today = dt.date.today()
+    employee = WorkTimeEmployee("E1", load=False)
+    employee.punch("work", dt.datetime.combine(today, dt.time(0, 0)), db=db)
+    employee.punch("break", dt.datetime.combine(today, dt.time(0, 1)), db=db)
+
+    # The day was never saved, a new instance only finds the intervals
+    restarted = WorkTimeEmployee("E1", load=False)
+    restarted.restore_punches(db.load_intervals("E1", today.isoformat()))
+    assert restarted.on_break == dt.time(0, 1)
+    assert restarted.get_day(today).start_time == dt.time(0, 0)
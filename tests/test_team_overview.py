@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Tests of the paged team overview."""
+
+import datetime as dt
+
+import pytest
+
+TODAY = dt.date(2026, 10, 19)  # A Monday
+
+
+@pytest.fixture(params=['db', 'legacy_db'])
+def any_db(request):
+    """A database of either layout."""
+    return request.getfixturevalue(request.param)
+
+
+def test_pages_of_employees(any_db):
+    for employee_id, vacation_days in (('E1', 30), ('E2', 25), ('E3', 20)):
+        any_db.save_employee(employee_id, vacation_days, 2)
+    # E1 punched in today and forgot to punch out on Friday
+    any_db.save_day('E1', '2026-10-16', '08:00')
+    any_db.save_day('E1', '2026-10-19', '07:30')
+    # E2 worked one hour more than the target of Thursday
+    any_db.save_day('E2', '2026-10-15', '08:00', '18:00', 3600.0)
+
+    assert any_db.count_employees() == 3
+    first_page = any_db.load_team_overview(TODAY, 8 * 3600, 2)
+    assert first_page == [('E1', 30, 2, 7.5 * 3600, None, -16 * 3600, 1),
+                          ('E2', 25, 2, None, None, 3600, 0)]
+    assert any_db.load_team_overview(TODAY, 8 * 3600, 2, offset=2) == [('E3', 20, 2, None, None, 0, 0)]
+
+
+def test_closed_months_count_with_their_frozen_flex_time(any_db):
+    any_db.save_employee('E1', 30, 0)
+    any_db.save_day('E1', '2026-09-01', '08:00', '10:00')
+    any_db.close_month('E1', dt.date(2026, 9, 1), dt.date(2026, 9, 30), 2 * 3600, 8 * 3600, 1800, 0, 0)
+    # The day of the closed month is skipped, only the frozen flex time counts
+    assert any_db.load_team_overview(TODAY, 8 * 3600, 10)[0][5] == 1800
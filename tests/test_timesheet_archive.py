@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Tests of archiving past years into database files of their own."""
+
+import datetime as dt
+import os
+
+import gui_constants
+import timesheet_archive
+
+MARCH = dt.date(2025, 3, 1), dt.date(2025, 3, 31)
+
+
+def count_live_days(db, year):
+    db.c.execute('SELECT COUNT(*) FROM timesheet_v2 WHERE day BETWEEN ? AND ?',
+                 (dt.date(year, 1, 1).toordinal(), dt.date(year, 12, 31).toordinal()))
+    return db.c.fetchone()[0]
+
+
+def test_archived_year_is_still_readable_and_can_be_restored(db):
+    db.save_day('E1', '2025-03-03', '08:00', '16:00')
+    db.save_day('E1', '2026-03-02', '08:00', '16:00')
+    db.start_interval('E1', '2025-03-03', 'work', dt.datetime(2025, 3, 3, 8))
+    db.end_interval('E1', '2025-03-03', 'work', dt.datetime(2025, 3, 3, 16))
+    db.disconnect_from_database()
+    # Only closed years can be archived
+    assert not timesheet_archive.archive(2025)
+
+    db.connect_to_database()
+    db.close_month('E1', *MARCH, 8 * 3600, 8 * 3600, 0, 0, 0)
+    db.disconnect_from_database()
+    assert timesheet_archive.archive(2025, vacuum=False)
+    file_path = os.path.join(os.path.dirname(gui_constants.DATABASE_PATH), timesheet_archive.get_file_name(2025))
+    assert os.path.exists(file_path)
+
+    db.connect_to_database()
+    assert [row[0] for row in db.load_archives()] == [2025]
+    assert count_live_days(db, 2025) == 0 and count_live_days(db, 2026) == 1
+    # Dates in the archived year are read from the attached archive
+    assert len(db.load_days('E1', ['2025-03-03'])) == 1
+    assert len(db.load_intervals('E1', '2025-03-03')) == 1
+    assert not db.reopen_month('E1', MARCH[0])
+    db.detach_archives()
+    db.disconnect_from_database()
+
+    assert timesheet_archive.restore(2025)
+    assert not os.path.exists(file_path)
+    db.connect_to_database()
+    assert count_live_days(db, 2025) == 1 and db.load_archives() == []
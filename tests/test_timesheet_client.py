@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Tests of the client cache of the timesheet service."""
+
+import asyncio
+import http.client
+import queue
+import socket
+import threading
+import time
+
+import pytest
+
+import gui_constants
+import timesheet_client
+from timesheet_client import ServiceError, TimesheetClient
+from timesheet_server import TimesheetServer
+
+
+def test_event_waits_for_the_lock_before_changing_the_cache():
+    client = TimesheetClient()
+    client.cache[('/days', (('employee_id', 'E1'),))] = {'days': []}
+    client.cache[('/employees', ())] = {'employees': []}
+    event = {'origin': 'other', 'employee_id': 'E1', 'kind': 'counters'}
+    listener = threading.Thread(target=client.handle_event, args=(event,))
+    with client.lock:
+        listener.start()
+        listener.join(0.1)
+        assert listener.is_alive()
+        assert len(client.cache) == 2
+    listener.join(1.0)
+    assert not listener.is_alive()
+    assert client.cache == {}
+
+
+def test_own_events_keep_the_cache():
+    client = TimesheetClient()
+    client.cache[('/employees', ())] = {'employees': []}
+    client.handle_event({'origin': client.client_id, 'employee_id': 'E1', 'kind': 'counters'})
+    assert ('/employees', ()) in client.cache
+
+
+class FailingConnection():
+    """Stands in for http.client.HTTPConnection, every response fails."""
+
+    def __init__(self, sent, error):
+        self.sent = sent
+        self.error = error
+
+    def request(self, method, target, data, headers):
+        self.sent.append((method, target))
+
+    def getresponse(self):
+        raise self.error
+
+    def close(self):
+        pass
+
+
+def make_failing_client(monkeypatch, error):
+    sent = []
+    monkeypatch.setattr(timesheet_client.http.client, 'HTTPConnection',
+                        lambda *args, **kwargs: FailingConnection(sent, error))
+    return TimesheetClient('127.0.0.1', 1), sent
+
+
+def test_post_failing_after_it_was_sent_is_not_sent_again(monkeypatch):
+    client, sent = make_failing_client(monkeypatch, socket.timeout("timed out"))
+    with pytest.raises(ServiceError):
+        client.request('POST', '/punch', {'employee_id': 'E1'})
+    assert sent == [('POST', '/punch')]
+    # Reading twice changes nothing
+    with pytest.raises(ServiceError):
+        client.request('GET', '/days', employee_id='E1')
+    assert sent[1:] == [('GET', '/days?employee_id=E1')] * 2
+
+
+def test_post_on_a_stale_connection_is_sent_again(monkeypatch):
+    client, sent = make_failing_client(
+        monkeypatch, http.client.RemoteDisconnected("closed"))
+    # A new connection failing this way may have handled the request
+    with pytest.raises(ServiceError):
+        client.request('POST', '/punch', {'employee_id': 'E1'})
+    assert len(sent) == 1
+
+    client.connection = FailingConnection(sent, http.client.RemoteDisconnected("closed"))
+    with pytest.raises(ServiceError):
+        client.request('POST', '/punch', {'employee_id': 'E1'})
+    assert len(sent) == 3
+
+
+@pytest.fixture
+def running_server(monkeypatch):
+    """A TimesheetServer listening on a free port, on an event loop thread of its own."""
+    monkeypatch.setattr(gui_constants, 'RUN_MAINTENANCE', False)
+    server = TimesheetServer('127.0.0.1', 0)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_months_are_revalidated_and_invalidated_by_events(running_server):
+    writer = TimesheetClient('127.0.0.1', running_server.port)
+    reader = TimesheetClient('127.0.0.1', running_server.port)
+    events = queue.Queue()
+    try:
+        reader.listen(events.put)
+        assert reader.load_month('E1', 2026, 3) == ([], True)
+        assert reader.load_month('E1', 2026, 3) == ([], False)
+        assert reader.get_days('E1') == []
+        # The listener thread connects to /events on its own
+        deadline = time.monotonic() + 5
+        while not running_server.subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        writer.upsert_day('E1', {"date": "2026-03-02", "start_time": "08:00", "end_time": "16:00",
+                                 "end_day_offset": 0, "break_time": None, "state": "default",
+                                 "version": None})
+        assert writer.flush() == ({"2026-03-02": 1}, [])
+        event = events.get(timeout=5)
+        assert (event['employee_id'], event['dates']) == ('E1', ['2026-03-02'])
+        assert reader.cache == {}
+        days, changed = reader.load_month('E1', 2026, 3)
+        assert changed and [day['date'] for day in days] == ["2026-03-02"]
+    finally:
+        reader.stop_listening()
+        reader.close()
+        writer.close()
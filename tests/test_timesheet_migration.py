@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Tests of the migration to the numeric timesheet layout."""
+
+from database_functions import LEGACY_LAYOUT, NUMERIC_LAYOUT
+import timesheet_migration
+
+
+def test_migration_keeps_every_day(legacy_db):
+    db = legacy_db
+    db.save_day('E1', '2026-03-09', '08:00', '16:30', 1800.0)
+    db.save_day('E1', '2026-03-10', '22:00', '06:00', 0.0, end_day_offset=1)
+    db.save_day('E1', '2026-03-11', None, state='sick')
+    db.save_day('E2', '2026-03-09', '09:00')
+    days = {employee_id: db.load_days(employee_id) for employee_id in ('E1', 'E2')}
+    assert len(days['E1']) == 3 and db.get_layout() == LEGACY_LAYOUT
+    db.disconnect_from_database()
+
+    assert timesheet_migration.migrate(batch_size=2)
+    db.connect_to_database()
+    assert db.get_layout() == NUMERIC_LAYOUT
+    assert {employee_id: db.load_days(employee_id) for employee_id in ('E1', 'E2')} == days
+
+    # Instances started before the migration still write the legacy table
+    db.c.execute('''
+        INSERT INTO timesheet (employee_id, date, starttime, endtime, workhours, breaktime, state)
+        VALUES ('E2', '2026-03-10', '2026-03-10 09:00:00', NULL, NULL, NULL, 'default')
+    ''')
+    assert timesheet_migration.count_differences(db) == 0
+    db.disconnect_from_database()
+
+    assert timesheet_migration.finalize()
+    db.connect_to_database()
+    assert not timesheet_migration.has_legacy_table(db)
+    assert len(db.load_days('E2')) == 2
+
+
+def test_new_database_needs_no_migration(db):
+    db.disconnect_from_database()
+    assert timesheet_migration.migrate()
+    db.connect_to_database()
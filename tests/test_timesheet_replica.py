@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Tests of the local replica and its sync with the central database."""
+
+import time
+
+import pytest
+
+import gui_constants
+from database_functions import DatabaseFunctions
+from timesheet_replica import CentralDatabase, Replica, SyncError
+
+
+@pytest.fixture
+def replica(db, tmp_path):
+    """A new replica of the central database of the db fixture."""
+    return Replica(str(tmp_path / "replica.db"), CentralDatabase(gui_constants.DATABASE_PATH))
+
+
+@pytest.fixture
+def replica_db(replica):
+    db = DatabaseFunctions()
+    db.connect_to_database(replica.replica_path)
+    yield db
+    db.disconnect_from_database()
+
+
+def load_starts(db, employee_id):
+    return {row[0]: row[1] for row in db.load_days(employee_id)}
+
+
+def test_new_replica_is_filled(db, replica, replica_db):
+    db.save_employee('E1', 30, 0)
+    db.save_day('E1', '2026-03-09', '08:00', '16:00')
+    assert replica.sync() == {"days": {"E1": ["2026-03-09"]}, "employees": ["E1"]}
+    assert replica_db.load_days('E1') == db.load_days('E1')
+    # Nothing changed since, nothing is pulled again
+    assert replica.sync() == {"days": {}, "employees": []}
+
+
+def test_changes_of_both_sides_are_merged(db, replica, replica_db):
+    db.save_day('E1', '2026-03-09', '08:00', '16:00')
+    replica.sync()
+    replica_db.save_day('E1', '2026-03-10', '09:00', '17:00')
+    db.save_day('E1', '2026-03-11', '10:00', '18:00')
+    replica.sync()
+    assert load_starts(db, 'E1') == load_starts(replica_db, 'E1')
+    assert len(load_starts(db, 'E1')) == 3
+
+
+def test_field_changed_last_wins(db, replica, replica_db):
+    version = db.save_day('E1', '2026-03-09', '08:00', '16:00')
+    replica.sync()
+    db.save_day('E1', '2026-03-09', '07:00', '16:00', version=version)
+    time.sleep(0.01)
+    replica_db.save_day('E1', '2026-03-09', '08:00', '18:00', version=version)
+    replica.sync()
+    # The start was changed centrally, the end in the replica afterwards
+    assert db.load_days('E1') == replica_db.load_days('E1')
+    assert db.load_days('E1')[0][1:3] == (7 * 3600, 18 * 3600)
+
+
+def test_unreachable_central_database(tmp_path):
+    central = CentralDatabase(str(tmp_path / "missing.db"))
+    with pytest.raises(SyncError):
+        Replica(str(tmp_path / "replica.db"), central).sync()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Tests of the request handlers of the timesheet service."""
+
+import datetime as dt
+import json
+
+import pytest
+
+from timesheet_server import TimesheetServer
+
+
+@pytest.fixture
+def server():
+    """A TimesheetServer whose handlers are called directly, without a socket."""
+    server = TimesheetServer('127.0.0.1', 0)
+    server.connect()
+    yield server
+    server.disconnect()
+    server.executor.shutdown()
+
+
+def request(server, method, target, body=None):
+    """Dispatch a request and return its status and body."""
+    return server.dispatch(method, target, json.dumps(body).encode() if body else b'')
+
+
+def punch_interval(server, date_string, start, end, kind='work'):
+    """Store a closed punch interval."""
+    date_object = dt.date.fromisoformat(date_string)
+    server.db.start_interval("test", date_string, kind, dt.datetime.combine(date_object, start))
+    server.db.end_interval("test", date_string, kind, dt.datetime.combine(date_object, end))
+
+
+@pytest.mark.parametrize("year, month, last_day", [(2026, 2, 28), (2028, 2, 29), (2026, 4, 30),
+                                                   (2026, 12, 31)])
+def test_interval_totals_of_short_months(server, year, month, last_day):
+    date_string = f"{year:04d}-{month:02d}-{last_day:02d}"
+    punch_interval(server, date_string, dt.time(8), dt.time(12))
+    punch_interval(server, date_string, dt.time(10), dt.time(10, 30), kind='break')
+
+    status, body = request(server, 'GET', f'/intervals?employee_id=test&year={year}&month={month}')
+
+    assert status == 200
+    assert [(day["date"], day["work_time"], day["break_time"]) for day in body["days"]] == [
+        (date_string, 3.5 * 3600, 1800)]
+
+
+def day_body(date_string, start="08:00", end="16:00", version=None):
+    """Return a day as sent by the client, see WorkingDay.to_dict()."""
+    return {"date": date_string, "start_time": start, "end_time": end, "end_day_offset": 0,
+            "break_time": None, "state": "default", "version": version}
+
+
+def test_upsert_days_answers_versions_and_conflicts(server):
+    status, body = request(server, 'POST', '/days', {"employee_id": "test", "days": [
+        day_body("2026-03-02"), day_body("2026-03-03")]})
+    assert status == 200
+    assert body == {"versions": {"2026-03-02": 1, "2026-03-03": 1}, "conflicts": []}
+
+    # The second day is sent with the version it had before the first write
+    status, body = request(server, 'POST', '/days', {"employee_id": "test", "days": [
+        day_body("2026-03-02", end="17:00", version=1), day_body("2026-03-03", end="17:00")]})
+    assert status == 200
+    assert body == {"versions": {"2026-03-02": 2}, "conflicts": ["2026-03-03"]}
+
+
+def test_upsert_days_of_month_closed_by_another_process(server):
+    import month_close
+
+    request(server, 'POST', '/days', {"employee_id": "test", "days": [day_body("2026-03-02")]})
+    # The cached employee does not know that the month is closed now
+    month_close.close_month(dt.date(2026, 3, 1), ["test"])
+
+    status, body = request(server, 'POST', '/days', {"employee_id": "test", "days": [
+        day_body("2026-03-02", end="18:00", version=1), day_body("2026-03-03")]})
+
+    assert status == 409
+    assert "closed" in body["error"]
+    assert "test" not in server.employees
+    assert [row[:3] for row in server.db.load_days("test")] == [
+        (dt.date(2026, 3, 2).toordinal(), 8 * 3600, 16 * 3600)]
+
+
+def test_punch_racing_with_a_writer_outside_the_service(server):
+    status, body = request(server, 'POST', '/punch', {"employee_id": "test", "kind": "work"})
+    assert status == 200
+    date_string, version = body["day"]["date"], body["day"]["version"]
+    # Changed without the service, the cached day still has the old version
+    server.db.save_day("test", date_string, "06:00", None, None, version=version)
+
+    status, body = request(server, 'POST', '/punch', {"employee_id": "test", "kind": "work"})
+
+    assert status == 409
+    assert date_string in body["error"]
+    day = server.get_employee("test").get_day(dt.date.fromisoformat(date_string))
+    assert (day.start_time, day.version) == (dt.time(6), version + 1)
+
+
+def test_unknown_paths_methods_and_bad_requests(server):
+    assert request(server, 'GET', '/nothing')[0] == 404
+    assert request(server, 'DELETE', '/days')[0] == 405
+    assert request(server, 'GET', '/days')[0] == 400  # Without employee_id
+    assert server.dispatch('POST', '/days', b'{not json')[0] == 400
+
+
+def test_month_is_answered_with_304_while_unchanged(server):
+    status, body = request(server, 'GET', '/month?employee_id=test&year=2026&month=3')
+    assert status == 200 and body['days'] == []
+    etag = body['etag']
+    assert server.dispatch('GET', '/month?employee_id=test&year=2026&month=3', b'', etag)[0] == 304
+
+    request(server, 'POST', '/days', {"employee_id": "test", "days": [day_body("2026-03-02")]})
+    status, body = server.dispatch('GET', '/month?employee_id=test&year=2026&month=3', b'', etag)
+    assert status == 200 and body['etag'] != etag
+    assert [day['date'] for day in body['days']] == ["2026-03-02"]
+    # Other months keep their ETag
+    status, body = request(server, 'GET', '/month?employee_id=test&year=2026&month=4')
+    assert server.dispatch('GET', '/month?employee_id=test&year=2026&month=4', b'', body['etag'])[0] == 304
+
+
+def test_batch_answers_every_request(server):
+    status, body = request(server, 'POST', '/batch', {"requests": [
+        {"method": "POST", "path": "/days", "body": {"employee_id": "a", "days": [day_body("2026-03-02")]}},
+        {"method": "POST", "path": "/days", "body": {"employee_id": "b", "days": [day_body("2026-03-02")]}},
+        {"method": "GET", "path": "/nothing"}]})
+    assert status == 200
+    assert [response['status'] for response in body['responses']] == [200, 200, 404]
+    assert request(server, 'GET', '/days?employee_id=b')[1]['days'][0]['start_time'] == "08:00"
+
+
+def test_vacation_days_with_stale_version_are_rejected(server):
+    status, body = request(server, 'POST', '/vacation', {
+        "employee_id": "test", "vacation_days": 30, "old_vacation_days": 0, "version": None})
+    assert (status, body) == (200, {"version": 1})
+    assert request(server, 'POST', '/vacation', {
+        "employee_id": "test", "vacation_days": 29, "old_vacation_days": 0, "version": 1})[1] == {"version": 2}
+    assert request(server, 'POST', '/vacation', {
+        "employee_id": "test", "vacation_days": 28, "old_vacation_days": 0, "version": 1})[0] == 409
+    assert request(server, 'GET', '/employees')[1]['employees'][0]['vacation_days'] == 29
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Tests of the binary snapshots of the timesheets."""
+
+import datetime as dt
+import os
+
+from data_model import WorkTimeEmployee
+import gui_constants
+import timesheet_snapshot
+from timesheet_snapshot import SnapshotCache
+
+ROWS = [(740000, 28800, 59400, 1800, 28800, 0, 1), (740001, None, None, None, None, 2, 3)]
+
+
+def test_snapshot_is_only_valid_for_its_counter():
+    cache = SnapshotCache()
+    cache.write('E1', 7, ROWS)
+    assert cache.read('E1', 7) == ROWS
+    assert cache.read('E1', 8) is None
+    assert cache.read('E2', 7) is None
+
+
+def test_employee_id_is_no_path():
+    cache = SnapshotCache()
+    for employee_id in ('../E1', 'C:/E1', 'E1', 'e1'):
+        assert os.path.dirname(cache.get_file_path(employee_id)) == cache.directory
+    assert cache.get_file_path('E1') != cache.get_file_path('e1')
+    cache.write('../E1', 7, ROWS)
+    assert cache.read('../E1', 7) == ROWS
+    assert os.listdir(cache.directory) == [os.path.basename(cache.get_file_path('../E1'))]
+
+
+def test_truncated_snapshot_is_ignored():
+    cache = SnapshotCache()
+    cache.write('E1', 7, ROWS)
+    with open(cache.get_file_path('E1'), 'r+b') as file:
+        file.truncate(SnapshotCache.HEADER.size + 10)
+    assert cache.read('E1', 7) is None
+
+
+def test_loading_an_employee_writes_its_snapshot(db, monkeypatch):
+    monkeypatch.setattr(gui_constants, 'USE_SNAPSHOTS', True)
+    db.save_day('E1', '2026-03-09', '08:00', '16:30', 1800.0)
+    db.save_day('E1', '2026-03-10', '08:00')
+    WorkTimeEmployee('E1')
+    timesheet_snapshot.wait_for_rebuilds()
+
+    counter = db.load_timesheet_counter('E1')
+    assert timesheet_snapshot.load('E1', counter) == db.load_days('E1', exclude_closed=True)
+    # Every change of the days makes the snapshot stale
+    db.save_day('E1', '2026-03-11', '08:00')
+    assert timesheet_snapshot.load('E1', db.load_timesheet_counter('E1')) is None
+    assert WorkTimeEmployee('E1').get_day(dt.date(2026, 3, 11)).start_time == dt.time(8)
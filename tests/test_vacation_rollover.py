@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Tests of the year-end vacation rollover."""
+
+import csv
+import os
+
+import gui_constants
+import vacation_rollover
+
+
+def load_counters(db):
+    db.c.execute('SELECT employee_id, vacation_days, old_vacation_days, rollover_year FROM employees')
+    return sorted(db.c.fetchall())
+
+
+def test_rollover_of_the_database_runs_once(db):
+    db.save_employee('E1', 10, 3)
+    db.save_employee('E2', -2, 0)
+    db.disconnect_from_database()
+
+    preview = vacation_rollover.rollover_database(2027, carry_over_limit=5, dry_run=True)
+    report = vacation_rollover.rollover_database(2027, carry_over_limit=5)
+    assert preview == report
+    assert report == {"year": 2027, "employees": 2, "rolled_over": 2, "already_rolled_over": 0,
+                      "carried_over": 5, "expired": 8, "granted": 60}
+    # Running it again for the same year changes nothing
+    assert vacation_rollover.rollover_database(2027, carry_over_limit=5)["already_rolled_over"] == 2
+
+    db.connect_to_database()
+    assert load_counters(db) == [('E1', 30, 5, 2027), ('E2', 30, 0, 2027)]
+
+
+def test_rollover_of_the_csv_file_in_chunks(monkeypatch):
+    monkeypatch.setattr(gui_constants, 'ROLLOVER_CHUNK_SIZE', 2)
+    file_path = os.path.join(gui_constants.DATA_PATH, "employees.csv")
+    with open(file_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Employee ID', 'Vacation Days', 'Old Vacation Days'])
+        writer.writerows([['E1', 10, 3], ['E2', 4, 0], ['E3', 0, 1]])
+
+    report = vacation_rollover.rollover_csv(2027, workers=2)
+    assert report["rolled_over"] == 3 and report["carried_over"] == 14 and report["expired"] == 4
+    with open(file_path, newline='') as csvfile:
+        rows = [(row['Employee ID'], row['Vacation Days'], row['Old Vacation Days'], row['Rollover Year'])
+                for row in csv.DictReader(csvfile)]
+    assert rows == [('E1', '30', '10', '2027'), ('E2', '30', '4', '2027'), ('E3', '30', '0', '2027')]
+    assert vacation_rollover.rollover_csv(2027)["already_rolled_over"] == 3
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Tests of the working day calendar."""
+
+import datetime as dt
+import os
+
+import gui_constants
+from working_calendar import WorkingCalendar
+
+
+def test_weekends_and_regional_holidays_are_no_working_days():
+    calendar = WorkingCalendar()
+    assert calendar.is_working_day(dt.date(2026, 3, 9))  # A Monday
+    assert not calendar.is_working_day(dt.date(2026, 3, 14))  # A Saturday
+    assert not calendar.is_working_day(dt.date(2026, 4, 6))  # Easter Monday
+    # Epiphany is only a holiday in some regions
+    assert calendar.is_working_day(dt.date(2026, 1, 6), 'DE')
+    assert not calendar.is_working_day(dt.date(2026, 1, 6), 'DE-BY')
+
+
+def test_cached_bitset_is_read_instead_of_built(monkeypatch):
+    bitset = WorkingCalendar().get_bitset(2026)
+    # The folder is read when it is used, so the redirected one is used
+    assert os.path.isfile(os.path.join(gui_constants.CALENDAR_PATH, "DE_2026.bin"))
+
+    def build(region, year):
+        raise AssertionError("The cached bitset was built again")
+
+    calendar = WorkingCalendar()
+    monkeypatch.setattr(calendar, 'build', build)
+    assert calendar.get_bitset(2026) == bitset
+
+
+def test_changed_holiday_rules_rebuild_the_bitset(monkeypatch):
+    assert WorkingCalendar().is_working_day(dt.date(2026, 3, 9))
+    monkeypatch.setattr(gui_constants, 'FIXED_PUBLIC_HOLIDAYS',
+                        gui_constants.FIXED_PUBLIC_HOLIDAYS + ((3, 9),))
+    assert not WorkingCalendar().is_working_day(dt.date(2026, 3, 9))
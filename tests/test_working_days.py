@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests of the sorted index of the working days of an employee."""
+
+import datetime as dt
+
+from data_model import EMPTY_DAY, WorkTimeEmployee
+
+FIRST = dt.date(2026, 3, 1)
+
+
+def make_employee(*offsets):
+    employee = WorkTimeEmployee("E1", load=False)
+    for offset in offsets:
+        employee.create_day(FIRST + dt.timedelta(days=offset))
+    return employee
+
+
+def dates(days):
+    return [(day.date - FIRST).days for day in days]
+
+
+def test_days_created_out_of_order_are_found_in_date_order():
+    employee = make_employee(10, 2, 31, 5, 2)
+    assert employee.day_numbers == sorted(employee.working_days)
+    assert dates(employee.days_between()) == [2, 5, 10, 31]
+    assert dates(employee.days_between(FIRST + dt.timedelta(days=3),
+                                       FIRST + dt.timedelta(days=10))) == [5, 10]
+    assert dates(employee.days_between(end_date=FIRST + dt.timedelta(days=4))) == [2]
+    assert dates(employee.days_between(FIRST + dt.timedelta(days=32))) == []
+
+
+def test_removed_days_leave_the_index():
+    employee = make_employee(1, 2, 3)
+    employee.remove_day(FIRST + dt.timedelta(days=2))
+    employee.remove_day(FIRST + dt.timedelta(days=7))
+    assert dates(employee.days_between()) == [1, 3]
+    assert employee.get_day(FIRST + dt.timedelta(days=2)) is EMPTY_DAY
+    employee.clear_days()
+    assert list(employee.days_between()) == [] and employee.working_days == {}
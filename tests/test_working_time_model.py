@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Tests of the working-time models and public holidays."""
+
+import datetime as dt
+
+import pytest
+
+from data_model import WorkTimeEmployee
+import gui_constants
+import working_calendar
+from working_time_model import TargetSchedule, WorkingTimeModel
+
+
+def test_holidays_on_weekends_are_listed():
+    holidays = working_calendar.get_holidays(2026, 'DE')
+    # German Unity Day 2026 is a Saturday
+    assert dt.date(2026, 10, 3) in holidays
+    assert holidays == sorted(holidays)
+
+
+def test_holiday_on_weekend_has_no_target():
+    schedule = TargetSchedule([WorkingTimeModel((8, 8, 8, 8, 8, 4, 0), dt.date(2026, 1, 1))])
+    assert schedule.get_target(dt.date(2026, 10, 3), 'DE') == 0
+    assert schedule.get_target(dt.date(2026, 10, 10), 'DE') == 4 * 3600
+    assert schedule.get_target(dt.date(2026, 10, 5), 'DE') == 8 * 3600
+
+
+def test_team_overview_skips_target_of_holiday_on_weekend(db):
+    db.save_employee('E1', 30, 0, region='DE')
+    db.save_working_time_model('E1', '2026-01-01', None, (8, 8, 8, 8, 8, 4, 0))
+    for date in ('2026-10-03', '2026-10-10'):
+        db.save_day('E1', date, None)
+    (row,) = db.load_team_overview(dt.date(2026, 10, 19), 8 * 3600, 10)
+    # Only the Saturday which is no holiday deducts its target
+    assert row[5] == -4 * 3600
+
+
+def test_latest_model_wins_and_default_applies_outside_models():
+    schedule = TargetSchedule([
+        WorkingTimeModel((6, 6, 6, 6, 0, 0, 0), dt.date(2026, 7, 1), dt.date(2026, 9, 30)),
+        WorkingTimeModel((8, 8, 8, 8, 8, 0, 0), dt.date(2026, 1, 1)),
+    ])
+    assert schedule.get_target(dt.date(2026, 7, 3)) == 0  # Friday off in the part time model
+    assert schedule.get_target(dt.date(2026, 7, 6)) == 6 * 3600
+    assert schedule.get_target(dt.date(2026, 10, 5)) == 8 * 3600
+    assert schedule.get_target(dt.date(2025, 12, 29)) == round(gui_constants.DAILY_WORKING_HOURS * 3600)
+
+
+def test_model_must_have_seven_days_and_end_after_start():
+    with pytest.raises(ValueError):
+        WorkingTimeModel((8, 8, 8, 8, 8))
+    with pytest.raises(ValueError):
+        WorkingTimeModel((8,) * 7, dt.date(2026, 2, 1), dt.date(2026, 1, 31))
+
+
+def test_employee_loads_models_from_the_database(db):
+    db.save_working_time_model('E1', '2026-01-01', None, (4, 4, 4, 4, 4, 0, 0))
+    db.save_working_time_model('E1', '2026-06-01', '2026-06-30', (8, 8, 8, 8, 8, 0, 0))
+    db.delete_working_time_model('E1', '2026-06-01')
+    assert db.load_working_time_models('E1') == [('2026-01-01', None, 4, 4, 4, 4, 4, 0, 0)]
+
+    employee = WorkTimeEmployee('E1')
+    assert employee.get_target(dt.date(2026, 6, 1)) == 4 * 3600
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+This module archives past years of the STC time management application.
+
+Archiving a year moves its days and punch intervals out of the database
+into a database file of its own next to it, e.g. "timesheet_2024.db" for
+"timesheet.db". The live database only keeps what is needed every day:
+the open months and the frozen totals of the closed months, so its size,
+queries and VACUUM no longer grow with the age of the company.
+
+Only years whose days are all in closed months (see month_close.py) can be
+archived. The flex time and the team overview use the frozen totals and
+never read archived days. Queries whose dates reach into an archived year,
+e.g. displaying a month of it, ATTACH the archive and read it together with
+the live table, see DatabaseFunctions.load_days(). Archived months can't be
+reopened; restoring the year moves its days back first.
+
+Functions
+---------
+get_file_name(year)
+    Returns the file name of the archive of a year.
+archive(year, vacuum=True)
+    Moves a closed year into its archive.
+restore(year)
+    Moves an archived year back into the database.
+list_archives()
+    Prints the archived years.
+
+Usage
+-----
+    python timesheet_archive.py archive YEAR [--no-vacuum]
+    python timesheet_archive.py restore YEAR
+    python timesheet_archive.py list
+"""
+
+import argparse
+import datetime as dt
+import os
+
+import gui_constants
+
+
+def get_file_name(year):
+    """
+    Return the file name of the archive of a year.
+
+    Parameters
+    ----------
+    year : int
+        The archived year.
+
+    Returns
+    -------
+    str
+        The name of the database file followed by the year,
+        e.g. "timesheet_2024.db".
+    """
+    stem, extension = os.path.splitext(os.path.basename(gui_constants.DATABASE_PATH))
+    return f"{stem}_{year}{extension or '.db'}"
+
+
+def archive(year, vacuum=True):
+    """
+    Move the days and punch intervals of a closed year into its archive.
+
+    Parameters
+    ----------
+    year : int
+        The year to archive.
+    vacuum : bool, optional
+        Compact the database file afterwards (default is True).
+
+    Returns
+    -------
+    bool
+        True if the year is archived afterwards.
+    """
+    from database_functions import DatabaseFunctions, NUMERIC_LAYOUT, run_with_retry
+    from timesheet_migration import get_file_size, has_legacy_table
+
+    if year >= dt.date.today().year:
+        print(f"{year} is not over yet and can't be archived.")
+        return False
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        if db.get_layout() < NUMERIC_LAYOUT or has_legacy_table(db):
+            print("Migrate the database with timesheet_migration.py (including --finalize) first.")
+            return False
+        if year in {row[0] for row in db.load_archives()}:
+            print(f"{year} is already archived.")
+            return True
+        open_days = db.count_open_days(dt.date(year, 1, 1).toordinal(),
+                                       dt.date(year, 12, 31).toordinal())
+        if open_days:
+            print(f"{open_days} days of {year} are in open months, close them with month_close.py first.")
+            return False
+
+        file_name = get_file_name(year)
+        schema = run_with_retry(db.attach_archive, year, file_name)
+
+        def move():
+            with db.transaction():
+                return db.archive_year(year, schema, file_name)
+
+        size = get_file_size()
+        days, punches = run_with_retry(move)
+        db.detach_archives()
+        if vacuum:
+            # Give the pages of the archived year back to the file system
+            run_with_retry(db.c.execute, 'VACUUM')
+        print("Archived {days} days and {punches} punch intervals of {year} into {file}, "
+              "database file {before:.1f} MB -> {after:.1f} MB.".format(
+                  days=days, punches=punches, year=year, file=file_name,
+                  before=size / 1e6, after=get_file_size() / 1e6))
+        return True
+    finally:
+        db.disconnect_from_database()
+
+
+def restore(year):
+    """
+    Move an archived year back into the database and delete its archive.
+
+    Parameters
+    ----------
+    year : int
+        The archived year.
+
+    Returns
+    -------
+    bool
+        True if the year was restored.
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        file_names = {row[0]: row[1] for row in db.load_archives()}
+        if year not in file_names:
+            print(f"{year} is not archived.")
+            return False
+        schema = run_with_retry(db.attach_archive, year, file_names[year])
+
+        def move_back():
+            with db.transaction():
+                return db.restore_year(year, schema)
+
+        days, punches = run_with_retry(move_back)
+        db.detach_archives()
+    finally:
+        db.disconnect_from_database()
+
+    # Instances which attached the archive keep their open file until they detach it
+    os.remove(os.path.join(os.path.dirname(gui_constants.DATABASE_PATH), file_names[year]))
+    print(f"Restored {days} days and {punches} punch intervals of {year}.")
+    return True
+
+
+def list_archives():
+    """Print the archived years."""
+    from database_functions import DatabaseFunctions
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        for year, file_name, _, _, days, punches in db.load_archives():
+            print(f"{year}: {file_name}, {days} days, {punches} punch intervals")
+    finally:
+        db.disconnect_from_database()
+
+
+def main():
+    """Archive or restore years from the command line."""
+    parser = argparse.ArgumentParser(description="Move closed years into database files of their own")
+    parser.add_argument('action', choices=('archive', 'restore', 'list'))
+    parser.add_argument('year', type=int, nargs='?', help="The year to archive or restore")
+    parser.add_argument('--no-vacuum', action='store_true',
+                        help="Don't compact the database file after archiving")
+    arguments = parser.parse_args()
+
+    if arguments.action == 'list':
+        list_archives()
+    elif arguments.year is None:
+        parser.error(f"{arguments.action} requires a year")
+    elif arguments.action == 'archive':
+        archive(arguments.year, not arguments.no_vacuum)
+    else:
+        restore(arguments.year)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides the client of the local timesheet service.
+
+The client keeps one HTTP/1.1 keep-alive connection to the service, caches
+the answers of read requests until the data is changed through this client
+and queues day upserts, so a save sends all changed days in one request.
+
+Months are cached by (employee, year, month) together with their ETag, so
+revalidating a month the client already holds costs one "304 Not Modified"
+answer. Changes made by other clients are pushed over a second, long-lived
+/events connection and invalidate the cached responses of that employee.
+
+Classes
+-------
+TimesheetClient
+    Caching and batching client for the timesheet_server endpoints.
+
+Functions
+---------
+get_client()
+    Returns the shared client of this process.
+
+Usage
+-----
+Set gui_constants.USE_SERVICE = True and start the service with
+`python timesheet_server.py`. Running this module starts a service on a free
+localhost port with a temporary database and performs a round trip.
+"""
+
+import http.client
+import json
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+
+import gui_constants
+
+
+class ServiceError(Exception):
+    """Raised if the timesheet service answers with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__("{status}: {message}".format(status=status, message=message))
+        self.status = status
+        self.message = message
+
+
+class TimesheetClient():
+    """
+    A client for the local timesheet service.
+
+    Attributes
+    ----------
+    host : str
+        Address of the service.
+    port : int
+        Port of the service.
+    timeout : float
+        Seconds to wait for a response.
+    client_id : str
+        Random id sent with every change, so the client can ignore the
+        events caused by itself.
+    cache : dict
+        (path, query) of read requests mapped to their response.
+    months : dict
+        (employee_id, year, month) mapped to the ETag and days of the month.
+    pending_days : dict
+        Employee ids mapped to the queued day upserts, keyed by date.
+    lock : threading.Lock
+        Guards the connection, cache and months, which the listener
+        thread changes as well.
+    listener : threading.Thread or None
+        Thread reading the /events connection.
+    """
+
+    def __init__(self, host=None, port=None, timeout=None):
+        """
+        Initializes a TimesheetClient. The connection is opened on first use.
+
+        Parameters
+        ----------
+        host : str, optional
+            Address of the service (default is gui_constants.SERVICE_HOST).
+        port : int, optional
+            Port of the service (default is gui_constants.SERVICE_PORT).
+        timeout : float, optional
+            Seconds to wait for a response
+            (default is gui_constants.SERVICE_TIMEOUT).
+        """
+        self.host = gui_constants.SERVICE_HOST if host is None else host
+        self.port = gui_constants.SERVICE_PORT if port is None else port
+        self.timeout = gui_constants.SERVICE_TIMEOUT if timeout is None else timeout
+        self.connection = None
+        self.client_id = uuid.uuid4().hex
+        self.cache = {}
+        self.months = {}
+        self.pending_days = {}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.event_socket = None
+        self.on_event = None
+
+    def request(self, method, path, body=None, etag=None, **query):
+        """
+        Send a request and return the decoded response body.
+
+        GET requests are sent again once on a new connection if they fail.
+        Other requests are only sent again if the reused keep-alive
+        connection turned out to be closed by the service, any other
+        failure may come after the service handled them.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, 'GET' or 'POST'.
+        path : str
+            Endpoint, e.g. '/days'.
+        body : dict, optional
+            JSON body of the request.
+        etag : str, optional
+            ETag of the cached response, sent as If-None-Match.
+        **query
+            Query string parameters.
+
+        Returns
+        -------
+        dict or None
+            The decoded response body. Is None if the service answered
+            "304 Not Modified".
+
+        Raises
+        ------
+        ServiceError
+            If the service answers with an error status or is not reachable.
+        """
+        target = path
+        if query:
+            target += '?' + urllib.parse.urlencode(query)
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+
+        with self.lock:
+            for attempt in range(2):
+                is_reused = self.connection is not None
+                if not is_reused:
+                    self.connection = http.client.HTTPConnection(
+                        self.host, self.port, timeout=self.timeout)
+                try:
+                    self.connection.request(method, target, data, headers)
+                    response = self.connection.getresponse()
+                    payload = json.loads(response.read() or b'{}')
+                    break
+                except (http.client.HTTPException, OSError) as e:
+                    self.close()
+                    is_stale = is_reused and isinstance(
+                        e, (http.client.RemoteDisconnected, BrokenPipeError))
+                    if attempt == 1 or not (method == 'GET' or is_stale):
+                        raise ServiceError(None, "Service not reachable: {}".format(e)) from e
+
+        if response.status == 304:
+            return None
+        if response.status != 200:
+            raise ServiceError(response.status, payload.get('error', ''))
+        return payload
+
+    def get(self, path, **query):
+        """Send a GET request, answered from the cache if possible."""
+        key = (path, tuple(sorted(query.items())))
+        with self.lock:
+            if key in self.cache:
+                return self.cache[key]
+        response = self.request('GET', path, **query)
+        with self.lock:
+            self.cache[key] = response
+        return response
+
+    def invalidate(self, employee_id=None):
+        """
+        Remove cached responses.
+
+        Parameters
+        ----------
+        employee_id : str, optional
+            Only remove the responses concerning this employee.
+            Removes everything by default.
+        """
+        with self.lock:
+            if employee_id is None:
+                self.cache.clear()
+                return
+            for key in list(self.cache):
+                if ('employee_id', employee_id) in key[1]:
+                    del self.cache[key]
+
+    def close(self):
+        """Close the connection to the service."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    # --------------------------------------------------------------------------
+    # Pushed invalidation
+
+    def listen(self, on_event=None):
+        """
+        Start receiving change events of other clients on a background thread.
+
+        The cached responses of the changed employee are invalidated before
+        on_event is called. Calling listen() again only replaces the callback.
+
+        Parameters
+        ----------
+        on_event : callable, optional
+            Called on the listener thread with every event, see the
+            /events endpoint of timesheet_server.
+        """
+        self.on_event = on_event
+        if self.listener is None:
+            self.listener = threading.Thread(target=self.receive_events, daemon=True)
+            self.listener.start()
+
+    def stop_listening(self):
+        """Stop the listener thread and close the /events connection."""
+        listener = self.listener
+        self.listener = None
+        if self.event_socket is not None:
+            # Unblocks the listener thread waiting for the next event
+            try:
+                self.event_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Already disconnected
+        if listener is not None and listener is not threading.current_thread():
+            listener.join(self.timeout)
+
+    def receive_events(self):
+        """
+        Read events until stop_listening() is called.
+
+        Reconnects after a second if the connection is lost. As events may
+        have been missed in the meantime, the whole cache is dropped then.
+        """
+        while self.listener is threading.current_thread():
+            connection = http.client.HTTPConnection(self.host, self.port)
+            try:
+                connection.request('GET', '/events')
+                # The connection forgets its socket once the response is open
+                self.event_socket = connection.sock
+                response = connection.getresponse()
+                for line in response:
+                    self.handle_event(json.loads(line))
+            except (http.client.HTTPException, OSError, ValueError):
+                pass
+            finally:
+                self.event_socket = None
+                connection.close()
+            self.invalidate()
+            with self.lock:
+                self.months.clear()
+            if self.listener is threading.current_thread():
+                time.sleep(1.0)
+
+    def handle_event(self, event):
+        """Invalidate the cache for an event and pass it to the callback."""
+        if event['origin'] == self.client_id:
+            return
+        self.invalidate(event['employee_id'])
+        if event['kind'] == 'counters':
+            with self.lock:
+                self.cache.pop(('/employees', ()), None)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    # --------------------------------------------------------------------------
+    # Operations
+
+    def get_employees(self):
+        """Return all employees with their vacation day counters."""
+        return self.get('/employees')['employees']
+
+    def get_team_page(self, offset, limit):
+        """
+        Return one page of the team overview.
+
+        Not cached, the overview shows the punch status of right now.
+        """
+        return self.request('GET', '/team', offset=offset, limit=limit)
+
+    def get_days(self, employee_id, start=None, end=None):
+        """Return the days of an employee as dictionaries, see WorkingDay.to_dict()."""
+        query = {'employee_id': employee_id}
+        if start is not None:
+            query['start'] = start
+        if end is not None:
+            query['end'] = end
+        return self.get('/days', **query)['days']
+
+    def load_month(self, employee_id, year, month):
+        """
+        Return the days of an employee in one month.
+
+        A cached month is revalidated with its ETag and only
+        transferred again if it was changed.
+
+        Returns
+        -------
+        tuple
+            List of days as dictionaries and whether the month
+            differs from the cached one.
+        """
+        key = (employee_id, year, month)
+        with self.lock:
+            etag, days = self.months.get(key, (None, None))
+        payload = self.request('GET', '/month', etag=etag, employee_id=employee_id,
+                               year=year, month=month)
+        if payload is None:
+            return days, False
+        with self.lock:
+            self.months[key] = (payload['etag'], payload['days'])
+        return payload['days'], True
+
+    def get_flex_time(self, employee_id):
+        """Return the accumulated flex time of an employee in seconds."""
+        return self.get('/flex', employee_id=employee_id)['flex_time']
+
+    def get_working_time_models(self, employee_id):
+        """Return the working-time models of an employee as dictionaries."""
+        return self.get('/models', employee_id=employee_id)['models']
+
+    def get_closed_months(self, employee_id):
+        """Return the closed months of an employee, see DatabaseFunctions.load_closed_months()."""
+        return self.get('/closed_months', employee_id=employee_id)['months']
+
+    def upsert_day(self, employee_id, day):
+        """
+        Queue a day to be written by the next flush().
+
+        Parameters
+        ----------
+        employee_id : str
+            Username/employee_id.
+        day : dict
+            The day as created by WorkingDay.to_dict().
+        """
+        self.pending_days.setdefault(employee_id, {})[day['date']] = day
+
+    def flush(self):
+        """
+        Write all queued days in a single request.
+
+        Returns
+        -------
+        tuple
+            Dictionary of the written dates mapped to their new version and
+            list of the dates which were changed by another client.
+        """
+        if not self.pending_days:
+            return {}, []
+        requests = [
+            {'method': 'POST', 'path': '/days',
+             'body': {'employee_id': employee_id, 'days': list(days.values()),
+                      'client_id': self.client_id}}
+            for employee_id, days in self.pending_days.items()
+        ]
+        employee_ids = list(self.pending_days)
+        self.pending_days = {}
+
+        if len(requests) == 1:
+            responses = [{'status': 200,
+                          'body': self.request('POST', '/days', requests[0]['body'])}]
+        else:
+            responses = self.request('POST', '/batch', {'requests': requests})['responses']
+
+        versions = {}
+        conflicts = []
+        for employee_id, response in zip(employee_ids, responses):
+            self.invalidate(employee_id)
+            if response['status'] != 200:
+                raise ServiceError(response['status'], response['body'].get('error', ''))
+            versions.update(response['body']['versions'])
+            conflicts += response['body']['conflicts']
+        return versions, conflicts
+
+    def punch(self, employee_id, kind):
+        """
+        Start or end the workday ("work") or a break ("break") of today.
+
+        Returns
+        -------
+        dict
+            Today's day and the start of the running break ("on_break").
+        """
+        self.invalidate(employee_id)
+        return self.request('POST', '/punch', {'employee_id': employee_id, 'kind': kind,
+                                               'client_id': self.client_id})
+
+    def get_punch_state(self, employee_id):
+        """Return the start of the running break of an employee ("on_break")."""
+        return self.get('/punch', employee_id=employee_id)
+
+    def get_interval_totals(self, employee_id, year, month):
+        """Return the work and break totals of every punched day of a month."""
+        return self.get('/intervals', employee_id=employee_id, year=year, month=month)['days']
+
+    def update_vacation(self, employee_id, vacation_days, old_vacation_days, version=None,
+                        region=None):
+        """
+        Update the vacation day counters and the holiday region of an employee.
+
+        Returns
+        -------
+        int or None
+            The new version, None if the counters were changed in the meantime.
+        """
+        with self.lock:
+            self.cache.pop(('/employees', ()), None)
+        try:
+            return self.request('POST', '/vacation', {
+                'employee_id': employee_id,
+                'vacation_days': vacation_days,
+                'old_vacation_days': old_vacation_days,
+                'version': version,
+                'region': region,
+                'client_id': self.client_id
+            })['version']
+        except ServiceError as e:
+            if e.status == 409:
+                return None
+            raise
+
+    def update_employees(self, rows):
+        """
+        Update the vacation day counters and holiday regions of several
+        employees in a single request.
+
+        Parameters
+        ----------
+        rows : list
+            Tuples of employee_id, vacation_days, old_vacation_days, the
+            version read (None for a new employee) and region.
+
+        Returns
+        -------
+        dict
+            The employee_ids mapped to their new version, None if the
+            counters were changed in the meantime.
+        """
+        with self.lock:
+            self.cache.pop(('/employees', ()), None)
+        return self.request('POST', '/employees', {
+            'employees': [{'employee_id': employee_id,
+                           'vacation_days': vacation_days,
+                           'old_vacation_days': old_vacation_days,
+                           'version': version,
+                           'region': region}
+                          for employee_id, vacation_days, old_vacation_days, version, region in rows],
+            'client_id': self.client_id
+        })['versions']
+
+
+_client = None
+
+
+def get_client():
+    """Return the shared TimesheetClient of this process."""
+    global _client
+    if _client is None:
+        _client = TimesheetClient()
+    return _client
+
+
+if __name__ == "__main__":
+    import asyncio
+    import datetime as dt
+    import os
+    import tempfile
+
+    from timesheet_server import TimesheetServer
+
+    # Start a service on a free port with a throwaway database
+    gui_constants.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "service_test.db")
+    server = TimesheetServer('127.0.0.1', 0)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    client = TimesheetClient('127.0.0.1', server.port)
+    print("Version:", client.update_vacation("test", 30, 2))
+    today = "{:%Y-%m-%d}".format(dt.date.today())
+    client.upsert_day("test", {'date': today, 'start_time': "00:00", 'end_time': "00:30",
+                               'break_time': None, 'state': 'default', 'version': None})
+    versions, conflicts = client.flush()
+    print("Written:", versions, "Conflicts:", conflicts)
+    events = []
+    other_client = TimesheetClient('127.0.0.1', server.port)
+    other_client.listen(events.append)
+    time.sleep(0.2)
+
+    print("Month:", client.load_month("test", dt.date.today().year, dt.date.today().month))
+    print("Unchanged month:", client.load_month("test", dt.date.today().year,
+                                                dt.date.today().month)[1])
+    print("Flex time:", client.get_flex_time("test"))
+
+    # A second client still holding the old version is rejected
+    client.upsert_day("test", {'date': today, 'start_time': "09:00", 'end_time': "17:00",
+                               'break_time': None, 'state': 'default', 'version': None})
+    print("Stale write conflicts:", client.flush()[1])
+    print("Stale vacation update:", client.update_vacation("test", 25, 0, version=0))
+    print("Employees:", client.get_employees())
+    print("Punched:", client.punch("test", "work"))
+    print("Changed month:", client.load_month("test", dt.date.today().year,
+                                              dt.date.today().month)[1])
+    time.sleep(0.2)
+    print("Events pushed to the other client:", events)
+
+    other_client.stop_listening()
+    client.close()
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
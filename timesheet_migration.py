@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+This module migrates the timesheet table of the STC time management
+application from the legacy text layout to the numeric layout.
+
+The legacy table "timesheet" stores dates, start and end times as strings,
+the numeric table "timesheet_v2" stores the day number, start, end, break
+and work time in seconds and a state code as integers, see
+DatabaseFunctions.create_numeric_timesheet(). Rows and the primary key get
+smaller and loading a timesheet does not parse any strings.
+
+The migration runs while other instances keep working:
+1. Triggers mirror every insert, update and delete on the legacy table into
+   the numeric table.
+2. The existing rows are copied in batches of
+   gui_constants.MIGRATION_BATCH_SIZE rows, each in a short transaction of
+   its own, so other instances are only blocked briefly.
+3. Both tables are compared and the layout is switched in one transaction
+   (PRAGMA user_version). Instances read the layout before every access
+   and continue with the numeric table.
+
+The legacy table and the triggers are kept, so writes of instances started
+before the migration still arrive in the numeric table. Once all instances
+are updated, --finalize drops them and compacts the database file.
+
+Functions
+---------
+migrate(batch_size=None, dry_run=False)
+    Copies the legacy table and switches to the numeric layout.
+finalize()
+    Drops the legacy table after the migration.
+
+Usage
+-----
+    python timesheet_migration.py [--batch-size ROWS] [--dry-run]
+    python timesheet_migration.py --finalize
+"""
+
+import argparse
+import os
+import time
+
+import gui_constants
+
+
+# Mirror changes of the legacy table into the numeric table while migrating
+TRIGGERS = {
+    'timesheet_v2_insert': '''
+        CREATE TRIGGER IF NOT EXISTS timesheet_v2_insert AFTER INSERT ON timesheet
+        BEGIN
+            INSERT OR REPLACE INTO timesheet_v2
+            SELECT NEW.employee_id, {new}, NEW.version;
+        END
+    ''',
+    'timesheet_v2_update': '''
+        CREATE TRIGGER IF NOT EXISTS timesheet_v2_update AFTER UPDATE ON timesheet
+        BEGIN
+            DELETE FROM timesheet_v2
+            WHERE employee_id = OLD.employee_id AND day = julianday(OLD.date) - 1721424.5;
+            INSERT OR REPLACE INTO timesheet_v2
+            SELECT NEW.employee_id, {new}, NEW.version;
+        END
+    ''',
+    'timesheet_v2_delete': '''
+        CREATE TRIGGER IF NOT EXISTS timesheet_v2_delete AFTER DELETE ON timesheet
+        BEGIN
+            DELETE FROM timesheet_v2
+            WHERE employee_id = OLD.employee_id AND day = julianday(OLD.date) - 1721424.5;
+        END
+    ''',
+}
+
+
+def get_file_size():
+    """Return the size of the database file in bytes."""
+    return os.path.getsize(gui_constants.DATABASE_PATH)
+
+
+def has_legacy_table(db):
+    """Check whether the database still contains the legacy timesheet table."""
+    db.c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'timesheet'")
+    return db.c.fetchone() is not None
+
+
+def count_differences(db):
+    """
+    Compare the legacy and the numeric table.
+
+    Returns
+    -------
+    int
+        Amount of legacy rows missing in the numeric table plus the amount
+        of numeric rows without a legacy row, 0 if both tables match.
+    """
+    from database_functions import LEGACY_TO_NUMERIC
+
+    db.c.execute(f'''
+        SELECT COUNT(*) FROM (
+            SELECT t.employee_id, {LEGACY_TO_NUMERIC.format(row='t')}, t.version FROM timesheet t
+            EXCEPT
+            SELECT * FROM timesheet_v2
+        )
+    ''')
+    missing = db.c.fetchone()[0]
+    db.c.execute('''
+        SELECT COUNT(*) FROM timesheet_v2 v
+        WHERE NOT EXISTS (SELECT 1 FROM timesheet t
+                          WHERE t.employee_id = v.employee_id
+                              AND julianday(t.date) - 1721424.5 = v.day)
+    ''')
+    return missing + db.c.fetchone()[0]
+
+
+def migrate(batch_size=None, dry_run=False):
+    """
+    Migrate the timesheet table to the numeric layout.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        Rows copied per transaction
+        (default is gui_constants.MIGRATION_BATCH_SIZE).
+    dry_run : bool, optional
+        Only report what would be migrated (default is False).
+
+    Returns
+    -------
+    bool
+        True if the database uses the numeric layout afterwards.
+    """
+    from database_functions import (DatabaseFunctions, LEGACY_TO_NUMERIC, NUMERIC_LAYOUT,
+                                    run_with_retry)
+
+    batch_size = batch_size or gui_constants.MIGRATION_BATCH_SIZE
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        if db.get_layout() >= NUMERIC_LAYOUT:
+            print("The database already uses the numeric layout.")
+            return True
+
+        db.c.execute('SELECT COUNT(*), MIN(rowid), MAX(rowid) FROM timesheet')
+        rows, first_rowid, last_rowid = db.c.fetchone()
+        print("{rows} rows in the legacy layout, database file {size:.1f} MB.".format(
+            rows=rows, size=get_file_size() / 1e6))
+        if dry_run:
+            return False
+
+        def install_triggers():
+            with db.transaction():
+                db.create_numeric_timesheet()
+                for trigger in TRIGGERS.values():
+                    db.c.execute(trigger.format(new=LEGACY_TO_NUMERIC.format(row='NEW')))
+
+        def copy_batch(start_rowid):
+            with db.transaction():
+                db.c.execute(f'''
+                    INSERT OR REPLACE INTO timesheet_v2
+                    SELECT t.employee_id, {LEGACY_TO_NUMERIC.format(row='t')}, t.version
+                    FROM timesheet t WHERE t.rowid >= ? AND t.rowid < ?
+                    ORDER BY t.rowid
+                ''', (start_rowid, start_rowid + batch_size))
+
+        def switch_layout():
+            # Compared while holding the write lock, nobody can change the tables in between
+            with db.transaction():
+                differences = count_differences(db)
+                if differences == 0:
+                    db.c.execute(f'PRAGMA user_version = {NUMERIC_LAYOUT}')
+                    # Closed months and the change feed, the copied rows are not recorded as changes
+                    db.create_layout_triggers()
+            return differences
+
+        # Rows changed from here on are mirrored by the triggers
+        run_with_retry(install_triggers)
+
+        start = time.perf_counter()
+        if rows:
+            # Later rows are inserted by other instances and mirrored already
+            for start_rowid in range(first_rowid, last_rowid + 1, batch_size):
+                run_with_retry(copy_batch, start_rowid)
+                print("Copied up to row {rowid} of {last}.".format(
+                    rowid=min(start_rowid + batch_size - 1, last_rowid), last=last_rowid))
+
+        differences = run_with_retry(switch_layout)
+        if differences:
+            print(f"Migration aborted, {differences} rows differ. The legacy layout is still used.")
+            return False
+        print("Migrated {rows} rows in {seconds:.2f} s, the numeric layout is used now.".format(
+            rows=rows, seconds=time.perf_counter() - start))
+        return True
+    finally:
+        db.disconnect_from_database()
+
+
+def finalize():
+    """
+    Drop the legacy table and the triggers after the migration and compact
+    the database file.
+
+    Instances started before the migration must not be running anymore,
+    their writes would be lost.
+
+    Returns
+    -------
+    bool
+        True if the legacy table was dropped.
+    """
+    from database_functions import DatabaseFunctions, NUMERIC_LAYOUT, run_with_retry
+
+    db = DatabaseFunctions()
+    run_with_retry(db.connect_to_database)
+    try:
+        if db.get_layout() < NUMERIC_LAYOUT:
+            print("The database is not migrated yet.")
+            return False
+        if not has_legacy_table(db):
+            print("The legacy table is already dropped.")
+            return True
+
+        def drop_legacy_table():
+            with db.transaction():
+                for trigger in TRIGGERS:
+                    db.c.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+                db.c.execute('DROP TABLE timesheet')
+
+        size = get_file_size()
+        run_with_retry(drop_legacy_table)
+        # Give the pages of the legacy table back to the file system
+        run_with_retry(db.c.execute, 'VACUUM')
+        print("Dropped the legacy table, database file {before:.1f} MB -> {after:.1f} MB.".format(
+            before=size / 1e6, after=get_file_size() / 1e6))
+        return True
+    finally:
+        db.disconnect_from_database()
+
+
+def main():
+    """Run the migration from the command line."""
+    parser = argparse.ArgumentParser(description="Migrate the timesheet table to the numeric layout")
+    parser.add_argument('--batch-size', type=int,
+                        help="Rows copied per transaction (default is MIGRATION_BATCH_SIZE)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report what would be migrated")
+    parser.add_argument('--finalize', action='store_true',
+                        help="Drop the legacy table after the migration")
+    arguments = parser.parse_args()
+
+    if arguments.finalize:
+        finalize()
+    else:
+        migrate(arguments.batch_size, arguments.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,585 @@
+# -*- coding: utf-8 -*-
+"""
+This module keeps a local replica of the database of the STC time
+management application, so laptops keep working away from the shared drive.
+
+With gui_constants.USE_REPLICA the application reads and writes a database
+file on the local disk (gui_constants.REPLICA_PATH), and
+gui_constants.DATABASE_PATH becomes the central database. A background
+thread syncs both every gui_constants.SYNC_INTERVAL milliseconds, in
+batches of gui_constants.SYNC_BATCH_SIZE changes:
+- push: The days and employees changed in the replica since the last push,
+  read from its change feed (see change_feed.py), are merged into the
+  central database.
+- pull: The working-time models and closed months are maintained centrally
+  and copied as they are. Then the days and employees changed in the
+  central database since the last pull are merged into the replica.
+The central database is either the database file or, with
+gui_constants.SYNC_WITH_SERVICE, the timesheet service (see
+timesheet_server.py). While it is not reachable, the replica keeps working
+and its changes are pushed by a later sync.
+
+Conflicts are resolved per employee, date and field: triggers stamp every
+changed field with the time of the change, the value changed last wins, see
+DatabaseFunctions.apply_sync_records(). Merging the same changes twice
+changes nothing, so an interrupted sync is simply repeated. A new replica,
+and one whose cursor points to pruned changes of the central database, is
+filled with all employees and days first. Both databases must use the
+numeric layout (see timesheet_migration.py), archived years and punch
+intervals stay where they are.
+
+Classes
+-------
+CentralDatabase
+    The central database file.
+CentralService
+    The timesheet service in front of the central database.
+Replica
+    Syncs the replica with the central database.
+
+Functions
+---------
+open_replica(replica_path=None)
+    Switches the application to the replica.
+sync_in_background()
+    Syncs the replica on the background thread.
+sync_before_exit()
+    Pushes the last changes before the application exits.
+
+Usage
+-----
+    python timesheet_replica.py sync [--replica PATH]
+    python timesheet_replica.py status [--replica PATH]
+"""
+
+import argparse
+import concurrent.futures
+import datetime as dt
+import logging
+import os
+import time
+
+import gui_constants
+import logging_config
+from timesheet_client import ServiceError, TimesheetClient
+
+logger = logging.getLogger(__name__)
+
+
+class SyncError(Exception):
+    """Raised if the central database can't be synced with."""
+
+
+def read_changes(db, cursor, limit):
+    """
+    Read the rows changed in a database after a cursor.
+
+    Parameters
+    ----------
+    db : DatabaseFunctions
+        Connection to the database.
+    cursor : int
+        Sequence number of the last change read before.
+    limit : int
+        Sequence numbers read at most.
+
+    Returns
+    -------
+    tuple
+        The records as returned by DatabaseFunctions.load_sync_records()
+        (None if changes after the cursor were pruned), the new cursor and
+        the last change of the database.
+    """
+    # Cursor, keys and rows from the same read transaction
+    db.c.execute('BEGIN')
+    try:
+        last = db.load_last_change()
+        first = db.load_first_change()
+        if cursor > last or first is not None and first > cursor + 1:
+            return None, cursor, last
+        new_cursor = min(last, cursor + limit)
+        return db.load_sync_records(db.load_changed_keys(cursor, new_cursor)), new_cursor, last
+    finally:
+        db.conn.commit()
+
+
+def read_rows(db, after, limit):
+    """
+    Read one page of all employees and days of a database.
+
+    Parameters
+    ----------
+    db : DatabaseFunctions
+        Connection to the database.
+    after : tuple or None
+        Key of the last day of the previous page, None for the first page.
+    limit : int
+        Days per page.
+
+    Returns
+    -------
+    tuple
+        The records, the key of the last day (None if it was the last page)
+        and the last change of the database.
+    """
+    db.c.execute('BEGIN')
+    try:
+        keys = db.load_sync_keys(after, limit)
+        days = [key for key in keys if key[0] == 'timesheet']
+        return (db.load_sync_records(keys), tuple(days[-1]) if len(days) == limit else None,
+                db.load_last_change())
+    finally:
+        db.conn.commit()
+
+
+def write_records(db, records):
+    """Merge records in one transaction, see DatabaseFunctions.apply_sync_records()."""
+    from database_functions import run_with_retry
+
+    def write():
+        with db.transaction():
+            return db.apply_sync_records(records)
+
+    return run_with_retry(write)
+
+
+class CentralDatabase():
+    """
+    The central database file, opened for every sync.
+
+    Attributes
+    ----------
+    database_path : str
+        Path of the database file, e.g. on the shared drive.
+    """
+
+    def __init__(self, database_path):
+        """
+        Initializes a CentralDatabase.
+
+        Parameters
+        ----------
+        database_path : str
+            Path of the database file.
+        """
+        self.database_path = database_path
+
+    def connect(self):
+        """
+        Return a connection to the database.
+
+        Raises
+        ------
+        SyncError
+            If the file is not reachable or not migrated.
+        """
+        from database_functions import DatabaseFunctions, NUMERIC_LAYOUT, run_with_retry
+
+        # Connecting to a missing file would create an empty database
+        if not os.path.isfile(self.database_path):
+            raise SyncError(f"{self.database_path} is not reachable")
+        db = DatabaseFunctions()
+        run_with_retry(db.connect_to_database, self.database_path)
+        if db.get_layout() < NUMERIC_LAYOUT:
+            db.disconnect_from_database()
+            raise SyncError("Migrate the central database with timesheet_migration.py first")
+        return db
+
+    def call(self, function, *args):
+        """Call function with a connection and the arguments, retried while busy."""
+        from database_functions import run_with_retry
+
+        db = self.connect()
+        try:
+            return run_with_retry(function, db, *args)
+        finally:
+            db.disconnect_from_database()
+
+    def load_changes(self, cursor, limit):
+        """Return the changes after a cursor, see read_changes()."""
+        return self.call(read_changes, cursor, limit)
+
+    def load_rows(self, after, limit):
+        """Return one page of all employees and days, see read_rows()."""
+        return self.call(read_rows, after, limit)
+
+    def apply(self, records):
+        """Merge the records of the replica, returns the changed and the rejected keys."""
+        return self.call(write_records, records)
+
+    def load_reference(self):
+        """Return the rows of the centrally maintained tables."""
+        return self.call(lambda db: db.load_reference_rows())
+
+
+class CentralService():
+    """
+    The timesheet service in front of the central database.
+
+    Attributes
+    ----------
+    client : TimesheetClient
+        A client of its own, used on the sync thread only.
+    """
+
+    def __init__(self):
+        """Initializes a CentralService for the service of gui_constants."""
+        self.client = TimesheetClient()
+
+    def load_changes(self, cursor, limit):
+        """Return the changes after a cursor, see read_changes()."""
+        payload = self.client.request('GET', '/sync/changes', cursor=cursor, limit=limit)
+        return payload['records'], payload['cursor'], payload['last']
+
+    def load_rows(self, after, limit):
+        """Return one page of all employees and days, see read_rows()."""
+        query = {'limit': limit}
+        if after is not None:
+            query.update(after_employee=after[1], after_day=after[2])
+        payload = self.client.request('GET', '/sync/rows', **query)
+        return payload['records'], payload['next'], payload['last']
+
+    def apply(self, records):
+        """Merge the records of the replica, returns the changed and the rejected keys."""
+        payload = self.client.request('POST', '/sync/records', {'records': records})
+        return payload['changed'], payload['rejected']
+
+    def load_reference(self):
+        """Return the rows of the centrally maintained tables."""
+        return self.client.request('GET', '/sync/reference')['tables']
+
+
+class Replica():
+    """
+    A local replica of the central database.
+
+    Attributes
+    ----------
+    replica_path : str
+        Path of the replica on the local disk.
+    central : CentralDatabase or CentralService
+        The central database.
+    batch_size : int
+        Sequence numbers, or days when filling the replica, per batch.
+    """
+
+    def __init__(self, replica_path, central, batch_size=None):
+        """
+        Initializes a Replica.
+
+        Parameters
+        ----------
+        replica_path : str
+            Path of the replica, created by the first sync.
+        central : CentralDatabase or CentralService
+            The central database.
+        batch_size : int, optional
+            Changes per batch (default is gui_constants.SYNC_BATCH_SIZE).
+        """
+        self.replica_path = replica_path
+        self.central = central
+        self.batch_size = batch_size or gui_constants.SYNC_BATCH_SIZE
+
+    def sync(self):
+        """
+        Push the changes of the replica, then pull the changes of the central database.
+
+        Returns
+        -------
+        dict
+            "days" maps employee ids to the dates ('%Y-%m-%d') of their
+            pulled days, "employees" lists the employees whose vacation days
+            were pulled.
+
+        Raises
+        ------
+        SyncError, ServiceError, OSError or sqlite3.Error
+            If the central database is not reachable. Nothing is lost, the
+            next sync continues where this one stopped.
+        """
+        from database_functions import DatabaseFunctions, run_with_retry
+
+        db = DatabaseFunctions()
+        run_with_retry(db.connect_to_database, self.replica_path)
+        try:
+            start = time.perf_counter()
+            changes = {"days": {}, "employees": []}
+            pushed, rejected = self.push(db)
+            pulled = self.pull(db, changes)
+            if pushed or pulled or rejected:
+                logger.info("Replica synced: %d changes pushed (%d rejected in closed months), "
+                            "%d pulled in %.2f s.", pushed, rejected, pulled, time.perf_counter() - start)
+            return changes
+        finally:
+            db.disconnect_from_database()
+
+    def push(self, db):
+        """
+        Merge the changes of the replica since the last push into the central database.
+
+        Returns
+        -------
+        tuple
+            Amount of pushed and of rejected rows.
+        """
+        from database_functions import run_with_retry
+
+        cursor = db.load_sync_cursor('push') or 0
+        pushed = rejected = 0
+        while True:
+            records, new_cursor, last = run_with_retry(read_changes, db, cursor, self.batch_size)
+            if records is None:
+                # Only if the change feed of the replica was pruned by hand
+                return self.push_all(db, last)
+            if records:
+                rejected += len(self.central.apply(records)[1])
+                pushed += len(records)
+            # Advanced once the central database has the changes
+            run_with_retry(db.save_sync_cursor, 'push', new_cursor)
+            cursor = new_cursor
+            if cursor >= last:
+                break
+        # Nobody else reads the change feed of the replica
+        run_with_retry(db.prune_change_feed, cursor)
+        return pushed, rejected
+
+    def push_all(self, db, last):
+        """Merge all employees and days of the replica into the central database."""
+        from database_functions import run_with_retry
+
+        after = None
+        pushed = rejected = 0
+        while True:
+            records, after, _ = run_with_retry(read_rows, db, after, self.batch_size)
+            rejected += len(self.central.apply(records)[1])
+            pushed += len(records)
+            if after is None:
+                break
+        run_with_retry(db.save_sync_cursor, 'push', last)
+        return pushed, rejected
+
+    def pull(self, db, changes):
+        """
+        Copy the centrally maintained tables and merge the changes of the
+        central database since the last pull into the replica.
+
+        Parameters
+        ----------
+        db : DatabaseFunctions
+            Connection to the replica.
+        changes : dict
+            Collects the pulled days and employees, see sync().
+
+        Returns
+        -------
+        int
+            Amount of changed rows of the replica.
+        """
+        from database_functions import run_with_retry
+
+        # First, the changes of a month reopened centrally are rejected while it is closed here
+        tables = self.central.load_reference()
+
+        def replace():
+            with db.transaction():
+                return db.replace_reference_rows(tables)
+
+        run_with_retry(replace)
+
+        cursor = db.load_sync_cursor('pull')
+        pulled = 0
+        if cursor is None:
+            cursor, pulled = self.fill(db, changes)
+        while True:
+            records, new_cursor, last = self.central.load_changes(cursor, self.batch_size)
+            if records is None:
+                logger.warning("The changes since the last sync were pruned, the replica is filled again.")
+                cursor, filled = self.fill(db, changes)
+                pulled += filled
+                continue
+            pulled += self.merge(db, records, changes, new_cursor)
+            if new_cursor >= last:
+                return pulled
+            cursor = new_cursor
+
+    def fill(self, db, changes):
+        """
+        Merge all employees and days of the central database into the replica.
+
+        Returns
+        -------
+        tuple
+            The pull cursor to continue with and the amount of changed rows.
+        """
+        from database_functions import run_with_retry
+
+        after = None
+        cursor = None
+        pulled = 0
+        while True:
+            records, after, last = self.central.load_rows(after, self.batch_size)
+            # Changes made while filling are pulled again, merging them twice is harmless
+            if cursor is None:
+                cursor = last
+            pulled += self.merge(db, records, changes)
+            if after is None:
+                break
+        # Only stored at the end, an interrupted fill starts again
+        run_with_retry(db.save_sync_cursor, 'pull', cursor)
+        logger.info("Replica filled with %d employees and days.", pulled)
+        return cursor, pulled
+
+    def merge(self, db, records, changes, cursor=None):
+        """
+        Merge records of the central database into the replica and store the
+        pull cursor in the same transaction.
+
+        Returns
+        -------
+        int
+            Amount of changed rows.
+        """
+        from database_functions import run_with_retry
+
+        def write():
+            with db.transaction():
+                last_change = db.load_last_change()
+                changed, _ = db.apply_sync_records(records)
+                # The merged rows are recorded in the change feed, but need no push
+                if (db.load_sync_cursor('push') or 0) == last_change:
+                    db.save_sync_cursor('push', db.load_last_change())
+                if cursor is not None:
+                    db.save_sync_cursor('pull', cursor)
+                return changed
+
+        changed = run_with_retry(write)
+        for table_name, employee_id, day in changed:
+            if table_name == 'employees':
+                changes["employees"].append(employee_id)
+            else:
+                changes["days"].setdefault(employee_id, []).append(
+                    dt.date.fromordinal(day).isoformat())
+        return len(changed)
+
+    def print_status(self):
+        """Print the cursors and the amount of changes waiting for the push."""
+        from database_functions import DatabaseFunctions
+
+        db = DatabaseFunctions()
+        db.connect_to_database(self.replica_path)
+        try:
+            push = db.load_sync_cursor('push') or 0
+            print(f"Replica {self.replica_path}")
+            print("Pull cursor: {}".format(db.load_sync_cursor('pull')))
+            print("Changes to push: {}".format(len(db.load_changed_keys(push, db.load_last_change()))))
+        finally:
+            db.disconnect_from_database()
+
+
+# The replica of this process, see open_replica()
+replica = None
+
+# One thread runs all syncs, so two syncs never merge the same changes at the same time
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync")
+running = None
+
+
+def get_central():
+    """Return the central database of gui_constants."""
+    if gui_constants.SYNC_WITH_SERVICE:
+        return CentralService()
+    return CentralDatabase(gui_constants.DATABASE_PATH)
+
+
+def open_replica(replica_path=None):
+    """
+    Switch the application to the replica: gui_constants.DATABASE_PATH is
+    replaced by the replica and becomes the central database. A new replica
+    is filled before it is used, if the central database is reachable.
+
+    Parameters
+    ----------
+    replica_path : str, optional
+        Path of the replica (default is gui_constants.REPLICA_PATH).
+
+    Returns
+    -------
+    Replica
+    """
+    global replica
+
+    replica_path = os.path.expanduser(replica_path or gui_constants.REPLICA_PATH)
+    os.makedirs(os.path.dirname(replica_path) or '.', exist_ok=True)
+    replica = Replica(replica_path, get_central())
+    is_new = not os.path.isfile(replica_path)
+    gui_constants.DATABASE_PATH = replica_path
+    if is_new:
+        try:
+            replica.sync()
+        except Exception as error:
+            logger.warning("Failed to fill the replica: %s", error)
+    return replica
+
+
+def run_sync():
+    """Sync the replica once, returns the pulled changes or None if it failed."""
+    try:
+        return replica.sync()
+    except Exception as error:
+        logger.warning("Failed to sync the replica: %s", error)
+        return None
+
+
+def sync_in_background():
+    """
+    Sync the replica on the background thread, unless the previous sync is
+    still running.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        Completed with the pulled changes (see Replica.sync()) or None.
+    """
+    global running
+
+    if running is None or running.done():
+        running = executor.submit(run_sync)
+    return running
+
+
+def sync_before_exit():
+    """
+    Queue one more sync for the changes saved last. The interpreter waits
+    for it before it exits.
+    """
+    executor.submit(run_sync)
+
+
+def main():
+    """Sync the replica or show its state from the command line."""
+    parser = argparse.ArgumentParser(description="Sync the local replica with the central database")
+    parser.add_argument('action', choices=('sync', 'status'))
+    parser.add_argument('--replica', default=gui_constants.REPLICA_PATH,
+                        help="Path of the replica (default is REPLICA_PATH)")
+    arguments = parser.parse_args()
+
+    import sqlite3
+
+    logging_config.configure()
+    replica_path = os.path.expanduser(arguments.replica)
+    if arguments.action == 'status':
+        if not os.path.isfile(replica_path):
+            print(f"There is no replica at {replica_path}.")
+            return
+        Replica(replica_path, get_central()).print_status()
+        return
+
+    os.makedirs(os.path.dirname(replica_path) or '.', exist_ok=True)
+    try:
+        Replica(replica_path, get_central()).sync()
+    except (SyncError, ServiceError, OSError, sqlite3.Error) as error:
+        logger.error("Failed to sync the replica: %s", error)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,741 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a local timesheet service for the STC time management
+application.
+
+Instead of every workstation opening the shared SQLite file, a single server
+process owns the database and exposes the operations used by WorkTimeEmployee
+and Timesheet as a small HTTP/JSON interface on localhost. All requests are
+executed one after another on a single worker thread with one pooled
+connection, so writes are serialized instead of fighting over file locks.
+
+Every month of every employee carries an ETag which changes whenever a day
+of that month is written. Clients revalidate cached months with
+If-None-Match and are told about changes made by other clients over a
+long-lived /events connection.
+
+Classes
+-------
+TimesheetServer
+    An asyncio HTTP/1.1 server answering JSON requests.
+
+Endpoints
+---------
+GET  /employees
+    All employees with their vacation day counters and versions.
+GET  /team?offset=...&limit=...
+    One page of the aggregated team overview and the amount of employees.
+GET  /days?employee_id=...[&start=YYYY-MM-DD&end=YYYY-MM-DD]
+    The working days of an employee, optionally limited to a date range.
+GET  /month?employee_id=...&year=...&month=...
+    The working days of an employee in one month and its ETag. Answers 304
+    without body if the If-None-Match header matches the ETag.
+POST /days {"employee_id": ..., "days": [...]}
+    Upserts a batch of days. Days whose version does not match the stored
+    version are not written and reported as conflicts. Answers 409 if the
+    database rejects the days, e.g. of a month closed in the meantime.
+POST /punch {"employee_id": ..., "kind": "work" | "break"}
+    Starts or ends the workday or a break of today. Every punch opens or
+    closes an interval in the punches table. Answers 409 if today was
+    changed by a process bypassing the service.
+GET  /punch?employee_id=...
+    The start of the running break ("on_break"), null if there is none.
+GET  /intervals?employee_id=...&year=...&month=...
+    Work and break totals of every punched day of a month.
+GET  /flex?employee_id=...
+    The accumulated flex time in seconds.
+GET  /models?employee_id=...
+    The working-time models of an employee.
+GET  /closed_months?employee_id=...
+    The frozen totals of the closed months of an employee.
+GET  /sync/changes?cursor=...&limit=...
+    The days and employees changed after a cursor, with the time of the
+    last change of every field, for replicas (see timesheet_replica.py).
+GET  /sync/rows?limit=...[&after_employee=...&after_day=...]
+    One page of all employees and days, for new replicas.
+POST /sync/records {"records": [...]}
+    Merges the changes of a replica field by field, the value changed last
+    wins. Answers the changed and the rejected keys.
+GET  /sync/reference
+    The working-time models and closed months, copied to replicas.
+POST /vacation {"employee_id": ..., "vacation_days": ...,
+                "old_vacation_days": ..., "version": ..., "region": ...}
+    Updates the vacation day counters and the holiday region, answers 409
+    on a version conflict.
+POST /employees {"employees": [{"employee_id": ..., "vacation_days": ...,
+                                "old_vacation_days": ..., "version": ...,
+                                "region": ...}]}
+    Updates the counters of several employees in one transaction. Answers
+    the new versions, null for the employees with a version conflict.
+POST /batch {"requests": [{"method": ..., "path": ..., "body": ...}]}
+    Executes several requests in one round trip.
+GET  /events
+    Keeps the connection open and streams one JSON line per change:
+    {"sequence": ..., "employee_id": ..., "kind": "days" | "counters",
+     "dates": [...], "origin": ...}. origin is the client_id sent with
+    the changing request.
+
+Usage
+-----
+    python timesheet_server.py [--host HOST] [--port PORT] [--database PATH]
+"""
+
+import argparse
+import asyncio
+import calendar
+import concurrent.futures
+import datetime as dt
+import json
+import logging
+import secrets
+import sqlite3
+import urllib.parse
+
+from data_model import WorkTimeEmployee, ConcurrentModificationError
+from database_functions import DatabaseFunctions, NUMERIC_LAYOUT, run_with_retry
+import database_maintenance
+from datetime_functions import DatetimeFunctions as dtf
+import gui_constants
+import logging_config
+import timesheet_replica
+
+logger = logging.getLogger(__name__)
+
+
+class RequestError(Exception):
+    """Raised by request handlers to answer with an HTTP error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class TimesheetServer():
+    """
+    An HTTP/JSON server owning the timesheet database.
+
+    Attributes
+    ----------
+    host : str
+        Address the server listens on.
+    port : int
+        Port the server listens on. Is updated to the actual port once the
+        server is started, so 0 can be used to pick a free port.
+    db : DatabaseFunctions or None
+        The pooled connection, only used on the worker thread.
+    employees : dict
+        Employee ids mapped to their cached WorkTimeEmployee.
+    executor : concurrent.futures.ThreadPoolExecutor
+        The single worker thread executing all requests.
+    instance : str
+        Random token of this server run, part of every ETag so ETags of a
+        previous run never match.
+    sequence : int
+        Number of changes since the server was started.
+    month_sequences : dict
+        (employee_id, 'YYYY-MM') mapped to the sequence of its last change.
+    subscribers : set
+        One asyncio.Queue per open /events connection.
+    """
+
+    REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict",
+               500: "Internal Server Error"}
+
+    def __init__(self, host=None, port=None):
+        """
+        Initializes a TimesheetServer without starting it.
+
+        Parameters
+        ----------
+        host : str, optional
+            Address to listen on (default is gui_constants.SERVICE_HOST).
+        port : int, optional
+            Port to listen on (default is gui_constants.SERVICE_PORT).
+        """
+        self.host = gui_constants.SERVICE_HOST if host is None else host
+        self.port = gui_constants.SERVICE_PORT if port is None else port
+        self.db = None
+        self.employees = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="timesheet-db")
+        self.server = None
+        self.maintenance = None
+        self.loop = None
+        self.instance = secrets.token_hex(4)
+        self.sequence = 0
+        self.month_sequences = {}
+        self.subscribers = set()
+        self.routes = {
+            ('GET', '/employees'): self.get_employees,
+            ('GET', '/team'): self.get_team_page,
+            ('GET', '/days'): self.get_days,
+            ('GET', '/month'): self.get_month,
+            ('POST', '/days'): self.upsert_days,
+            ('POST', '/punch'): self.punch,
+            ('GET', '/punch'): self.get_punch_state,
+            ('GET', '/intervals'): self.get_interval_totals,
+            ('GET', '/flex'): self.get_flex_time,
+            ('GET', '/models'): self.get_working_time_models,
+            ('GET', '/closed_months'): self.get_closed_months,
+            ('GET', '/sync/changes'): self.get_sync_changes,
+            ('GET', '/sync/rows'): self.get_sync_rows,
+            ('POST', '/sync/records'): self.apply_sync_records,
+            ('GET', '/sync/reference'): self.get_sync_reference,
+            ('POST', '/vacation'): self.update_vacation,
+            ('POST', '/employees'): self.update_employees,
+            ('POST', '/batch'): self.batch,
+        }
+
+    # --------------------------------------------------------------------------
+    # Server lifecycle
+
+    async def start(self):
+        """Open the database connection and start listening."""
+        self.loop = asyncio.get_running_loop()
+        await self.loop.run_in_executor(self.executor, self.connect)
+        self.server = await asyncio.start_server(self.handle_connection,
+                                                 self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info("Timesheet service listening on %s:%d", self.host, self.port)
+        if gui_constants.RUN_MAINTENANCE:
+            self.maintenance = self.loop.create_task(self.maintain())
+
+    async def serve_forever(self):
+        """Start the server and answer requests until cancelled."""
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop listening and close the database connection."""
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(None)
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+            self.maintenance = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.disconnect)
+        self.executor.shutdown()
+
+    async def maintain(self):
+        """
+        Run the due database maintenance tasks on their own thread every
+        gui_constants.MAINTENANCE_CHECK_INTERVAL milliseconds, the first
+        time one interval after the start.
+        """
+        while True:
+            await asyncio.sleep(gui_constants.MAINTENANCE_CHECK_INTERVAL / 1000)
+            database_maintenance.run_due_tasks_in_background()
+
+    def connect(self):
+        """Open the pooled database connection."""
+        self.db = DatabaseFunctions()
+        self.db.connect_to_database()
+
+    def disconnect(self):
+        """Close the pooled database connection."""
+        if self.db is not None:
+            self.db.disconnect_from_database()
+            self.db = None
+
+    # --------------------------------------------------------------------------
+    # HTTP handling
+
+    async def handle_connection(self, reader, writer):
+        """
+        Answer all requests of a keep-alive connection.
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            Stream of the incoming requests.
+        writer : asyncio.StreamWriter
+            Stream for the responses.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                if method == 'GET' and target == '/events':
+                    await self.stream_events(writer)
+                    break
+
+                status, payload = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.dispatch, method, target, body,
+                    headers.get('if-none-match'))
+
+                # A 304 answer must not have a body
+                data = json.dumps(payload).encode('utf-8') if status != 304 else b''
+                keep_alive = (version == 'HTTP/1.1'
+                              and headers.get('connection', '').lower() != 'close')
+                etag = "ETag: {}\r\n".format(payload['etag']) if 'etag' in payload else ""
+                writer.write(
+                    "HTTP/1.1 {status} {reason}\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Content-Length: {length}\r\n{etag}"
+                    "Connection: {connection}\r\n\r\n".format(
+                        status=status, reason=self.REASONS.get(status, ""),
+                        length=len(data), etag=etag,
+                        connection="keep-alive" if keep_alive else "close"
+                    ).encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream_events(self, writer):
+        """
+        Send every change as a JSON line until the client disconnects.
+
+        Parameters
+        ----------
+        writer : asyncio.StreamWriter
+            Stream of the /events connection.
+        """
+        subscriber = asyncio.Queue()
+        self.subscribers.add(subscriber)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\n"
+                         b"Content-Type: application/x-ndjson\r\n"
+                         b"Connection: close\r\n\r\n")
+            await writer.drain()
+            while True:
+                event = await subscriber.get()
+                if event is None:
+                    break
+                writer.write(json.dumps(event).encode('utf-8') + b"\n")
+                await writer.drain()
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def notify(self, employee_id, date_strings, origin, kind='days'):
+        """
+        Advance the ETags of the changed months and push an event to all subscribers.
+
+        Called on the worker thread after a successful write.
+
+        Parameters
+        ----------
+        employee_id : str
+            Username/employee_id of the changed employee.
+        date_strings : list
+            Dates ('%Y-%m-%d') of the changed days.
+        origin : str or None
+            client_id of the client which made the change.
+        kind : str, optional
+            'days' or 'counters' (default is 'days').
+        """
+        self.sequence += 1
+        for date_string in date_strings:
+            self.month_sequences[(employee_id, date_string[:7])] = self.sequence
+        event = {"sequence": self.sequence, "employee_id": employee_id,
+                 "kind": kind, "dates": sorted(date_strings), "origin": origin}
+        for subscriber in list(self.subscribers):
+            self.loop.call_soon_threadsafe(subscriber.put_nowait, event)
+
+    def dispatch(self, method, target, body, if_none_match=None):
+        """
+        Execute a request on the worker thread.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, e.g. 'GET'.
+        target : str
+            Request path including the query string.
+        body : bytes or dict
+            JSON body of the request, already decoded for batched requests.
+        if_none_match : str, optional
+            ETag the client already holds. If it is still current, the
+            request is answered with 304.
+
+        Returns
+        -------
+        tuple
+            HTTP status and json compatible response body.
+        """
+        url = urllib.parse.urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                return 405, {"error": "Method not allowed"}
+            return 404, {"error": "Unknown path {}".format(url.path)}
+        try:
+            if isinstance(body, bytes):
+                body = json.loads(body) if body else {}
+            parameters = dict(urllib.parse.parse_qsl(url.query))
+            parameters.update(body or {})
+            payload = handler(parameters)
+            if if_none_match is not None and payload.get('etag') == if_none_match:
+                return 304, {'etag': if_none_match}
+            return 200, payload
+        except RequestError as e:
+            return e.status, {"error": e.message}
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"error": "Invalid request: {}".format(e)}
+        except Exception as e:
+            logger.exception("Error handling %s %s: %s", method, url.path, e)
+            return 500, {"error": str(e)}
+
+    # --------------------------------------------------------------------------
+    # Request handlers, all executed on the worker thread
+
+    def get_employee(self, employee_id):
+        """
+        Return the cached employee, reading it from the database on first use.
+
+        Parameters
+        ----------
+        employee_id : str
+            Username/employee_id.
+
+        Returns
+        -------
+        WorkTimeEmployee
+            The employee with all working days loaded.
+        """
+        employee = self.employees.get(employee_id)
+        if employee is None:
+            employee = WorkTimeEmployee(employee_id, load=False)
+            employee.region = self.db.load_employee_region(employee_id) or gui_constants.DEFAULT_REGION
+            employee.read_from_database(db=self.db)
+            employee.is_loaded = True
+            self.employees[employee_id] = employee
+        return employee
+
+    def get_employees(self, parameters):
+        """Return all employees with their vacation day counters."""
+        return {"employees": [
+            {"employee_id": row[0], "vacation_days": row[1],
+             "old_vacation_days": row[2], "version": row[3], "region": row[4]}
+            for row in self.db.load_employees()
+        ]}
+
+    def get_team_page(self, parameters):
+        """Return one page of the team overview, aggregated by the database."""
+        rows = self.db.load_team_overview(dt.date.today(),
+                                          gui_constants.DAILY_WORKING_HOURS * 3600,
+                                          int(parameters['limit']),
+                                          int(parameters.get('offset', 0)))
+        return {"rows": rows, "total": self.db.count_employees()}
+
+    def get_days(self, parameters):
+        """Return the days of an employee, optionally between start and end."""
+        employee = self.get_employee(parameters['employee_id'])
+        start = parameters.get('start')
+        end = parameters.get('end')
+        return {"days": [
+            day.to_dict() for day in employee.days_between(
+                dt.date.fromisoformat(start) if start else None,
+                dt.date.fromisoformat(end) if end else None)
+            if day.has_entry()
+        ]}
+
+    def get_month(self, parameters):
+        """Return the days of an employee in one month and the ETag of the month."""
+        prefix = "{year:04d}-{month:02d}".format(year=int(parameters['year']),
+                                                 month=int(parameters['month']))
+        first_date = dt.date.fromisoformat(prefix + '-01')
+        # Closed months are only loaded on demand
+        self.get_employee(parameters['employee_id']).load_month(
+            first_date.year, first_date.month, db=self.db)
+        payload = self.get_days({'employee_id': parameters['employee_id'],
+                                 'start': prefix + '-01',
+                                 'end': (dtf.add_months(self, first_date, 1)
+                                         - dt.timedelta(days=1)).isoformat()})
+        payload['etag'] = '"{instance}-{sequence}"'.format(
+            instance=self.instance,
+            sequence=self.month_sequences.get((parameters['employee_id'], prefix), 0))
+        return payload
+
+    def save_days(self, employee):
+        """
+        Save the changed days of a cached employee.
+
+        Raises
+        ------
+        ConcurrentModificationError
+            If days were changed by a process bypassing the service.
+        RequestError
+            With status 409 if the database rejected the days, e.g. of a
+            month closed by another process. Other database errors are
+            answered with 500. Nothing is saved then, the cached employee
+            is read again by the next request.
+        """
+        try:
+            employee.save_to_database(db=self.db)
+        except sqlite3.Error as e:
+            self.employees.pop(employee.employee_id, None)
+            if isinstance(e, sqlite3.IntegrityError):
+                raise RequestError(409, "Days of {} were rejected: {}".format(employee.employee_id, e))
+            raise
+
+    def upsert_days(self, parameters):
+        """
+        Write a batch of days of one employee in a single transaction.
+
+        Every day carries the version it had when the client read it. Days
+        whose version does not match are not written and are reported as
+        conflicts, all other days are saved.
+
+        Returns
+        -------
+        dict
+            "versions" maps the dates of the written days to their new
+            version, "conflicts" lists the dates which were not written.
+        """
+        employee = self.get_employee(parameters['employee_id'])
+        conflicts = []
+        written = []
+        for data in parameters['days']:
+            date_object = dtf.convert_string_to_date(self, data['date'])
+            if employee.is_closed(date_object):
+                conflicts.append(data['date'])
+                continue
+            day = employee.create_day(date_object)
+            if data.get('version') != day.version:
+                conflicts.append(data['date'])
+                continue
+            day.update_from_dict(data)
+            written.append(data['date'])
+
+        try:
+            self.save_days(employee)
+        except ConcurrentModificationError as e:
+            # Changed by a process bypassing the service
+            conflicts += e.conflicts
+            employee.reload_days(e.conflicts)
+
+        versions = {date_string: employee.get_day(dt.date.fromisoformat(date_string)).version
+                    for date_string in written if date_string not in conflicts}
+        if versions:
+            self.notify(employee.employee_id, list(versions), parameters.get('client_id'))
+        return {"versions": versions, "conflicts": conflicts}
+
+    def punch(self, parameters):
+        """
+        Start or end the workday ("work") or a break ("break") of today.
+
+        Returns
+        -------
+        dict
+            Today's day and the start of the running break, see get_punch_state().
+
+        Raises
+        ------
+        RequestError
+            With status 409 if today was changed by a process bypassing the
+            service. The day is read again.
+        """
+        employee = self.get_employee(parameters['employee_id'])
+        try:
+            today = employee.punch(parameters['kind'], db=self.db)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+
+        try:
+            self.save_days(employee)
+        except ConcurrentModificationError as e:
+            # Changed by a process bypassing the service, the client reloads the day
+            employee.reload_days(e.conflicts)
+            raise RequestError(409, "Days of {} were changed in the meantime: {}".format(
+                employee.employee_id, ", ".join(e.conflicts)))
+        self.notify(employee.employee_id, [today.to_dict()['date']], parameters.get('client_id'))
+        return dict(self.get_punch_state(parameters), day=today.to_dict())
+
+    def get_punch_state(self, parameters):
+        """Return the start of the running break of an employee ('%H:%M:%S') or None."""
+        employee = self.get_employee(parameters['employee_id'])
+        on_break = employee.on_break
+        return {"on_break": on_break.isoformat(timespec='seconds') if on_break else None}
+
+    def get_interval_totals(self, parameters):
+        """Return the punch interval totals of every day of a month, see load_interval_totals()."""
+        year, month = int(parameters['year']), int(parameters['month'])
+        prefix = "{year:04d}-{month:02d}".format(year=year, month=month)
+        last_day = calendar.monthrange(year, month)[1]
+        return {"days": [
+            {"date": row[0], "start": row[1], "end": row[2], "work_time": row[3],
+             "break_time": row[4], "work_intervals": row[5]}
+            for row in self.db.load_interval_totals(parameters['employee_id'],
+                                                    prefix + '-01', f"{prefix}-{last_day:02d}")
+        ]}
+
+    def get_flex_time(self, parameters):
+        """Return the accumulated flex time of an employee in seconds."""
+        employee = self.get_employee(parameters['employee_id'])
+        return {"flex_time": employee.get_flex_time()}
+
+    def get_working_time_models(self, parameters):
+        """Return the working-time models of an employee."""
+        employee = self.get_employee(parameters['employee_id'])
+        return {"models": [model.to_dict() for model in employee.schedule.models]}
+
+    def get_closed_months(self, parameters):
+        """Return the frozen totals of the closed months of an employee."""
+        return {"months": self.db.load_closed_months(parameters['employee_id'])}
+
+    def require_numeric_layout(self):
+        """Raise a RequestError (409) unless the database is migrated, replicas need its field clocks."""
+        if self.db.get_layout() < NUMERIC_LAYOUT:
+            raise RequestError(409, "Migrate the database with timesheet_migration.py first")
+
+    def get_sync_changes(self, parameters):
+        """Return the changes after a cursor, see timesheet_replica.read_changes()."""
+        self.require_numeric_layout()
+        records, cursor, last = timesheet_replica.read_changes(
+            self.db, int(parameters['cursor']), int(parameters['limit']))
+        return {"records": records, "cursor": cursor, "last": last}
+
+    def get_sync_rows(self, parameters):
+        """Return one page of all employees and days, see timesheet_replica.read_rows()."""
+        self.require_numeric_layout()
+        after = None
+        if 'after_employee' in parameters:
+            after = ('timesheet', parameters['after_employee'], int(parameters['after_day']))
+        records, after, last = timesheet_replica.read_rows(self.db, after, int(parameters['limit']))
+        return {"records": records, "next": after, "last": last}
+
+    def apply_sync_records(self, parameters):
+        """
+        Merge the changes of a replica and tell the other clients about them.
+
+        Returns
+        -------
+        dict
+            "changed" and "rejected" list the keys (table, employee_id, day)
+            of the changed rows and of the days in closed months.
+        """
+        self.require_numeric_layout()
+        changed, rejected = timesheet_replica.write_records(self.db, parameters['records'])
+        dates = {}
+        for table_name, employee_id, day in changed:
+            # Read again on the next request
+            self.employees.pop(employee_id, None)
+            if table_name == 'employees':
+                self.notify(employee_id, [], None, kind='counters')
+            else:
+                dates.setdefault(employee_id, []).append(dt.date.fromordinal(day).isoformat())
+        for employee_id, date_strings in dates.items():
+            self.notify(employee_id, date_strings, None)
+        return {"changed": changed, "rejected": rejected}
+
+    def get_sync_reference(self, parameters):
+        """Return the working-time models and closed months for replicas."""
+        return {"tables": self.db.load_reference_rows()}
+
+    def update_vacation(self, parameters):
+        """
+        Update the vacation day counters and the holiday region of an employee.
+
+        Raises
+        ------
+        RequestError
+            With status 409 if the counters were changed in the meantime.
+        """
+        version = run_with_retry(self.db.save_employee,
+                                 parameters['employee_id'],
+                                 parameters['vacation_days'],
+                                 parameters['old_vacation_days'],
+                                 parameters.get('version'),
+                                 parameters.get('region'))
+        if version is None:
+            raise RequestError(409, "Vacation days of {} were changed in the meantime"
+                               .format(parameters['employee_id']))
+        # The region changes the target hours of the cached employee
+        employee = self.employees.get(parameters['employee_id'])
+        if employee is not None and parameters.get('region'):
+            employee.region = parameters['region']
+        self.notify(parameters['employee_id'], [], parameters.get('client_id'), kind='counters')
+        return {"version": version}
+
+    def update_employees(self, parameters):
+        """
+        Update the vacation day counters and holiday regions of several
+        employees in one transaction.
+
+        Returns
+        -------
+        dict
+            "versions" maps the employee_ids to their new version, None for
+            the employees which were changed in the meantime.
+        """
+        rows = [(data['employee_id'], data['vacation_days'], data['old_vacation_days'],
+                 data.get('version'), data.get('region'))
+                for data in parameters['employees']]
+
+        def write():
+            with self.db.transaction():
+                return self.db.save_employees(rows)
+
+        versions = run_with_retry(write)
+        for employee_id, _, _, _, region in rows:
+            if versions[employee_id] is None:
+                continue
+            # The region changes the target hours of the cached employee
+            employee = self.employees.get(employee_id)
+            if employee is not None and region:
+                employee.region = region
+            self.notify(employee_id, [], parameters.get('client_id'), kind='counters')
+        return {"versions": versions}
+
+    def batch(self, parameters):
+        """
+        Execute several requests in one round trip.
+
+        Returns
+        -------
+        dict
+            "responses" lists status and body of every request in order.
+        """
+        responses = []
+        for request in parameters['requests']:
+            status, body = self.dispatch(request['method'], request['path'],
+                                         request.get('body') or {})
+            responses.append({"status": status, "body": body})
+        return {"responses": responses}
+
+
+def main():
+    """Run the timesheet service until it is interrupted."""
+    parser = argparse.ArgumentParser(description="Local timesheet service")
+    parser.add_argument('--host', default=gui_constants.SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=gui_constants.SERVICE_PORT)
+    parser.add_argument('--database', default=gui_constants.DATABASE_PATH,
+                        help="Path of the SQLite database owned by the service")
+    arguments = parser.parse_args()
+
+    gui_constants.DATABASE_PATH = arguments.database
+    logging_config.configure()
+    server = TimesheetServer(arguments.host, arguments.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Timesheet service stopped.")
+
+
+if __name__ == "__main__":
+    main()
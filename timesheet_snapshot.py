@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides binary snapshots of the timesheets of the STC time
+management application.
+
+A snapshot holds the days of the open months of one employee as returned by
+DatabaseFunctions.load_days(), stored column by column as 32 bit integers.
+It is memory-mapped when the employee is loaded, so no rows have to be
+queried and no strings parsed. Every snapshot carries the change counter of
+the employee's days (timesheet_counters) it was built from; if the counter
+in the database differs, the snapshot is stale and the days are loaded from
+the database instead.
+
+Snapshots are written by a background thread after the days were loaded
+from the database or saved, into a folder next to the database file.
+Deleting the folder is always safe. They are only used with
+gui_constants.USE_SNAPSHOTS, which is off by default: with the numeric
+layout the database is read nearly as fast.
+
+Classes
+-------
+SnapshotCache
+    Reads and writes the snapshots of a database.
+
+Functions
+---------
+load(employee_id, counter)
+    Returns the days of a valid snapshot.
+rebuild_in_background(employee_id)
+    Rebuilds the snapshot of an employee on the background thread.
+wait_for_rebuilds()
+    Waits until all requested snapshots are written.
+"""
+
+import array
+import concurrent.futures
+import logging
+import mmap
+import os
+import struct
+import sys
+
+import gui_constants
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache():
+    """
+    Snapshots of the timesheets of one database.
+
+    Attributes
+    ----------
+    directory : str
+        Folder the snapshots are stored in.
+    database_path : str
+        The database the snapshots are built from.
+    """
+
+    # Magic, byte order, change counter and amount of days, followed by the columns
+    HEADER = struct.Struct("<4scxxqI")
+    MAGIC = b"STS1"
+    # Stored instead of NULL
+    NONE = -2 ** 31
+    # Day number, start, end, break and work seconds, state code and version
+    COLUMNS = 7
+
+    def __init__(self, directory=None):
+        """
+        Initializes a SnapshotCache.
+
+        Parameters
+        ----------
+        directory : str, optional
+            Folder the snapshots are stored in (default is a folder named
+            after gui_constants.DATABASE_PATH).
+        """
+        self.database_path = gui_constants.DATABASE_PATH
+        if directory is None:
+            directory = os.path.splitext(self.database_path)[0] + "_snapshots"
+        self.directory = directory
+
+    def get_file_path(self, employee_id):
+        """
+        Return the path of the snapshot of an employee.
+
+        The file name is the hex encoded employee ID, so any ID stays inside
+        the folder and IDs differing in case only don't share a file.
+        """
+        return os.path.join(self.directory, employee_id.encode('utf-8').hex() + ".bin")
+
+    def read(self, employee_id, counter):
+        """
+        Read the days of an employee from the snapshot.
+
+        Parameters
+        ----------
+        employee_id : str
+            The employee.
+        counter : int
+            The current change counter of the employee's days.
+
+        Returns
+        -------
+        list or None
+            Tuples like DatabaseFunctions.load_days(), None if there is no
+            snapshot or it was built from another counter.
+        """
+        try:
+            with open(self.get_file_path(employee_id), 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    return self.__read_columns(buffer, counter)
+        except (OSError, ValueError, struct.error):
+            # Missing, empty or truncated file
+            return None
+
+    def __read_columns(self, buffer, counter):
+        """Return the rows of a mapped snapshot, None if it is not valid."""
+        magic, byte_order, stored_counter, amount = self.HEADER.unpack_from(buffer)
+        if (magic != self.MAGIC or byte_order != sys.byteorder[0].encode()
+                or stored_counter != counter
+                or len(buffer) != self.HEADER.size + self.COLUMNS * 4 * amount):
+            return None
+
+        with memoryview(buffer) as view:
+            columns = [view[self.HEADER.size + column * 4 * amount:
+                            self.HEADER.size + (column + 1) * 4 * amount].cast('i')
+                       for column in range(self.COLUMNS)]
+            try:
+                none = self.NONE
+                # Day number, state code and version are never NULL
+                values = [column.tolist() if index in (0, 5, 6)
+                          else [None if value == none else value for value in column]
+                          for index, column in enumerate(columns)]
+                return list(zip(*values))
+            finally:
+                # The mapping can only be closed once no view refers to it
+                for column in columns:
+                    column.release()
+
+    def write(self, employee_id, counter, rows):
+        """
+        Write the snapshot of an employee. Failing to write only costs
+        loading from the database.
+
+        Parameters
+        ----------
+        employee_id : str
+            The employee.
+        counter : int
+            The change counter the rows were read with.
+        rows : list
+            Tuples like DatabaseFunctions.load_days().
+        """
+        columns = [array.array('i', (self.NONE if value is None else value for value in column))
+                   for column in zip(*rows)] or [array.array('i')] * self.COLUMNS
+        file_path = self.get_file_path(employee_id)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Replace atomically, other instances may map the file at the same time
+            with open(file_path + ".tmp", 'wb') as file:
+                file.write(self.HEADER.pack(self.MAGIC, sys.byteorder[0].encode(),
+                                            counter, len(rows)))
+                for column in columns:
+                    column.tofile(file)
+            os.replace(file_path + ".tmp", file_path)
+        except OSError as error:
+            logger.warning("Failed to write timesheet snapshot: %s", error)
+
+    def rebuild(self, employee_id):
+        """
+        Read the days of an employee from the database and write its snapshot.
+
+        Opens a connection of its own, so it can run on any thread.
+        """
+        from database_functions import DatabaseFunctions
+
+        db = DatabaseFunctions()
+        db.connect_to_database(self.database_path)
+        try:
+            # Counter and days from the same read transaction
+            db.c.execute('BEGIN')
+            counter = db.load_timesheet_counter(employee_id)
+            rows = db.load_days(employee_id, exclude_closed=True)
+            db.conn.commit()
+        finally:
+            db.disconnect_from_database()
+        self.write(employee_id, counter, rows)
+
+
+# One thread writes all snapshots, so a file is never written twice at the same time
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+
+
+def load(employee_id, counter):
+    """
+    Return the days of a valid snapshot, see SnapshotCache.read().
+    """
+    return SnapshotCache().read(employee_id, counter)
+
+
+def rebuild_in_background(employee_id):
+    """
+    Rebuild the snapshot of an employee on the background thread.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        Completed once the snapshot is written.
+    """
+    def rebuild():
+        try:
+            cache.rebuild(employee_id)
+        except Exception as error:
+            logger.warning("Failed to rebuild timesheet snapshot: %s", error)
+
+    # Bound now, the database path may change until the thread runs
+    cache = SnapshotCache()
+    return executor.submit(rebuild)
+
+
+def wait_for_rebuilds():
+    """Wait until all snapshots requested so far are written."""
+    executor.submit(lambda: None).result()
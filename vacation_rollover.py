@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides the year-end vacation rollover of the STC time
+management application.
+
+Rolling the vacation days over into a year means for every employee:
+- The remaining vacation days become the old vacation days, limited to
+  gui_constants.VACATION_CARRY_OVER_LIMIT.
+- The remaining old vacation days of the previous year expire.
+- The yearly entitlement is granted as new vacation days.
+
+Every employee remembers the last year it was rolled over into, so running
+the rollover twice for the same year changes nothing.
+
+With the database all employees are rolled over by one set-based UPDATE in
+a single transaction. The employees csv file is split into chunks of
+gui_constants.ROLLOVER_CHUNK_SIZE employees which are processed by parallel
+worker processes and written back atomically.
+
+Functions
+---------
+roll_over(vacation_days, entitlement, carry_over_limit=None)
+    Returns the new vacation and old vacation days of one employee.
+rollover_database(year, carry_over_limit=None, dry_run=False)
+    Rolls over all employees in the database.
+rollover_csv(year, carry_over_limit=None, dry_run=False, workers=None)
+    Rolls over all employees in the employees csv file.
+
+Usage
+-----
+    python vacation_rollover.py [--year YEAR] [--dry-run] [--csv]
+                                [--carry-over-limit DAYS] [--workers N]
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import datetime as dt
+import itertools
+import os
+
+import gui_constants
+
+
+CSV_FIELDS = ['Employee ID', 'Vacation Days', 'Old Vacation Days',
+              'Vacation Entitlement', 'Rollover Year', 'Region']
+
+
+def roll_over(vacation_days, entitlement, carry_over_limit=None):
+    """
+    Return the vacation days of one employee after the rollover.
+
+    Parameters
+    ----------
+    vacation_days : int
+        Remaining vacation days of the ending year.
+    entitlement : int
+        Vacation days granted for the new year.
+    carry_over_limit : int, optional
+        Maximum of remaining vacation days carried over (default is no limit).
+
+    Returns
+    -------
+    tuple
+        New vacation days and new old vacation days.
+    """
+    carried_over = vacation_days
+    if carry_over_limit is not None:
+        carried_over = min(carried_over, carry_over_limit)
+    return entitlement, max(carried_over, 0)
+
+
+def summarize(year, rows):
+    """
+    Summarize the rollover of all employees.
+
+    Parameters
+    ----------
+    year : int
+        The year rolled over into.
+    rows : list
+        Tuples of employee_id, vacation_days, old_vacation_days, new vacation
+        days, new old vacation days and the rollover year before the rollover.
+
+    Returns
+    -------
+    dict
+        Amount of employees, rolled over employees, employees already rolled
+        over and the sums of carried over, expired and granted days.
+    """
+    report = {"year": year, "employees": len(rows), "rolled_over": 0,
+              "already_rolled_over": 0, "carried_over": 0, "expired": 0,
+              "granted": 0}
+    for _, vacation_days, old_vacation_days, new_vacation_days, new_old_vacation_days, rollover_year in rows:
+        if rollover_year is not None and rollover_year >= year:
+            report["already_rolled_over"] += 1
+            continue
+        report["rolled_over"] += 1
+        report["carried_over"] += new_old_vacation_days
+        report["expired"] += ((old_vacation_days or 0) + max(vacation_days or 0, 0)
+                              - new_old_vacation_days)
+        report["granted"] += new_vacation_days
+    return report
+
+
+def rollover_database(year, carry_over_limit=None, dry_run=False):
+    """
+    Roll the vacation days of all employees in the database over into year.
+
+    Parameters
+    ----------
+    year : int
+        The year rolled over into.
+    carry_over_limit : int, optional
+        Maximum of remaining vacation days carried over (default is no limit).
+    dry_run : bool, optional
+        Only report what would change (default is False).
+
+    Returns
+    -------
+    dict
+        The report, see summarize().
+    """
+    from database_functions import DatabaseFunctions, run_with_retry
+
+    def rollover():
+        if dry_run:
+            return db.preview_vacation_rollover(year, carry_over_limit)
+        with db.transaction():
+            rows = db.preview_vacation_rollover(year, carry_over_limit)
+            db.rollover_vacation_days(year, carry_over_limit)
+        return rows
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        rows = run_with_retry(rollover)
+    finally:
+        db.disconnect_from_database()
+    return summarize(year, rows)
+
+
+def rollover_chunk(rows, year, carry_over_limit, default_entitlement):
+    """
+    Roll over one chunk of rows of the employees csv file.
+
+    Executed in a worker process.
+
+    Parameters
+    ----------
+    rows : list
+        Rows of the employees csv file as dictionaries.
+    year : int
+        The year rolled over into.
+    carry_over_limit : int or None
+        Maximum of remaining vacation days carried over.
+    default_entitlement : int
+        Entitlement of rows without 'Vacation Entitlement'.
+
+    Returns
+    -------
+    tuple
+        The rolled over rows and the report rows, see summarize().
+    """
+    new_rows = []
+    report_rows = []
+    for row in rows:
+        vacation_days = int(row['Vacation Days']) if row['Vacation Days'] else 30
+        old_vacation_days = int(row['Old Vacation Days']) if row['Old Vacation Days'] else 0
+        entitlement = int(row.get('Vacation Entitlement') or default_entitlement)
+        rollover_year = int(row['Rollover Year']) if row.get('Rollover Year') else None
+
+        new_row = dict(row, **{'Vacation Entitlement': entitlement})
+        if rollover_year is None or rollover_year < year:
+            new_vacation_days, new_old_vacation_days = roll_over(
+                vacation_days, entitlement, carry_over_limit)
+            new_row.update({'Vacation Days': new_vacation_days,
+                            'Old Vacation Days': new_old_vacation_days,
+                            'Rollover Year': year})
+        else:
+            new_vacation_days, new_old_vacation_days = vacation_days, old_vacation_days
+
+        new_rows.append(new_row)
+        report_rows.append((row['Employee ID'], vacation_days, old_vacation_days,
+                            new_vacation_days, new_old_vacation_days, rollover_year))
+    return new_rows, report_rows
+
+
+def rollover_csv(year, carry_over_limit=None, dry_run=False, workers=None,
+                 file_path=None):
+    """
+    Roll the vacation days of all employees in the csv file over into year.
+
+    Parameters
+    ----------
+    year : int
+        The year rolled over into.
+    carry_over_limit : int, optional
+        Maximum of remaining vacation days carried over (default is no limit).
+    dry_run : bool, optional
+        Only report what would change (default is False).
+    workers : int, optional
+        Amount of worker processes (default is the amount of CPUs).
+    file_path : str, optional
+        The employees csv file (default is employees.csv in the data folder).
+
+    Returns
+    -------
+    dict
+        The report, see summarize().
+    """
+    if file_path is None:
+        file_path = os.path.join(gui_constants.DATA_PATH, "employees.csv")
+
+    with open(file_path, 'r', newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    size = gui_constants.ROLLOVER_CHUNK_SIZE
+    chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+    arguments = (itertools.repeat(year), itertools.repeat(carry_over_limit),
+                 itertools.repeat(gui_constants.VACATION_DAYS_PER_YEAR))
+    if len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(rollover_chunk, chunks, *arguments))
+    else:
+        # Starting worker processes takes longer than a single chunk
+        results = list(map(rollover_chunk, chunks, *arguments))
+
+    new_rows = [row for chunk_rows, _ in results for row in chunk_rows]
+    report = summarize(year, [row for _, report_rows in results for row in report_rows])
+
+    if not dry_run and report["rolled_over"]:
+        # Write to a temporary file first, so a crash never leaves a half written file
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(new_rows)
+        os.replace(temp_path, file_path)
+    return report
+
+
+def print_report(report, dry_run=False):
+    """Print a rollover report."""
+    print("{mode}Vacation rollover into {year}:".format(
+        mode="[Dry run] " if dry_run else "", year=report["year"]))
+    print("  Employees:            {employees}".format(**report))
+    print("  Rolled over:          {rolled_over}".format(**report))
+    print("  Already rolled over:  {already_rolled_over}".format(**report))
+    print("  Days carried over:    {carried_over}".format(**report))
+    print("  Days expired:         {expired}".format(**report))
+    print("  Days granted:         {granted}".format(**report))
+
+
+def main():
+    """Run the rollover from the command line."""
+    parser = argparse.ArgumentParser(description="Year-end vacation rollover")
+    parser.add_argument('--year', type=int, default=dt.date.today().year,
+                        help="The year rolled over into (default is the current year)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report what would change")
+    parser.add_argument('--csv', action='store_true',
+                        help="Roll over the employees csv file instead of the database")
+    parser.add_argument('--carry-over-limit', type=int,
+                        default=gui_constants.VACATION_CARRY_OVER_LIMIT,
+                        help="Maximum of remaining vacation days carried over")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes for the csv file (default is the amount of CPUs)")
+    arguments = parser.parse_args()
+
+    if arguments.csv:
+        report = rollover_csv(arguments.year, arguments.carry_over_limit,
+                              arguments.dry_run, arguments.workers)
+    else:
+        report = rollover_database(arguments.year, arguments.carry_over_limit,
+                                   arguments.dry_run)
+    print_report(report, arguments.dry_run)
+
+
+if __name__ == "__main__":
+    main()
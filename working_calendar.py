@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides a precomputed working day calendar for the STC time
+management application.
+
+For every year and holiday region a bitset with one bit per day of the year
+is built once: the bit is set if the day is a working day, i.e. neither on a
+weekend nor a public holiday of that region. Bitsets are kept in memory and
+cached on disk in gui_constants.CALENDAR_PATH, each file carries a checksum
+of the holiday rules it was built from and is rebuilt if the rules change.
+
+Target hours, month rendering and range bookings look up the bitset instead
+of recomputing weekdays and holidays.
+
+Classes
+-------
+WorkingCalendar
+    Builds, caches and looks up the working day bitsets.
+
+Functions
+---------
+is_working_day(date_object, region=None)
+    Checks whether a date is a working day in a region.
+get_holidays(year, region=None)
+    Returns the public holidays of a year.
+"""
+
+import calendar
+import datetime as dt
+import logging
+import os
+import struct
+import zlib
+
+from datetime_functions import DatetimeFunctions as dtf
+import gui_constants
+
+logger = logging.getLogger(__name__)
+
+
+class WorkingCalendar():
+    """
+    Bitsets of working days per year and region.
+
+    Attributes
+    ----------
+    directory : str or None
+        Folder the bitsets are cached in, gui_constants.CALENDAR_PATH at the
+        time of the access unless another folder was given. Nothing is
+        written if None.
+    bitsets : dict
+        (region, year) mapped to the bitset of that year.
+    holidays : dict
+        (region, year) mapped to the sorted public holidays of that year.
+    """
+
+    # Checksum of the holiday rules followed by the bitset of 366 days
+    FILE_FORMAT = struct.Struct("<I46s")
+
+    def __init__(self, directory=None):
+        """
+        Initializes an empty WorkingCalendar.
+
+        Parameters
+        ----------
+        directory : str, optional
+            Folder the bitsets are cached in
+            (default is gui_constants.CALENDAR_PATH).
+        """
+        self.own_directory = directory
+        self.bitsets = {}
+        self.holidays = {}
+
+    @property
+    def directory(self):
+        """Folder the bitsets are cached in, read when it is used."""
+        return gui_constants.CALENDAR_PATH if self.own_directory is None else self.own_directory
+
+    def get_bitset(self, year, region=None):
+        """
+        Return the bitset of a year, loading or building it if needed.
+
+        Parameters
+        ----------
+        year : int
+            The year.
+        region : str, optional
+            The holiday region (default is gui_constants.DEFAULT_REGION).
+
+        Returns
+        -------
+        bytes
+            Bit n (byte n // 8, bit n % 8) is set if day n
+            (0 is January 1st) is a working day.
+        """
+        key = (region or gui_constants.DEFAULT_REGION, year)
+        bitset = self.bitsets.get(key)
+        if bitset is None:
+            bitset = self.read(*key)
+            if bitset is None:
+                bitset = self.build(*key)
+                self.write(*key, bitset)
+            self.bitsets[key] = bitset
+        return bitset
+
+    def build(self, region, year):
+        """Compute the bitset of a year from the weekdays and holiday rules."""
+        holidays = dtf.get_public_holidays(None, year, region)
+        bitset = bytearray(46)
+        date_object = dt.date(year, 1, 1)
+        for day in range(366 if calendar.isleap(year) else 365):
+            if date_object.weekday() < 5 and date_object not in holidays:
+                bitset[day >> 3] |= 1 << (day & 7)
+            date_object += dt.timedelta(days=1)
+        return bytes(bitset)
+
+    def get_file_path(self, region, year):
+        """Return the path of the cache file of a year."""
+        return os.path.join(self.directory, "{region}_{year}.bin".format(
+            region=region, year=year))
+
+    def get_checksum(self, region):
+        """Return the checksum of the holiday rules of a region."""
+        rules = (gui_constants.FIXED_PUBLIC_HOLIDAYS, gui_constants.EASTER_PUBLIC_HOLIDAYS,
+                 gui_constants.REGIONAL_HOLIDAYS[region])
+        return zlib.crc32(repr(rules).encode('utf-8'))
+
+    def read(self, region, year):
+        """
+        Read a cached bitset from disk.
+
+        Returns
+        -------
+        bytes or None
+            The bitset, None if it is not cached or was built from
+            different holiday rules.
+        """
+        if self.directory is None:
+            return None
+        try:
+            with open(self.get_file_path(region, year), 'rb') as file:
+                checksum, bitset = self.FILE_FORMAT.unpack(file.read())
+        except (OSError, struct.error):
+            return None
+        return bitset if checksum == self.get_checksum(region) else None
+
+    def write(self, region, year, bitset):
+        """Cache a bitset on disk. Failing to write only costs a rebuild."""
+        if self.directory is None:
+            return
+        file_path = self.get_file_path(region, year)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Replace atomically, other instances may read the file at the same time
+            with open(file_path + ".tmp", 'wb') as file:
+                file.write(self.FILE_FORMAT.pack(self.get_checksum(region), bitset))
+            os.replace(file_path + ".tmp", file_path)
+        except OSError as error:
+            logger.warning("Failed to cache working day calendar: %s", error)
+
+    def is_working_day(self, date_object, region=None):
+        """
+        Check whether a date is neither on a weekend nor a public holiday.
+
+        Parameters
+        ----------
+        date_object : datetime.date
+            The date to check.
+        region : str, optional
+            The holiday region (default is gui_constants.DEFAULT_REGION).
+
+        Returns
+        -------
+        bool
+            True if the date is a working day.
+        """
+        bitset = self.get_bitset(date_object.year, region)
+        day = date_object.timetuple().tm_yday - 1
+        return bool(bitset[day >> 3] >> (day & 7) & 1)
+
+    def get_holidays(self, year, region=None):
+        """
+        Return the public holidays of a year, including those on weekends.
+        Unlike the bitsets they are not cached on disk, a year's holidays
+        are computed from the rules once per process.
+
+        Parameters
+        ----------
+        year : int
+            The year.
+        region : str, optional
+            The holiday region (default is gui_constants.DEFAULT_REGION).
+
+        Returns
+        -------
+        list
+            The holidays as datetime.date objects in ascending order.
+        """
+        key = (region or gui_constants.DEFAULT_REGION, year)
+        holidays = self.holidays.get(key)
+        if holidays is None:
+            holidays = sorted(dtf.get_public_holidays(None, year, key[0]))
+            self.holidays[key] = holidays
+        return holidays
+
+
+calendar_index = WorkingCalendar()
+
+
+def is_working_day(date_object, region=None):
+    """
+    Check whether a date is a working day, see WorkingCalendar.is_working_day().
+    """
+    return calendar_index.is_working_day(date_object, region)
+
+
+def get_holidays(year, region=None):
+    """
+    Return the public holidays of a year, see WorkingCalendar.get_holidays().
+    """
+    return calendar_index.get_holidays(year, region)
+
+
+if __name__ == "__main__":
+    import time
+
+    for region in gui_constants.REGIONAL_HOLIDAYS:
+        print(region, ", ".join("{:%m-%d}".format(day) for day in get_holidays(dt.date.today().year, region)))
+
+    days = [dt.date(2000, 1, 1) + dt.timedelta(days=offset) for offset in range(36500)]
+    start = time.perf_counter()
+    working_days = sum(is_working_day(day) for day in days)
+    print("{amount} working days in 100 years, looked up in {seconds:.3f} s".format(
+        amount=working_days, seconds=time.perf_counter() - start))
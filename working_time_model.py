@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+This module provides the working-time models of the STC time management
+application.
+
+A working-time model holds the target hours of every weekday and the range
+of dates it is valid for. Every employee can have several models, e.g. when
+a contract changes from full time to part time. Days not covered by any
+model use gui_constants.DAILY_WORKING_HOURS from Monday to Friday.
+
+The flex time deducts the target of every day. The targets of a year are
+derived once from the models and the working day calendar and kept in an
+array with one entry per day, which is only rebuilt when the models change.
+
+Classes
+-------
+WorkingTimeModel
+    Target hours per weekday, valid for a range of dates.
+TargetSchedule
+    Cached daily targets of one employee.
+
+Usage
+-----
+    python working_time_model.py EMPLOYEE_ID
+    python working_time_model.py EMPLOYEE_ID --from 2027-01-01 --hours 6 6 6 6 0 0 0
+    python working_time_model.py EMPLOYEE_ID --from 2027-01-01 --delete
+"""
+
+import argparse
+import array
+import datetime as dt
+
+import gui_constants
+import working_calendar
+
+
+class WorkingTimeModel():
+    """
+    Target hours per weekday, valid for a range of dates.
+
+    Attributes
+    ----------
+    weekday_hours : tuple
+        Target hours from Monday to Sunday.
+    valid_from : datetime.date
+        First day the model is valid.
+    valid_to : datetime.date or None
+        Last day the model is valid, None if it is valid indefinitely.
+    """
+
+    def __init__(self, weekday_hours, valid_from=dt.date.min, valid_to=None):
+        """
+        Initializes a WorkingTimeModel.
+
+        Parameters
+        ----------
+        weekday_hours : sequence
+            Seven target hours from Monday to Sunday.
+        valid_from : datetime.date, optional
+            First day the model is valid (default is always).
+        valid_to : datetime.date, optional
+            Last day the model is valid (default is indefinitely).
+        """
+        if len(weekday_hours) != 7:
+            raise ValueError("A working-time model needs hours for seven weekdays.")
+        if valid_to is not None and valid_to < valid_from:
+            raise ValueError("The end of a working-time model must not be before its start.")
+        self.weekday_hours = tuple(float(hours) for hours in weekday_hours)
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+
+    def __repr__(self):
+        return "WorkingTimeModel({hours}, {start}, {end})".format(
+            hours=self.weekday_hours, start=self.valid_from, end=self.valid_to)
+
+    def covers(self, date_object):
+        """Check whether the model is valid on a date."""
+        return (self.valid_from <= date_object
+                and (self.valid_to is None or date_object <= self.valid_to))
+
+    def get_weekday_seconds(self):
+        """Return the target seconds from Monday to Sunday."""
+        return tuple(round(hours * 3600) for hours in self.weekday_hours)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Create a model from a row of the working_time_models table.
+
+        Parameters
+        ----------
+        row : tuple
+            valid_from, valid_to and the hours from Monday to Sunday.
+        """
+        valid_to = dt.date.fromisoformat(row[1]) if row[1] else None
+        return cls(row[2:9], dt.date.fromisoformat(row[0]), valid_to)
+
+    def to_dict(self):
+        """Return the model as a dictionary of JSON compatible values."""
+        return {"valid_from": self.valid_from.isoformat(),
+                "valid_to": self.valid_to.isoformat() if self.valid_to else None,
+                "weekday_hours": list(self.weekday_hours)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a model from a dictionary returned by to_dict()."""
+        valid_to = dt.date.fromisoformat(data['valid_to']) if data['valid_to'] else None
+        return cls(data['weekday_hours'], dt.date.fromisoformat(data['valid_from']), valid_to)
+
+
+DEFAULT_MODEL = WorkingTimeModel((gui_constants.DAILY_WORKING_HOURS,) * 5 + (0, 0))
+
+
+class TargetSchedule():
+    """
+    Cached daily targets of one employee.
+
+    The schedule is immutable: a contract change replaces the schedule and
+    with it the cached targets.
+
+    Attributes
+    ----------
+    models : list
+        The WorkingTimeModels of the employee, ordered by valid_from.
+    targets : dict
+        (region, year) mapped to an array of the target seconds of every
+        day of that year.
+    """
+
+    def __init__(self, models=()):
+        """
+        Initializes a TargetSchedule.
+
+        Parameters
+        ----------
+        models : iterable, optional
+            The WorkingTimeModels of the employee (default is none, i.e.
+            DEFAULT_MODEL on every day).
+        """
+        self.models = sorted(models, key=lambda model: model.valid_from)
+        self.targets = {}
+
+    def build(self, year, region):
+        """
+        Compute the target seconds of every day of a year.
+
+        Where models overlap, the one starting last wins. Public holidays
+        have no target, also if they fall on a weekend the model has
+        hours on.
+        """
+        start_date = dt.date(year, 1, 1)
+        end_date = dt.date(year, 12, 31)
+        models = [model for model in self.models
+                  if model.valid_from <= end_date
+                  and (model.valid_to is None or start_date <= model.valid_to)]
+
+        # Fill the weeks of the default model, then overwrite the ranges of the models
+        offset = start_date.weekday()
+        weekday_seconds = DEFAULT_MODEL.get_weekday_seconds()
+        targets = array.array('l', (weekday_seconds[(offset + day) % 7]
+                                    for day in range(end_date.timetuple().tm_yday)))
+        for model in models:
+            weekday_seconds = model.get_weekday_seconds()
+            first_day = max(model.valid_from, start_date).timetuple().tm_yday - 1
+            last_day = min(model.valid_to or end_date, end_date).timetuple().tm_yday - 1
+            for day in range(first_day, last_day + 1):
+                targets[day] = weekday_seconds[(offset + day) % 7]
+
+        for holiday in working_calendar.get_holidays(year, region):
+            targets[holiday.timetuple().tm_yday - 1] = 0
+        return targets
+
+    def get_targets(self, year, region=None):
+        """
+        Return the target seconds of every day of a year.
+
+        Parameters
+        ----------
+        year : int
+            The year.
+        region : str, optional
+            The holiday region (default is gui_constants.DEFAULT_REGION).
+
+        Returns
+        -------
+        array.array
+            Index 0 is January 1st.
+        """
+        key = (region or gui_constants.DEFAULT_REGION, year)
+        targets = self.targets.get(key)
+        if targets is None:
+            targets = self.targets[key] = self.build(year, key[0])
+        return targets
+
+    def get_target(self, date_object, region=None):
+        """Return the target seconds of a day."""
+        return self.get_targets(date_object.year, region)[date_object.timetuple().tm_yday - 1]
+
+
+def main():
+    """List, add or delete the working-time models of an employee."""
+    from database_functions import DatabaseFunctions
+
+    parser = argparse.ArgumentParser(description="Working-time models of an employee")
+    parser.add_argument('employee_id')
+    parser.add_argument('--from', dest='valid_from', type=dt.date.fromisoformat,
+                        help="First day of the model to add or delete")
+    parser.add_argument('--to', dest='valid_to', type=dt.date.fromisoformat,
+                        help="Last day of the model to add (default is indefinitely)")
+    parser.add_argument('--hours', type=float, nargs=7, metavar='HOURS',
+                        help="Target hours from Monday to Sunday")
+    parser.add_argument('--delete', action='store_true',
+                        help="Delete the model starting at --from")
+    arguments = parser.parse_args()
+
+    db = DatabaseFunctions()
+    db.connect_to_database()
+    try:
+        if arguments.delete:
+            if arguments.valid_from is None:
+                parser.error("--delete requires --from")
+            db.delete_working_time_model(arguments.employee_id, arguments.valid_from.isoformat())
+        elif arguments.hours is not None:
+            if arguments.valid_from is None:
+                parser.error("--hours requires --from")
+            model = WorkingTimeModel(arguments.hours, arguments.valid_from, arguments.valid_to)
+            db.save_working_time_model(arguments.employee_id, model.valid_from.isoformat(),
+                                       model.to_dict()['valid_to'], model.weekday_hours)
+
+        for row in db.load_working_time_models(arguments.employee_id):
+            print(WorkingTimeModel.from_row(row))
+    finally:
+        db.disconnect_from_database()
+
+
+if __name__ == "__main__":
+    main()